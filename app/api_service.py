@@ -0,0 +1,31 @@
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# 独立进程模式的API服务，由 native_bridge.py 启动，通过本地IPC与原生消息桥通信。
+# 多个工作进程时页面数据、全文索引和内嵌资源保存在共享状态目录中。
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown API服务（独立进程模式）")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MARKDOWN_API_WORKERS", "1")),
+                        help="API工作进程数，默认读取 MARKDOWN_API_WORKERS")
+    args = parser.parse_args()
+
+    if args.workers > 1 and not os.environ.get("MARKDOWN_STATE_DIR"):
+        # 未指定状态目录时使用临时目录，服务退出时删除
+        state_dir = tempfile.mkdtemp(prefix="markdown-state-")
+        atexit.register(shutil.rmtree, state_dir, ignore_errors=True)
+        os.environ["MARKDOWN_STATE_DIR"] = state_dir
+
+    # 状态目录需要在导入 main 之前设置，工作进程通过环境变量继承
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as service
+    service.serve_api(args.workers)
+
+
+if __name__ == "__main__":
+    main()
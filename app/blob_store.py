@@ -0,0 +1,209 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote_to_bytes
+
+logger = logging.getLogger('api')
+
+# 内存中保存的二进制内容总量上限，超过后淘汰最久未使用的内容
+BLOB_STORE_MAX_BYTES = 256 * 1024 * 1024
+# 短于该长度的 data: URI 保持原样（引用本身约70个字符）
+MIN_DATA_URI_CHARS = 512
+# 大于该长度的内联 <svg> 才会被替换
+MIN_INLINE_SVG_CHARS = 2048
+# 内容摘要长度（十六进制字符）
+DIGEST_CHARS = 32
+
+# 按页面声明的类型返回的内容：图片和字体。SVG 和 HTML 等可以包含脚本的类型不在其中，
+# 它们作为附件下载，不会在API所在的源（本机API端口）上执行
+INLINE_MEDIA_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/jpg", "image/gif", "image/webp", "image/avif", "image/bmp",
+    "image/x-icon", "image/vnd.microsoft.icon",
+    "font/woff", "font/woff2", "font/ttf", "font/otf", "font/collection",
+    "application/font-woff", "application/font-woff2", "application/x-font-woff",
+    "application/x-font-ttf", "application/vnd.ms-fontobject"
+})
+# 所有内容响应都带上的安全响应头：禁止按内容猜测类型，作为文档打开时也处于沙箱中且不加载任何资源
+BLOB_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "sandbox; default-src 'none'"
+}
+
+DATA_URI_PATTERN = re.compile(
+    r'(?<![\w-])data:(?P<type>[a-z]+/[a-z0-9.+-]+)?(?P<params>(?:;[a-z0-9.+-]+=[^;,"\'\s()<>]*)*)'
+    r'(?P<base64>;base64)?,(?P<data>[^"\'\s()<>]*)',
+    re.IGNORECASE
+)
+SVG_TAG_PATTERN = re.compile(r'<svg\b[^>]*>|</svg\s*>', re.IGNORECASE)
+SVG_LABEL_PATTERN = re.compile(r'<title[^>]*>([^<]*)</title>|\baria-label="([^"]*)"', re.IGNORECASE)
+
+
+class BlobStore:
+    """按内容摘要去重的二进制内容存储（内存，按LRU淘汰）
+
+    指定 directory 时内容保存为以摘要命名的文件，供多个进程共用（不做淘汰，目录随会话清理）。
+    """
+
+    def __init__(self, max_bytes=BLOB_STORE_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.blobs = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+
+    def put(self, media_type, data):
+        """保存内容并返回摘要，相同内容只保存一份"""
+        digest = hashlib.sha256(data).hexdigest()[:DIGEST_CHARS]
+        if self.directory:
+            return self._put_file(digest, media_type, data)
+        with self.lock:
+            if digest in self.blobs:
+                self.blobs.move_to_end(digest)
+                self.deduplicated += 1
+                return digest
+            self.blobs[digest] = (media_type, data)
+            self.total_bytes += len(data)
+            self.stored += 1
+            while self.total_bytes > self.max_bytes and len(self.blobs) > 1:
+                _, (_, evicted) = self.blobs.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evicted += 1
+        return digest
+
+    def _put_file(self, digest, media_type, data):
+        path = os.path.join(self.directory, digest)
+        with self.lock:
+            if os.path.exists(path):
+                self.deduplicated += 1
+                return digest
+            self.stored += 1
+            self.total_bytes += len(data)
+        # 先写临时文件再改名，其他进程不会读到写了一半的内容
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(media_type.encode("ascii", "replace") + b"\n" + data)
+        os.replace(temp_path, path)
+        return digest
+
+    def get(self, digest):
+        """返回 (media_type, data)，不存在或已被淘汰时返回 None"""
+        if self.directory:
+            if not re.fullmatch(r'[0-9a-f]+', digest):
+                return None
+            try:
+                with open(os.path.join(self.directory, digest), "rb") as f:
+                    media_type, _, data = f.read().partition(b"\n")
+                return media_type.decode("ascii"), data
+            except FileNotFoundError:
+                return None
+        with self.lock:
+            blob = self.blobs.get(digest)
+            if blob is not None:
+                self.blobs.move_to_end(digest)
+            return blob
+
+    def stats(self):
+        with self.lock:
+            return {
+                "count": len(self.blobs),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "evicted": self.evicted
+            }
+
+    def __len__(self):
+        if self.directory:
+            return sum(1 for name in os.listdir(self.directory) if not name.endswith(".tmp"))
+        return len(self.blobs)
+
+
+def blob_response_headers(media_type, digest):
+    """返回 (响应类型, 附加响应头)：允许的图片和字体按声明的类型返回，其他内容作为二进制附件下载"""
+    if media_type.lower() in INLINE_MEDIA_TYPES:
+        return media_type, dict(BLOB_SECURITY_HEADERS)
+    return "application/octet-stream", dict(BLOB_SECURITY_HEADERS,
+                                            **{"Content-Disposition": f'attachment; filename="{digest}"'})
+
+
+def decode_data_uri(match):
+    """解码 data: URI，返回 (media_type, bytes)；格式错误时返回 None"""
+    media_type = (match.group("type") or "text/plain").lower()
+    payload = match.group("data")
+    try:
+        if match.group("base64"):
+            # 部分页面使用URL安全的Base64或省略填充
+            payload = payload.replace('-', '+').replace('_', '/')
+            return media_type, base64.b64decode(payload + '=' * (-len(payload) % 4), validate=True)
+        return media_type, unquote_to_bytes(payload)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def find_inline_svgs(html):
+    """返回最外层 <svg> 元素的 (起始, 结束) 位置，正确处理嵌套的 svg"""
+    spans = []
+    depth = 0
+    start = None
+    for match in SVG_TAG_PATTERN.finditer(html):
+        if match.group(0)[1] != '/':
+            if depth == 0:
+                start = match.start()
+            if not match.group(0).endswith('/>'):
+                depth += 1
+            elif depth == 0:
+                spans.append((start, match.end()))
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                spans.append((start, match.end()))
+    return spans
+
+
+def offload_blobs(html, store, url_prefix, min_data_uri_chars=MIN_DATA_URI_CHARS, min_svg_chars=MIN_INLINE_SVG_CHARS):
+    """把较大的 data: URI 和内联 <svg> 移入内容存储，替换为引用URL；返回 (新HTML, 移出的字节数)"""
+    if not html or ("data:" not in html and "<svg" not in html.lower()):
+        return html, 0
+    original_length = len(html)
+
+    def replace_data_uri(match):
+        if len(match.group("data")) < min_data_uri_chars:
+            return match.group(0)
+        decoded = decode_data_uri(match)
+        if decoded is None:
+            return match.group(0)
+        return url_prefix + store.put(*decoded)
+
+    html = DATA_URI_PATTERN.sub(replace_data_uri, html)
+
+    pieces = []
+    position = 0
+    for start, end in find_inline_svgs(html):
+        if end - start < min_svg_chars:
+            continue
+        svg = html[start:end]
+        if "xmlns=" not in svg[:svg.index('>')]:
+            # 单独提供的SVG文件需要命名空间
+            svg = "<svg xmlns=\"http://www.w3.org/2000/svg\"" + svg[4:]
+        label = SVG_LABEL_PATTERN.search(svg)
+        alt = (label.group(1) or label.group(2) or "").strip() if label else ""
+        digest = store.put("image/svg+xml", svg.encode("utf-8"))
+        pieces.append(html[position:start])
+        pieces.append(f'<img src="{url_prefix}{digest}" alt="{alt.replace(chr(34), "")}">')
+        position = end
+    if pieces:
+        pieces.append(html[position:])
+        html = ''.join(pieces)
+
+    return html, original_length - len(html)
@@ -0,0 +1,80 @@
+import threading
+import time
+
+# 未指定截止时间时等待插件响应的时间（秒），以及请求可以指定的最长截止时间
+DEFAULT_REQUEST_TIMEOUT = 60
+MAX_REQUEST_TIMEOUT = 600
+# 请求头中的截止时间（秒），与请求体中的 timeout 参数等价
+TIMEOUT_HEADER = "x-request-timeout"
+
+
+class RequestCancelled(Exception):
+    """客户端已断开或请求超过截止时间，后续工作不再需要"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """一个请求的截止时间与取消状态，在事件循环和工作线程之间共享"""
+
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    def cancel(self, reason="cancelled"):
+        """标记为已取消并调用已注册的回调（只生效一次）"""
+        with self.lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(reason)
+
+    def on_cancel(self, callback):
+        """注册取消回调；已取消时立即调用"""
+        with self.lock:
+            if self.reason is None:
+                self.callbacks.append(callback)
+                return
+        callback(self.reason)
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def remaining(self, default=None):
+        """距截止时间的秒数；没有截止时间时返回 default"""
+        if self.deadline is None:
+            return default
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check(self):
+        """已取消或已超过截止时间时抛出 RequestCancelled"""
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        if self.reason is not None:
+            raise RequestCancelled(self.reason)
+
+
+def request_timeout(headers, body, default=DEFAULT_REQUEST_TIMEOUT):
+    """读取请求的截止时间（秒）：请求体中的 timeout 优先，其次是 X-Request-Timeout 请求头
+
+    取值无效时抛出 ValueError。
+    """
+    value = body.get("timeout") if isinstance(body, dict) else None
+    if value is None:
+        value = headers.get(TIMEOUT_HEADER)
+    if value is None:
+        return default
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("timeout 必须是数字") from None
+    if not 0 < timeout <= MAX_REQUEST_TIMEOUT:
+        raise ValueError(f"timeout 必须在 0 到 {MAX_REQUEST_TIMEOUT} 秒之间")
+    return timeout
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+# 原生消息通道的连接监督：空闲时按自适应间隔发送心跳，读取到 EOF 时立即判定断开。
+# 通道断开或插件无响应时，进行中的请求立即以 disconnected 状态结束，不必等到请求超时。
+# 只使用标准库，原生消息桥（native_bridge.py）和本地程序（main.py）共用。
+
+# 空闲时心跳间隔的下限和上限（秒）：每次心跳得到响应后间隔加倍，有消息往来时不发送心跳
+HEARTBEAT_MIN_INTERVAL = float(os.environ.get("MARKDOWN_HEARTBEAT_MIN", "5"))
+HEARTBEAT_MAX_INTERVAL = float(os.environ.get("MARKDOWN_HEARTBEAT_MAX", "60"))
+# 心跳发出后在该时间（秒）内没有收到任何消息，视为插件无响应
+HEARTBEAT_TIMEOUT = float(os.environ.get("MARKDOWN_HEARTBEAT_TIMEOUT", "10"))
+
+CHANNEL_LOST_REASONS = {
+    "eof": "插件已关闭连接",
+    "heartbeat_timeout": "插件未响应心跳",
+    "send_failed": "无法向插件发送消息",
+    "bridge_lost": "与原生消息桥的连接已断开"
+}
+
+
+class ChannelClosed(Exception):
+    """stdin 已关闭（插件断开连接），通道不会再恢复"""
+
+
+def describe_channel_loss(reason):
+    return CHANNEL_LOST_REASONS.get(reason, reason or "插件连接已断开")
+
+
+def channel_lost_message(request_id, reason):
+    """通道断开时交给进行中请求的回调，格式与插件的错误响应相同（带 error 字段）"""
+    return {
+        "type": "channel_lost",
+        "request_id": request_id,
+        "status": "disconnected",
+        "reason": reason,
+        "error": f"插件连接已断开: {describe_channel_loss(reason)}"
+    }
+
+
+def channel_state_message(state, reason=None):
+    """通道状态变化的通知：原生消息桥发给API工作进程，成员进程发给多浏览器代理"""
+    return {"type": "channel_state", "state": state, "reason": reason}
+
+
+class ConnectionSupervisor:
+    """监督一个原生消息通道的状态：connected、unresponsive（心跳超时，收到消息后恢复）或 closed（EOF）
+
+    读取消息的线程每收到一条消息调用 received()，读取到 EOF 时调用 closed()；
+    状态变化时在监督线程或调用线程中调用 on_state(state, reason)。
+    """
+
+    def __init__(self, send_heartbeat, on_state, min_interval=HEARTBEAT_MIN_INTERVAL,
+                 max_interval=HEARTBEAT_MAX_INTERVAL, timeout=HEARTBEAT_TIMEOUT):
+        # send_heartbeat 返回是否发送成功
+        self.send_heartbeat = send_heartbeat
+        self.on_state = on_state
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.state = "connected"
+        self.reason = None
+        self.interval = min_interval
+        self.last_received = time.monotonic()
+        # 等待响应的心跳的发出时间
+        self.probe_sent = None
+        self.heartbeats = 0
+        self.missed_heartbeats = 0
+        self.outages = 0
+
+    @property
+    def connected(self):
+        return self.state == "connected"
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        while not self.stopping.wait(self.next_check()):
+            self.check()
+
+    def next_check(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.probe_sent is not None:
+                due = self.probe_sent + self.timeout
+            else:
+                due = self.last_received + self.interval
+        return max(due - now, 0.05)
+
+    def received(self, now=None):
+        """收到插件的任何消息都说明通道正常"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.last_received = now
+            if self.probe_sent is not None:
+                self.probe_sent = None
+                # 空闲的通道响应正常，逐步拉长心跳间隔
+                self.interval = min(self.interval * 2, self.max_interval)
+            changed = self.state == "unresponsive" and self._transition("connected", None)
+        if changed:
+            self.on_state("connected", None)
+
+    def check(self, now=None):
+        """到期时发送心跳，或判定上一次心跳已超时"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.state == "closed":
+                return
+            probe = False
+            if self.probe_sent is not None:
+                if now - self.probe_sent < self.timeout:
+                    return
+                self.probe_sent = None
+                self.missed_heartbeats += 1
+                # 无响应期间按最短间隔继续探测
+                self.interval = self.min_interval
+                changed = self._transition("unresponsive", "heartbeat_timeout")
+            elif now - self.last_received >= self.interval:
+                self.probe_sent = now
+                self.heartbeats += 1
+                probe, changed = True, False
+            else:
+                return
+        if changed:
+            self.on_state("unresponsive", "heartbeat_timeout")
+        if probe and not self._send_heartbeat():
+            with self.lock:
+                self.probe_sent = None
+                changed = self._transition("unresponsive", "send_failed")
+            if changed:
+                self.on_state("unresponsive", "send_failed")
+
+    def closed(self, reason="eof"):
+        """读取到 EOF：通道不会再恢复"""
+        with self.lock:
+            changed = self._transition("closed", reason)
+        self.stop()
+        if changed:
+            self.on_state("closed", reason)
+
+    def _send_heartbeat(self):
+        try:
+            return bool(self.send_heartbeat())
+        except Exception:
+            return False
+
+    def _transition(self, state, reason):
+        if self.state == state or self.state == "closed":
+            return False
+        if self.state == "connected":
+            self.outages += 1
+        self.state = state
+        self.reason = reason
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "reason": self.reason,
+                "heartbeat_interval": self.interval,
+                "last_received_ago": round(time.monotonic() - self.last_received, 1),
+                "heartbeats": self.heartbeats,
+                "missed_heartbeats": self.missed_heartbeats,
+                "outages": self.outages
+            }
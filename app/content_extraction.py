@@ -0,0 +1,276 @@
+import logging
+import re
+from html.parser import HTMLParser
+
+logger = logging.getLogger('api')
+
+# 不产生块级结构的行内元素，其文字计入所在的文本块
+INLINE_TAGS = {
+    "a", "abbr", "b", "bdi", "bdo", "br", "cite", "code", "data", "del", "dfn", "em", "i", "ins",
+    "kbd", "mark", "q", "s", "samp", "small", "span", "strong", "sub", "sup", "time", "u", "var", "wbr"
+}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+    "source", "track", "wbr"
+}
+# 其中的文字不参与打分
+IGNORED_TAGS = {"script", "style", "noscript", "template", "head", "title"}
+# 可以作为正文容器的元素
+CANDIDATE_TAGS = {"article", "main", "section", "div", "td", "body", "blockquote"}
+# 正文容器内整块删除的元素
+BOILERPLATE_TAGS = {"nav", "aside", "footer", "form", "button", "iframe", "script", "style", "noscript", "template"}
+# 保留的非文字内容：含这些元素的块不会因为文字少而被删除
+MEDIA_TAGS = {"img", "picture", "figure", "video", "table", "pre"}
+
+POSITIVE_PATTERN = re.compile(r'article|content|main|post|entry|body|text|story|blog|prose|markdown', re.IGNORECASE)
+NEGATIVE_PATTERN = re.compile(
+    r'nav|menu|footer|header|sidebar|side-bar|comment|cookie|consent|banner|share|social|related|'
+    r'\bads?\b|advert|promo|sponsor|breadcrumb|popup|modal|subscribe|newsletter|toolbar|pagination|widget',
+    re.IGNORECASE
+)
+
+# 少于该字数的文本块不计分，避免按钮、标签等零散文字
+MIN_BLOCK_CHARS = 25
+# 选出的正文少于该字数时认为提取失败，返回完整页面
+MIN_CONTENT_CHARS = 200
+# 正文容器内链接文字占比超过该值、且非链接文字较少的块视为导航/链接列表
+MAX_LINK_DENSITY = 0.5
+MAX_LINK_LIST_CHARS = 200
+
+
+class Node:
+    __slots__ = (
+        "tag", "attrs", "parent", "children", "start", "end",
+        "own_text", "own_link_text", "text", "link_text", "tag_count", "has_media", "score"
+    )
+
+    def __init__(self, tag, attrs, parent, start):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.start = start
+        self.end = None
+        self.own_text = 0
+        self.own_link_text = 0
+        self.text = 0
+        self.link_text = 0
+        self.tag_count = 0
+        self.has_media = tag in MEDIA_TAGS
+        self.score = 0.0
+
+    def link_density(self):
+        return self.link_text / self.text if self.text else 0.0
+
+    def text_density(self):
+        """每个元素平均的文字数，导航和链接列表的文本密度很低"""
+        return self.text / (self.tag_count + 1)
+
+    def class_weight(self):
+        """根据标签、class、id 和 role 调整权重"""
+        names = f"{self.attrs.get('class') or ''} {self.attrs.get('id') or ''}"
+        weight = 1.0
+        if self.tag in ("article", "main") or self.attrs.get("role") == "main":
+            weight *= 1.5
+        if POSITIVE_PATTERN.search(names):
+            weight *= 1.25
+        if NEGATIVE_PATTERN.search(names) or self.tag in BOILERPLATE_TAGS:
+            weight *= 0.3
+        return weight
+
+
+class DomBuilder(HTMLParser):
+    """构建只记录源码位置和文字统计的轻量DOM树，输出时直接截取原始HTML"""
+
+    def __init__(self, html):
+        super().__init__(convert_charrefs=True)
+        self.html = html
+        self.line_offsets = [0]
+        for match in re.finditer('\n', html):
+            self.line_offsets.append(match.end())
+        self.root = Node("#root", {}, None, 0)
+        self.stack = [self.root]
+        self.nodes = []
+        self.link_depth = 0
+        self.ignored_depth = 0
+
+    def source_offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        start = self.source_offset()
+        node = Node(tag, dict(attrs), self.stack[-1], start)
+        self.stack[-1].children.append(node)
+        self.nodes.append(node)
+        if tag in VOID_TAGS:
+            node.end = start + len(self.get_starttag_text() or "")
+            return
+        self.stack.append(node)
+        if tag == "a":
+            self.link_depth += 1
+        if tag in IGNORED_TAGS:
+            self.ignored_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        start = self.source_offset()
+        node = Node(tag, dict(attrs), self.stack[-1], start)
+        node.end = start + len(self.get_starttag_text() or "")
+        self.stack[-1].children.append(node)
+        self.nodes.append(node)
+
+    def handle_endtag(self, tag):
+        if not any(node.tag == tag for node in self.stack[1:]):
+            return
+        start = self.source_offset()
+        closing = self.html.find('>', start)
+        end = closing + 1 if closing >= 0 else len(self.html)
+        # 未显式闭合的元素（如 <p>、<li>）在此处一并结束
+        while True:
+            node = self.stack.pop()
+            node.end = end if node.tag == tag else start
+            if node.tag == "a":
+                self.link_depth -= 1
+            if node.tag in IGNORED_TAGS:
+                self.ignored_depth -= 1
+            if node.tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.ignored_depth:
+            return
+        length = len(' '.join(data.split()))
+        if not length:
+            return
+        node = self.stack[-1]
+        node.own_text += length
+        if self.link_depth:
+            node.own_link_text += length
+
+    def close(self):
+        super().close()
+        for node in self.stack[1:]:
+            node.end = len(self.html)
+        self.root.end = len(self.html)
+
+
+def build_tree(html):
+    builder = DomBuilder(html)
+    builder.feed(html)
+    builder.close()
+
+    # 子节点总在父节点之后创建，倒序遍历即可自底向上汇总
+    for node in reversed(builder.nodes):
+        node.text += node.own_text
+        node.link_text += node.own_link_text
+        parent = node.parent
+        parent.text += node.text
+        parent.link_text += node.link_text
+        parent.tag_count += node.tag_count + 1
+        parent.has_media = parent.has_media or node.has_media
+    builder.root.text += builder.root.own_text
+    return builder.root, builder.nodes
+
+
+def score_blocks(nodes):
+    """文本块（元素自身及行内子元素的文字）按非链接文字量给父元素和祖父元素计分"""
+    for node in nodes:
+        if node.tag in INLINE_TAGS or node.tag in IGNORED_TAGS:
+            continue
+        inline_text = node.own_text
+        inline_links = node.own_link_text
+        for child in node.children:
+            if child.tag in INLINE_TAGS:
+                inline_text += child.text
+                inline_links += child.link_text
+        if inline_text < MIN_BLOCK_CHARS:
+            continue
+        contribution = inline_text - inline_links
+        if node.tag in CANDIDATE_TAGS:
+            node.score += contribution
+        parent = node.parent
+        if parent is not None:
+            parent.score += contribution
+            if parent.parent is not None:
+                parent.parent.score += contribution / 2
+
+
+def select_main_node(nodes):
+    best = None
+    best_score = 0.0
+    for node in nodes:
+        if node.tag not in CANDIDATE_TAGS or not node.score:
+            continue
+        score = node.score * (1 - node.link_density()) * node.class_weight()
+        if score > best_score:
+            best, best_score = node, score
+    return best
+
+
+def is_boilerplate(node):
+    """正文容器内需要删除的块：导航、页脚、分享栏、链接列表等"""
+    if node.tag in BOILERPLATE_TAGS:
+        return True
+    if node.tag in INLINE_TAGS or node.tag in VOID_TAGS:
+        return False
+    names = f"{node.attrs.get('class') or ''} {node.attrs.get('id') or ''}"
+    plain_text = node.text - node.link_text
+    if NEGATIVE_PATTERN.search(names) and not POSITIVE_PATTERN.search(names) and plain_text < MAX_LINK_LIST_CHARS * 2:
+        return True
+    if node.text and node.link_density() > MAX_LINK_DENSITY and plain_text < MAX_LINK_LIST_CHARS:
+        return True
+    # 文本密度很低且没有图片、表格、代码的块（空容器、图标栏）
+    return not node.has_media and node.text < MIN_BLOCK_CHARS and node.tag_count > 3 and node.text_density() < 2
+
+
+def extract_slices(html, node):
+    """截取节点的原始HTML，去掉其中的模板块"""
+    pieces = []
+    position = node.start
+
+    def visit(current):
+        nonlocal position
+        for child in current.children:
+            if is_boilerplate(child):
+                pieces.append(html[position:child.start])
+                position = child.end
+            else:
+                visit(child)
+
+    visit(node)
+    pieces.append(html[position:node.end])
+    return ''.join(pieces)
+
+
+def find_title_heading(nodes, main_node):
+    """正文容器外的第一个 h1（文章标题常放在页头）"""
+    inside = main_node
+    for node in nodes:
+        if node.tag != "h1" or not node.text:
+            continue
+        ancestor = node.parent
+        while ancestor is not None and ancestor is not inside:
+            ancestor = ancestor.parent
+        return None if ancestor is inside else node
+    return None
+
+
+def extract_main_content(html):
+    """按文本密度和链接密度选出正文所在的元素，返回只含正文的HTML；无法识别时返回原HTML"""
+    if not html:
+        return html
+    try:
+        root, nodes = build_tree(html)
+        score_blocks(nodes)
+        main_node = select_main_node(nodes)
+        if main_node is None or main_node.text - main_node.link_text < MIN_CONTENT_CHARS:
+            return html
+
+        content = extract_slices(html, main_node)
+        heading = find_title_heading(nodes, main_node)
+        if heading is not None:
+            content = html[heading.start:heading.end] + "\n" + content
+        return content
+    except Exception as e:
+        logger.warning(f"提取正文失败，使用完整页面: {str(e)}")
+        return html
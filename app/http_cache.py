@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# 小于该大小的响应（状态、错误等控制消息）不压缩，压缩开销大于节省的传输量
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# 已压缩响应体的缓存上限，重复读取同一结果时不再重新压缩
+COMPRESSED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只使用 gzip
+    brotli = None
+
+
+def json_body(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def content_etag(body):
+    """根据响应体内容计算强ETag"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match 是否包含该ETag；忽略弱校验前缀和压缩编码后缀，同一内容的任何编码都视为匹配"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    digest = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-", 1)[0] == digest:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding):
+    """按 Accept-Encoding 选择压缩方式，优先 br，其次 gzip；都不接受时返回 None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressedBodyCache:
+    """按 (ETag, 编码) 缓存压缩后的响应体，按LRU淘汰"""
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, etag, encoding, body):
+        key = (etag, encoding)
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            self.misses += 1
+        compressed = compress(body, encoding)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = compressed
+                self.total_bytes += len(compressed)
+                while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return compressed
+
+    def stats(self):
+        with self.lock:
+            return {
+                "count": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -5,20 +5,34 @@ import time
 import atexit
 import threading
 from datetime import datetime
-import uvicorn
-from starlette.applications import Starlette
-from starlette.routing import Route
 from typing import Dict
 import logging
 import os
 from logging.handlers import RotatingFileHandler
 import signal
 import asyncio
-from starlette.responses import JSONResponse
 import uuid
 import re
-import html2text
-import httpx
+import socket
+import codecs
+import concurrent.futures
+from contextlib import asynccontextmanager
+from markdown_sections import build_section_index, outline, read_section, read_page, DEFAULT_PAGE_BYTES
+from scheduler import Scheduler, SchedulerOverloaded, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
+from site_crawler import CrawlJob, parse_page, is_html, CRAWLER_USER_AGENT
+from content_extraction import extract_main_content
+from blob_store import BlobStore, offload_blobs, blob_response_headers, BLOB_SECURITY_HEADERS
+from traffic_recorder import create_recorder
+from http_cache import CompressedBodyCache, json_body, content_etag, etag_matches, negotiate_encoding, COMPRESS_MIN_BYTES
+from streaming_conversion import StreamingMarkdownConverter, create_html2text, collapse_newlines, iter_chunks, STREAM_CHUNK_CHARS
+from near_duplicates import DedupPageStore, DEDUP_ENABLED
+from structured_extraction import extract_structures, pack_numeric_columns, table_to_csv
+from profile_broker import ProfileBroker, BrokerMember, BROKER_ENABLED, MAX_RECONNECT_DELAY
+from connection_supervisor import (ConnectionSupervisor, ChannelClosed, channel_lost_message, channel_state_message,
+                                   describe_channel_loss)
+from cancellation import CancelToken, RequestCancelled, request_timeout, DEFAULT_REQUEST_TIMEOUT
+from prefetch import (PrefetchBudget, prefetch_config_message, prefetch_max_age, snapshot_request_id, snapshot_age,
+                      is_fresh, PREFETCH_ENABLED, PREFETCH_MAX_AGE, PREFETCH_MAX_PAGE_BYTES, PREFETCH_MAX_PAGES)
 
 # 配置日志
 def setup_logger():
@@ -73,50 +87,84 @@ def setup_logger():
 # 创建日志记录器
 logger, api_logger = setup_logger()
 
-# 读取来自 stdin 的消息并对其进行解码
+# API服务器就绪事件，由应用启动钩子设置；就绪后才向插件发送启动消息
+api_ready = threading.Event()
+
+# 原生消息录制器，设置 MARKDOWN_RECORD_PATH 时启用（独立进程模式下由原生消息桥录制）
+traffic_recorder = None
+
+# 读取来自 stdin 的消息并对其进行解码；stdin 已关闭（插件断开连接）时抛出 ChannelClosed
 def get_message():
     try:
         # 检查输入流是否可用
         if not hasattr(sys.stdin, 'buffer') or not sys.stdin.buffer.readable():
-            logger.error("输入流不可用")
-            time.sleep(1)
-            return None
+            raise ChannelClosed("输入流不可用")
             
+        # read 会阻塞到有数据为止，读到的数据不足时说明 stdin 已关闭
         raw_length = sys.stdin.buffer.read(4)
-        if not raw_length:
-            # 这是正常的无消息状态，使用最低级别的日志
-            logger.debug("等待新消息...", extra={"quiet": True})  # 添加extra参数用于过滤
-            time.sleep(1)  # 等待1秒后继续检查
-            return None
+        if len(raw_length) < 4:
+            raise ChannelClosed("stdin 已关闭")
         
         message_length = struct.unpack('=I', raw_length)[0]
-        message = sys.stdin.buffer.read(message_length).decode("utf-8")
+        body = sys.stdin.buffer.read(message_length)
+        if len(body) < message_length:
+            raise ChannelClosed("stdin 在消息中途关闭")
+        message = body.decode("utf-8")
         logger.debug(f"收到来自插件的消息: {message}")
-        return json.loads(message)
-    except struct.error as e:
-        logger.error(f"解析消息长度时出错: {str(e)}")
-        time.sleep(1)
-        return None
-    except json.JSONDecodeError as e:
+        message = json.loads(message)
+        if traffic_recorder is not None:
+            traffic_recorder.record("in", message, message_length + 4)
+        return message
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        # 整帧已读取，后续消息不受影响
         logger.error(f"解析JSON消息时出错: {str(e)}")
-        time.sleep(1)
-        return None
-    except Exception as e:
-        logger.error(f"读取消息时出错: {str(e)}")
-        time.sleep(1)
         return None
+    except OSError as e:
+        raise ChannelClosed(f"读取消息时出错: {str(e)}")
+
+# stdout 写锁，避免多个线程并发写入时消息帧交错
+stdout_lock = threading.Lock()
+
+# 独立进程模式下与原生消息桥（native_bridge.py）的IPC连接，消息经由桥转发给插件
+BRIDGE_ADDRESS = os.environ.get("MARKDOWN_BRIDGE_ADDRESS")
+bridge_connection = None
+
+# 多个浏览器共用一个API端口：占用端口的进程为代理（broker），按请求把消息交给各浏览器；
+# 其他进程为成员（broker_member），只在插件与代理之间转发消息
+broker = None
+broker_member = None
+
+# 本进程原生消息通道的监督（main() 中创建）；独立进程模式下通道状态由原生消息桥通知
+channel_supervisor = None
+channel_state = {"state": "connected", "reason": None}
+# 代理进程的浏览器断开后，等待其他浏览器（或插件重新连接时启动的新进程）注册的时间（秒），超时后退出并释放API端口
+ORPHAN_TIMEOUT = float(os.environ.get("MARKDOWN_ORPHAN_TIMEOUT", "30"))
 
 # 向 stdout 写入消息
 def send_message(encoded_message):
     try:
+        # 代理模式下发给其他浏览器的请求经由成员进程转发
+        if broker is not None and broker.send(encoded_message):
+            return True
+        if bridge_connection is not None:
+            with stdout_lock:
+                bridge_connection.send_bytes(encoded_message)
+            return True
+        # stdin 已关闭说明插件已断开，stdout 也不再有读取方
+        if channel_supervisor is not None and channel_supervisor.state == "closed":
+            return False
+
         # 检查输出流是否可用
         if not hasattr(sys.stdout, 'buffer') or not sys.stdout.buffer.writable():
             logger.error("输出流不可用")
             return False
     
         # 写入消息长度
-        sys.stdout.buffer.write(encoded_message)
-        sys.stdout.buffer.flush()
+        with stdout_lock:
+            sys.stdout.buffer.write(encoded_message)
+            sys.stdout.buffer.flush()
+        if traffic_recorder is not None:
+            traffic_recorder.record("out", encoded_message)
         return True
     except Exception as e:
         logger.error(f"发送消息时出错: {str(e)}")
@@ -181,52 +229,357 @@ def send_exit_message():
         logger.error(f"发送退出消息时出错: {str(e)}")
         print(f"发送退出消息时出错: {str(e)}", file=sys.stderr)
 
+# API服务监听地址；配置了Unix域套接字路径时同时监听该路径，TCP作为后备始终可用
+API_HOST = "127.0.0.1"
+API_PORT = int(os.environ.get("MARKDOWN_API_PORT", "8888"))
+API_UDS_PATH = os.environ.get("MARKDOWN_API_UDS")
+
+# MCP服务地址，配置了Unix域套接字路径且该路径存在时优先使用
+MCP_URL = os.environ.get("MARKDOWN_MCP_URL", "http://localhost:8014")
+MCP_UDS_PATH = os.environ.get("MARKDOWN_MCP_UDS")
+
+def uds_supported():
+    """当前平台是否支持Unix域套接字"""
+    return hasattr(socket, "AF_UNIX")
+
+def bind_unix_socket(path):
+    """绑定Unix域套接字，清理上次异常退出遗留的套接字文件"""
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, 0o600)  # 仅允许当前用户访问
+    return sock
+
+def bind_tcp_socket(host, port):
+    """绑定TCP套接字"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if sys.platform == "win32":
+        # Windows 上 SO_REUSEADDR 允许多个进程绑定同一端口，其他浏览器启动的本地程序需要能发现端口已被占用
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+def mcp_http_client(timeout=30.0):
+    """创建访问MCP服务的HTTP客户端，Unix域套接字可用时走本地套接字，否则回退到TCP"""
+    import httpx
+    
+    if MCP_UDS_PATH and uds_supported() and os.path.exists(MCP_UDS_PATH):
+        return httpx.Client(timeout=timeout, transport=httpx.HTTPTransport(uds=MCP_UDS_PATH))
+    return httpx.Client(timeout=timeout)
+
 # 全局回调字典
 callbacks = {}
 
-# 全局存储字典，用于存储页面源码及转换结果
-page_sources = {}
+# 多个API工作进程共用的状态目录（页面数据、全文索引、内嵌资源），未设置时保存在进程内存中
+STATE_DIR = os.environ.get("MARKDOWN_STATE_DIR")
+
+# 全局存储字典，用于存储页面源码及转换结果；进程内存储时近似重复的页面只保存相对规范版本的差异
+if STATE_DIR:
+    from page_store import SQLitePageStore
+    page_sources = SQLitePageStore(os.path.join(STATE_DIR, "page_sources.db"))
+else:
+    page_sources = DedupPageStore() if DEDUP_ENABLED else {}
+
+# 已获取页面的全文索引，在后台线程中增量更新；首次保存或搜索页面时创建（打开数据库并启动索引线程）
+_search_index = None
+# 首次使用时创建的对象（全文索引、内存分配跟踪）共用的创建锁
+_lazy_init_lock = threading.Lock()
+
+def get_search_index():
+    """获取全文索引，首次使用时创建"""
+    global _search_index
+    with _lazy_init_lock:
+        if _search_index is None:
+            from search_index import SearchIndex
+            _search_index = SearchIndex(os.path.join(STATE_DIR, "search_index.db") if STATE_DIR else ":memory:")
+        return _search_index
+
+# 各类后台工作的并发上限：(工作线程数, 队列容量)
+SCHEDULER_LIMITS = {
+    "extension": (8, 64),  # 等待插件往返
+    "fetch": (8, 64),  # 对外HTTP请求
+    "convert": (2, 32)  # HTML转Markdown，CPU密集且受GIL限制
+}
+scheduler = Scheduler(SCHEDULER_LIMITS)
+
+# 由调用方自行转换的请求ID，收到源码时不再启动后台转换
+inline_conversion_requests = set()
+
+async def run_scheduled(work_class, fn, *args, priority=PRIORITY_NORMAL):
+    """在调度器中执行任务并异步等待结果，队列已满时抛出 SchedulerOverloaded"""
+    return await asyncio.wrap_future(scheduler.submit(work_class, fn, *args, priority=priority))
+
+def overloaded_response(error, **extra):
+    """过载时返回429，并通过Retry-After告知客户端等待时间"""
+    from starlette.responses import JSONResponse
+    api_logger.warning(f"请求被拒绝: {str(error)}")
+    return JSONResponse({
+        "status": "overloaded",
+        "message": str(error),
+        "work_class": error.work_class,
+        "retry_after": error.retry_after,
+        **extra
+    }, status_code=429, headers={"Retry-After": str(error.retry_after)})
+
+# Markdown结果响应的压缩缓存，重复读取同一结果时不再重新压缩
+compressed_bodies = CompressedBodyCache()
+# 大于该大小的响应体交给转换工作队列压缩，不阻塞事件循环
+COMPRESS_OFFLOAD_BYTES = 256 * 1024
+
+async def markdown_json_response(request, payload, headers=None):
+    """返回带强ETag的JSON响应：If-None-Match 匹配时返回304，客户端接受时压缩较大的响应体"""
+    from starlette.responses import Response
+    body = json_body(payload)
+    etag = content_etag(body)
+    # 同一请求ID的内容可能被重新转换，客户端每次都需要用ETag确认
+    headers = {**(headers or {}), "ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        try:
+            if len(body) >= COMPRESS_OFFLOAD_BYTES:
+                body = await run_scheduled("convert", compressed_bodies.get_or_compress, etag, encoding, body, priority=PRIORITY_INTERACTIVE)
+            else:
+                body = compressed_bodies.get_or_compress(etag, encoding, body)
+            headers["Content-Encoding"] = encoding
+            # 不同编码的表示使用不同的强ETag
+            headers["ETag"] = f'"{etag[1:-1]}-{encoding}"'
+        except SchedulerOverloaded:
+            api_logger.warning("转换队列已满，响应不压缩")
+    return Response(body, media_type="application/json", headers=headers)
+
+def send_cancel(request_id, reason):
+    """通知插件放弃该请求：停止抓取页面，已取得的源码不再回传"""
+    logger.info(f"通知插件取消请求，ID: {request_id}, 原因: {reason}")
+    send_message(encode_message({"type": "cancel_request", "request_id": request_id, "reason": reason}))
+
+async def wait_disconnected(request):
+    """等待客户端断开连接（请求体读取完毕后调用）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def cancellable(request, token, awaitable):
+    """等待 awaitable 完成；客户端断开或超过截止时间时取消该工作并抛出 RequestCancelled"""
+    work = asyncio.ensure_future(awaitable)
+    disconnected = asyncio.ensure_future(wait_disconnected(request))
+    try:
+        await asyncio.wait({work, disconnected}, timeout=token.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        if work.done():
+            return work.result()
+        # 工作线程中等待插件的部分由取消回调唤醒；尚在队列中的任务不会再执行
+        token.cancel("disconnected" if disconnected.done() else "deadline")
+        work.cancel()
+        raise RequestCancelled(token.reason)
+    finally:
+        disconnected.cancel()
+
+def cancelled_response(error, **extra):
+    """请求被取消：超过截止时间时返回超时错误，客户端已断开时的响应不会被读取"""
+    from starlette.responses import JSONResponse
+    if error.reason == "deadline":
+        api_logger.warning(f"请求超过截止时间: {extra}")
+        return JSONResponse({"status": "timeout", "message": "请求超过截止时间", **extra},
+                            status_code=failure_status_code("timeout"))
+    api_logger.info(f"客户端已断开，停止处理: {extra}")
+    return JSONResponse({"status": "cancelled", "message": "客户端已断开", **extra}, status_code=499)
+
+def assign_browser(request_id, request_type, body, tab_id=None):
+    """代理模式下按请求中的 profile、window_id 选择浏览器，返回响应中附带的配置文件字段（单浏览器时为空）
+
+    没有匹配的浏览器时抛出 LookupError。
+    """
+    if broker is None:
+        return {}
+    return {"profile": broker.assign(request_id, request_type, body.get("profile"), body.get("window_id"), tab_id)}
+
+def release_browser(request_id):
+    """请求未发出时释放已选择的浏览器"""
+    if broker is not None:
+        broker.finish(request_id)
+
+def no_browser_response(error, **extra):
+    from starlette.responses import JSONResponse
+    api_logger.warning(f"没有匹配的浏览器: {str(error)}")
+    if not broker.browsers():
+        # 所有浏览器都已断开（或插件无响应）
+        return JSONResponse({"status": "disconnected", "message": str(error), **extra}, status_code=503)
+    return JSONResponse({"status": "error", "message": str(error), **extra}, status_code=404)
+
+def failure_status_code(status):
+    """插件往返失败时的HTTP状态码：超时 504，插件连接不可用 503"""
+    return {"timeout": 504, "disconnected": 503}.get(status, 500)
+
+def channel_unavailable(request_id):
+    """原生消息通道已断开或插件无响应时返回失败结果（不发送请求，也不等待超时），否则返回 None
+
+    代理模式下由代理按浏览器的通道状态选择浏览器。
+    """
+    if broker is not None or channel_state["state"] == "connected":
+        return None
+    return {
+        "status": "disconnected",
+        "message": f"插件连接不可用: {describe_channel_loss(channel_state['reason'])}",
+        "request_id": request_id
+    }
+
+def fail_inflight_requests(reason):
+    """通道断开：所有等待插件响应的请求立即结束"""
+    pending = list(callbacks.items())
+    if pending:
+        logger.warning(f"插件连接不可用，结束进行中的请求: {len(pending)}, 原因: {describe_channel_loss(reason)}")
+    for request_id, callback in pending:
+        try:
+            callback(channel_lost_message(request_id, reason))
+        except Exception as e:
+            logger.error(f"结束请求时出错: {str(e)}, ID: {request_id}")
+
+def set_channel_state(state, reason=None):
+    """原生消息通道状态变化（本进程的监督、原生消息桥或代理成员通知）"""
+    logger.log(logging.INFO if state == "connected" else logging.WARNING,
+               f"插件连接状态: {state}" + (f", 原因: {describe_channel_loss(reason)}" if reason else ""))
+    if broker is not None:
+        # 代理模式下只影响该浏览器：不再为其分配请求，进行中的请求立即结束
+        broker.set_available(broker.current(), state == "connected", reason)
+        return
+    channel_state.update(state=state, reason=reason)
+    if state != "connected":
+        fail_inflight_requests(reason)
+
+def channel_status():
+    """原生消息通道的状态：本进程监督的统计，或原生消息桥通知的状态"""
+    if channel_supervisor is not None:
+        return channel_supervisor.stats()
+    return dict(channel_state)
+
+# 站点抓取任务的断点目录，以及正在运行的任务ID（同一任务不能同时运行两次）
+CRAWL_CHECKPOINT_DIR = os.environ.get("MARKDOWN_CRAWL_DIR", "crawl_jobs")
+CRAWL_JOB_ID_PATTERN = re.compile(r'^crawl_[0-9a-f]{8}$')
+active_crawls = set()
+
+# 页面中内嵌的 data: URI 和大型内联SVG移入按内容去重的存储，页面中只保留引用URL
+blob_store = BlobStore(directory=os.path.join(STATE_DIR, "blobs") if STATE_DIR else None)
+BLOB_URL_PREFIX = f"http://{API_HOST}:{API_PORT}/api/blob/"
+
+def offload_page_blobs(html_content, request_id=None):
+    """把页面中内嵌的二进制内容移入 blob_store，返回替换后的HTML"""
+    try:
+        html_content, saved = offload_blobs(html_content, blob_store, BLOB_URL_PREFIX)
+        if saved:
+            api_logger.info(f"已移出内嵌资源 {saved} 字节，ID: {request_id}, 剩余源码长度: {len(html_content)}")
+    except Exception as e:
+        api_logger.error(f"移出内嵌资源时出错: {str(e)}, ID: {request_id}")
+    return html_content
+
+# 标签页元数据缓存，由插件上报的标签页列表更新
+tab_registry = {
+    "tabs": {},
+    "updated_time": None
+}
+
+# 预取模式下插件最近上报的当前标签页快照（"current"）和保留的预取页面ID（"pages"），多个工作进程共用
+if STATE_DIR:
+    from page_store import SQLitePageStore
+    prefetch_index = SQLitePageStore(os.path.join(STATE_DIR, "prefetch.db"))
+else:
+    prefetch_index = {}
+# 本进程预转换占用的CPU时间
+prefetch_budget = PrefetchBudget()
+# 更新当前快照时持有，保证较早的快照不会在保存完成后覆盖更新的快照
+prefetch_lock = threading.Lock()
+
+# 未指定 main_content 参数时是否只保留正文（去掉导航、侧栏、页脚等）
+MAIN_CONTENT_DEFAULT = os.environ.get("MARKDOWN_MAIN_CONTENT", "").lower() in ("1", "true", "yes")
+
+def wants_main_content(body, default=MAIN_CONTENT_DEFAULT):
+    """读取请求中的 main_content 参数"""
+    value = body.get("main_content")
+    return default if value is None else bool(value)
 
 # 转换HTML为Markdown
-def convert_html_to_markdown(html_content):
-    """将HTML内容转换为Markdown格式"""
+def convert_html_to_markdown(html_content, main_content=False):
+    """将HTML内容转换为Markdown格式，main_content 为真时先提取正文"""
     try:
-        # 创建html2text转换器实例
-        converter = html2text.HTML2Text()
-        # 配置转换器
-        converter.ignore_links = False
-        converter.ignore_images = False
-        converter.body_width = 0  # 不限制宽度
-        converter.protect_links = True  # 保护链接
-        converter.unicode_snob = True  # 正确处理Unicode字符
-        converter.single_line_break = True  # 使用单行换行
+        # 与已保存页面的源码完全相同时（如重复获取未变化的页面）直接复用转换结果
+        if isinstance(page_sources, DedupPageStore):
+            markdown = page_sources.converted_markdown(html_content, main_content)
+            if markdown is not None:
+                return markdown
+        
+        if main_content:
+            html_content = extract_main_content(html_content)
+        
+        # 创建html2text转换器实例（与流式转换使用相同的配置）
+        converter = create_html2text()
         
         # 转换HTML为Markdown
         markdown = converter.handle(html_content)
         
         # 一些简单的清理
         # 减少多余空行
-        markdown = re.sub(r'\n{3,}', '\n\n', markdown)
+        markdown = collapse_newlines(markdown)
         
         return markdown
     except Exception as e:
         api_logger.error(f"HTML转Markdown转换失败: {str(e)}")
         return f"转换失败: {str(e)}"
 
+def store_markdown(request_id, markdown, main_content=False, page_data=None, **fields):
+    """保存转换后的Markdown，并在转换时建立标题/章节索引；fields 为同时更新的其他字段
+
+    page_data 为新获取的页面数据（替换已保存的数据），未提供时更新已保存的页面。
+    去重存储在写入时计算指纹和差异，较慢：在事件循环中需通过 run_scheduled("convert", ...) 调用。
+    """
+    page_data = page_sources.get(request_id, {}) if page_data is None else page_data
+    page_data.update(fields)
+    page_data["sections"] = build_section_index(markdown)
+    page_data["markdown"] = markdown
+    page_data["main_content"] = main_content
+    page_data["markdown_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # 共享存储中读到的是副本，需要写回
+    page_sources[request_id] = page_data
+    
+    # 提交到全文索引队列，索引在后台线程中更新，不阻塞当前请求
+    headings = [section["title"] for section in page_data["sections"] if section["level"] > 0]
+    title = page_data.get("title") or (headings[0] if headings else "")
+    get_search_index().submit(request_id, page_data.get("url", ""), title, markdown)
+    return page_data
+
 async def handle_index(request):
     """处理首页请求"""
+    from starlette.responses import JSONResponse
     return JSONResponse({
         "message": "本地消息推送服务已启动",
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "endpoints": {
             "发送通知": "/api/send-notification",
             "获取页面源码": "/api/get-page-source",
-            "获取Markdown格式": "/api/get-webpage-markdown"
+            "获取Markdown格式": "/api/get-webpage-markdown",
+            "列出标签页": "/api/list-tabs",
+            "并发获取多个标签页": "/api/capture-tabs",
+            "Markdown目录": "/api/markdown-outline",
+            "Markdown章节": "/api/markdown-section",
+            "Markdown分页": "/api/markdown-page",
+            "全文搜索": "/api/search",
+            "规范版本": "/api/canonical-capture",
+            "表格和代码块": "/api/extract-structured",
+            "站点抓取": "/api/crawl-site",
+            "调度状态": "/api/scheduler-stats",
+            "已连接的浏览器": "/api/browsers",
+            "内存统计": "/api/admin/memory",
+            "分配跟踪": "/api/admin/tracemalloc"
         }
     })
 
 async def handle_send_notification(request):
     """处理发送通知请求"""
+    from starlette.responses import JSONResponse
     try:
         body = await request.json()
         message = body.get("message")
@@ -260,6 +613,7 @@ async def handle_send_notification(request):
 
 async def handle_get_page_source(request):
     """处理获取页面源码请求"""
+    from starlette.responses import JSONResponse
     try:
         body = await request.json()
         request_id = body.get("request_id")
@@ -276,6 +630,17 @@ async def handle_get_page_source(request):
             "request_id": request_id,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+        # 指定窗口时获取该窗口的当前标签页
+        if body.get("window_id") is not None:
+            request_message["window_id"] = body["window_id"]
+        try:
+            browser = assign_browser(request_id, "get_page_source", body)
+        except LookupError as e:
+            return no_browser_response(e, request_id=request_id)
+        unavailable = channel_unavailable(request_id)
+        if unavailable is not None:
+            release_browser(request_id)
+            return JSONResponse(unavailable, status_code=503)
         
         # 创建事件用于等待响应
         response_event = threading.Event()
@@ -287,54 +652,65 @@ async def handle_get_page_source(request):
                 response_data["response"] = message
                 response_event.set()
         
-        # 注册回调
-        callbacks[request_id] = handle_response
-        
-        # 通过标准输出发送消息到插件
-        encoded_msg = encode_message(request_message)
-        if not encoded_msg:
-            return JSONResponse({
-                "status": "error",
-                "message": "请求消息编码失败",
-                "request_id": request_id
-            }, status_code=500)
-            
-        send_result = send_message(encoded_msg)
-        
-        if not send_result:
-            return JSONResponse({
-                "status": "error", 
-                "message": "页面源码请求发送失败", 
-                "request_id": request_id
-            }, status_code=500)
-        
         # 创建一个后台任务来处理长时间等待的响应
         def wait_for_response():
             try:
                 # 等待响应，最多等待60秒
-                if response_event.wait(60):  # 修改超时时间为60秒
+                if response_event.wait(60) and response_data["response"] is not None:  # 修改超时时间为60秒
                     response = response_data["response"]
+                    if response.get("type") == "channel_lost":
+                        api_logger.error(f"{response['error']}，ID: {request_id}")
+                        if page_sources.get(request_id, {}).get("status") == "pending":
+                            del page_sources[request_id]
+                        return
                     # 处理响应，可以保存到文件或执行其他操作
                     api_logger.info(f"收到页面源码响应，ID: {request_id}, URL: {response.get('url', '未知')}, 源码长度: {len(response.get('source_code', ''))}")
                 else:
                     api_logger.error(f"等待页面源码响应超时，ID: {request_id}")
+                    if page_sources.get(request_id, {}).get("status") == "pending":
+                        del page_sources[request_id]
             except Exception as e:
                 api_logger.error(f"处理页面源码响应时出错: {str(e)}")
             finally:
                 # 清理回调
                 if request_id in callbacks:
                     del callbacks[request_id]
-                    
-        # 启动后台线程
-        bg_thread = threading.Thread(target=wait_for_response)
-        bg_thread.daemon = True
-        bg_thread.start()
+        
+        # 注册回调
+        callbacks[request_id] = handle_response
+        # 多个工作进程时查询结果的请求可能由其他进程处理，通过共享存储标记请求仍在处理中（单进程时由回调判断）
+        if STATE_DIR:
+            page_sources[request_id] = {"status": "pending"}
+        
+        # 先占用插件往返的工作槽位，过载时不再向插件发送请求
+        try:
+            scheduler.submit("extension", wait_for_response, priority=PRIORITY_NORMAL)
+        except SchedulerOverloaded as e:
+            callbacks.pop(request_id, None)
+            page_sources.pop(request_id, None)
+            release_browser(request_id)
+            return overloaded_response(e, request_id=request_id)
+        
+        # 通过标准输出发送消息到插件
+        encoded_msg = encode_message(request_message)
+        send_result = send_message(encoded_msg) if encoded_msg else False
+        
+        if not send_result:
+            # 唤醒等待任务，释放工作槽位
+            response_event.set()
+            release_browser(request_id)
+            return JSONResponse({
+                "status": "error", 
+                "message": "页面源码请求发送失败", 
+                "request_id": request_id
+            }, status_code=500)
         
         # 立即返回请求已接收的响应
         return JSONResponse({
             "status": "pending",
             "message": "页面源码请求已发送，等待响应",
-            "request_id": request_id
+            "request_id": request_id,
+            **browser
         })
             
     except Exception as e:
@@ -347,6 +723,7 @@ async def handle_get_page_source(request):
 
 async def handle_page_source_result(request):
     """获取页面源码结果"""
+    from starlette.responses import JSONResponse
     try:
         body = await request.json()
         request_id = body.get("request_id")
@@ -358,14 +735,14 @@ async def handle_page_source_result(request):
             }, status_code=400)
             
         # 检查是否有结果可用
-        if request_id in callbacks:
+        page_data = page_sources.get(request_id)
+        if request_id in callbacks or (page_data and page_data.get("status") == "pending"):
             return JSONResponse({
                 "status": "pending",
                 "message": "页面源码请求仍在处理中"
             })
-        elif request_id in page_sources:
+        elif page_data is not None:
             # 从存储中获取结果
-            page_data = page_sources[request_id]
             return JSONResponse({
                 "status": "success",
                 "message": "页面源码请求已完成",
@@ -391,9 +768,12 @@ async def handle_page_source_result(request):
 
 async def handle_get_markdown(request):
     """获取页面源码的Markdown格式"""
+    from starlette.responses import JSONResponse
     try:
         body = await request.json()
         request_id = body.get("request_id")
+        # 未指定时沿用已有的转换结果
+        main_content = body.get("main_content")
         
         if not request_id:
             return JSONResponse({
@@ -401,18 +781,26 @@ async def handle_get_markdown(request):
                 "message": "缺少请求ID"
             }, status_code=400)
             
-        # 检查是否有结果可用
-        if request_id in page_sources:
-            page_data = page_sources[request_id]
-            
-            # 检查是否已经有转换过的markdown
-            if "markdown" not in page_data:
+        # 检查是否有结果可用；仍在获取中的请求（共享存储中的 pending 标记）与不存在时相同
+        page_data = page_sources.get(request_id)
+        if page_data is not None and page_data.get("status") != "pending":
+            # 检查是否已经有符合要求的markdown
+            if not has_markdown(page_data, main_content):
                 # 如果没有转换过，就现在转换
                 html_content = page_data.get("source_code", "")
                 if html_content:
-                    markdown = convert_html_to_markdown(html_content)
-                    page_data["markdown"] = markdown
-                    page_data["markdown_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    try:
+                        page_data = await run_scheduled("convert", get_markdown_page_data, request_id, main_content, page_data,
+                                                       priority=PRIORITY_INTERACTIVE)
+                    except SchedulerOverloaded as e:
+                        return overloaded_response(e, request_id=request_id)
+                elif page_data.get("status") == "timeout":
+                    # 直接获取网页时超过了截止时间
+                    return JSONResponse({
+                        "status": "timeout",
+                        "message": page_data.get("error", "请求超过截止时间"),
+                        "request_id": request_id
+                    }, status_code=failure_status_code("timeout"))
                 else:
                     return JSONResponse({
                         "status": "error",
@@ -420,13 +808,14 @@ async def handle_get_markdown(request):
                     }, status_code=400)
             
             # 返回markdown结果
-            return JSONResponse({
+            return await markdown_json_response(request, {
                 "status": "success",
                 "message": "成功获取Markdown内容",
                 "request_id": request_id,
                 "url": page_data.get("url", "unknown"),
                 "markdown_length": len(page_data["markdown"]),
                 "markdown_time": page_data.get("markdown_time"),
+                "main_content": page_data.get("main_content", False),
                 "markdown": page_data["markdown"]
             })
         else:
@@ -444,60 +833,142 @@ async def handle_get_markdown(request):
             "message": error_msg
         }, status_code=500)
 
+# 直接获取网页时使用的请求头
+FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+def fetch_html(url, token):
+    """获取网页源码（在获取工作线程中执行），返回 (状态码, HTML)；按块读取，超过截止时间时抛出 RequestCancelled"""
+    import httpx
+    
+    token.check()
+    with httpx.Client(timeout=min(30.0, token.remaining(30.0)), follow_redirects=True) as client:
+        with client.stream("GET", url, headers=FETCH_HEADERS) as response:
+            chunks = []
+            for chunk in response.iter_bytes():
+                token.check()
+                chunks.append(chunk)
+            return response.status_code, b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+
+def fetch_and_store(url, request_id, token):
+    """获取网页，移出内嵌资源后按请求ID保存源码（在获取工作线程中执行），返回 (状态码, 保存的源码)；状态码不为200时不保存"""
+    status_code, html_content = fetch_html(url, token)
+    if status_code != 200:
+        return status_code, None
+    html_content = offload_page_blobs(html_content, request_id)
+    page_sources[request_id] = {
+        "url": url,
+        "source_code": html_content,
+        "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "completed"
+    }
+    return status_code, html_content
+
+def stream_fetch(url, request_id, token, put):
+    """流式获取网页，解码后的HTML片段交给 put（在获取工作线程中执行，超过截止时间或客户端断开时中止）"""
+    try:
+        token.check()
+        api_logger.info(f"开始流式获取网页，ID: {request_id}, URL: {url}")
+        import httpx
+        
+        with httpx.Client(timeout=min(30.0, token.remaining(30.0)), follow_redirects=True) as client:
+            with client.stream("GET", url, headers=FETCH_HEADERS) as response:
+                if response.status_code != 200:
+                    put({"error": f"获取网页失败，状态码: {response.status_code}"})
+                    return
+                # 多字节字符可能被分在两个网络块中
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                for chunk in response.iter_bytes():
+                    token.check()
+                    text = decoder.decode(chunk)
+                    if text:
+                        put({"data": text, "done": False})
+                put({"data": decoder.decode(b"", final=True), "done": True})
+    except RequestCancelled as e:
+        api_logger.warning(f"流式获取网页已中止，ID: {request_id}, 原因: {e.reason}")
+        put({"error": "获取网页超过截止时间", "status": "timeout"})
+    except Exception as e:
+        api_logger.error(f"流式获取网页时出错: {str(e)}, ID: {request_id}")
+        put({"error": f"获取网页时出错: {str(e)}"})
+
 async def handle_get_webpage_markdown(request):
     """直接获取网页并转换为Markdown"""
+    from starlette.responses import JSONResponse
     try:
         body = await request.json()
         url = body.get("url")
+        main_content = wants_main_content(body)
         
         if not url:
             return JSONResponse({
                 "status": "error",
                 "message": "请提供网页URL"
             }, status_code=400)
+        # 指定截止时间后，超时的获取中止，尚未开始的转换跳过（源码保留，读取时再按需转换）
+        try:
+            token = CancelToken(request_timeout(request.headers, body, default=None))
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
             
         # 生成一个请求ID
         request_id = f"md_{uuid.uuid4().hex[:8]}"
         api_logger.info(f"收到直接获取网页Markdown请求，ID: {request_id}, URL: {url}")
+        
+        # stream 为真时边下载边转换，以NDJSON逐段返回Markdown
+        if body.get("stream"):
+            loop = asyncio.get_running_loop()
+            chunks = asyncio.Queue()
+            put = lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item)
+            try:
+                scheduler.submit("fetch", stream_fetch, url, request_id, token, put, priority=PRIORITY_NORMAL)
+            except SchedulerOverloaded as e:
+                return overloaded_response(e, url=url)
+            return streaming_markdown_response(request_id, url, chunks, token, main_content)
             
+        def convert_fetched(html_content):
+            try:
+                token.check()
+                api_logger.info(f"开始转换为Markdown，ID: {request_id}")
+                markdown = convert_html_to_markdown(html_content, main_content)
+                store_markdown(request_id, markdown, main_content, status="success")
+                api_logger.info(f"网页已转换为Markdown，ID: {request_id}, Markdown长度: {len(markdown)}")
+            except RequestCancelled:
+                api_logger.warning(f"已超过截止时间，跳过转换，ID: {request_id}")
+            except Exception as e:
+                api_logger.error(f"转换网页时出错: {str(e)}, ID: {request_id}")
+        
         # 创建一个后台任务来获取网页并转换
         def fetch_and_convert():
             try:
+                # 在队列中等待期间已超过截止时间的请求不再获取
+                token.check()
                 api_logger.info(f"开始获取网页，ID: {request_id}, URL: {url}")
                 
-                # 使用httpx获取网页内容
-                with httpx.Client(timeout=30.0, follow_redirects=True) as client:
-                    response = client.get(url, headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    })
-                    
-                    if response.status_code != 200:
-                        api_logger.error(f"获取网页失败，状态码: {response.status_code}, ID: {request_id}")
-                        page_sources[request_id] = {
-                            "url": url,
-                            "error": f"获取网页失败，状态码: {response.status_code}",
-                            "status": "error"
-                        }
-                        return
-                    
-                    html_content = response.text
-                    
-                    # 保存网页源码
+                status_code, html_content = fetch_and_store(url, request_id, token)
+                if status_code != 200:
+                    api_logger.error(f"获取网页失败，状态码: {status_code}, ID: {request_id}")
                     page_sources[request_id] = {
                         "url": url,
-                        "source_code": html_content,
-                        "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "status": "completed"
+                        "error": f"获取网页失败，状态码: {status_code}",
+                        "status": "error"
                     }
+                    return
                     
-                    # 转换为Markdown
-                    api_logger.info(f"开始转换为Markdown，ID: {request_id}")
-                    markdown = convert_html_to_markdown(html_content)
-                    page_sources[request_id]["markdown"] = markdown
-                    page_sources[request_id]["markdown_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    page_sources[request_id]["status"] = "success"
-                    api_logger.info(f"网页已转换为Markdown，ID: {request_id}, Markdown长度: {len(markdown)}")
+                # 转换交给转换工作队列，获取线程立即释放
+                try:
+                    scheduler.submit("convert", convert_fetched, html_content, priority=PRIORITY_BULK)
+                except SchedulerOverloaded:
+                    # 转换队列已满，保留源码，读取时再按需转换
+                    api_logger.warning(f"转换队列已满，稍后按需转换，ID: {request_id}")
                     
+            except RequestCancelled:
+                api_logger.warning(f"获取网页超过截止时间，ID: {request_id}, URL: {url}")
+                page_sources[request_id] = {
+                    "url": url,
+                    "error": "获取网页超过截止时间",
+                    "status": "timeout"
+                }
             except Exception as e:
                 error_msg = f"获取并转换网页时出错: {str(e)}"
                 api_logger.error(error_msg)
@@ -507,10 +978,11 @@ async def handle_get_webpage_markdown(request):
                     "status": "error"
                 }
                 
-        # 启动后台线程
-        bg_thread = threading.Thread(target=fetch_and_convert)
-        bg_thread.daemon = True
-        bg_thread.start()
+        # 批量URL转换使用低优先级，不影响当前标签页等交互请求
+        try:
+            scheduler.submit("fetch", fetch_and_convert, priority=PRIORITY_BULK)
+        except SchedulerOverloaded as e:
+            return overloaded_response(e, url=url)
         
         # 立即返回请求已接收的响应
         return JSONResponse({
@@ -546,6 +1018,29 @@ def handle_page_source_response(message):
             
         api_logger.info(f"收到页面源码响应，ID: {request_id}, URL: {url}, 源码长度: {len(source_code)}")
         
+        # 移出内嵌资源、保存源码在转换工作队列中进行，不阻塞读取插件消息的线程（心跳和其他响应）；
+        # 有请求在等待时使用交互优先级
+        priority = PRIORITY_INTERACTIVE if request_id in callbacks else PRIORITY_BULK
+        try:
+            scheduler.submit("convert", receive_page_source, message, priority=priority)
+        except SchedulerOverloaded:
+            api_logger.warning(f"转换队列已满，在当前线程保存页面源码，ID: {request_id}")
+            receive_page_source(message)
+        return True
+        
+    except Exception as e:
+        api_logger.error(f"处理页面源码响应时出错: {str(e)}")
+        return False
+
+def receive_page_source(message):
+    """保存插件返回的页面源码、提交后台转换，并交给等待该请求的回调"""
+    request_id = message["request_id"]
+    url = message.get("url", "未知URL")
+    try:
+        # 内嵌图片、字体等移入内容存储，保存和回调的都是替换后的源码
+        source_code = offload_page_blobs(message["source_code"], request_id)
+        message["source_code"] = source_code
+        
         # 保存页面源码到全局存储中
         page_sources[request_id] = {
             "url": url,
@@ -556,29 +1051,28 @@ def handle_page_source_response(message):
         # 预先转换为Markdown（在后台线程中进行）
         def convert_in_background():
             try:
-                markdown = convert_html_to_markdown(source_code)
-                page_sources[request_id]["markdown"] = markdown
-                page_sources[request_id]["markdown_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                markdown = convert_html_to_markdown(source_code, MAIN_CONTENT_DEFAULT)
+                store_markdown(request_id, markdown, MAIN_CONTENT_DEFAULT)
                 api_logger.info(f"页面源码已转换为Markdown，ID: {request_id}, Markdown长度: {len(markdown)}")
             except Exception as e:
                 api_logger.error(f"后台转换Markdown时出错: {str(e)}")
         
-        # 启动转换线程
-        convert_thread = threading.Thread(target=convert_in_background)
-        convert_thread.daemon = True
-        convert_thread.start()
-        
-        # 调用回调函数
-        if request_id in callbacks:
-            callbacks[request_id](message)
-            return True
-        else:
-            api_logger.warning(f"收到页面源码响应，但没有对应的回调函数，ID: {request_id}")
-            return False
-        
+        # 调用方会自行转换时跳过后台转换
+        if request_id not in inline_conversion_requests:
+            try:
+                scheduler.submit("convert", convert_in_background, priority=PRIORITY_BULK)
+            except SchedulerOverloaded:
+                api_logger.warning(f"转换队列已满，跳过后台转换，ID: {request_id}")
     except Exception as e:
-        api_logger.error(f"处理页面源码响应时出错: {str(e)}")
-        return False
+        api_logger.error(f"保存页面源码时出错: {str(e)}, ID: {request_id}")
+    
+    # 调用回调函数
+    callback = callbacks.get(request_id)
+    if callback is not None:
+        callback(message)
+        return True
+    api_logger.warning(f"收到页面源码响应，但没有对应的回调函数，ID: {request_id}")
+    return False
 
 def handle_set_active_page(message):
     """处理从插件发送的设置活跃页面请求"""
@@ -600,9 +1094,7 @@ def handle_set_active_page(message):
         # 向MCP服务器发送设置活跃页面请求
         try:
             # 使用httpx发送POST请求到MCP服务器
-            import httpx
-            
-            set_page_url = "http://localhost:8014/messages/"
+            set_page_url = f"{MCP_URL}/messages/"
             payload = {
                 "type": "function_call",
                 "id": str(uuid.uuid4()),
@@ -617,7 +1109,7 @@ def handle_set_active_page(message):
             # 异步发送请求
             def send_request():
                 try:
-                    with httpx.Client(timeout=30.0) as client:
+                    with mcp_http_client(timeout=30.0) as client:
                         response = client.post(set_page_url, json=payload)
                         if response.status_code != 202:
                             logger.error(f"MCP服务器返回错误状态码: {response.status_code}")
@@ -649,10 +1141,19 @@ def handle_set_active_page(message):
                     send_message(encode_message(error_message))
                     return False
             
-            # 启动一个线程来发送请求
-            thread = threading.Thread(target=send_request)
-            thread.daemon = True
-            thread.start()
+            # 用户点击插件触发，使用交互优先级
+            try:
+                scheduler.submit("fetch", send_request, priority=PRIORITY_INTERACTIVE)
+            except SchedulerOverloaded as e:
+                logger.error(f"设置活跃页面请求被拒绝: {str(e)}")
+                send_message(encode_message({
+                    "type": "active_page_set",
+                    "url": url,
+                    "status": "error",
+                    "error": str(e),
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                }))
+                return False
             
             return True
             
@@ -664,6 +1165,127 @@ def handle_set_active_page(message):
         logger.error(f"处理设置活跃页面请求时出错: {str(e)}")
         return False
 
+def remember_prefetched_page(request_id):
+    """记录预取页面，超过保留数量时删除最早的未被读取过的页面"""
+    with prefetch_lock:
+        pages = [rid for rid in prefetch_index.get("pages", []) if rid != request_id]
+        pages.append(request_id)
+        while len(pages) > PREFETCH_MAX_PAGES:
+            evicted = pages.pop(0)
+            page_data = page_sources.get(evicted)
+            # 已返回给客户端的页面保留，客户端可能继续按请求ID读取
+            if page_data is not None and not page_data.get("served"):
+                page_sources.pop(evicted, None)
+                get_search_index().remove(evicted)
+        prefetch_index["pages"] = pages
+
+def convert_snapshot(request_id):
+    """预转换快照；排队期间已被更新的快照替代或已经转换时跳过"""
+    current = prefetch_index.get("current") or {}
+    if current.get("request_id") != request_id:
+        api_logger.debug(f"快照已被替代，跳过预转换，ID: {request_id}")
+        return
+    page_data = page_sources.get(request_id)
+    if page_data is None or has_markdown(page_data, MAIN_CONTENT_DEFAULT):
+        return
+    started = time.thread_time()
+    markdown = convert_html_to_markdown(page_data["source_code"], MAIN_CONTENT_DEFAULT)
+    prefetch_budget.add(time.thread_time() - started)
+    # 转换期间页面可能已被淘汰
+    if request_id not in page_sources:
+        return
+    store_markdown(request_id, markdown, MAIN_CONTENT_DEFAULT)
+    api_logger.info(f"快照已预转换为Markdown，ID: {request_id}, Markdown长度: {len(markdown)}")
+
+def handle_page_snapshot(message):
+    """处理插件主动上报的当前标签页快照：新快照立即替代之前的快照，内容交给转换工作队列保存并预先转换"""
+    if not PREFETCH_ENABLED:
+        return False
+    try:
+        tab_id = message.get("tab_id")
+        url = message.get("url", "")
+        source_code = message.get("source_code")
+        current = {
+            "snapshot_id": uuid.uuid4().hex[:8],
+            "tab_id": tab_id,
+            "window_id": message.get("window_id"),
+            "url": url,
+            "title": message.get("title", ""),
+            "reason": message.get("reason", ""),
+            "captured_time": time.time(),
+            # 代理模式下快照所属的浏览器，按该浏览器的标签页缓存判断快照是否仍然有效
+            "profile": broker.current().profile if broker is not None else None,
+            "request_id": None
+        }
+        # 保存完成（request_id 已设置）之前没有可用的快照，获取当前标签页时向插件获取
+        with prefetch_lock:
+            prefetch_index["current"] = current
+
+        if not source_code or len(source_code) > PREFETCH_MAX_PAGE_BYTES:
+            # 当前标签页无法抓取（加载中、浏览器内部页面、页面过大），之前的快照作废
+            logger.debug(f"当前标签页没有可用快照，标签页: {tab_id}, URL: {url}")
+            return True
+
+        # 计算内容摘要、移出内嵌资源和保存不在读取插件消息的线程中进行
+        try:
+            scheduler.submit("convert", store_snapshot, current, source_code, priority=PRIORITY_BULK)
+        except SchedulerOverloaded:
+            api_logger.warning(f"转换队列已满，丢弃标签页快照，标签页: {tab_id}, URL: {url}")
+        return True
+    except Exception as e:
+        logger.error(f"处理标签页快照时出错: {str(e)}")
+        return False
+
+def store_snapshot(current, source_code):
+    """保存快照并设为当前快照（在转换工作队列中执行），内容未转换过时在预转换CPU时间上限内立即转换"""
+    request_id = snapshot_request_id(current["tab_id"], source_code)
+    page_data = page_sources.get(request_id)
+    if page_data is None:
+        page_sources[request_id] = {
+            "url": current["url"],
+            "title": current["title"],
+            "tab_id": current["tab_id"],
+            "source_code": offload_page_blobs(source_code, request_id),
+            "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "prefetched": True
+        }
+        remember_prefetched_page(request_id)
+    with prefetch_lock:
+        # 排队期间插件已上报更新的快照
+        if (prefetch_index.get("current") or {}).get("snapshot_id") != current["snapshot_id"]:
+            api_logger.debug(f"快照已被替代，ID: {request_id}")
+            return
+        prefetch_index["current"] = dict(current, request_id=request_id)
+    logger.info(f"收到标签页快照（{current['reason']}），ID: {request_id}, URL: {current['url']}, 源码长度: {len(source_code)}")
+
+    # 内容没有变化时只刷新快照时间
+    if page_data is not None and has_markdown(page_data, MAIN_CONTENT_DEFAULT):
+        return
+    if not prefetch_budget.allow():
+        api_logger.info(f"预转换CPU时间已达上限，跳过预转换，ID: {request_id}")
+        return
+    convert_snapshot(request_id)
+
+def snapshot_tab(current):
+    """快照对应标签页在标签页缓存中的元数据，代理模式下在快照所属浏览器的缓存中查找"""
+    if broker is not None:
+        return broker.tab(current.get("profile"), current.get("tab_id"))
+    return tab_registry["tabs"].get(current.get("tab_id"))
+
+async def load_prefetched_current_tab(main_content, max_age=PREFETCH_MAX_AGE):
+    """返回新鲜的当前标签页快照 (页面数据, 快照信息)，尚未转换时立即转换；没有可用快照时返回None"""
+    current = prefetch_index.get("current")
+    tab = snapshot_tab(current) if current else None
+    if not is_fresh(current, tab, max_age):
+        return None
+    page_data = await load_markdown_page_data(current["request_id"], main_content)
+    if page_data is None:
+        return None
+    if not page_data.get("served"):
+        page_data["served"] = True
+        page_sources[current["request_id"]] = page_data
+    return page_data, current
+
 def graceful_shutdown(signum, frame):
     """优雅关闭服务器"""
     api_logger.info("收到关闭信号，开始优雅关闭...")
@@ -691,27 +1313,78 @@ def graceful_shutdown(signum, frame):
 
 async def handle_get_current_tab_markdown(request):
     """直接获取当前标签页的Markdown内容"""
+    from starlette.responses import JSONResponse
     try:
+        body = await read_json_body(request)
+        main_content = wants_main_content(body)
+        try:
+            token = CancelToken(request_timeout(request.headers, body))
+            max_age = prefetch_max_age(body)
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+        # 预取模式下直接使用插件最近上报的新鲜快照，不再等待插件往返；prefetch 为假时强制重新获取
+        # 指定浏览器或窗口时快照可能来自其他浏览器，不使用预取
+        targeted = body.get("profile") is not None or body.get("window_id") is not None
+        if PREFETCH_ENABLED and body.get("prefetch", True) and not targeted:
+            try:
+                prefetched = await load_prefetched_current_tab(main_content, max_age)
+            except SchedulerOverloaded as e:
+                return overloaded_response(e)
+            if prefetched is not None:
+                page_data, current = prefetched
+                api_logger.info(f"使用预取的标签页快照，ID: {current['request_id']}, URL: {current['url']}")
+                if body.get("stream"):
+                    return stored_markdown_stream(current["request_id"], current["url"], page_data, prefetched=True)
+                return await current_tab_response(request, body, current["request_id"], current["url"], page_data,
+                                                  headers={"Age": str(int(snapshot_age(current)))}, prefetched=True)
+
         # 生成一个唯一的请求ID
         request_id = f"current_tab_{uuid.uuid4().hex[:8]}"
         api_logger.info(f"收到获取当前标签页Markdown请求，ID: {request_id}")
         
+        try:
+            browser = assign_browser(request_id, "get_page_source", body)
+        except LookupError as e:
+            return no_browser_response(e, request_id=request_id)
+        
+        # stream 为真时插件分片回传源码，边接收边转换，以NDJSON逐段返回Markdown
+        if body.get("stream"):
+            return await stream_current_tab(request, request_id, token, main_content, body.get("window_id"), browser)
+        
         # 获取当前页面源码
         api_logger.info(f"开始获取当前标签页源码，ID: {request_id}")
-        page_source_result = get_page_source(request_id)
+        # 在插件往返工作队列中等待响应（交互优先级），避免阻塞事件循环上的其他请求
+        # 客户端断开或超过截止时间时停止等待，并通知插件放弃
+        inline_conversion_requests.add(request_id)
+        try:
+            page_source_result = await cancellable(request, token, run_scheduled(
+                "extension", get_page_source, request_id, None, token, body.get("window_id"), priority=PRIORITY_INTERACTIVE))
+        except SchedulerOverloaded as e:
+            release_browser(request_id)
+            return overloaded_response(e, request_id=request_id)
+        except RequestCancelled as e:
+            # 尚在队列中的任务不会再执行，已发出的请求也不再等待响应
+            release_browser(request_id)
+            return cancelled_response(e, request_id=request_id)
+        finally:
+            inline_conversion_requests.discard(request_id)
         
         # 详细记录获取结果
         api_logger.info(f"获取页面源码结果: {page_source_result.get('status')}, ID: {request_id}")
         
+        if page_source_result.get("status") in ("timeout", "cancelled"):
+            return cancelled_response(RequestCancelled(token.reason or "deadline"), request_id=request_id)
         if page_source_result.get("status") != "success":
             error_msg = page_source_result.get("message", "获取页面源码失败")
             api_logger.error(f"获取页面源码失败: {error_msg}, ID: {request_id}")
+            status = "disconnected" if page_source_result.get("status") == "disconnected" else "error"
             return JSONResponse({
-                "status": "error",
+                "status": status,
                 "message": error_msg,
                 "request_id": request_id,
                 "error_details": page_source_result
-            }, status_code=500)
+            }, status_code=failure_status_code(status))
         
         # 成功获取源码，开始转换为Markdown
         source_code = page_source_result.get("source_code", "")
@@ -727,10 +1400,20 @@ async def handle_get_current_tab_markdown(request):
                 "url": url
             }, status_code=500)
         
-        # 转换为Markdown
+        # 转换为Markdown并保存（去重存储写入较慢，同在转换工作队列中进行）
         api_logger.info(f"开始转换为Markdown，ID: {request_id}, URL: {url}, 源码长度: {len(source_code)}")
+        page_data = {
+            "url": url,
+            "source_code": source_code,
+            "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
         try:
-            markdown = convert_html_to_markdown(source_code)
+            page_data = await cancellable(request, token, run_scheduled(
+                "convert", convert_and_store, request_id, page_data, main_content, priority=PRIORITY_INTERACTIVE))
+        except SchedulerOverloaded as e:
+            return overloaded_response(e, request_id=request_id, url=url)
+        except RequestCancelled as e:
+            return cancelled_response(e, request_id=request_id, url=url)
         except Exception as e:
             error_msg = f"HTML转换Markdown失败: {str(e)}"
             api_logger.error(f"{error_msg}, ID: {request_id}")
@@ -741,27 +1424,9 @@ async def handle_get_current_tab_markdown(request):
                 "url": url
             }, status_code=500)
         
-        # 保存结果到全局存储
-        page_sources[request_id] = {
-            "url": url,
-            "source_code": source_code,
-            "markdown": markdown,
-            "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "markdown_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        api_logger.info(f"页面已转换为Markdown，ID: {request_id}, Markdown长度: {len(markdown)}")
-        
-        # 返回Markdown内容
-        return JSONResponse({
-            "status": "success",
-            "message": "成功获取当前标签页Markdown内容",
-            "request_id": request_id,
-            "url": url,
-            "markdown_length": len(markdown),
-            "markdown": markdown
-        })
-        
+        api_logger.info(f"页面已转换为Markdown，ID: {request_id}, Markdown长度: {len(page_data['markdown'])}")
+        return await current_tab_response(request, body, request_id, url, page_data, **browser)
+
     except Exception as e:
         error_msg = f"获取当前标签页Markdown时出错: {str(e)}"
         api_logger.error(f"{error_msg}, ID: {request_id if 'request_id' in locals() else 'unknown'}")
@@ -771,57 +1436,1325 @@ async def handle_get_current_tab_markdown(request):
             "request_id": request_id if 'request_id' in locals() else "unknown"
         }, status_code=500)
 
-# 创建路由
-routes = [
-    Route("/", endpoint=handle_index),
-    Route("/api/send-notification", endpoint=handle_send_notification, methods=["POST"]),
-    Route("/api/get-page-source", endpoint=handle_get_page_source, methods=["POST"]),
-    Route("/api/page-source-result", endpoint=handle_page_source_result, methods=["POST"]),
-    Route("/api/get-markdown", endpoint=handle_get_markdown, methods=["POST"]),
-    Route("/api/get-webpage-markdown", endpoint=handle_get_webpage_markdown, methods=["POST"]),
-    Route("/api/get-current-tab-markdown", endpoint=handle_get_current_tab_markdown, methods=["POST"]),
-]
-
-# 创建Starlette应用
-app = Starlette(routes=routes)
-
-def start_api_server():
-    """启动API服务器"""
-    try:
-        # 保存原始的标准输出流
-        original_stdout = sys.stdout
-        original_stderr = sys.stderr
-        
-        # 配置服务器
-        config = uvicorn.Config(
-            app,
-            host="127.0.0.1",
-            port=8888,
-            log_level="info",
-            log_config=None,  # 禁用uvicorn的默认日志配置
-            lifespan="on"
-        )
-        
-        # 创建服务器实例
-        server = uvicorn.Server(config)
-        
-        # 恢复标准输出流
-        sys.stdout = original_stdout
-        sys.stderr = original_stderr
-        
-        api_logger.info("API服务器正在启动...")
-        
-        # 使用异步方式运行服务器
+async def current_tab_response(request, body, request_id, url, page_data, headers=None, **extra):
+    """当前标签页的成功响应：outline_only 时只返回目录，由客户端按章节或分页读取正文"""
+    markdown = page_data["markdown"]
+    if body.get("outline_only"):
+        return await markdown_json_response(request, {
+            "status": "success",
+            "message": "成功获取当前标签页目录",
+            "request_id": request_id,
+            "url": url,
+            "markdown_length": len(markdown),
+            "outline": outline(page_data["sections"]),
+            **extra
+        }, headers)
+    
+    return await markdown_json_response(request, {
+        "status": "success",
+        "message": "成功获取当前标签页Markdown内容",
+        "request_id": request_id,
+        "url": url,
+        "markdown_length": len(markdown),
+        "markdown": markdown,
+        **extra
+    }, headers)
+
+def ndjson_line(payload):
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+def save_streamed_page(request_id, url, source_code, markdown, main_content, fields):
+    """保存流式转换的源码和完整结果，fields 为同时保存的其他字段（在转换工作线程中执行）"""
+    page_data = {
+        "url": url,
+        "source_code": offload_page_blobs(source_code, request_id),
+        "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    return store_markdown(request_id, markdown, main_content, page_data, status="success", **fields)
+
+def streaming_markdown_response(request_id, url, chunks, token, main_content, on_close=None, **extra):
+    """边接收HTML边转换，以NDJSON逐段返回Markdown
+    
+    chunks 为 asyncio.Queue，元素为 {"data": HTML片段, "done": 是否最后一片, "url": 页面地址（可选）}，
+    出错时为 {"error": 错误信息, "status": 状态（可选）}。依次输出 start、若干 chunk 和 summary
+    （出错时最后一行为 error），完整结果按 request_id 保存；extra 附加在 start、summary 中并随页面保存。
+    main_content 为真时提取正文需要完整文档，收齐后一次转换。结束后调用 on_close(原因)，
+    正常结束时原因为 None，客户端断开或超过截止时间时 token 同时被取消。
+    """
+    from starlette.responses import StreamingResponse
+    async def stream_results():
+        nonlocal url
+        started = time.monotonic()
+        converter = None if main_content else StreamingMarkdownConverter(
+            transform=lambda html_content: offload_page_blobs(html_content, request_id))
+        sources, emitted = [], []
+        first_chunk_ms = None
+        finished = False
         try:
-            asyncio.run(server.serve())
-        except RuntimeError as e:
-            if "asyncio.run() cannot be called from a running event loop" in str(e):
-                # 如果已经在事件循环中，使用不同的方法启动
-                api_logger.warning("检测到已有事件循环，使用替代方法启动服务器")
-                loop = asyncio.get_event_loop()
-                loop.run_until_complete(server.serve())
+            yield ndjson_line({"type": "start", "request_id": request_id, "url": url, **extra})
+            done = False
+            while not done:
+                try:
+                    items = [await asyncio.wait_for(chunks.get(), token.remaining())]
+                except asyncio.TimeoutError:
+                    token.cancel("deadline")
+                    items = [{"error": "请求超过截止时间", "status": "timeout"}]
+                # 转换期间到达的片段合并后一起转换，减少转换队列的往返
+                while not chunks.empty():
+                    items.append(chunks.get_nowait())
+                error = next((item for item in items if "error" in item), None)
+                if error is not None:
+                    finished = error.get("status") != "timeout"
+                    api_logger.error(f"流式转换失败: {error['error']}, ID: {request_id}")
+                    yield ndjson_line({
+                        "type": "error",
+                        "status": error.get("status", "error"),
+                        "message": error["error"],
+                        "request_id": request_id,
+                        "url": url
+                    })
+                    return
+                url = next((item["url"] for item in reversed(items) if item.get("url")), url)
+                done = any(item.get("done") for item in items)
+                data = "".join(item.get("data", "") for item in items)
+                sources.append(data)
+                if converter is None or not data:
+                    continue
+                markdown = await run_scheduled("convert", converter.feed, data, priority=PRIORITY_INTERACTIVE)
+                if markdown:
+                    if first_chunk_ms is None:
+                        first_chunk_ms = round((time.monotonic() - started) * 1000, 1)
+                    emitted.append(markdown)
+                    yield ndjson_line({"type": "chunk", "markdown": markdown})
+            
+            source_code = "".join(sources)
+            if converter is None:
+                tail = await run_scheduled("convert", convert_html_to_markdown, offload_page_blobs(source_code, request_id),
+                                           main_content, priority=PRIORITY_INTERACTIVE)
+            else:
+                tail = await run_scheduled("convert", converter.close, priority=PRIORITY_INTERACTIVE)
+            if tail:
+                if first_chunk_ms is None:
+                    first_chunk_ms = round((time.monotonic() - started) * 1000, 1)
+                emitted.append(tail)
+                yield ndjson_line({"type": "chunk", "markdown": tail})
+            
+            markdown = "".join(emitted)
+            await run_scheduled("convert", save_streamed_page, request_id, url, source_code, markdown, main_content, extra,
+                                priority=PRIORITY_INTERACTIVE)
+            finished = True
+            api_logger.info(f"流式转换完成，ID: {request_id}, 源码长度: {len(source_code)}, Markdown长度: {len(markdown)}")
+            yield ndjson_line({
+                "type": "summary",
+                "status": "success",
+                "request_id": request_id,
+                "url": url,
+                "source_length": len(source_code),
+                "markdown_length": len(markdown),
+                "chunks": len(emitted),
+                "first_chunk_ms": first_chunk_ms,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+                **extra
+            })
+        except SchedulerOverloaded as e:
+            api_logger.warning(f"转换队列已满，流式转换中止，ID: {request_id}")
+            token.cancel("overloaded")
+            yield ndjson_line({
+                "type": "error",
+                "status": "overloaded",
+                "message": str(e),
+                "retry_after": e.retry_after,
+                "request_id": request_id,
+                "url": url
+            })
+        finally:
+            # 客户端断开时响应生成器被关闭，停止获取剩余的源码
+            if not finished:
+                token.cancel("disconnected")
+            if on_close is not None:
+                on_close(None if finished else token.reason)
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def stored_markdown_stream(request_id, url, page_data, **extra):
+    """已有转换结果时按流式响应的格式一次返回"""
+    from starlette.responses import StreamingResponse
+    markdown = page_data["markdown"]
+    
+    async def stream_results():
+        yield ndjson_line({"type": "start", "request_id": request_id, "url": url})
+        yield ndjson_line({"type": "chunk", "markdown": markdown})
+        yield ndjson_line({
+            "type": "summary",
+            "status": "success",
+            "request_id": request_id,
+            "url": url,
+            "markdown_length": len(markdown),
+            "chunks": 1,
+            **extra
+        })
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def stream_current_tab(request, request_id, token, main_content, window_id=None, browser=None):
+    """流式获取当前标签页：插件分片回传源码，每一片到达后立即转换
+
+    与非流式获取相同，在插件往返工作队列中发送请求并占用槽位直到流式响应结束，队列已满时返回429。
+    """
+    from starlette.responses import JSONResponse
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    sent = concurrent.futures.Future()
+    finished = threading.Event()
+    
+    # 在消息读取线程中调用；不支持分片的旧版插件仍回传完整源码
+    def handle_message(message):
+        if message.get("type") == "page_source_chunk":
+            item = {"data": message.get("data", ""), "done": bool(message.get("done")), "url": message.get("url")}
+        elif "error" in message:
+            item = {"error": message["error"], "status": message.get("status", "error")}
+        else:
+            item = {"data": message.get("source_code", ""), "done": True, "url": message.get("url")}
+        loop.call_soon_threadsafe(chunks.put_nowait, item)
+    
+    def close(reason):
+        callbacks.pop(request_id, None)
+        inline_conversion_requests.discard(request_id)
+        finished.set()
+        if reason is not None:
+            send_cancel(request_id, reason)
+    
+    unavailable = channel_unavailable(request_id)
+    if unavailable is not None:
+        release_browser(request_id)
+        return JSONResponse(unavailable, status_code=503)
+    request_message = {
+        "type": "get_page_source",
+        "request_id": request_id,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "timeout": round(token.remaining(DEFAULT_REQUEST_TIMEOUT), 1),
+        "stream": True,
+        "chunk_size": STREAM_CHUNK_CHARS
+    }
+    if window_id is not None:
+        request_message["window_id"] = window_id
+    
+    def send_and_hold():
+        """在插件往返工作线程中发送请求，之后一直占用该槽位，直到流式响应结束或超过截止时间"""
+        if not sent.set_running_or_notify_cancel() or token.cancelled:
+            return
+        callbacks[request_id] = handle_message
+        inline_conversion_requests.add(request_id)
+        request_message["timeout"] = round(token.remaining(DEFAULT_REQUEST_TIMEOUT), 1)
+        sent.set_result(send_message(encode_message(request_message)))
+        finished.wait(token.remaining(DEFAULT_REQUEST_TIMEOUT))
+    
+    try:
+        slot = scheduler.submit("extension", send_and_hold, priority=PRIORITY_INTERACTIVE)
+    except SchedulerOverloaded as e:
+        release_browser(request_id)
+        return overloaded_response(e, request_id=request_id)
+    try:
+        send_result = await cancellable(request, token, asyncio.wrap_future(sent))
+    except RequestCancelled as e:
+        # 尚在队列中时请求不会再发出；已发出时通知插件放弃
+        close(None if slot.cancel() else e.reason)
+        release_browser(request_id)
+        return cancelled_response(e, request_id=request_id)
+    if not send_result:
+        close(None)
+        release_browser(request_id)
+        return JSONResponse({
+            "status": "error",
+            "message": "页面源码请求发送失败",
+            "request_id": request_id
+        }, status_code=500)
+    api_logger.info(f"页面源码请求已发送（分片回传），ID: {request_id}")
+    return streaming_markdown_response(request_id, None, chunks, token, main_content, on_close=close, **(browser or {}))
+
+async def read_json_body(request):
+    """读取JSON请求体，请求体为空时返回空字典"""
+    raw_body = await request.body()
+    if not raw_body.strip():
+        return {}
+    return json.loads(raw_body)
+
+def convert_and_store(request_id, page_data, main_content=False):
+    """转换新获取的页面并连同源码一起保存（在转换工作队列中执行），返回保存的页面数据"""
+    markdown = convert_html_to_markdown(page_data["source_code"], main_content)
+    return store_markdown(request_id, markdown, main_content, page_data)
+
+def has_markdown(page_data, main_content=None):
+    """是否已有Markdown；指定 main_content 时还要求提取方式一致（没有源码时无法重新转换，沿用已有结果）"""
+    if "markdown" not in page_data:
+        return False
+    if main_content is None or not page_data.get("source_code"):
+        return True
+    return page_data.get("main_content", False) == bool(main_content)
+
+def get_markdown_page_data(request_id, main_content=None, page_data=None):
+    """获取已转换为Markdown的页面数据，尚未转换或提取方式不同时立即转换；不存在时返回None
+
+    page_data 为调用方刚读取的页面数据，避免再次读取（近似重复的页面每次读取都要按差异还原）。
+    """
+    page_data = page_sources.get(request_id) if page_data is None else page_data
+    if page_data is None:
+        return None
+    if not has_markdown(page_data, main_content):
+        html_content = page_data.get("source_code", "")
+        if not html_content:
+            return None
+        main_content = MAIN_CONTENT_DEFAULT if main_content is None else bool(main_content)
+        page_data = store_markdown(request_id, convert_html_to_markdown(html_content, main_content), main_content)
+    elif "sections" not in page_data:
+        # 读取得到的是副本，章节索引需要写回，之后的读取不再重建
+        page_data["sections"] = build_section_index(page_data["markdown"])
+        page_sources[request_id] = page_data
+    return page_data
+
+async def load_markdown_page_data(request_id, main_content=None):
+    """获取Markdown页面数据，需要转换或建立章节索引时交给转换工作队列"""
+    page_data = page_sources.get(request_id)
+    if page_data is not None and has_markdown(page_data, main_content) and "sections" in page_data:
+        return page_data
+    return await run_scheduled("convert", get_markdown_page_data, request_id, main_content, page_data,
+                               priority=PRIORITY_INTERACTIVE)
+
+async def handle_markdown_outline(request):
+    """获取Markdown的标题目录（不含正文）"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        request_id = body.get("request_id")
+        
+        if not request_id:
+            return JSONResponse({
+                "status": "error",
+                "message": "缺少请求ID"
+            }, status_code=400)
+        
+        try:
+            page_data = await load_markdown_page_data(request_id, body.get("main_content"))
+        except SchedulerOverloaded as e:
+            return overloaded_response(e, request_id=request_id)
+        if page_data is None:
+            return JSONResponse({
+                "status": "error",
+                "message": "找不到指定请求ID的Markdown内容",
+                "request_id": request_id
+            }, status_code=404)
+        
+        return await markdown_json_response(request, {
+            "status": "success",
+            "message": "成功获取Markdown目录",
+            "request_id": request_id,
+            "url": page_data.get("url", "unknown"),
+            "total_bytes": sum(section["byte_length"] for section in page_data["sections"]),
+            "outline": outline(page_data["sections"])
+        })
+        
+    except Exception as e:
+        error_msg = f"获取Markdown目录时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_extract_structured(request):
+    """直接从页面源码提取表格和代码块，不经过Markdown
+
+    源码来自已保存的 request_id，或直接获取 url（源码按新的请求ID保存，可重复提取）。
+    表格按列返回并推断类型；arrays 为真时数值列打包为与 NumPy/Arrow 兼容的缓冲区；
+    format 为 csv 时返回第 table 个表格的CSV。
+    """
+    from starlette.responses import JSONResponse, Response
+    try:
+        body = await read_json_body(request)
+        request_id = body.get("request_id")
+        url = body.get("url")
+        output_format = body.get("format", "json")
+        include = body.get("include", ["tables", "code"])
+        
+        if not request_id and not url:
+            return JSONResponse({"status": "error", "message": "请提供请求ID或网页URL"}, status_code=400)
+        if output_format not in ("json", "csv"):
+            return JSONResponse({"status": "error", "message": "format 仅支持 json 或 csv"}, status_code=400)
+        if not isinstance(include, list) or not set(include) <= {"tables", "code"}:
+            return JSONResponse({"status": "error", "message": "include 仅支持 tables 和 code"}, status_code=400)
+        try:
+            table_index = int(body.get("table", 0))
+            token = CancelToken(request_timeout(request.headers, body, default=None))
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+        
+        if request_id:
+            page_data = page_sources.get(request_id)
+            if page_data is None or not page_data.get("source_code"):
+                return JSONResponse({
+                    "status": "error",
+                    "message": "找不到指定请求ID的页面源码",
+                    "request_id": request_id
+                }, status_code=404)
+            url = page_data.get("url", "unknown")
+            source_code = page_data["source_code"]
+        else:
+            request_id = f"st_{uuid.uuid4().hex[:8]}"
+            try:
+                status_code, source_code = await cancellable(request, token, run_scheduled(
+                    "fetch", fetch_and_store, url, request_id, token, priority=PRIORITY_NORMAL))
+            except RequestCancelled as e:
+                return cancelled_response(e, url=url)
+            if status_code != 200:
+                return JSONResponse({
+                    "status": "error",
+                    "message": f"获取网页失败，状态码: {status_code}",
+                    "url": url
+                }, status_code=502)
+        
+        tables, code_blocks = await run_scheduled(
+            "convert", extract_structures, source_code, "tables" in include, "code" in include, priority=PRIORITY_NORMAL)
+        api_logger.info(f"已提取表格 {len(tables)} 个、代码块 {len(code_blocks)} 个，ID: {request_id}")
+        
+        if output_format == "csv":
+            if not 0 <= table_index < len(tables):
+                return JSONResponse({
+                    "status": "error",
+                    "message": f"页面中没有第 {table_index} 个表格（共 {len(tables)} 个）",
+                    "request_id": request_id
+                }, status_code=404)
+            return Response(table_to_csv(tables[table_index]), media_type="text/csv; charset=utf-8",
+                            headers={"X-Request-Id": request_id})
+        
+        if body.get("arrays"):
+            tables = [pack_numeric_columns(table) for table in tables]
+        payload = {"status": "success", "request_id": request_id, "url": url}
+        if "tables" in include:
+            payload["tables"] = tables
+        if "code" in include:
+            payload["code_blocks"] = code_blocks
+        return await markdown_json_response(request, payload)
+        
+    except SchedulerOverloaded as e:
+        return overloaded_response(e, request_id=body.get("request_id"))
+    except Exception as e:
+        error_msg = f"提取表格和代码块时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_canonical_capture(request):
+    """查询页面的规范版本：近似重复的页面返回它引用的规范版本ID和指纹距离，规范版本返回引用它的副本"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        request_id = body.get("request_id")
+        
+        if not request_id:
+            return JSONResponse({
+                "status": "error",
+                "message": "缺少请求ID"
+            }, status_code=400)
+        
+        if request_id not in page_sources:
+            return JSONResponse({
+                "status": "error",
+                "message": "找不到指定请求ID的页面",
+                "request_id": request_id
+            }, status_code=404)
+        
+        if not isinstance(page_sources, DedupPageStore):
+            # 未启用去重（或多进程共享存储）时每个页面都是规范版本
+            return JSONResponse({
+                "status": "success",
+                "request_id": request_id,
+                "canonical_id": request_id,
+                "duplicate": False,
+                "distance": 0,
+                "duplicates": []
+            })
+        
+        canonical_id, distance = page_sources.canonical(request_id)
+        return JSONResponse({
+            "status": "success",
+            "request_id": request_id,
+            "canonical_id": canonical_id,
+            "duplicate": canonical_id != request_id,
+            "distance": distance,
+            "duplicates": page_sources.duplicates_of(canonical_id)
+        })
+        
+    except Exception as e:
+        error_msg = f"查询规范版本时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_markdown_section(request):
+    """按章节编号获取Markdown内容"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        request_id = body.get("request_id")
+        section_id = body.get("section")
+        
+        if not request_id or not isinstance(section_id, int):
+            return JSONResponse({
+                "status": "error",
+                "message": "请提供请求ID和章节编号 section"
+            }, status_code=400)
+        max_bytes = body.get("max_bytes")
+        if max_bytes is not None and (not isinstance(max_bytes, int) or isinstance(max_bytes, bool) or max_bytes < 0):
+            return JSONResponse({
+                "status": "error",
+                "message": "max_bytes 必须是非负整数"
+            }, status_code=400)
+        
+        try:
+            page_data = await load_markdown_page_data(request_id, body.get("main_content"))
+        except SchedulerOverloaded as e:
+            return overloaded_response(e, request_id=request_id)
+        if page_data is None:
+            return JSONResponse({
+                "status": "error",
+                "message": "找不到指定请求ID的Markdown内容",
+                "request_id": request_id
+            }, status_code=404)
+        
+        section = read_section(
+            page_data["markdown"],
+            page_data["sections"],
+            section_id,
+            include_subsections=bool(body.get("include_subsections", False)),
+            max_bytes=max_bytes
+        )
+        if section is None:
+            return JSONResponse({
+                "status": "error",
+                "message": f"章节编号超出范围，共 {len(page_data['sections'])} 个章节",
+                "request_id": request_id
+            }, status_code=404)
+        
+        return await markdown_json_response(request, {
+            "status": "success",
+            "message": "成功获取章节内容",
+            "request_id": request_id,
+            "section": section
+        })
+        
+    except Exception as e:
+        error_msg = f"获取章节内容时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_markdown_page(request):
+    """按字节偏移分页获取Markdown内容"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        request_id = body.get("request_id")
+        
+        if not request_id:
+            return JSONResponse({
+                "status": "error",
+                "message": "缺少请求ID"
+            }, status_code=400)
+        
+        try:
+            page_data = await load_markdown_page_data(request_id, body.get("main_content"))
+        except SchedulerOverloaded as e:
+            return overloaded_response(e, request_id=request_id)
+        if page_data is None:
+            return JSONResponse({
+                "status": "error",
+                "message": "找不到指定请求ID的Markdown内容",
+                "request_id": request_id
+            }, status_code=404)
+        
+        page = read_page(
+            page_data["markdown"],
+            page_data["sections"],
+            offset=body.get("offset", 0),
+            limit=body.get("limit", DEFAULT_PAGE_BYTES)
+        )
+        
+        return await markdown_json_response(request, {
+            "status": "success",
+            "message": "成功获取分页内容",
+            "request_id": request_id,
+            **page
+        })
+        
+    except Exception as e:
+        error_msg = f"获取分页内容时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_search(request):
+    """在已获取的页面中全文搜索，按相关度返回请求ID和摘要"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        query = (body.get("query") or "").strip()
+        limit = max(1, min(int(body.get("limit", 10)), 100))
+        
+        if not query:
+            return JSONResponse({
+                "status": "error",
+                "message": "请提供搜索关键词 query"
+            }, status_code=400)
+        
+        search_index = get_search_index()
+        if not search_index.available:
+            return JSONResponse({
+                "status": "error",
+                "message": "全文搜索不可用（SQLite未启用FTS5）"
+            }, status_code=503)
+        
+        started = time.perf_counter()
+        results = search_index.search(query, limit)
+        
+        return JSONResponse({
+            "status": "success",
+            "message": f"找到 {len(results)} 个结果",
+            "query": query,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+            "results": results
+        })
+        
+    except Exception as e:
+        error_msg = f"搜索页面时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def handle_get_blob(request):
+    """按内容摘要返回页面中移出的图片、字体等内容；其他类型（包括SVG）只作为附件下载"""
+    from starlette.responses import JSONResponse, Response
+    digest = request.path_params["digest"]
+    blob = blob_store.get(digest)
+    if blob is None:
+        return JSONResponse({
+            "status": "error",
+            "message": "找不到指定的内容，可能已被淘汰",
+            "digest": digest
+        }, status_code=404, headers=BLOB_SECURITY_HEADERS)
+    
+    # 内容按摘要寻址，永不改变，客户端可以长期缓存
+    media_type, data = blob
+    media_type, headers = blob_response_headers(media_type, digest)
+    headers.update({"ETag": f'"{digest}"', "Cache-Control": "public, max-age=31536000, immutable"})
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type=media_type, headers=headers)
+
+async def handle_scheduler_stats(request):
+    """查看各工作队列的并发、排队和拒绝情况（多个工作进程时为处理该请求的进程）"""
+    from starlette.responses import JSONResponse
+    return JSONResponse({
+        "status": "success",
+        "pid": os.getpid(),
+        "scheduler": scheduler.stats(),
+        "prefetch": prefetch_budget.stats() if PREFETCH_ENABLED else None
+    })
+
+async def handle_browsers(request):
+    """列出已连接的浏览器：配置文件名、进程、窗口和进行中的请求数（未启用多浏览器代理时只有本进程的浏览器）"""
+    from starlette.responses import JSONResponse
+    if broker is None:
+        return JSONResponse({"status": "success", "role": "standalone", "browsers": [], "channel": channel_status()})
+    return JSONResponse({"status": "success", **broker.stats(), "channel": channel_status()})
+
+# 按需开启的内存分配跟踪（tracemalloc），首次查看内存时创建
+_allocation_profiler = None
+
+def get_allocation_profiler():
+    """获取内存分配跟踪器，首次使用时创建（导入 tracemalloc）"""
+    global _allocation_profiler
+    with _lazy_init_lock:
+        if _allocation_profiler is None:
+            from memory_report import AllocationProfiler
+            _allocation_profiler = AllocationProfiler()
+        return _allocation_profiler
+
+def page_sources_memory(limit):
+    """page_sources 的条目数和大小，以及占用最多的页面"""
+    from memory_report import page_size_breakdown
+    if STATE_DIR:
+        # 共享存储中的页面在磁盘上，只统计JSON大小
+        return {"backend": "sqlite", **page_sources.size_stats(limit)}
+    entries = []
+    field_totals = {}
+    # 去重存储按实际保存的内容（副本为差异）统计
+    pages = page_sources.pages if isinstance(page_sources, DedupPageStore) else page_sources
+    for request_id, page_data in list(pages.items()):
+        size, fields = page_size_breakdown(page_data)
+        for name, field_size in fields.items():
+            field_totals[name] = field_totals.get(name, 0) + field_size
+        entries.append((size, request_id, page_data.get("url", ""), fields))
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    return {
+        "backend": "memory",
+        "count": len(entries),
+        "total_bytes": sum(entry[0] for entry in entries),
+        "field_bytes": field_totals,
+        "largest": [
+            {"request_id": request_id, "url": url, "size_bytes": size, "field_bytes": fields}
+            for size, request_id, url, fields in entries[:limit]
+        ]
+    }
+
+def collect_memory_stats(limit=10):
+    """本进程各数据结构的内存占用；需要遍历所有页面，在工作线程中执行"""
+    from memory_report import estimate_size, process_memory
+    return {
+        "process": process_memory(),
+        "page_sources": page_sources_memory(limit),
+        "caches": {
+            "compressed_bodies": compressed_bodies.stats(),
+            "blob_store": blob_store.stats(),
+            "dedup": page_sources.stats() if isinstance(page_sources, DedupPageStore) else None,
+            "search_index": get_search_index().stats(),
+            "prefetch": {
+                "pages": len(prefetch_index.get("pages", [])),
+                "budget": prefetch_budget.stats()
+            } if PREFETCH_ENABLED else None
+        },
+        "requests": {
+            "callbacks": len(callbacks),
+            "inline_conversion_requests": len(inline_conversion_requests),
+            "active_crawls": len(active_crawls),
+            "tabs": len(tab_registry["tabs"]),
+            "tab_registry_bytes": estimate_size(tab_registry)
+        },
+        "scheduler": scheduler.stats(),
+        "traffic_recorder": {
+            "pending": traffic_recorder.queue.qsize(),
+            "written_bytes": traffic_recorder.written_bytes
+        } if traffic_recorder is not None else None,
+        "tracemalloc": get_allocation_profiler().status()
+    }
+
+async def handle_memory_stats(request):
+    """按数据结构查看内存占用（多个工作进程时为处理该请求的进程）；独立进程模式下同时返回原生消息桥的统计"""
+    from starlette.responses import JSONResponse
+    try:
+        limit = int(request.query_params.get("limit", 10))
+        report = await run_scheduled("convert", collect_memory_stats, limit, priority=PRIORITY_NORMAL)
+    except SchedulerOverloaded as e:
+        return overloaded_response(e)
+    except ValueError:
+        return JSONResponse({"status": "error", "message": "limit 必须是整数"}, status_code=400)
+    
+    # 共享内存中的大消息、请求路由和缓存的消息由原生消息桥持有
+    if bridge_connection is not None:
+        reply = await request_extension_async({"type": "bridge_stats", "request_id": f"bridge_stats_{uuid.uuid4().hex[:8]}"}, 5)
+        report["bridge"] = reply["response"].get("stats") if reply["status"] == "success" else {"status": reply["status"]}
+    return JSONResponse({"status": "success", **report})
+
+async def handle_tracemalloc(request):
+    """内存分配跟踪：start/stop 开关，snapshot 保存快照并返回占用最多的分配位置，diff 与之前的快照比较"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await read_json_body(request)
+        action = body.get("action", "status")
+        limit = int(body.get("limit", 20))
+        key_type = body.get("key_type", "lineno")
+        if key_type not in ("lineno", "filename", "traceback"):
+            raise ValueError("key_type 仅支持 lineno、filename 或 traceback")
+        
+        allocation_profiler = get_allocation_profiler()
+        if action == "start":
+            result = allocation_profiler.start(int(body.get("frames", 10)))
+        elif action == "stop":
+            result = allocation_profiler.stop()
+        elif action == "status":
+            result = allocation_profiler.status()
+        elif action == "snapshot":
+            result = await run_scheduled("convert", allocation_profiler.snapshot, limit, key_type, priority=PRIORITY_NORMAL)
+        elif action == "diff":
+            result = await run_scheduled("convert", allocation_profiler.diff, body.get("baseline"), limit, key_type, priority=PRIORITY_NORMAL)
+        else:
+            raise ValueError("action 仅支持 start、stop、status、snapshot 或 diff")
+        return JSONResponse({"status": "success", "pid": os.getpid(), **result})
+    except SchedulerOverloaded as e:
+        return overloaded_response(e)
+    except (ValueError, KeyError, RuntimeError) as e:
+        message = e.args[0] if isinstance(e, KeyError) else str(e)
+        return JSONResponse({"status": "error", "message": message}, status_code=400)
+
+def _resolve_future(future, value):
+    """在事件循环线程中设置future结果（忽略已完成或已取消的future）"""
+    if not future.done():
+        future.set_result(value)
+
+async def request_extension_async(request_message, timeout):
+    """向插件发送请求，并在事件循环中异步等待同一request_id的响应"""
+    request_id = request_message["request_id"]
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    # 回调由读取stdin的主线程调用，需要切回事件循环线程
+    def handle_response(message):
+        if isinstance(message, dict) and message.get("request_id") == request_id:
+            loop.call_soon_threadsafe(_resolve_future, future, message)
+    
+    # 发给原生消息桥的统计请求不经过插件
+    unavailable = channel_unavailable(request_id) if request_message.get("type") != "bridge_stats" else None
+    if unavailable is not None:
+        release_browser(request_id)
+        return unavailable
+    
+    callbacks[request_id] = handle_response
+    sent = False
+    try:
+        encoded_msg = encode_message(request_message)
+        if not encoded_msg:
+            return {
+                "status": "error",
+                "message": "请求消息编码失败",
+                "request_id": request_id
+            }
+        
+        if not send_message(encoded_msg):
+            return {
+                "status": "error",
+                "message": "请求发送失败",
+                "request_id": request_id
+            }
+        sent = True
+        
+        try:
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if request_message.get("type") == "get_page_source":
+                send_cancel(request_id, "deadline")
+            return {
+                "status": "timeout",
+                "message": "等待插件响应超时",
+                "request_id": request_id
+            }
+        except asyncio.CancelledError:
+            # 调用方已放弃（客户端断开）
+            if request_message.get("type") == "get_page_source":
+                send_cancel(request_id, "disconnected")
+            raise
+        
+        if response.get("type") == "channel_lost":
+            return {
+                "status": "disconnected",
+                "message": response["error"],
+                "request_id": request_id
+            }
+        return {
+            "status": "success",
+            "request_id": request_id,
+            "response": response
+        }
+    finally:
+        # 清理回调；请求未发出时释放已选择的浏览器
+        callbacks.pop(request_id, None)
+        if not sent:
+            release_browser(request_id)
+
+def handle_tabs_update(message):
+    """处理插件上报的标签页列表，更新标签页元数据缓存"""
+    try:
+        tabs = message.get("tabs")
+        if not isinstance(tabs, list):
+            logger.error("标签页列表格式无效")
+            return False
+        
+        tabs = {
+            tab["id"]: {
+                "id": tab["id"],
+                "window_id": tab.get("window_id"),
+                "url": tab.get("url", ""),
+                "title": tab.get("title", ""),
+                "active": bool(tab.get("active")),
+                "status": tab.get("status")
+            }
+            for tab in tabs if isinstance(tab, dict) and "id" in tab
+        }
+        updated_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.debug(f"标签页缓存已更新，共 {len(tabs)} 个标签页")
+        # 代理模式下按浏览器分别缓存（标签页ID只在各自的浏览器内唯一），用于按窗口或标签页选择浏览器；
+        # tab_registry 只保存本进程浏览器的标签页，成员上报的列表不会覆盖它
+        if broker is not None:
+            broker.update_tabs(tabs, updated_time)
+        if broker is None or broker.current().local:
+            tab_registry["tabs"] = tabs
+            tab_registry["updated_time"] = updated_time
+        
+        # 如果是对list_tabs请求的响应，调用对应回调
+        request_id = message.get("request_id")
+        if request_id and request_id in callbacks:
+            callbacks[request_id](message)
+        return True
+    except Exception as e:
+        logger.error(f"处理标签页列表时出错: {str(e)}")
+        return False
+
+async def handle_list_tabs(request):
+    """列出浏览器中打开的标签页"""
+    from starlette.responses import JSONResponse
+    try:
+        body = await request.json()
+        refresh = bool(body.get("refresh", False))
+        timeout = float(body.get("timeout", 5))
+        
+        if broker is not None:
+            return await list_browser_tabs(body.get("profile"), refresh, timeout)
+        
+        # 缓存为空或显式要求刷新时，向插件请求最新的标签页列表
+        if refresh or not tab_registry["tabs"]:
+            request_message = {
+                "type": "list_tabs",
+                "request_id": f"tabs_{uuid.uuid4().hex[:8]}",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            result = await request_extension_async(request_message, timeout)
+            if result["status"] != "success" and not tab_registry["tabs"]:
+                return JSONResponse({
+                    "status": result["status"],
+                    "message": result["message"]
+                }, status_code=failure_status_code(result["status"]))
+        
+        return JSONResponse({
+            "status": "success",
+            "message": "成功获取标签页列表",
+            "updated_time": tab_registry["updated_time"],
+            "tabs": list(tab_registry["tabs"].values())
+        })
+        
+    except Exception as e:
+        error_msg = f"获取标签页列表时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+async def list_browser_tabs(profile, refresh, timeout):
+    """代理模式：列出各浏览器（或指定浏览器）的标签页，每个标签页附带所属浏览器的配置文件名"""
+    from starlette.responses import JSONResponse
+    try:
+        links = broker.browsers(profile)
+    except LookupError as e:
+        return no_browser_response(e)
+    
+    # 缓存为空或显式要求刷新的浏览器同时请求最新列表
+    requests = []
+    for link in links:
+        if refresh or not link.tabs:
+            request_id = f"tabs_{uuid.uuid4().hex[:8]}"
+            broker.assign(request_id, "list_tabs", link.profile)
+            requests.append(request_extension_async({
+                "type": "list_tabs",
+                "request_id": request_id,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, timeout))
+    results = await asyncio.gather(*requests)
+    
+    tabs = [{**tab, "profile": link.profile} for link in links for tab in link.tabs.values()]
+    failed = [result for result in results if result["status"] != "success"]
+    if failed and not tabs:
+        return JSONResponse({
+            "status": failed[0]["status"],
+            "message": failed[0]["message"]
+        }, status_code=failure_status_code(failed[0]["status"]))
+    
+    return JSONResponse({
+        "status": "success",
+        "message": "成功获取标签页列表",
+        "browsers": [{"profile": link.profile, "updated_time": link.tabs_time} for link in links],
+        "tabs": tabs
+    })
+
+async def capture_tab(tab_id, timeout, output_format="markdown", main_content=False, profile=None):
+    """获取指定标签页的源码并转换，返回单个标签页的结果（不抛出异常）
+
+    代理模式下发给 profile 指定的浏览器，未指定时发给缓存中包含该标签页的浏览器。
+    """
+    request_id = f"tab_{tab_id}_{uuid.uuid4().hex[:8]}"
+    started = time.monotonic()
+    result = {
+        "type": "tab_result",
+        "tab_id": tab_id,
+        "request_id": request_id
+    }
+    try:
+        request_message = {
+            "type": "get_page_source",
+            "request_id": request_id,
+            "tab_id": tab_id,
+            "timeout": timeout,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if broker is not None:
+            result["profile"] = broker.assign(request_id, "get_page_source", profile, tab_id=tab_id)
+        # 由本函数转换，收到源码时不再启动后台转换
+        inline_conversion_requests.add(request_id)
+        try:
+            reply = await request_extension_async(request_message, timeout)
+        finally:
+            inline_conversion_requests.discard(request_id)
+        if reply["status"] != "success":
+            result.update(status=reply["status"], message=reply["message"])
+            return result
+        
+        response = reply["response"]
+        if "error" in response or not response.get("source_code"):
+            result.update(status="error", message=response.get("error", "响应中缺少页面源码"))
+            return result
+        
+        source_code = response["source_code"]
+        url = response.get("url", "unknown")
+        result.update(status="success", url=url, source_code_length=len(source_code))
+        
+        if output_format == "html":
+            result["source_code"] = source_code
+        else:
+            # 转换和保存交给转换工作队列，避免阻塞事件循环
+            page_data = {
+                "url": url,
+                "tab_id": tab_id,
+                "source_code": source_code,
+                "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            try:
+                page_data = await run_scheduled("convert", convert_and_store, request_id, page_data, main_content,
+                                                priority=PRIORITY_NORMAL)
+            except SchedulerOverloaded as e:
+                result.update(status="overloaded", message=str(e), retry_after=e.retry_after)
+                return result
+            markdown = page_data["markdown"]
+            result.update(markdown_length=len(markdown), markdown=markdown)
+        return result
+    except Exception as e:
+        api_logger.error(f"获取标签页内容时出错，标签页: {tab_id}, 错误: {str(e)}")
+        result.update(status="error", message=str(e))
+        return result
+    finally:
+        result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+async def handle_capture_tabs(request):
+    """并发获取多个标签页的内容，按完成顺序以NDJSON流式返回"""
+    from starlette.responses import JSONResponse, StreamingResponse
+    try:
+        body = await request.json()
+        tab_ids = body.get("tab_ids")
+        timeout = float(body.get("timeout", 30))
+        output_format = body.get("format", "markdown")
+        main_content = wants_main_content(body)
+        # 代理模式下指定标签页所在的浏览器（标签页ID只在各自的浏览器内唯一）
+        profile = body.get("profile")
+        
+        if not isinstance(tab_ids, list) or not tab_ids:
+            return JSONResponse({
+                "status": "error",
+                "message": "请提供标签页ID列表 tab_ids"
+            }, status_code=400)
+        
+        if output_format not in ("markdown", "html"):
+            return JSONResponse({
+                "status": "error",
+                "message": "format 仅支持 markdown 或 html"
+            }, status_code=400)
+        
+        # 去重并保持顺序
+        tab_ids = list(dict.fromkeys(tab_ids))
+        api_logger.info(f"收到多标签页获取请求，标签页: {tab_ids}, 单标签页超时: {timeout}秒")
+        
+        async def stream_results():
+            started = time.monotonic()
+            tasks = [asyncio.ensure_future(capture_tab(tab_id, timeout, output_format, main_content, profile)) for tab_id in tab_ids]
+            counts = {}
+            try:
+                # 每个标签页完成后立即输出，一个标签页卡住不会阻塞其他标签页
+                for next_result in asyncio.as_completed(tasks):
+                    result = await next_result
+                    counts[result["status"]] = counts.get(result["status"], 0) + 1
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                
+                yield json.dumps({
+                    "type": "summary",
+                    "total": len(tab_ids),
+                    "counts": counts,
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+                }, ensure_ascii=False) + "\n"
+            finally:
+                # 客户端断开时取消尚未完成的标签页请求
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+        
+    except Exception as e:
+        error_msg = f"获取多个标签页内容时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+def fetch_crawl_url(client, url):
+    """抓取单个URL，只读取HTML和文本类型的响应体"""
+    with client.stream("GET", url) as response:
+        content_type = response.headers.get("content-type", "")
+        text = ""
+        if response.status_code == 200 and (is_html(content_type) or content_type.startswith("text/")):
+            response.read()
+            text = response.text
+        return {
+            "status_code": response.status_code,
+            "location": response.headers.get("location"),
+            "content_type": content_type,
+            "text": text
+        }
+
+def process_crawled_page(html_content, url, main_content=False):
+    """提取链接并转换为Markdown，在转换工作队列中执行"""
+    html_content = offload_page_blobs(html_content, url)
+    page = parse_page(html_content, url)
+    page["markdown"] = convert_html_to_markdown(html_content, main_content)
+    return page
+
+async def run_scheduled_when_ready(work_class, fn, *args, priority=PRIORITY_BULK):
+    """抓取任务不丢弃页面：队列已满时按 Retry-After 等待后重试"""
+    while True:
+        try:
+            return await run_scheduled(work_class, fn, *args, priority=priority)
+        except SchedulerOverloaded as e:
+            await asyncio.sleep(e.retry_after)
+
+async def handle_crawl_site(request):
+    """从起始URL并发抓取整个站点，每个页面转换为Markdown后以NDJSON流式返回"""
+    from starlette.responses import JSONResponse, StreamingResponse
+    try:
+        body = await read_json_body(request)
+        resume_id = body.get("resume")
+        
+        if resume_id:
+            checkpoint_path = os.path.join(CRAWL_CHECKPOINT_DIR, f"{resume_id}.json")
+            if not CRAWL_JOB_ID_PATTERN.match(str(resume_id)) or not os.path.exists(checkpoint_path):
+                return JSONResponse({
+                    "status": "error",
+                    "message": f"未找到抓取任务的断点: {resume_id}"
+                }, status_code=404)
+            job = CrawlJob.from_checkpoint(
+                checkpoint_path,
+                max_pages=body.get("max_pages"),
+                concurrency=body.get("concurrency"),
+                rate_limit=body.get("rate_limit")
+            )
+        else:
+            if not body.get("url"):
+                return JSONResponse({
+                    "status": "error",
+                    "message": "请提供起始URL"
+                }, status_code=400)
+            job_id = f"crawl_{uuid.uuid4().hex[:8]}"
+            job = CrawlJob(
+                job_id,
+                body["url"],
+                max_depth=body.get("max_depth", 2),
+                max_pages=body.get("max_pages", 100),
+                concurrency=body.get("concurrency", 4),
+                same_origin=body.get("same_origin", True),
+                include_paths=body.get("include_paths"),
+                exclude_paths=body.get("exclude_paths"),
+                rate_limit=body.get("rate_limit", 2.0),
+                respect_robots=body.get("respect_robots", True),
+                checkpoint_path=os.path.join(CRAWL_CHECKPOINT_DIR, f"{job_id}.json")
+            )
+        
+        if job.job_id in active_crawls:
+            return JSONResponse({
+                "status": "error",
+                "message": f"抓取任务正在运行: {job.job_id}"
+            }, status_code=409)
+        
+        include_markdown = body.get("include_markdown", True)
+        main_content = wants_main_content(body)
+        api_logger.info(f"开始站点抓取，任务: {job.job_id}, 起始URL: {job.seed_url}, 深度: {job.max_depth}, 并发: {job.concurrency}")
+        
+        async def stream_results():
+            import httpx
+            
+            started = time.monotonic()
+            active_crawls.add(job.job_id)
+            client = httpx.Client(timeout=30.0, headers={
+                "User-Agent": f"Mozilla/5.0 (compatible; {CRAWLER_USER_AGENT}/1.0)"
+            })
+            
+            # 网络请求和转换都走调度器的低优先级队列，不影响交互请求
+            async def fetch(url):
+                return await run_scheduled_when_ready("fetch", fetch_crawl_url, client, url)
+            
+            async def process(html_content, url):
+                return await run_scheduled_when_ready("convert", process_crawled_page, html_content, url, main_content)
+            
+            try:
+                yield json.dumps({
+                    "type": "job",
+                    "job_id": job.job_id,
+                    "seed_url": job.seed_url,
+                    "resumed": bool(resume_id)
+                }, ensure_ascii=False) + "\n"
+                
+                # 恢复的任务接着之前的页面编号
+                page_number = job.pages_crawled
+                async for result in job.run(fetch, process):
+                    if result["status"] == "success":
+                        # 抓取的页面与其他来源一样可以分段读取和全文搜索
+                        page_number += 1
+                        request_id = f"{job.job_id}_{page_number}"
+                        page_data = {
+                            "url": result["url"],
+                            "title": result["title"],
+                            "received_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "status": "success"
+                        }
+                        await run_scheduled_when_ready("convert", store_markdown, request_id, result["markdown"],
+                                                       main_content, page_data)
+                        result["request_id"] = request_id
+                        result["markdown_length"] = len(result["markdown"])
+                        if not include_markdown:
+                            del result["markdown"]
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                
+                summary = job.summary()
+                summary["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+                api_logger.info(f"站点抓取结束，任务: {job.job_id}, 页面: {job.pages_crawled}, 剩余: {summary['remaining']}")
+                yield json.dumps(summary, ensure_ascii=False) + "\n"
+            finally:
+                active_crawls.discard(job.job_id)
+                client.close()
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+        
+    except ValueError as e:
+        return JSONResponse({
+            "status": "error",
+            "message": str(e)
+        }, status_code=400)
+    except Exception as e:
+        error_msg = f"启动站点抓取时出错: {str(e)}"
+        api_logger.error(error_msg)
+        return JSONResponse({
+            "status": "error",
+            "message": error_msg
+        }, status_code=500)
+
+@asynccontextmanager
+async def lifespan(app):
+    """应用启动钩子：独立进程模式下先连接原生消息桥，服务开始接受请求时设置就绪事件"""
+    if BRIDGE_ADDRESS and bridge_connection is None:
+        connect_bridge()
+    api_ready.set()
+    api_logger.info("API服务器已就绪")
+    try:
+        yield
+    finally:
+        api_ready.clear()
+
+def create_app():
+    """创建Starlette应用（由 start_api_server 在API服务线程中调用）
+
+    starlette 在此导入：浏览器每次重连都会重新启动本程序，原生消息通道不等待Web框架加载。
+    """
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    
+    routes = [
+        Route("/", endpoint=handle_index),
+        Route("/api/send-notification", endpoint=handle_send_notification, methods=["POST"]),
+        Route("/api/get-page-source", endpoint=handle_get_page_source, methods=["POST"]),
+        Route("/api/page-source-result", endpoint=handle_page_source_result, methods=["POST"]),
+        Route("/api/get-markdown", endpoint=handle_get_markdown, methods=["POST"]),
+        Route("/api/get-webpage-markdown", endpoint=handle_get_webpage_markdown, methods=["POST"]),
+        Route("/api/get-current-tab-markdown", endpoint=handle_get_current_tab_markdown, methods=["POST"]),
+        Route("/api/list-tabs", endpoint=handle_list_tabs, methods=["POST"]),
+        Route("/api/capture-tabs", endpoint=handle_capture_tabs, methods=["POST"]),
+        Route("/api/crawl-site", endpoint=handle_crawl_site, methods=["POST"]),
+        Route("/api/markdown-outline", endpoint=handle_markdown_outline, methods=["POST"]),
+        Route("/api/markdown-section", endpoint=handle_markdown_section, methods=["POST"]),
+        Route("/api/markdown-page", endpoint=handle_markdown_page, methods=["POST"]),
+        Route("/api/search", endpoint=handle_search, methods=["POST"]),
+        Route("/api/canonical-capture", endpoint=handle_canonical_capture, methods=["POST"]),
+        Route("/api/extract-structured", endpoint=handle_extract_structured, methods=["POST"]),
+        Route("/api/scheduler-stats", endpoint=handle_scheduler_stats),
+        Route("/api/browsers", endpoint=handle_browsers),
+        Route("/api/admin/memory", endpoint=handle_memory_stats),
+        Route("/api/admin/tracemalloc", endpoint=handle_tracemalloc, methods=["POST"]),
+        Route("/api/blob/{digest}", endpoint=handle_get_blob),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def start_api_server(tcp_socket=None):
+    """启动API服务器；tcp_socket 为已绑定的API端口，未提供时在此绑定"""
+    try:
+        import uvicorn
+        
+        # 保存原始的标准输出流
+        original_stdout = sys.stdout
+        original_stderr = sys.stderr
+        
+        # 配置服务器
+        config = uvicorn.Config(
+            create_app(),
+            host=API_HOST,
+            port=API_PORT,
+            log_level="info",
+            log_config=None,  # 禁用uvicorn的默认日志配置
+            lifespan="on"
+        )
+        
+        # 创建服务器实例
+        server = uvicorn.Server(config)
+        
+        # 恢复标准输出流
+        sys.stdout = original_stdout
+        sys.stderr = original_stderr
+        
+        # 创建监听套接字：TCP始终监听，配置了Unix域套接字时同时监听
+        sockets = [tcp_socket or bind_tcp_socket(API_HOST, API_PORT)]
+        if API_UDS_PATH:
+            if uds_supported():
+                sockets.append(bind_unix_socket(API_UDS_PATH))
+                api_logger.info(f"API服务器同时监听Unix域套接字: {API_UDS_PATH}")
+            else:
+                api_logger.warning("当前平台不支持Unix域套接字，仅使用TCP")
+        
+        api_logger.info("API服务器正在启动...")
+        
+        # 使用异步方式运行服务器
+        try:
+            asyncio.run(server.serve(sockets=sockets))
+        except RuntimeError as e:
+            if "asyncio.run() cannot be called from a running event loop" in str(e):
+                # 如果已经在事件循环中，使用不同的方法启动
+                api_logger.warning("检测到已有事件循环，使用替代方法启动服务器")
+                loop = asyncio.get_event_loop()
+                loop.run_until_complete(server.serve(sockets=sockets))
             else:
                 raise
+        finally:
+            if API_UDS_PATH and os.path.exists(API_UDS_PATH):
+                os.unlink(API_UDS_PATH)
         
     except Exception as e:
         api_logger.error(f"API服务器启动失败: {str(e)}")
@@ -829,8 +2762,10 @@ def start_api_server():
         import traceback
         api_logger.error(traceback.format_exc())
 
-def get_page_source(request_id: str = None) -> Dict:
-    """请求获取当前浏览器页面的源码"""
+def get_page_source(request_id: str = None, tab_id: int = None, token: CancelToken = None, window_id: int = None) -> Dict:
+    """请求获取当前浏览器页面（或指定标签页、指定窗口的当前标签页）的源码；token 的截止时间同时告知插件，取消时通知插件放弃"""
+    # 请求发出后由插件的响应或取消消息结束浏览器路由，未发出时在返回前释放
+    sent = False
     try:
         # 如果没有请求ID，生成一个
         if not request_id:
@@ -844,10 +2779,24 @@ def get_page_source(request_id: str = None) -> Dict:
             "request_id": request_id,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+        if tab_id is not None:
+            request_message["tab_id"] = tab_id
+        elif window_id is not None:
+            request_message["window_id"] = window_id
+        token = token or CancelToken(DEFAULT_REQUEST_TIMEOUT)
+        if token.cancelled:
+            return {"status": "cancelled", "message": "请求已取消", "request_id": request_id}
+        unavailable = channel_unavailable(request_id)
+        if unavailable is not None:
+            return unavailable
+        # 插件据此放弃超时的页面抓取
+        request_message["timeout"] = round(token.remaining(DEFAULT_REQUEST_TIMEOUT), 1)
         
         # 创建事件用于等待响应
         response_event = threading.Event()
         response_data = {"response": None}
+        # 客户端断开时立即停止等待
+        token.on_cancel(lambda reason: response_event.set())
         
         # 定义回调函数
         def handle_response(message):
@@ -876,18 +2825,20 @@ def get_page_source(request_id: str = None) -> Dict:
                     "message": "页面源码请求发送失败", 
                     "request_id": request_id
                 }
+            sent = True
             
             # 发送通知
             logger.info(f"页面源码请求已发送，等待响应，ID: {request_id}")
             
-            # 等待响应，最多等待60秒
-            if response_event.wait(60):
-                response = response_data["response"]
+            # 等待响应，直到截止时间
+            response_event.wait(token.remaining(DEFAULT_REQUEST_TIMEOUT))
+            response = response_data["response"]
+            if response is not None:
                 
-                # 检查响应中是否包含错误信息
+                # 检查响应中是否包含错误信息（通道断开时为 disconnected）
                 if "error" in response:
                     return {
-                        "status": "error",
+                        "status": response.get("status", "error"),
                         "message": response["error"],
                         "request_id": request_id
                     }
@@ -907,7 +2858,15 @@ def get_page_source(request_id: str = None) -> Dict:
                     "url": response.get("url", "unknown"),
                     "source_code": response["source_code"]
                 }
+            elif token.cancelled:
+                send_cancel(request_id, token.reason)
+                return {
+                    "status": "cancelled",
+                    "message": "请求已取消",
+                    "request_id": request_id
+                }
             else:
+                send_cancel(request_id, "deadline")
                 return {
                     "status": "timeout",
                     "message": "等待页面源码响应超时",
@@ -927,8 +2886,289 @@ def get_page_source(request_id: str = None) -> Dict:
             "message": error_msg, 
             "request_id": request_id if request_id else "unknown"
         }
+    finally:
+        if not sent:
+            release_browser(request_id)
+
+def dispatch_message(message):
+    """处理一条来自插件的消息（原生消息循环、独立API服务进程和多浏览器代理共用）"""
+    if broker is not None:
+        broker.observe(message)
+    if isinstance(message, dict):
+        if message.get("action") == "init":
+            logger.info("收到初始化消息")
+            # 插件上报的配置文件ID用于按浏览器转发请求
+            if broker is not None:
+                broker.identify(message.get("profile"))
+            # 发送确认响应
+            init_response = {
+                "type": "system",
+                "content": "初始化成功",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            send_message(encode_message(init_response))
+            # 开启预取时通知插件主动上报当前标签页快照
+            config = prefetch_config_message()
+            if config is not None:
+                send_message(encode_message(config))
+            return
+        elif message.get("action") == "heartbeat":
+            logger.debug("收到心跳响应")
+            return
+        elif message.get("type") == "page_source_response":
+            # 处理页面源码响应
+            logger.info("收到页面源码响应")
+            handle_page_source_response(message)
+            return
+        elif message.get("type") == "page_source_chunk":
+            # 分片回传的页面源码，交给正在流式转换的请求
+            callback = callbacks.get(message.get("request_id"))
+            if callback is not None:
+                callback(message)
+            else:
+                logger.warning(f"收到页面源码分片，但没有对应的请求，ID: {message.get('request_id')}")
+            return
+        elif message.get("type") == "button_click":
+            button_message = message.get("message", "")
+            logger.info(f"收到按钮点击消息: {button_message}")
+            response = f"来自exe程序的消息：收到 {button_message}"
+            send_message(encode_message(response))
+            return
+        elif message.get("type") == "tabs_update":
+            # 处理标签页列表上报
+            handle_tabs_update(message)
+            return
+        elif message.get("type") == "channel_lost":
+            # 插件连接已断开，等待中的请求立即结束
+            callback = callbacks.get(message.get("request_id"))
+            if callback is not None:
+                callback(message)
+            return
+        elif message.get("type") == "channel_state":
+            # 原生消息桥或代理成员通知插件连接状态变化
+            set_channel_state(message.get("state"), message.get("reason"))
+            return
+        elif message.get("type") == "bridge_stats":
+            # 原生消息桥对统计请求的回复
+            callback = callbacks.get(message.get("request_id"))
+            if callback is not None:
+                callback(message)
+            return
+        elif message.get("type") == "page_snapshot":
+            # 处理插件主动上报的当前标签页快照
+            handle_page_snapshot(message)
+            return
+        elif message.get("type") == "set_active_page":
+            # 处理设置活跃页面请求
+            logger.info("收到设置活跃页面请求")
+            handle_set_active_page(message)
+            return
+            
+    # 处理常规消息
+    if message == "用户点击了按钮1":
+        send_message(encode_message("来自exe程序的消息：按钮1被点击"))
+    elif message == "用户点击了按钮2":
+        send_message(encode_message("来自exe程序的消息：按钮2被点击"))
+    elif message == "用户点击了按钮3":
+        send_message(encode_message("来自exe程序的消息：按钮3被点击"))
+    elif message == "用户点击了按钮4":
+        time.sleep(3)
+        send_message(encode_message("来自exe程序的消息：按钮4被点击"))
+
+def connect_bridge():
+    """连接原生消息桥，并在后台线程中处理桥转发来的插件消息"""
+    global bridge_connection
+    from multiprocessing.connection import Client
+    
+    bridge_connection = Client(BRIDGE_ADDRESS, authkey=bytes.fromhex(os.environ["MARKDOWN_BRIDGE_AUTHKEY"]))
+    api_logger.info(f"已连接原生消息桥: {BRIDGE_ADDRESS}")
+    threading.Thread(target=read_bridge_messages, daemon=True).start()
+
+def read_bridge_messages():
+    """读取桥转发的消息帧（与 stdin 上的格式相同）；连接断开时进行中的请求立即结束，并重新连接"""
+    while True:
+        try:
+            frame = bridge_connection.recv_bytes()
+        except (EOFError, OSError):
+            api_logger.error("与原生消息桥的连接已断开")
+            set_channel_state("disconnected", "bridge_lost")
+            reconnect_bridge()
+            return
+        try:
+            message = json.loads(frame[4:].decode("utf-8"))
+            if isinstance(message, dict) and message.get("type") == "shared_payload":
+                message = read_shared_payload(message)
+            dispatch_message(message)
+        except Exception as e:
+            logger.error(f"处理消息时出错: {str(e)}")
+
+def reconnect_bridge():
+    """按指数退避重新连接原生消息桥，期间的请求立即以 disconnected 失败"""
+    delay = 0.1
+    while True:
+        time.sleep(delay)
+        try:
+            connect_bridge()
+        except Exception as e:
+            api_logger.warning(f"重新连接原生消息桥失败: {str(e)}")
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            continue
+        # 插件的实际状态由桥随后通知
+        set_channel_state("connected")
+        return
+
+def read_shared_payload(handle):
+    """从桥共享的内存段中直接解码大消息，读取完毕后通知桥释放该段"""
+    from shared_payload import open_shared_payload
+    try:
+        with open_shared_payload(handle) as view:
+            return json.loads(str(view, "utf-8"))
+    finally:
+        send_message(encode_message({"type": "shared_payload_release", "name": handle["name"]}))
+
+def serve_api(workers=1):
+    """独立进程模式（由 api_service.py 调用）：只运行API服务，插件消息经由原生消息桥转发"""
+    if workers <= 1:
+        start_api_server()
+        return
+    import uvicorn
+    
+    # 多个工作进程共用一个TCP监听套接字，每个进程在启动钩子中各自连接原生消息桥
+    api_logger.info(f"API服务器以 {workers} 个工作进程启动...")
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=API_HOST,
+        port=API_PORT,
+        workers=workers,
+        log_level="info",
+        log_config=None,
+        lifespan="on",
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
+
+def claim_api_port():
+    """绑定并监听API端口；已被其他进程（通常是另一个浏览器启动的本地程序）占用时返回 None"""
+    try:
+        sock = bind_tcp_socket(API_HOST, API_PORT)
+        sock.listen(2048)
+        return sock
+    except OSError:
+        return None
+
+def start_host_role(profile=None):
+    """确定本进程的角色：占用API端口则启动API服务器并作为代理，否则作为成员注册到已有的代理
+
+    profile 为已上报的配置文件ID；返回是否成功（端口被占用且无法连接代理时返回 False）。
+    """
+    global broker, broker_member
+    sock = claim_api_port()
+    if sock is not None:
+        api_logger.info("正在启动API服务器线程...")
+        threading.Thread(target=start_api_server, args=(sock,), daemon=True).start()
+        # 不固定等待API服务器：原生消息通道不依赖API服务，立即开始处理插件消息，
+        # 启动钩子设置 api_ready 后再向插件发送启动消息
+        threading.Thread(target=watch_api_startup, daemon=True).start()
+        if BROKER_ENABLED:
+            try:
+                broker = ProfileBroker(API_PORT, dispatch_message, profile).start()
+                atexit.register(broker.stop)
+            except Exception as e:
+                api_logger.error(f"多浏览器代理启动失败: {str(e)}")
+        return True
+    if not BROKER_ENABLED:
+        api_logger.error(f"API端口 {API_PORT} 已被占用")
+        return False
+    try:
+        broker_member = BrokerMember(API_PORT, send_message, handle_broker_lost, profile).connect()
+        return True
+    except Exception as e:
+        api_logger.error(f"API端口 {API_PORT} 已被占用，且无法连接多浏览器代理: {str(e)}")
+        return False
+
+def handle_broker_lost():
+    """代理所在的浏览器退出后重新确定角色：端口已空出时接管，否则注册到新的代理"""
+    global broker_member
+    member, broker_member = broker_member, None
+    profile = member.profile if member is not None else None
+    delay = 0.5
+    while not start_host_role(profile):
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+def handle_extension_message(message):
+    """处理本进程 stdin 上的插件消息：成员进程只在本地处理初始化和心跳，其他消息转发给代理"""
+    member = broker_member
+    if member is None or not isinstance(message, dict):
+        dispatch_message(message)
+        return
+    if message.get("action") == "init":
+        member.register(message.get("profile"))
+    elif message.get("action") != "heartbeat":
+        if not member.forward(encode_message(message)):
+            logger.warning(f"代理不可用，丢弃插件消息: {message.get('type')}")
+        return
+    dispatch_message(message)
+
+def watch_api_startup(timeout=15):
+    """等待API服务器就绪后发送启动消息；超时未就绪时只记录错误"""
+    started = time.monotonic()
+    if api_ready.wait(timeout):
+        api_logger.info(f"API服务器启动耗时: {(time.monotonic() - started) * 1000:.0f}ms")
+        send_startup_message()
+    else:
+        api_logger.error(f"API服务器在 {timeout} 秒内未就绪")
+
+def send_startup_message():
+    startup_message = {
+        "type": "system",
+        "content": "本地应用程序已启动",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if not send_message(encode_message(startup_message)):
+        logger.error("无法发送启动消息")
+    logger.info("本地应用程序已启动")
+
+def send_heartbeat():
+    return send_message(encode_message({
+        "type": "heartbeat",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }))
+
+def handle_channel_state(state, reason):
+    """本进程的原生消息通道状态变化：成员进程转发给代理，其他情况在本进程处理"""
+    if state == "closed":
+        return
+    handle_extension_message(channel_state_message(state, reason))
+
+def handle_channel_closed(reason):
+    """stdin 已关闭（插件断开连接或浏览器退出）
+
+    插件重新连接时浏览器会启动新的本地程序。代理进程保留正在运行的API服务器，新进程作为成员注册后继续提供服务；
+    在 ORPHAN_TIMEOUT 内没有任何浏览器时退出并释放API端口。其他角色直接退出。
+    """
+    logger.warning(f"插件已断开连接: {reason}")
+    channel_supervisor.closed("eof")
+    if broker is None:
+        fail_inflight_requests("eof")
+        return
+    set_channel_state("closed", "eof")
+    api_logger.info(f"本地浏览器已断开，API服务器继续运行，等待其他浏览器注册（{ORPHAN_TIMEOUT:.0f}秒）")
+    orphaned_since = None
+    while True:
+        if broker.browsers():
+            orphaned_since = None
+        elif orphaned_since is None:
+            orphaned_since = time.monotonic()
+        elif time.monotonic() - orphaned_since >= ORPHAN_TIMEOUT:
+            api_logger.info("没有已连接的浏览器，退出并释放API端口")
+            return
+        time.sleep(0.5)
 
 def main():
+    global traffic_recorder, channel_supervisor
+    traffic_recorder = create_recorder()
+    
     # 注册信号处理
     signal.signal(signal.SIGINT, graceful_shutdown)
     signal.signal(signal.SIGTERM, graceful_shutdown)
@@ -940,139 +3180,36 @@ def main():
     original_stdout = sys.stdout
     original_stderr = sys.stderr
     
-    connection_retry_count = 0
-    max_connection_retries = 5
-    last_connection_check = time.time()
-    connection_check_interval = 30
+    # 启动API服务器（或注册到其他浏览器的本地程序）；原生消息通道断开时不重启API服务器
+    if not start_host_role():
+        api_logger.error("本进程不提供API服务，只处理插件消息")
+        send_startup_message()
+    elif broker_member is not None:
+        # 成员进程使用代理已在运行的API服务器；本进程启动API服务器时，就绪后由 watch_api_startup 发送
+        send_startup_message()
+    
+    # 空闲时按自适应间隔发送心跳；插件无响应时进行中的请求立即结束
+    channel_supervisor = ConnectionSupervisor(send_heartbeat, handle_channel_state).start()
     
-    while connection_retry_count < max_connection_retries:
+    # 持续监听chrome插件发来的消息，读取到 EOF 时立即处理断开
+    while True:
+        # 确保使用原始的标准输出流
+        sys.stdout = original_stdout
+        sys.stderr = original_stderr
+        
         try:
-            # 确保使用原始的标准输出流
-            sys.stdout = original_stdout
-            sys.stderr = original_stderr
-            
-            # 启动API服务器线程
-            api_logger.info("正在启动API服务器线程...")
-            server_thread = threading.Thread(target=start_api_server, daemon=True)
-            server_thread.start()
-            
-            # 等待服务器启动
-            api_logger.info("等待API服务器启动...")
-            time.sleep(2)
-            
-            # 发送启动消息
-            startup_message = {
-                "type": "system",
-                "content": "本地应用程序已启动",
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            if not send_message(encode_message(startup_message)):
-                raise Exception("无法发送启动消息")
-            
-            logger.info("本地应用程序已启动")
-            
-            # 重置连接重试计数
-            connection_retry_count = 0
-            
-            # 持续监听chrome插件发来的消息
-            consecutive_errors = 0
-            empty_reads = 0
-            while True:
-                # 确保使用原始的标准输出流
-                sys.stdout = original_stdout
-                sys.stderr = original_stderr
-                
-                current_time = time.time()
-                
-                # 定期检查连接状态
-                if current_time - last_connection_check >= connection_check_interval:
-                    logger.debug("执行定期连接状态检查")
-                    last_connection_check = current_time
-                    
-                    try:
-                        # 发送心跳消息
-                        heartbeat = {
-                            "type": "heartbeat",
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        if not send_message(encode_message(heartbeat)):
-                            logger.warning("心跳消息发送失败")
-                            raise Exception("心跳消息发送失败")
-                    except Exception as e:
-                        logger.error(f"心跳检查失败: {str(e)}")
-                        break  # 跳出内层循环，触发重连
-                
-                try:
-                    message = get_message()
-                    
-                    if message is None:
-                        empty_reads += 1
-                        if empty_reads >= 30:  # 如果连续30次（约30秒）都没有读到消息
-                            logger.warning("长时间未收到消息，检查连接状态")
-                            empty_reads = 0  # 重置计数器
-                        continue
-                    
-                    empty_reads = 0  # 成功读取消息，重置计数器
-                    
-                    if isinstance(message, dict):
-                        if message.get("action") == "init":
-                            logger.info("收到初始化消息")
-                            # 发送确认响应
-                            init_response = {
-                                "type": "system",
-                                "content": "初始化成功",
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            }
-                            send_message(encode_message(init_response))
-                            continue
-                        elif message.get("action") == "heartbeat":
-                            logger.debug("收到心跳响应")
-                            continue
-                        elif message.get("type") == "page_source_response":
-                            # 处理页面源码响应
-                            logger.info("收到页面源码响应")
-                            handle_page_source_response(message)
-                            continue
-                        elif message.get("type") == "button_click":
-                            button_message = message.get("message", "")
-                            logger.info(f"收到按钮点击消息: {button_message}")
-                            response = f"来自exe程序的消息：收到 {button_message}"
-                            send_message(encode_message(response))
-                            continue
-                        elif message.get("type") == "set_active_page":
-                            # 处理设置活跃页面请求
-                            logger.info("收到设置活跃页面请求")
-                            handle_set_active_page(message)
-                            continue
-                            
-                    # 处理常规消息
-                    if message == "用户点击了按钮1":
-                        send_message(encode_message("来自exe程序的消息：按钮1被点击"))
-                    elif message == "用户点击了按钮2":
-                        send_message(encode_message("来自exe程序的消息：按钮2被点击"))
-                    elif message == "用户点击了按钮3":
-                        send_message(encode_message("来自exe程序的消息：按钮3被点击"))
-                    elif message == "用户点击了按钮4":
-                        time.sleep(3)
-                        send_message(encode_message("来自exe程序的消息：按钮4被点击"))
-                        
-                except Exception as e:
-                    logger.error(f"处理消息时出错: {str(e)}")
-                    consecutive_errors += 1
-                    if consecutive_errors >= 3:  # 如果连续出错3次
-                        break  # 跳出内层循环，触发重连
-                    continue
-                    
-                consecutive_errors = 0  # 成功处理消息，重置错误计数
-                    
+            message = get_message()
+        except ChannelClosed as e:
+            handle_channel_closed(str(e))
+            sys.exit(0)
+        
+        channel_supervisor.received()
+        if message is None:
+            continue
+        try:
+            handle_extension_message(message)
         except Exception as e:
-            logger.error(f"程序运行时出错 (尝试 {connection_retry_count + 1}/{max_connection_retries}): {str(e)}")
-            connection_retry_count += 1
-            if connection_retry_count < max_connection_retries:
-                time.sleep(5)  # 等待5秒后重试
-            else:
-                logger.error("达到最大重试次数，程序退出")
-                sys.exit(1)
+            logger.error(f"处理消息时出错: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
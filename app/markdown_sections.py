@@ -0,0 +1,149 @@
+import re
+from bisect import bisect_right
+
+# ATX 标题（html2text 只输出这种形式），行首最多3个空格
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})[ \t]+(.*?)[ \t#]*$')
+# 围栏代码块的起止标记，代码块中的 # 不算标题
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+
+# 分页读取的默认/最大字节数
+DEFAULT_PAGE_BYTES = 16 * 1024
+MAX_PAGE_BYTES = 256 * 1024
+
+
+def build_section_index(markdown):
+    """扫描Markdown，建立标题/章节索引（字节偏移基于UTF-8编码）"""
+    sections = []
+    byte_offset = 0
+    char_offset = 0
+    fence = None
+
+    for line in markdown.splitlines(keepends=True):
+        stripped = line.rstrip('\r\n')
+        fence_match = FENCE_PATTERN.match(stripped)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None:
+            heading = HEADING_PATTERN.match(stripped)
+            if heading:
+                if not sections and byte_offset > 0:
+                    # 第一个标题之前的内容作为前言章节
+                    sections.append({"level": 0, "title": "", "byte_offset": 0, "char_offset": 0})
+                sections.append({
+                    "level": len(heading.group(1)),
+                    "title": heading.group(2).strip(),
+                    "byte_offset": byte_offset,
+                    "char_offset": char_offset
+                })
+
+        byte_offset += len(line.encode('utf-8'))
+        char_offset += len(line)
+
+    if not sections and markdown:
+        sections.append({"level": 0, "title": "", "byte_offset": 0, "char_offset": 0})
+
+    # 章节长度到下一个标题为止
+    for position, section in enumerate(sections):
+        section["id"] = position
+        if position + 1 < len(sections):
+            following = sections[position + 1]
+            section["byte_length"] = following["byte_offset"] - section["byte_offset"]
+            section["char_length"] = following["char_offset"] - section["char_offset"]
+        else:
+            section["byte_length"] = byte_offset - section["byte_offset"]
+            section["char_length"] = char_offset - section["char_offset"]
+
+    return sections
+
+
+def outline(sections):
+    """返回不含内部字段的目录"""
+    return [
+        {
+            "id": section["id"],
+            "level": section["level"],
+            "title": section["title"],
+            "byte_offset": section["byte_offset"],
+            "byte_length": section["byte_length"]
+        }
+        for section in sections
+    ]
+
+
+def read_section(markdown, sections, section_id, include_subsections=False, max_bytes=None):
+    """读取指定章节内容，include_subsections 为真时包含其下级章节"""
+    if section_id < 0 or section_id >= len(sections):
+        return None
+
+    section = sections[section_id]
+    end = section_id + 1
+    if include_subsections:
+        while end < len(sections) and sections[end]["level"] > section["level"] > 0:
+            end += 1
+
+    start_char = section["char_offset"]
+    end_char = sections[end]["char_offset"] if end < len(sections) else len(markdown)
+    content = markdown[start_char:end_char]
+
+    truncated = False
+    if max_bytes is not None:
+        encoded = content.encode('utf-8')
+        if len(encoded) > max_bytes:
+            content = encoded[:_char_boundary(encoded, max_bytes)].decode('utf-8')
+            truncated = True
+
+    return {
+        "id": section["id"],
+        "level": section["level"],
+        "title": section["title"],
+        "byte_offset": section["byte_offset"],
+        "byte_length": sum(sections[i]["byte_length"] for i in range(section_id, end)),
+        "subsection_count": end - section_id - 1,
+        "truncated": truncated,
+        "content": content
+    }
+
+
+def read_page(markdown, sections, offset=0, limit=DEFAULT_PAGE_BYTES):
+    """按字节偏移分页读取，边界对齐到完整的UTF-8字符"""
+    limit = max(1, min(int(limit), MAX_PAGE_BYTES))
+    offset = max(0, int(offset))
+
+    # 从偏移所在章节开始编码，避免每次都编码整篇文档
+    start_char = 0
+    base_offset = 0
+    if sections:
+        position = bisect_right([section["byte_offset"] for section in sections], offset) - 1
+        if position >= 0:
+            start_char = sections[position]["char_offset"]
+            base_offset = sections[position]["byte_offset"]
+
+    tail = markdown[start_char:].encode('utf-8')
+    total_bytes = base_offset + len(tail)
+    local_start = _char_boundary(tail, min(offset - base_offset, len(tail)))
+    local_end = _char_boundary(tail, min(local_start + limit, len(tail)))
+    if local_end == local_start and local_start < len(tail):
+        # limit 小于单个字符时至少返回一个完整字符
+        local_end = _char_boundary(tail, local_start + 4)
+
+    next_offset = base_offset + local_end
+    return {
+        "offset": base_offset + local_start,
+        "next_offset": next_offset if next_offset < total_bytes else None,
+        "total_bytes": total_bytes,
+        "content": tail[local_start:local_end].decode('utf-8')
+    }
+
+
+def _char_boundary(encoded, position):
+    """把字节位置向前调整到UTF-8字符边界；负数位置抛出 ValueError"""
+    if position < 0:
+        raise ValueError(f"字节位置不能为负数: {position}")
+    position = min(position, len(encoded))
+    while 0 < position < len(encoded) and (encoded[position] & 0xC0) == 0x80:
+        position -= 1
+    return position
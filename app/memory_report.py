@@ -0,0 +1,166 @@
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+# 内存统计只用标准库，原生消息桥和API服务共用
+
+# 保留的 tracemalloc 快照数，更早的快照被丢弃
+MAX_SNAPSHOTS = 4
+# 默认记录的调用栈深度
+DEFAULT_TRACE_FRAMES = 10
+# 不计入分配统计的文件（tracemalloc 自身和导入机制）
+IGNORED_FILES = ("<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>", tracemalloc.__file__)
+
+
+def estimate_size(obj, seen=None):
+    """估算对象及其包含的字典、列表和字符串占用的字节数（同一对象只计一次）"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    return size
+
+
+PAGE_FIELDS = ("source_code", "markdown", "sections", "source_delta", "markdown_delta")
+
+
+def page_size_breakdown(page_data):
+    """单个页面各字段的大致字节数：源码、Markdown（近似重复的页面为差异）、章节索引及其他字段"""
+    seen = set()
+    fields = {name: estimate_size(page_data[name], seen) for name in PAGE_FIELDS if name in page_data}
+    total = estimate_size(page_data, seen) + sum(fields.values())
+    return total, fields
+
+
+def process_memory():
+    """进程的常驻内存和峰值（字节）；无法获取时为 None"""
+    rss = peak = None
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if peak is None:
+        try:
+            import resource
+            # macOS 上单位为字节，Linux 上为KB
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform != "darwin":
+                peak *= 1024
+        except ImportError:  # Windows
+            pass
+    return {"pid": os.getpid(), "rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+def format_frame(frame):
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def format_stat(stat, key_type):
+    entry = {
+        "site": format_frame(stat.traceback[0]),
+        "size_bytes": stat.size,
+        "count": stat.count
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    if key_type == "traceback":
+        entry["traceback"] = [format_frame(frame) for frame in stat.traceback]
+    return entry
+
+
+class AllocationProfiler:
+    """按需开启 tracemalloc，保存快照并比较两次快照之间增长最多的分配位置"""
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()
+        self.sequence = itertools.count(1)
+        self.lock = threading.Lock()
+        # 只停止由本对象开启的跟踪
+        self.started_here = False
+
+    def start(self, frames=DEFAULT_TRACE_FRAMES):
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.started_here = True
+            return self.status()
+
+    def stop(self):
+        with self.lock:
+            if tracemalloc.is_tracing() and self.started_here:
+                tracemalloc.stop()
+            self.started_here = False
+            self.snapshots.clear()
+            return self.status()
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": [
+                {"snapshot_id": snapshot_id, "time": taken}
+                for snapshot_id, (taken, _) in self.snapshots.items()
+            ]
+        }
+
+    def _take(self):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("尚未开启分配跟踪，请先执行 start")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        )
+        snapshot_id = f"snap_{next(self.sequence)}"
+        self.snapshots[snapshot_id] = (time.strftime("%Y-%m-%d %H:%M:%S"), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot_id, snapshot
+
+    def snapshot(self, limit=20, key_type="lineno"):
+        """保存一个快照，返回占用最多的分配位置"""
+        with self.lock:
+            snapshot_id, snapshot = self._take()
+        stats = snapshot.statistics(key_type)
+        return {
+            "snapshot_id": snapshot_id,
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [format_stat(stat, key_type) for stat in stats[:limit]]
+        }
+
+    def diff(self, baseline=None, limit=20, key_type="lineno"):
+        """保存一个新快照，与 baseline（默认为上一个快照）比较，返回增长最多的分配位置"""
+        with self.lock:
+            if baseline is None:
+                if not self.snapshots:
+                    raise KeyError("没有可比较的快照，请先执行 snapshot")
+                baseline = next(reversed(self.snapshots))
+            if baseline not in self.snapshots:
+                raise KeyError(f"快照不存在或已被丢弃: {baseline}")
+            _, old = self.snapshots[baseline]
+            snapshot_id, snapshot = self._take()
+        stats = snapshot.compare_to(old, key_type)
+        return {
+            "snapshot_id": snapshot_id,
+            "baseline": baseline,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [format_stat(stat, key_type) for stat in stats[:limit]]
+        }
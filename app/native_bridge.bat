@@ -0,0 +1,2 @@
+@echo off
+python "%~dp0native_bridge.py"
\ No newline at end of file
@@ -0,0 +1,419 @@
+import json
+import logging
+import os
+import re
+import secrets
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from multiprocessing.connection import Listener
+
+from shared_payload import SharedPayloadPool, SHARED_PAYLOAD_MIN_BYTES
+from traffic_recorder import create_recorder
+from prefetch import prefetch_config_message
+from memory_report import process_memory
+from connection_supervisor import ConnectionSupervisor, channel_lost_message, channel_state_message
+
+# 独立进程模式的原生消息桥：只负责 stdin/stdout 与本地IPC之间的消息转发，
+# API服务（api_service.py，可多个工作进程）的负载不会拖慢插件消息和心跳的处理。
+# 只使用标准库，启动快；将 manifest.json 的 path 指向 native_bridge.bat 即可启用。
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+API_SERVICE_PY = os.path.join(APP_DIR, "api_service.py")
+
+# API工作进程数
+API_WORKERS = int(os.environ.get("MARKDOWN_API_WORKERS", "2"))
+# API服务异常退出后的重启间隔（秒）
+SERVICE_RESTART_DELAY = 2
+# 清理过期请求路由和共享内存段的间隔（秒）；心跳间隔由 ConnectionSupervisor 按通道空闲情况调整
+MAINTENANCE_INTERVAL = 30
+# 请求路由的保留时间，超时未响应的请求不再等待
+ROUTE_TTL = 300
+# API服务尚未连接时最多缓存的消息数
+MAX_BUFFERED_FRAMES = 100
+# 大消息（页面源码）只在开头查找请求ID，不解析整个JSON
+REQUEST_ID_PATTERN = re.compile(rb'"request_id"\s*:\s*"([^"\\]*)"')
+TYPE_PATTERN = re.compile(rb'"type"\s*:\s*"([^"\\]*)"')
+DONE_PATTERN = re.compile(rb'"done"\s*:\s*true')
+HEADER_SCAN_BYTES = 1024
+SMALL_FRAME_BYTES = 4096
+
+
+def setup_logger():
+    """配置日志记录器"""
+    log_dir = "logs"
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    logger = logging.getLogger('bridge')
+    logger.setLevel(logging.DEBUG)
+    handler = RotatingFileHandler(os.path.join(log_dir, 'bridge.log'), maxBytes=1024*1024, backupCount=5, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    return logger
+
+
+logger = setup_logger()
+
+
+def encode_message(message):
+    content = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return struct.pack('=I', len(content)) + content
+
+
+def system_message(content):
+    return {
+        "type": "system",
+        "content": content,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def is_partial(head):
+    """分片回传的页面源码在最后一片之前都保留请求路由"""
+    match = TYPE_PATTERN.search(head)
+    return bool(match) and match.group(1) == b"page_source_chunk" and not DONE_PATTERN.search(head)
+
+
+def default_address():
+    """Windows 使用命名管道，其他平台使用临时目录中的Unix域套接字"""
+    if sys.platform == "win32":
+        return rf"\\.\pipe\markdown-bridge-{os.getpid()}"
+    return os.path.join(tempfile.gettempdir(), f"markdown-bridge-{os.getpid()}.sock")
+
+
+class NativeBridge:
+    """在插件（stdin/stdout）与API服务工作进程（本地IPC）之间转发消息帧"""
+
+    def __init__(self, workers=API_WORKERS, address=None):
+        self.workers = workers
+        self.address = address or default_address()
+        self.authkey = secrets.token_bytes(32)
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.stdout_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.routes = {}
+        self.buffered = deque()
+        self.next_connection = 0
+        self.service = None
+        self.stopping = threading.Event()
+        # 大消息放在共享内存中交给工作进程，IPC连接上只传递段名称
+        self.payloads = SharedPayloadPool()
+        # 设置 MARKDOWN_RECORD_PATH 时录制与插件之间的消息
+        self.recorder = create_recorder()
+        # 插件无响应时通知工作进程，进行中的请求立即结束
+        self.supervisor = ConnectionSupervisor(self.send_heartbeat, self.handle_channel_state)
+
+    # ---- 插件一侧 ----
+
+    def write_frame(self, frame):
+        with self.stdout_lock:
+            sys.stdout.buffer.write(frame)
+            sys.stdout.buffer.flush()
+        if self.recorder is not None:
+            self.recorder.record("out", frame)
+
+    def read_frame(self):
+        """读取一帧，返回 (原始数据, 共享内存段)；stdin 关闭时返回 None
+
+        大消息直接读入共享内存段，此时原始数据只有4字节长度前缀。
+        """
+        raw_length = sys.stdin.buffer.read(4)
+        if len(raw_length) < 4:
+            return None
+        length = struct.unpack('=I', raw_length)[0]
+        if length >= SHARED_PAYLOAD_MIN_BYTES:
+            segment = self.payloads.allocate(length)
+            view = segment.buf[:length]
+            try:
+                received = 0
+                while received < length:
+                    count = sys.stdin.buffer.readinto(view[received:])
+                    if not count:
+                        break
+                    received += count
+            finally:
+                view.release()
+            if received < length:
+                self.payloads.discard(segment)
+                return None
+            return raw_length, segment
+        body = sys.stdin.buffer.read(length)
+        if len(body) < length:
+            return None
+        return raw_length + body, None
+
+    def handle_extension_frame(self, frame, segment=None):
+        if self.recorder is not None:
+            # 共享内存中的大消息只在录制时复制一份
+            self.recorder.record("in", frame if segment is None else frame + bytes(segment.buf[:struct.unpack('=I', frame)[0]]))
+        if segment is not None:
+            # 只在开头查找消息类型和请求ID
+            head = bytes(segment.buf[:HEADER_SCAN_BYTES])
+            match = TYPE_PATTERN.search(head)
+            if match and match.group(1) == b"tabs_update":
+                self.broadcast(frame, segment)
+                return
+            match = REQUEST_ID_PATTERN.search(head)
+            self.forward(frame, match.group(1).decode("utf-8") if match else None, segment, keep_route=is_partial(head))
+            return
+
+        body = frame[4:]
+        message = None
+        if len(body) <= SMALL_FRAME_BYTES:
+            try:
+                message = json.loads(body.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                logger.error("解析插件消息失败")
+                return
+
+        # 初始化和心跳由桥直接处理，不受API服务负载影响
+        if isinstance(message, dict):
+            if message.get("action") == "init":
+                logger.info("收到初始化消息")
+                self.write_frame(encode_message(system_message("初始化成功")))
+                config = prefetch_config_message()
+                if config is not None:
+                    self.write_frame(encode_message(config))
+                return
+            if message.get("action") == "heartbeat":
+                logger.debug("收到心跳响应")
+                return
+            if message.get("type") == "tabs_update":
+                # 标签页列表每个工作进程都要缓存
+                self.broadcast(frame)
+                return
+
+        if isinstance(message, dict):
+            request_id = message.get("request_id")
+        else:
+            match = REQUEST_ID_PATTERN.search(body[:HEADER_SCAN_BYTES])
+            request_id = match.group(1).decode("utf-8") if match else None
+        self.forward(frame, request_id, keep_route=is_partial(body[:HEADER_SCAN_BYTES]))
+
+    # ---- API服务一侧 ----
+
+    def forward(self, frame, request_id=None, segment=None, keep_route=False):
+        """发给发出该请求的工作进程；没有对应请求时轮流分配。keep_route 为真时后续还有同一请求的响应"""
+        with self.lock:
+            route = None
+            if request_id:
+                route = self.routes.get(request_id) if keep_route else self.routes.pop(request_id, None)
+                if route is not None and keep_route:
+                    self.routes[request_id] = (route[0], time.monotonic())
+            connection = route[0] if route and route[0] in self.connections else None
+            if connection is None:
+                if not self.connections:
+                    if len(self.buffered) >= MAX_BUFFERED_FRAMES:
+                        logger.warning("API服务未连接，丢弃最早缓存的消息")
+                        dropped = self.buffered.popleft()
+                        if dropped[2] is not None:
+                            self.payloads.discard(dropped[2])
+                    self.buffered.append((frame, request_id, segment))
+                    return
+                connection = self.connections[self.next_connection % len(self.connections)]
+                self.next_connection += 1
+        self.deliver([connection], frame, segment)
+
+    def broadcast(self, frame, segment=None):
+        with self.lock:
+            connections = list(self.connections)
+        self.deliver(connections, frame, segment)
+
+    def deliver(self, connections, frame, segment=None):
+        if segment is not None:
+            if not connections:
+                self.payloads.discard(segment)
+                return
+            # 每个接收方持有一个引用，读取完毕后回送释放消息
+            handle = self.payloads.share(segment, struct.unpack('=I', frame[:4])[0], connections)
+            frame = encode_message({"type": "shared_payload", **handle})
+        for connection in connections:
+            self.send(connection, frame)
+
+    def send(self, connection, frame):
+        try:
+            connection.send_bytes(frame)
+        except (OSError, EOFError) as e:
+            logger.error(f"向API服务转发消息失败: {str(e)}")
+            self.drop_connection(connection)
+
+    def drop_connection(self, connection):
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+            for request_id in [rid for rid, route in self.routes.items() if route[0] is connection]:
+                del self.routes[request_id]
+        self.payloads.release_holder(connection)
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+    def accept_connections(self):
+        while not self.stopping.is_set():
+            try:
+                connection = self.listener.accept()
+            except Exception as e:
+                if not self.stopping.is_set():
+                    logger.error(f"接受API服务连接失败: {str(e)}")
+                    time.sleep(0.1)
+                continue
+            with self.lock:
+                self.connections.append(connection)
+                buffered = list(self.buffered)
+                self.buffered.clear()
+            logger.info(f"API工作进程已连接，当前连接数: {len(self.connections)}")
+            # 工作进程连接（或重新连接）时插件已无响应
+            if not self.supervisor.connected:
+                self.send(connection, encode_message(channel_state_message(self.supervisor.state, self.supervisor.reason)))
+            threading.Thread(target=self.read_worker, args=(connection,), daemon=True).start()
+            for frame, request_id, segment in buffered:
+                self.forward(frame, request_id, segment)
+
+    def read_worker(self, connection):
+        """转发工作进程发往插件的消息，并记录请求ID以便把响应送回该进程"""
+        while True:
+            try:
+                frame = connection.recv_bytes()
+            except (EOFError, OSError):
+                logger.warning("API工作进程连接已断开")
+                self.drop_connection(connection)
+                return
+            try:
+                message = json.loads(frame[4:].decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                message = None
+            if isinstance(message, dict) and message.get("type") == "shared_payload_release":
+                self.payloads.release(message.get("name"), connection)
+                continue
+            if isinstance(message, dict) and message.get("type") == "bridge_stats":
+                self.send(connection, encode_message({**message, "stats": self.stats()}))
+                continue
+            if isinstance(message, dict) and message.get("request_id"):
+                with self.lock:
+                    self.routes[message["request_id"]] = (connection, time.monotonic())
+            self.write_frame(frame)
+
+    def stats(self):
+        """桥进程的内存和持有的消息：共享内存段、请求路由和等待API服务连接时缓存的消息"""
+        with self.lock:
+            buffered_bytes = sum(len(frame) + (segment.size if segment is not None else 0) for frame, _, segment in self.buffered)
+            return {
+                "process": process_memory(),
+                "connections": len(self.connections),
+                "routes": len(self.routes),
+                "buffered_frames": len(self.buffered),
+                "buffered_bytes": buffered_bytes,
+                "shared_payloads": self.payloads.stats()
+            }
+
+    # ---- 进程管理 ----
+
+    def start_service(self):
+        env = dict(os.environ)
+        env["MARKDOWN_BRIDGE_ADDRESS"] = self.address
+        env["MARKDOWN_BRIDGE_AUTHKEY"] = self.authkey.hex()
+        env["MARKDOWN_API_WORKERS"] = str(self.workers)
+        # API服务不能写 stdout，否则会破坏原生消息帧
+        self.service = subprocess.Popen(
+            [sys.executable, API_SERVICE_PY],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env
+        )
+        logger.info(f"API服务已启动，进程: {self.service.pid}, 工作进程数: {self.workers}")
+
+    def supervise_service(self):
+        """API服务异常退出时自动重启，插件连接不受影响"""
+        while not self.stopping.is_set():
+            code = self.service.wait()
+            if self.stopping.is_set():
+                return
+            logger.error(f"API服务已退出，退出码: {code}，{SERVICE_RESTART_DELAY}秒后重启")
+            time.sleep(SERVICE_RESTART_DELAY)
+            self.start_service()
+
+    def send_heartbeat(self):
+        try:
+            self.write_frame(encode_message({
+                "type": "heartbeat",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }))
+            return True
+        except Exception as e:
+            logger.error(f"心跳消息发送失败: {str(e)}")
+            return False
+
+    def handle_channel_state(self, state, reason):
+        """插件无响应或恢复：通知所有工作进程；无响应时等待中的请求立即以 disconnected 结束"""
+        logger.warning(f"插件连接状态: {state}, 原因: {reason}")
+        if state != "connected":
+            with self.lock:
+                routes, self.routes = self.routes, {}
+            for request_id, route in routes.items():
+                self.send(route[0], encode_message(channel_lost_message(request_id, reason)))
+        if state != "closed":
+            self.broadcast(encode_message(channel_state_message(state, reason)))
+
+    def maintenance(self):
+        while not self.stopping.wait(MAINTENANCE_INTERVAL):
+            # 清理长时间未响应的请求路由
+            expired = time.monotonic() - ROUTE_TTL
+            with self.lock:
+                for request_id in [rid for rid, route in self.routes.items() if route[1] < expired]:
+                    del self.routes[request_id]
+            self.payloads.expire()
+
+    def stop(self):
+        self.stopping.set()
+        self.supervisor.stop()
+        if self.service is not None and self.service.poll() is None:
+            self.service.terminate()
+            try:
+                self.service.wait(10)
+            except subprocess.TimeoutExpired:
+                self.service.kill()
+        try:
+            self.listener.close()
+        except OSError:
+            pass
+        self.payloads.close()
+        if sys.platform != "win32" and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def run(self):
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        self.start_service()
+        threading.Thread(target=self.supervise_service, daemon=True).start()
+        threading.Thread(target=self.maintenance, daemon=True).start()
+        self.supervisor.start()
+        self.write_frame(encode_message(system_message("本地应用程序已启动")))
+        logger.info(f"原生消息桥已启动，IPC地址: {self.address}")
+
+        try:
+            while True:
+                received = self.read_frame()
+                if received is None:
+                    logger.info("插件已断开连接")
+                    self.supervisor.closed("eof")
+                    break
+                self.supervisor.received()
+                self.handle_extension_frame(*received)
+        finally:
+            try:
+                self.write_frame(encode_message(system_message("本地应用程序即将关闭")))
+            except Exception:
+                pass
+            self.stop()
+
+
+if __name__ == "__main__":
+    NativeBridge().run()
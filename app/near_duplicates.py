@@ -0,0 +1,422 @@
+import array
+import bisect
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from collections.abc import MutableMapping
+
+# 近似重复检测：对转换后的Markdown计算 SimHash 指纹，与已保存页面的指纹海明距离不超过阈值时视为同一内容的副本，
+# 副本只保存相对规范版本（最先保存的那份）的差异，读取时再还原。
+
+# 设置为 0 时不去重，每次获取的页面完整保存
+DEDUP_ENABLED = os.environ.get("MARKDOWN_DEDUP", "1").lower() not in ("0", "false", "no")
+# 64位指纹分为8段，海明距离不超过7的两个指纹至少有一段完全相同，按段建索引查找候选
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+HASH_MASK = (1 << SIMHASH_BITS) - 1
+# 视为近似重复的最大海明距离；无关页面的距离在32左右
+DEDUP_MAX_DISTANCE = min(int(os.environ.get("MARKDOWN_DEDUP_DISTANCE", "6")), SIMHASH_BANDS - 1)
+# 连续若干个词组成一个特征
+SHINGLE_SIZE = 3
+# 特征太少的短页面指纹不可靠，不参与去重
+MIN_SHINGLES = 32
+# 差异超过原文的该比例时按完整内容保存
+MAX_DELTA_RATIO = 0.5
+# 每个复制片段按该字节数计入差异大小
+DELTA_OP_BYTES = 16
+
+# 中日韩文字逐字作为词，其他文字按连续的字母数字
+TOKEN_PATTERN = re.compile(r'[぀-ヿ㐀-鿿가-힯]|[^\W_]+')
+# 差异按行（Markdown）或标签（HTML）切分
+DELTA_TOKEN = re.compile(r'[^\n>]*[\n>]|[^\n>]+')
+# 以差异保存的字段
+DELTA_FIELDS = (("markdown", "markdown_delta"), ("source_code", "source_delta"))
+
+
+def simhash(text):
+    """文本的64位 SimHash 指纹；特征不足 MIN_SHINGLES 时返回 None
+
+    特征哈希使用内置的 hash()（字符串哈希按进程随机化），指纹只在本进程内比较。
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    shingles = list(zip(*(tokens[i:] for i in range(SHINGLE_SIZE))))
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    # 按位统计：特征哈希的每个字节位置取出一列转为大整数，(column >> bit) & ones 中 1 的个数即该位为 1 的特征数
+    data = array.array("Q", [hash(shingle) & HASH_MASK for shingle in shingles]).tobytes()
+    ones = int.from_bytes(b"\x01" * len(shingles), "little")
+    fingerprint = 0
+    for byte in range(SIMHASH_BITS // 8):
+        column = int.from_bytes(data[byte::8], "little")
+        for bit in range(8):
+            if ((column >> bit) & ones).bit_count() * 2 > len(shingles):
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(SIMHASH_BANDS)]
+
+
+def longest_increasing(pairs):
+    """按第二项排列的 (i, j) 中，i 严格递增的最长子序列"""
+    tails, tail_indexes, parents = [], [], [None] * len(pairs)
+    for index, (i, _) in enumerate(pairs):
+        position = bisect.bisect_left(tails, i)
+        if position:
+            parents[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(i)
+            tail_indexes.append(index)
+        else:
+            tails[position] = i
+            tail_indexes[position] = index
+    result, index = [], tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(pairs[index])
+        index = parents[index]
+    return result[::-1]
+
+
+def make_delta(base, text):
+    """text 相对 base 的差异：[起始, 结束] 表示复制 base 的片段，字符串表示插入的内容
+
+    以两边都只出现一次的片段为锚点（patience diff），再从锚点向前后扩展相同的片段，耗时与长度近似线性。
+    """
+    a, b = DELTA_TOKEN.findall(base), DELTA_TOKEN.findall(text)
+    offsets = [0]
+    for token in a:
+        offsets.append(offsets[-1] + len(token))
+    count_a, count_b = Counter(a), Counter(b)
+    unique_a = {token: i for i, token in enumerate(a) if count_a[token] == 1}
+    anchors = longest_increasing([(unique_a[token], j) for j, token in enumerate(b)
+                                  if count_b[token] == 1 and token in unique_a])
+    delta = []
+    next_a = next_b = 0
+    for i, j in anchors:
+        if i < next_a or j < next_b:
+            continue
+        start_a, start_b = i, j
+        while start_a > next_a and start_b > next_b and a[start_a - 1] == b[start_b - 1]:
+            start_a -= 1
+            start_b -= 1
+        end_a, end_b = i + 1, j + 1
+        while end_a < len(a) and end_b < len(b) and a[end_a] == b[end_b]:
+            end_a += 1
+            end_b += 1
+        if start_b > next_b:
+            delta.append("".join(b[next_b:start_b]))
+        if delta and not isinstance(delta[-1], str) and delta[-1][1] == offsets[start_a]:
+            delta[-1][1] = offsets[end_a]
+        else:
+            delta.append([offsets[start_a], offsets[end_a]])
+        next_a, next_b = end_a, end_b
+    if next_b < len(b):
+        delta.append("".join(b[next_b:]))
+    return delta
+
+
+def apply_delta(base, delta):
+    return "".join(op if isinstance(op, str) else base[op[0]:op[1]] for op in delta)
+
+
+def delta_size(delta):
+    return sum(len(op) if isinstance(op, str) else DELTA_OP_BYTES for op in delta)
+
+
+def source_digest(source_code):
+    return hashlib.sha256(source_code.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class DedupPageStore(MutableMapping):
+    """去重的 page_sources：近似重复的页面以差异保存，引用最先保存的规范版本
+
+    与 SQLitePageStore 相同，读取得到的是副本，修改页面数据后需要重新赋值才会保存。
+    索引只在本进程内维护，多个工作进程共用的存储不使用该包装。
+    """
+
+    def __init__(self, pages=None, max_distance=DEDUP_MAX_DISTANCE):
+        self.pages = {} if pages is None else pages
+        self.max_distance = max_distance
+        self.lock = threading.RLock()
+        # 规范版本：请求ID -> 指纹；按指纹分段的索引：段值 -> 请求ID集合
+        self.fingerprints = {}
+        self.band_index = [{} for _ in range(SIMHASH_BANDS)]
+        # 规范版本 -> 引用它的副本
+        self.dependents = {}
+        # 源码摘要 -> 请求ID，源码完全相同时复用转换结果
+        self.source_digests = {}
+        # 请求ID -> 源码摘要（source_digests 的反向索引），替换或删除页面时不必遍历全部摘要
+        self.request_digests = {}
+        self.duplicates = 0
+        self.saved_bytes = 0
+        self.reused_conversions = 0
+
+    # ---- 映射接口 ----
+
+    def __getitem__(self, request_id):
+        with self.lock:
+            page_data = self.pages[request_id]
+            canonical_id = page_data.get("duplicate_of")
+            base = self.pages.get(canonical_id) if canonical_id else None
+        if base is None:
+            return dict(page_data)
+        return self._restore(page_data, base)
+
+    def __setitem__(self, request_id, page_data):
+        page_data = {key: value for key, value in page_data.items() if key not in ("duplicate_of", "distance")}
+        orphans = []
+        with self.lock:
+            previous = self.pages.get(request_id)
+            unchanged = previous is not None and self._same_content(previous, page_data)
+            if not unchanged:
+                orphans = self._detach(request_id)
+        if unchanged:
+            self._store_unchanged(request_id, previous, page_data)
+            return
+        self._store(request_id, page_data)
+        self._restore_orphans(orphans)
+
+    def __delitem__(self, request_id):
+        with self.lock:
+            if request_id not in self.pages:
+                raise KeyError(request_id)
+            orphans = self._detach(request_id)
+            del self.pages[request_id]
+        self._restore_orphans(orphans)
+
+    def __contains__(self, request_id):
+        return request_id in self.pages
+
+    def __iter__(self):
+        return iter(list(self.pages))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.fingerprints.clear()
+            for index in self.band_index:
+                index.clear()
+            self.dependents.clear()
+            self.source_digests.clear()
+            self.request_digests.clear()
+
+    # ---- 查询 ----
+
+    def canonical(self, request_id):
+        """页面的规范版本ID和海明距离；页面本身是规范版本时返回 (request_id, 0)，不存在时抛出 KeyError"""
+        with self.lock:
+            page_data = self.pages[request_id]
+            return page_data.get("duplicate_of") or request_id, page_data.get("distance", 0)
+
+    def duplicates_of(self, request_id):
+        with self.lock:
+            return sorted(self.dependents.get(request_id, ()))
+
+    def converted_markdown(self, source_code, main_content):
+        """已保存页面中源码完全相同、提取方式相同的转换结果，没有时返回 None"""
+        with self.lock:
+            request_id = self.source_digests.get(source_digest(source_code))
+        page_data = self.get(request_id) if request_id else None
+        if (page_data is None or not page_data.get("markdown") or page_data.get("source_code") != source_code
+                or bool(page_data.get("main_content")) != bool(main_content)):
+            return None
+        with self.lock:
+            self.reused_conversions += 1
+        return page_data["markdown"]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pages": len(self.pages),
+                "canonical": len(self.fingerprints),
+                "duplicates": sum(len(dependents) for dependents in self.dependents.values()),
+                "duplicates_stored": self.duplicates,
+                "saved_bytes": self.saved_bytes,
+                "reused_conversions": self.reused_conversions,
+                "max_distance": self.max_distance
+            }
+
+    # ---- 内部实现 ----
+
+    def _restore(self, page_data, base):
+        restored = {key: value for key, value in page_data.items() if key not in ("markdown_delta", "source_delta")}
+        for field, delta_field in DELTA_FIELDS:
+            if delta_field in page_data:
+                restored[field] = apply_delta(base.get(field, ""), page_data[delta_field])
+        return restored
+
+    def _resolved(self, page_data, field):
+        """已保存页面的 markdown 或 source_code（副本的差异按规范版本还原）"""
+        delta_field = dict(DELTA_FIELDS)[field]
+        if delta_field not in page_data:
+            return page_data.get(field)
+        return apply_delta(self.pages[page_data["duplicate_of"]].get(field, ""), page_data[delta_field])
+
+    def _known_fingerprint(self, page_data):
+        """源码相同的页面已有指纹且转换结果相同时沿用，不再重新计算"""
+        if not page_data.get("source_code"):
+            return None
+        digest = source_digest(page_data["source_code"])
+        with self.lock:
+            stored = self.pages.get(self.source_digests.get(digest))
+            if stored is None or stored.get("simhash") is None or self._resolved(stored, "markdown") != page_data["markdown"]:
+                return None
+            return int(stored["simhash"], 16)
+
+    def _same_content(self, previous, page_data):
+        return all(self._resolved(previous, field) == page_data.get(field) for field, _ in DELTA_FIELDS)
+
+    def _store_unchanged(self, request_id, previous, page_data):
+        """内容未变（只更新了其他字段）：沿用原来的保存方式"""
+        with self.lock:
+            # 等待期间可能已被删除或替换，此时按新内容重新保存（不持有锁）
+            replaced = self.pages.get(request_id) is not previous
+            if not replaced:
+                if "duplicate_of" in previous:
+                    for field, delta_field in DELTA_FIELDS:
+                        if delta_field in previous:
+                            page_data[delta_field] = previous[delta_field]
+                            page_data.pop(field, None)
+                    page_data["duplicate_of"] = previous["duplicate_of"]
+                    page_data["distance"] = previous["distance"]
+                if previous.get("simhash") is not None:
+                    page_data["simhash"] = previous["simhash"]
+                self.pages[request_id] = page_data
+        if replaced:
+            self[request_id] = page_data
+
+    def _store(self, request_id, page_data):
+        """计算指纹，近似重复时以差异保存，否则作为规范版本保存；指纹和差异的计算不持有锁"""
+        markdown = page_data.get("markdown")
+        fingerprint = self._known_fingerprint(page_data) if markdown else None
+        if fingerprint is None and markdown:
+            fingerprint = simhash(markdown)
+        stored, orphans = self._store_duplicate(request_id, page_data, fingerprint) if fingerprint is not None else (False, [])
+        if not stored:
+            with self.lock:
+                orphans += self._store_canonical(request_id, page_data, fingerprint)
+        self._restore_orphans(orphans)
+
+    def _restore_orphans(self, orphans):
+        """规范版本被替换或删除后，重新保存引用它的副本（已在锁内还原为完整内容）"""
+        # 第一个副本成为新的规范版本，其余副本相对它重新计算差异
+        for request_id, full in orphans:
+            with self.lock:
+                # 期间已被替换或删除时不再处理
+                if self.pages.get(request_id) is not full:
+                    continue
+            self._store(request_id, dict(full))
+
+    def _nearest(self, fingerprint, exclude):
+        candidates = set()
+        for band, index in zip(bands(fingerprint), self.band_index):
+            candidates |= index.get(band, set())
+        candidates.discard(exclude)
+        best = None
+        for candidate in candidates:
+            distance = hamming_distance(fingerprint, self.fingerprints[candidate])
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (candidate, distance)
+        return best
+
+    def _store_duplicate(self, request_id, page_data, fingerprint):
+        """与已有规范版本近似时以差异保存，返回 (是否已保存, 需要重新保存的副本)"""
+        with self.lock:
+            nearest = self._nearest(fingerprint, request_id)
+            if nearest is None:
+                return False, []
+            canonical_id, distance = nearest
+            base = self.pages[canonical_id]
+        # 计算差异较慢，不持有锁
+        stored = {key: value for key, value in page_data.items() if key not in dict(DELTA_FIELDS)}
+        saved = 0
+        for field, delta_field in DELTA_FIELDS:
+            text = page_data.get(field)
+            if text is None:
+                continue
+            delta = make_delta(base.get(field) or "", text)
+            if delta_size(delta) > len(text) * MAX_DELTA_RATIO:
+                stored[field] = text
+                continue
+            stored[delta_field] = delta
+            saved += len(text) - delta_size(delta)
+        if "markdown_delta" not in stored:
+            return False, []
+        stored.update(duplicate_of=canonical_id, distance=distance, simhash=f"{fingerprint:016x}")
+        with self.lock:
+            # 计算期间规范版本被删除或修改时按完整内容保存
+            if self.pages.get(canonical_id) is not base:
+                return False, []
+            orphans = self._detach(request_id)
+            self.pages[request_id] = stored
+            self.dependents.setdefault(canonical_id, set()).add(request_id)
+            self._index_source(request_id, page_data)
+            self.duplicates += 1
+            self.saved_bytes += saved
+        return True, orphans
+
+    def _store_canonical(self, request_id, page_data, fingerprint):
+        """在锁内调用，返回需要重新保存的副本"""
+        orphans = self._detach(request_id)
+        if fingerprint is not None:
+            page_data["simhash"] = f"{fingerprint:016x}"
+            self.fingerprints[request_id] = fingerprint
+            for band, index in zip(bands(fingerprint), self.band_index):
+                index.setdefault(band, set()).add(request_id)
+        self.pages[request_id] = page_data
+        self._index_source(request_id, page_data)
+        return orphans
+
+    def _index_source(self, request_id, page_data):
+        if page_data.get("markdown") and page_data.get("source_code"):
+            digest = source_digest(page_data["source_code"])
+            self.source_digests[digest] = request_id
+            self.request_digests[request_id] = digest
+
+    def _detach(self, request_id):
+        """页面将被替换或删除：移出索引（在锁内调用）
+
+        作为规范版本被引用时，副本先还原为完整内容保存（不参与去重），返回 [(请求ID, 完整内容)]；
+        调用方释放锁后交给 _restore_orphans 重新计算指纹和差异。
+        """
+        page_data = self.pages.get(request_id)
+        if page_data is None:
+            return []
+        digest = self.request_digests.pop(request_id, None)
+        # 源码相同的页面之后保存时摘要已指向新的页面
+        if digest is not None and self.source_digests.get(digest) == request_id:
+            del self.source_digests[digest]
+        canonical_id = page_data.get("duplicate_of")
+        if canonical_id:
+            self.dependents.get(canonical_id, set()).discard(request_id)
+            if not self.dependents.get(canonical_id):
+                self.dependents.pop(canonical_id, None)
+            return []
+        fingerprint = self.fingerprints.pop(request_id, None)
+        if fingerprint is not None:
+            for band, index in zip(bands(fingerprint), self.band_index):
+                members = index.get(band)
+                if members is not None:
+                    members.discard(request_id)
+                    if not members:
+                        del index[band]
+        orphans = []
+        for rid in sorted(self.dependents.pop(request_id, ())):
+            # 保留副本自己的指纹，重新保存时不必再计算
+            full = {key: value for key, value in self._restore(self.pages[rid], page_data).items()
+                    if key not in ("duplicate_of", "distance")}
+            self.pages[rid] = full
+            orphans.append((rid, full))
+        return orphans
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+
+class SQLitePageStore(MutableMapping):
+    """page_sources 的多进程共享实现：每个页面以JSON保存在SQLite中，供多个API工作进程共用
+
+    与普通字典不同，读取得到的是副本，修改页面数据后需要重新赋值才会保存。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_sources ("
+            "request_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_time REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # sqlite3 连接不能跨线程共用，每个线程使用自己的连接
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def __getitem__(self, request_id):
+        row = self._connection().execute(
+            "SELECT data FROM page_sources WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(request_id)
+        return json.loads(row[0])
+
+    def __setitem__(self, request_id, page_data):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO page_sources(request_id, data, updated_time) VALUES (?, ?, ?)",
+            (request_id, json.dumps(page_data, ensure_ascii=False), time.time())
+        )
+
+    def __delitem__(self, request_id):
+        cursor = self._connection().execute("DELETE FROM page_sources WHERE request_id = ?", (request_id,))
+        if cursor.rowcount == 0:
+            raise KeyError(request_id)
+
+    def __contains__(self, request_id):
+        return self._connection().execute(
+            "SELECT 1 FROM page_sources WHERE request_id = ?", (request_id,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        rows = self._connection().execute("SELECT request_id FROM page_sources ORDER BY updated_time").fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM page_sources").fetchone()[0]
+
+    def size_stats(self, limit=10):
+        """各页面JSON的字节数：总数、总大小和最大的若干页面（不反序列化页面数据）"""
+        conn = self._connection()
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0) FROM page_sources").fetchone()
+        largest = conn.execute(
+            "SELECT request_id, LENGTH(CAST(data AS BLOB)) AS size FROM page_sources ORDER BY size DESC LIMIT ?", (limit,)
+        ).fetchall()
+        page_count, page_size = conn.execute("PRAGMA page_count").fetchone()[0], conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "count": count,
+            "total_bytes": total,
+            "file_bytes": page_count * page_size,
+            "largest": [{"request_id": request_id, "size_bytes": size} for request_id, size in largest]
+        }
+
+    def clear(self):
+        self._connection().execute("DELETE FROM page_sources")
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+# 预取模式：插件在标签页激活、加载完成或空闲时主动上报当前标签页的快照，
+# 本地程序以低优先级预先转换，获取当前标签页时直接使用新鲜的快照结果。
+PREFETCH_ENABLED = os.environ.get("MARKDOWN_PREFETCH", "").lower() in ("1", "true", "yes")
+# 快照可以直接返回的最长时间（秒），超过后重新向插件获取
+PREFETCH_MAX_AGE = float(os.environ.get("MARKDOWN_PREFETCH_MAX_AGE", "60"))
+# 用户无操作多久后重新上报一次当前标签页（秒），0 表示不在空闲时上报
+PREFETCH_IDLE_SECONDS = float(os.environ.get("MARKDOWN_PREFETCH_IDLE", "15"))
+# 单个快照的大小上限，超过时插件只上报标签页信息
+PREFETCH_MAX_PAGE_BYTES = int(os.environ.get("MARKDOWN_PREFETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+# 保留的预取页面数，更早的页面（未被读取过的）从页面存储中删除
+PREFETCH_MAX_PAGES = int(os.environ.get("MARKDOWN_PREFETCH_MAX_PAGES", "8"))
+# 预转换占用的CPU时间比例上限（百分比，按 PREFETCH_CPU_WINDOW 秒的滑动窗口统计）
+PREFETCH_CPU_PERCENT = float(os.environ.get("MARKDOWN_PREFETCH_CPU_PERCENT", "25"))
+PREFETCH_CPU_WINDOW = 60
+
+
+def prefetch_config_message():
+    """初始化成功后发给插件的预取配置；未开启预取时返回 None"""
+    if not PREFETCH_ENABLED:
+        return None
+    return {
+        "type": "prefetch_config",
+        "enabled": True,
+        "idle_seconds": PREFETCH_IDLE_SECONDS,
+        "max_bytes": PREFETCH_MAX_PAGE_BYTES
+    }
+
+
+def prefetch_max_age(body, default=PREFETCH_MAX_AGE):
+    """读取请求中的 max_age（秒）：快照超过该时间时重新向插件获取
+
+    取值无效时抛出 ValueError。
+    """
+    value = body.get("max_age") if isinstance(body, dict) else None
+    if value is None:
+        return default
+    try:
+        max_age = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("max_age 必须是数字") from None
+    if not max_age >= 0:
+        raise ValueError("max_age 不能为负数")
+    return max_age
+
+
+def snapshot_request_id(tab_id, source_code):
+    """同一标签页、同一内容的快照使用相同的请求ID，重复上报时不再转换"""
+    digest = hashlib.blake2b(source_code.encode("utf-8", "surrogatepass"), digest_size=6).hexdigest()
+    return f"prefetch_{tab_id}_{digest}"
+
+
+class PrefetchBudget:
+    """按滑动窗口统计预转换耗时，超过CPU比例上限时跳过新的预转换"""
+
+    def __init__(self, percent=PREFETCH_CPU_PERCENT, window=PREFETCH_CPU_WINDOW):
+        self.limit = window * percent / 100
+        self.window = window
+        self.samples = deque()
+        self.used = 0.0
+        self.lock = threading.Lock()
+        self.converted = 0
+        self.skipped = 0
+
+    def _trim(self, now):
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.used -= self.samples.popleft()[1]
+
+    def allow(self):
+        with self.lock:
+            self._trim(time.monotonic())
+            if self.used < self.limit:
+                return True
+            self.skipped += 1
+            return False
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append((time.monotonic(), seconds))
+            self.used += seconds
+            self.converted += 1
+
+    def stats(self):
+        with self.lock:
+            self._trim(time.monotonic())
+            return {
+                "cpu_seconds": round(self.used, 3),
+                "cpu_limit_seconds": round(self.limit, 3),
+                "window_seconds": self.window,
+                "converted": self.converted,
+                "skipped": self.skipped
+            }
+
+
+def snapshot_age(current, now=None):
+    """快照距今的秒数"""
+    return (time.time() if now is None else now) - current["captured_time"]
+
+
+def is_fresh(current, tab=None, max_age=PREFETCH_MAX_AGE, now=None):
+    """当前快照是否可以直接返回：有内容、未超过最长时间，且标签页缓存中该标签页仍处于激活状态、地址没有变化"""
+    if not current or not current.get("request_id"):
+        return False
+    if snapshot_age(current, now) > max_age:
+        return False
+    if tab is not None and (not tab.get("active") or tab.get("url") != current.get("url") or tab.get("status") == "loading"):
+        return False
+    return True
@@ -0,0 +1,431 @@
+import json
+import logging
+import os
+import re
+import secrets
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+
+from connection_supervisor import channel_lost_message
+
+# 多浏览器代理：每个浏览器（配置文件）各自启动一个本地程序，第一个绑定API端口的进程成为代理，
+# 之后启动的进程作为成员通过本地IPC注册，只在插件与代理之间转发消息。
+# API请求按 profile、window_id 或标签页所在的浏览器转发，未指定时选择进行中请求最少的浏览器。
+
+logger = logging.getLogger('api')
+
+# 设置为 0 时不启用代理：API端口被占用时本进程不提供API
+BROKER_ENABLED = os.environ.get("MARKDOWN_BROKER", "1").lower() not in ("0", "false", "no")
+# 本进程对应的浏览器配置文件名，优先于插件上报的配置文件ID
+PROFILE_NAME = os.environ.get("MARKDOWN_PROFILE")
+# 成员与代理断开后重新连接或接管API端口的最长间隔（秒）
+MAX_RECONNECT_DELAY = 30
+# 请求路由的保留时间，超时未响应的请求不再计入负载
+ROUTE_TTL = 300
+# 只在消息开头查找请求ID和类型
+REQUEST_ID_PATTERN = re.compile(rb'"request_id"\s*:\s*"([^"\\]*)"')
+TYPE_PATTERN = re.compile(rb'"type"\s*:\s*"([^"\\]*)"')
+HEADER_SCAN_BYTES = 1024
+
+
+def broker_dir():
+    """存放代理套接字和认证密钥的目录：仅当前用户可访问（0700），不使用共享临时目录中的固定文件名
+
+    优先使用 $XDG_RUNTIME_DIR，否则在临时目录中按用户ID创建；已存在的目录不属于当前用户或其他用户可访问时抛出 PermissionError。
+    """
+    if sys.platform == "win32":
+        # Windows 的临时目录按用户区分
+        return tempfile.gettempdir()
+    path = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"markdown-broker-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    check_private(os.lstat(path), path)
+    return path
+
+
+def check_private(stat, path):
+    """文件或目录必须属于当前用户，且组和其他用户没有任何权限（Windows 上不检查）"""
+    if sys.platform == "win32":
+        return
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(f"{path} 不属于当前用户或权限过宽 (uid={stat.st_uid}, mode={oct(stat.st_mode & 0o777)})")
+
+
+def broker_address(port):
+    """代理的IPC地址，按API端口区分：Windows 使用命名管道，其他平台使用私有目录中的Unix域套接字"""
+    if sys.platform == "win32":
+        return rf"\\.\pipe\markdown-broker-{port}"
+    return os.path.join(broker_dir(), f"markdown-broker-{port}.sock")
+
+
+def broker_key_path(port):
+    """代理的认证密钥文件，仅当前用户可读"""
+    return os.path.join(broker_dir(), f"markdown-broker-{port}.key")
+
+
+def write_broker_key(path, authkey):
+    """以独占方式新建密钥文件（0600）：遗留的同名文件先删除，不写入已存在的文件或符号链接"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as key_file:
+        key_file.write(authkey.hex())
+
+
+def read_broker_key(path):
+    """读取代理的认证密钥，文件不属于当前用户或其他用户可读写时抛出 PermissionError"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    with os.fdopen(fd, encoding="ascii") as key_file:
+        check_private(os.fstat(key_file.fileno()), path)
+        return bytes.fromhex(key_file.read().strip())
+
+
+def encode_message(message):
+    content = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return struct.pack('=I', len(content)) + content
+
+
+def default_profile():
+    return f"browser-{os.getpid()}"
+
+
+class BrowserLink:
+    """一个已注册的浏览器：代理进程自己的浏览器（stdout）或成员进程（IPC连接）"""
+
+    def __init__(self, profile, pid, connection=None):
+        self.profile = profile
+        self.pid = pid
+        self.connection = connection
+        self.send_lock = threading.Lock()
+        self.inflight = 0
+        self.served = 0
+        self.windows = set()
+        self.tabs = {}
+        self.tabs_time = None
+        self.connected_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    @property
+    def local(self):
+        return self.connection is None
+
+    def send(self, frame):
+        with self.send_lock:
+            self.connection.send_bytes(frame)
+
+    def info(self):
+        return {
+            "profile": self.profile,
+            "pid": self.pid,
+            "local": self.local,
+            "inflight": self.inflight,
+            "served": self.served,
+            "windows": sorted(window for window in self.windows if window is not None),
+            "tabs": len(self.tabs),
+            "connected_time": self.connected_time
+        }
+
+
+class ProfileBroker:
+    """代理一侧：接受成员注册，为请求选择浏览器，并把发往插件的消息交给该浏览器"""
+
+    def __init__(self, port, dispatch, profile=None):
+        self.address = broker_address(port)
+        self.key_path = broker_key_path(port)
+        # 成员转发来的插件消息与本进程 stdin 上的消息一样交给 dispatch 处理
+        self.dispatch = dispatch
+        self.lock = threading.Lock()
+        # profile 为成员接管代理时沿用的配置文件名
+        self.local = BrowserLink(PROFILE_NAME or profile or default_profile(), os.getpid())
+        self.links = {self.local.profile: self.local}
+        # 请求ID -> (浏览器, 请求类型, 发出时间)
+        self.routes = {}
+        # 正在处理哪个成员的消息：回复（如初始化确认）发回该成员
+        self.context = threading.local()
+        self.listener = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        authkey = secrets.token_bytes(32)
+        # 已绑定API端口，遗留的套接字文件属于已退出的代理
+        if sys.platform != "win32" and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, authkey=authkey)
+        write_broker_key(self.key_path, authkey)
+        threading.Thread(target=self.accept_members, daemon=True).start()
+        logger.info(f"多浏览器代理已启动，IPC地址: {self.address}, 本地浏览器: {self.local.profile}")
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        try:
+            self.listener.close()
+        except (AttributeError, OSError):
+            pass
+        for path in (self.key_path, self.address if sys.platform != "win32" else None):
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+    # ---- 成员连接 ----
+
+    def accept_members(self):
+        while not self.stopping.is_set():
+            try:
+                connection = self.listener.accept()
+            except Exception as e:
+                if self.stopping.is_set():
+                    return
+                logger.error(f"接受成员连接失败: {str(e)}")
+                time.sleep(0.1)
+                continue
+            threading.Thread(target=self.read_member, args=(connection,), daemon=True).start()
+
+    def read_member(self, connection):
+        link = None
+        try:
+            while True:
+                frame = connection.recv_bytes()
+                try:
+                    message = json.loads(frame[4:].decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    logger.error("解析成员转发的消息失败")
+                    continue
+                if isinstance(message, dict) and message.get("type") == "broker_register":
+                    link = self.register(message, connection, link)
+                    continue
+                if link is None:
+                    continue
+                self.context.link = link
+                try:
+                    self.dispatch(message)
+                except Exception as e:
+                    logger.error(f"处理成员消息时出错: {str(e)}, 浏览器: {link.profile}")
+                finally:
+                    self.context.link = None
+        except (EOFError, OSError):
+            pass
+        finally:
+            if link is not None:
+                self.unregister(link)
+            connection.close()
+
+    def register(self, message, connection, link=None):
+        """成员注册或更新配置文件名（插件初始化时上报配置文件ID）"""
+        pid = message.get("pid")
+        with self.lock:
+            if link is None:
+                link = BrowserLink(None, pid, connection)
+            else:
+                self.links.pop(link.profile, None)
+            link.profile = self.unique_profile(message.get("profile") or f"browser-{pid}", link)
+            self.links[link.profile] = link
+        logger.info(f"浏览器已注册，配置文件: {link.profile}, 进程: {pid}, 当前浏览器数: {len(self.links)}")
+        return link
+
+    def identify(self, profile):
+        """本进程的浏览器或正在处理其消息的成员上报了配置文件ID"""
+        link = self.current()
+        if not profile or link.profile == profile or (link.local and PROFILE_NAME):
+            return
+        with self.lock:
+            self.links.pop(link.profile, None)
+            link.profile = self.unique_profile(profile, link)
+            self.links[link.profile] = link
+        logger.info(f"浏览器配置文件ID已更新: {link.profile}")
+
+    def unique_profile(self, profile, link):
+        if self.links.get(profile) in (None, link):
+            return profile
+        return f"{profile}-{link.pid}"
+
+    def unregister(self, link, reason=None):
+        """成员断开（或浏览器的原生消息通道不可用）：不再为其分配请求，进行中的请求立即结束，不必等到超时"""
+        with self.lock:
+            if self.links.get(link.profile) is link:
+                del self.links[link.profile]
+            orphaned = [request_id for request_id, route in self.routes.items() if route[0] is link]
+            for request_id in orphaned:
+                del self.routes[request_id]
+            link.inflight = 0
+        logger.warning(f"浏览器已断开，配置文件: {link.profile}, 进行中的请求: {len(orphaned)}")
+        for request_id in orphaned:
+            self.dispatch(channel_lost_message(request_id, reason or f"浏览器已断开连接: {link.profile}"))
+
+    def set_available(self, link, available, reason=None):
+        """浏览器的原生消息通道断开或恢复（插件无响应后又收到消息）"""
+        if not available:
+            self.unregister(link, reason)
+            return
+        with self.lock:
+            if link.profile in self.links:
+                return
+            link.profile = self.unique_profile(link.profile, link)
+            self.links[link.profile] = link
+        logger.info(f"浏览器已恢复连接，配置文件: {link.profile}")
+
+    # ---- 请求路由 ----
+
+    def current(self):
+        """正在处理其消息的浏览器（本进程 stdin 上的消息属于本地浏览器）"""
+        return getattr(self.context, "link", None) or self.local
+
+    def select(self, profile=None, window_id=None, tab_id=None):
+        """选择浏览器：指定 profile 时使用该浏览器；否则在包含该窗口或标签页的浏览器中选择进行中请求最少的
+
+        没有匹配的浏览器时抛出 LookupError。
+        """
+        if profile is not None:
+            link = self.links.get(profile)
+            if link is None:
+                raise LookupError(f"没有已连接的浏览器配置文件: {profile}")
+            return link
+        candidates = list(self.links.values())
+        if not candidates:
+            raise LookupError("没有已连接的浏览器")
+        if window_id is not None:
+            candidates = [link for link in candidates if window_id in link.windows]
+            if not candidates:
+                raise LookupError(f"没有包含窗口 {window_id} 的浏览器")
+        if tab_id is not None:
+            # 标签页ID只在各自的浏览器内唯一，缓存中找不到时仍按负载选择
+            candidates = [link for link in candidates if tab_id in link.tabs] or candidates
+        return min(candidates, key=lambda link: (link.inflight, link.served))
+
+    def browsers(self, profile=None):
+        """全部浏览器，或指定配置文件的浏览器（不存在时抛出 LookupError）"""
+        with self.lock:
+            if profile is None:
+                return list(self.links.values())
+            return [self.select(profile)]
+
+    def assign(self, request_id, request_type, profile=None, window_id=None, tab_id=None):
+        """为请求选择浏览器，之后该请求ID发往插件的消息都交给它；返回配置文件名"""
+        with self.lock:
+            self.expire()
+            link = self.select(profile, window_id, tab_id)
+            link.inflight += 1
+            link.served += 1
+            self.routes[request_id] = (link, request_type, time.monotonic())
+            return link.profile
+
+    def finish(self, request_id):
+        with self.lock:
+            route = self.routes.pop(request_id, None)
+            if route is not None:
+                route[0].inflight = max(route[0].inflight - 1, 0)
+
+    def expire(self):
+        deadline = time.monotonic() - ROUTE_TTL
+        for request_id in [rid for rid, route in self.routes.items() if route[2] < deadline]:
+            link = self.routes.pop(request_id)[0]
+            link.inflight = max(link.inflight - 1, 0)
+
+    def observe(self, message):
+        """处理插件消息前调用：记录浏览器的窗口，收到最终响应时结束该请求的路由"""
+        if not isinstance(message, dict):
+            return
+        request_id = message.get("request_id")
+        if request_id and not (message.get("type") == "page_source_chunk" and not message.get("done")):
+            self.finish(request_id)
+
+    def update_tabs(self, tabs, updated_time):
+        """保存当前浏览器上报的标签页列表（标签页ID -> 元数据）"""
+        link = self.current()
+        link.tabs = tabs
+        link.tabs_time = updated_time
+        link.windows = {tab.get("window_id") for tab in tabs.values()}
+
+    def tab(self, profile, tab_id):
+        """指定浏览器缓存中的标签页元数据，浏览器或标签页不存在时返回 None"""
+        with self.lock:
+            link = self.links.get(profile)
+        return link.tabs.get(tab_id) if link is not None else None
+
+    def send(self, frame):
+        """把发往插件的消息交给对应的浏览器；应由本进程的浏览器（stdout）发送时返回 False"""
+        head = frame[4:4 + HEADER_SCAN_BYTES]
+        match = REQUEST_ID_PATTERN.search(head)
+        link = None
+        if match:
+            request_id = match.group(1).decode("utf-8")
+            with self.lock:
+                route = self.routes.get(request_id)
+            if route is not None:
+                link = route[0]
+                # 取消后不会再有响应
+                kind = TYPE_PATTERN.search(head)
+                if kind and kind.group(1) == b"cancel_request":
+                    self.finish(request_id)
+        if link is None:
+            link = self.current()
+        if link.local:
+            return False
+        try:
+            link.send(frame)
+        except (OSError, ValueError) as e:
+            logger.error(f"向浏览器转发消息失败: {str(e)}, 配置文件: {link.profile}")
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "role": "broker",
+                "address": self.address,
+                "routes": len(self.routes),
+                "browsers": [link.info() for link in self.links.values()]
+            }
+
+
+class BrokerMember:
+    """成员一侧：把插件消息转发给代理，并把代理发往插件的消息写回 stdout"""
+
+    def __init__(self, port, write, on_lost, profile=None):
+        self.address = broker_address(port)
+        self.key_path = broker_key_path(port)
+        self.write = write
+        self.on_lost = on_lost
+        self.profile = PROFILE_NAME or profile or default_profile()
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        authkey = read_broker_key(self.key_path)
+        self.connection = Client(self.address, authkey=authkey)
+        self.register()
+        threading.Thread(target=self.read_broker, daemon=True).start()
+        logger.info(f"已作为成员注册到多浏览器代理: {self.address}, 配置文件: {self.profile}")
+        return self
+
+    def register(self, profile=None):
+        """注册或更新配置文件名；MARKDOWN_PROFILE 优先于插件上报的ID"""
+        if profile and not PROFILE_NAME:
+            self.profile = profile
+        return self.forward(encode_message({"type": "broker_register", "profile": self.profile, "pid": os.getpid()}))
+
+    def forward(self, frame):
+        try:
+            with self.lock:
+                self.connection.send_bytes(frame)
+            return True
+        except (OSError, ValueError) as e:
+            logger.error(f"向代理转发消息失败: {str(e)}")
+            return False
+
+    def read_broker(self):
+        while True:
+            try:
+                frame = self.connection.recv_bytes()
+            except (EOFError, OSError):
+                logger.warning("与多浏览器代理的连接已断开")
+                break
+            self.write(frame)
+        self.connection.close()
+        self.on_lost()
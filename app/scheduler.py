@@ -0,0 +1,129 @@
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger('api')
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0  # 当前标签页等用户正在等待的请求
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2  # 批量URL转换、后台预转换
+
+# 非交互请求最多占用队列容量的比例，为交互请求保留余量
+BULK_QUEUE_SHARE = 0.5
+
+
+class SchedulerOverloaded(Exception):
+    """工作队列已满，调用方应返回429并带上Retry-After"""
+
+    def __init__(self, work_class, retry_after):
+        super().__init__(f"{work_class} 队列已满，请 {retry_after} 秒后重试")
+        self.work_class = work_class
+        self.retry_after = retry_after
+
+
+class WorkQueue:
+    """单个工作类别：固定数量的工作线程 + 有界优先级队列"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.tasks = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.running = 0
+        # 仍在队列中但已被调用方取消的任务数，这些任务不占用队列容量
+        self.cancelled_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        # 任务耗时的指数滑动平均，用于估算 Retry-After
+        self.avg_duration = 1.0
+
+    def submit(self, fn, args, kwargs, priority):
+        with self.lock:
+            waiting = self._waiting()
+            limit = self.max_queue if priority <= PRIORITY_INTERACTIVE else int(self.max_queue * BULK_QUEUE_SHARE)
+            if waiting >= limit:
+                self.rejected += 1
+                raise SchedulerOverloaded(self.name, self._retry_after(waiting))
+
+            future = Future()
+            future.add_done_callback(self._on_done)
+            self.tasks.put((priority, next(self.sequence), fn, args, kwargs, future))
+            # 工作线程按需创建，避免拖慢启动
+            if len(self.workers) < self.max_workers and len(self.workers) < self.running + waiting + 1:
+                worker = threading.Thread(target=self._run, name=f"{self.name}-worker-{len(self.workers)}", daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            return future
+
+    def _waiting(self):
+        return max(self.tasks.qsize() - self.cancelled_waiting, 0)
+
+    def _on_done(self, future):
+        if future.cancelled():
+            with self.lock:
+                self.cancelled_waiting += 1
+                self.cancelled += 1
+
+    def _retry_after(self, waiting):
+        """按队列长度和平均耗时估算需要等待的秒数"""
+        return max(1, math.ceil((waiting + self.running) * self.avg_duration / self.max_workers))
+
+    def _run(self):
+        while True:
+            priority, _, fn, args, kwargs, future = self.tasks.get()
+            if not future.set_running_or_notify_cancel():
+                with self.lock:
+                    self.cancelled_waiting -= 1
+                continue
+            with self.lock:
+                self.running += 1
+            started = time.monotonic()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                duration = time.monotonic() - started
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.avg_duration = self.avg_duration * 0.8 + duration * 0.2
+
+    def stats(self):
+        with self.lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self._waiting(),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "avg_duration_ms": round(self.avg_duration * 1000, 1)
+            }
+
+
+class Scheduler:
+    """按工作类别限制并发的中央调度器"""
+
+    def __init__(self, limits):
+        self.queues = {
+            name: WorkQueue(name, max_workers, max_queue)
+            for name, (max_workers, max_queue) in limits.items()
+        }
+
+    def submit(self, work_class, fn, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """提交任务并返回 concurrent.futures.Future；队列已满时抛出 SchedulerOverloaded"""
+        return self.queues[work_class].submit(fn, args, kwargs, priority)
+
+    def stats(self):
+        return {name: work_queue.stats() for name, work_queue in self.queues.items()}
@@ -0,0 +1,243 @@
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('api')
+
+# 单个页面参与索引的最大字符数，避免超大页面拖慢索引线程
+MAX_INDEXED_CHARS = 1024 * 1024
+# 每个写事务最多合并的文档数
+BATCH_SIZE = 16
+# 命中数超过该值的词视为宽泛的词，只用于过滤、不参与BM25排序，保证查询延迟
+MAX_RANKED_MATCHES = 500
+# 摘要长度（字符）
+SNIPPET_CHARS = 160
+
+# 中日韩字符：unicode61 分词器不会切分连续的汉字，索引和查询时在每个字两侧插入零宽空格（分词器视为分隔符）
+CJK_PATTERN = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+SEPARATOR = '\u200b'
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def segment(text):
+    """在中日韩字符两侧插入零宽空格，使每个字成为独立的词"""
+    return CJK_PATTERN.sub(SEPARATOR + r'\1' + SEPARATOR, text)
+
+
+def unsegment(text):
+    """去掉 segment 插入的零宽空格"""
+    return text.replace(SEPARATOR, '')
+
+
+def query_tokens(query):
+    """拆分用户输入的查询词"""
+    return TOKEN_PATTERN.findall(query)
+
+
+def phrase(token):
+    """把单个查询词转换为 FTS5 短语（中日韩字符逐字切分）"""
+    return '"' + segment(token) + '"'
+
+
+def build_match_query(query):
+    """把用户输入转换为 FTS5 查询：每个词作为短语，全部词都需命中"""
+    return ' AND '.join(phrase(token) for token in query_tokens(query))
+
+
+def make_snippet(body, tokens, width=SNIPPET_CHARS):
+    """以第一个命中的查询词为中心截取摘要，并用方括号标出查询词"""
+    ordered = sorted(tokens, key=len, reverse=True)
+    # 正文是切分后的文本，先在切分后的文本中定位，只对截取的窗口去掉分隔符
+    segmented_pattern = re.compile('|'.join(re.escape(segment(token)) for token in ordered), re.IGNORECASE)
+    match = segmented_pattern.search(body)
+    # 中日韩字符切分后每个字占3个字符，窗口按3倍截取后再裁剪
+    start = max(0, match.start() - width) if match else 0
+    window = unsegment(body[start:start + width * 3])
+    offset = 0
+    if match:
+        prefix = unsegment(body[start:match.start()])
+        offset = max(0, len(prefix) - width // 3)
+    text = window[offset:offset + width]
+    truncated_head = start > 0 or offset > 0
+    truncated_tail = start + width * 3 < len(body) or offset + width < len(window)
+
+    pattern = re.compile('|'.join(re.escape(token) for token in ordered), re.IGNORECASE)
+    snippet = ' '.join(pattern.sub(lambda m: f"[{m.group(0)}]", text).split())
+    return ('…' if truncated_head else '') + snippet + ('…' if truncated_tail else '')
+
+
+class SearchIndex:
+    """基于 SQLite FTS5 的增量全文索引，写入在后台线程中批量完成
+
+    path 为文件路径时，多个进程可以共用同一个索引（请求ID与行号的对应关系保存在 docs 表中）。
+    """
+
+    def __init__(self, path=":memory:"):
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.available = True
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        try:
+            if path != ":memory:":
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5("
+                "request_id UNINDEXED, url, title, body, tokenize='unicode61 remove_diacritics 2')"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, request_id TEXT UNIQUE)")
+        except sqlite3.OperationalError as e:
+            # 部分Python发行版的SQLite未编译FTS5
+            logger.error(f"SQLite不支持FTS5，全文搜索不可用: {str(e)}")
+            self.available = False
+            return
+
+        self.worker = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+        self.worker.start()
+
+    def submit(self, request_id, url, title, markdown):
+        """提交页面到索引队列，立即返回"""
+        if self.available:
+            self.pending.put(("upsert", request_id, url, title, markdown))
+
+    def remove(self, request_id):
+        """从索引中删除页面"""
+        if self.available:
+            self.pending.put(("delete", request_id, None, None, None))
+
+    def flush(self, timeout=None):
+        """等待队列中的文档全部写入索引"""
+        if not self.available:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.pending.all_tasks_done:
+            while self.pending.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.pending.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as e:
+                logger.error(f"更新全文索引时出错: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def _apply(self, batch):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for action, request_id, url, title, markdown in batch:
+                    row = self.conn.execute("SELECT rowid FROM docs WHERE request_id = ?", (request_id,)).fetchone()
+                    if row is not None:
+                        self.conn.execute("DELETE FROM pages WHERE rowid = ?", row)
+                        self.conn.execute("DELETE FROM docs WHERE rowid = ?", row)
+                    if action != "upsert":
+                        continue
+                    rowid = self.conn.execute("INSERT INTO docs(request_id) VALUES (?)", (request_id,)).lastrowid
+                    self.conn.execute(
+                        "INSERT INTO pages(rowid, request_id, url, title, body) VALUES (?, ?, ?, ?, ?)",
+                        (rowid, request_id, url or "", segment(title or ""), segment(markdown[:MAX_INDEXED_CHARS]))
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def search(self, query, limit=10):
+        """按相关度（BM25，标题权重更高）返回命中的页面及摘要"""
+        if not self.available:
+            return []
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        phrases = [phrase(token) for token in tokens]
+        match_query = ' AND '.join(phrases)
+        limit = int(limit)
+
+        with self.lock:
+            # bm25() 会遍历每个短语的全部命中来统计文档频率，宽泛的词代价很高而 IDF 接近 0，
+            # 因此只用命中数不超过 MAX_RANKED_MATCHES 的词排序，宽泛的词只作为过滤条件
+            selective = [p for p in phrases if not self._is_broad(p)]
+            ranked = []
+            if not selective:
+                # 全部是宽泛的词：按获取时间倒序返回最近的页面
+                ranked = self.conn.execute(
+                    "SELECT rowid, 0.0 FROM pages WHERE pages MATCH ? ORDER BY rowid DESC LIMIT ?",
+                    (match_query, limit)
+                ).fetchall()
+            else:
+                cursor = self.conn.execute(
+                    "SELECT rowid, bm25(pages, 0.0, 2.0, 5.0, 1.0) AS score "
+                    "FROM pages WHERE pages MATCH ? ORDER BY score",
+                    (' AND '.join(selective),)
+                )
+                needs_check = len(selective) < len(phrases)
+                for rowid, score in cursor:
+                    if needs_check and not self.conn.execute(
+                        "SELECT 1 FROM pages WHERE pages MATCH ? AND rowid = ?", (match_query, rowid)
+                    ).fetchone():
+                        continue
+                    ranked.append((rowid, score))
+                    if len(ranked) >= limit:
+                        break
+
+            rows = [
+                (self.conn.execute(
+                    "SELECT request_id, url, title, body FROM pages WHERE rowid = ?", (rowid,)
+                ).fetchone(), score)
+                for rowid, score in ranked
+            ]
+
+        # 摘要在锁外生成，按查询词在正文中的首次出现位置截取
+        return [
+            {
+                "request_id": request_id,
+                "url": url,
+                "title": unsegment(title).strip(),
+                "snippet": make_snippet(body, tokens),
+                "score": round(-score, 4)
+            }
+            for (request_id, url, title, body), score in rows if request_id is not None
+        ]
+
+    def _is_broad(self, phrase_query):
+        """短语的命中数是否超过 MAX_RANKED_MATCHES"""
+        return self.conn.execute(
+            "SELECT 1 FROM pages WHERE pages MATCH ? LIMIT 1 OFFSET ?",
+            (phrase_query, MAX_RANKED_MATCHES)
+        ).fetchone() is not None
+
+    def __len__(self):
+        if not self.available:
+            return 0
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def stats(self):
+        """索引的文档数、待写入数和数据库大小（内存索引时即占用的内存）"""
+        if not self.available:
+            return {"available": False}
+        with self.lock:
+            documents = self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "available": True,
+            "documents": documents,
+            "pending": self.pending.qsize(),
+            "database_bytes": page_count * page_size
+        }
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+# 进程间传递大负载（页面源码等）时使用共享内存段，IPC连接上只传递段名称和长度；
+# 小于该大小的负载直接通过连接发送，创建共享内存段的固定开销反而更大
+SHARED_PAYLOAD_MIN_BYTES = int(os.environ.get("MARKDOWN_SHM_MIN_BYTES", str(256 * 1024)))
+# 接收方长时间未释放的共享内存段（如进程崩溃）到期后强制回收
+SHARED_PAYLOAD_TTL = 300
+# 释放后保留以供复用的空闲段数量，复用已映射的段可省去创建和缺页的开销
+SHARED_PAYLOAD_SPARE_SEGMENTS = 4
+
+
+class SharedPayloadPool:
+    """创建方持有的共享内存段，按接收方引用计数管理生命周期，所有引用释放后回收"""
+
+    def __init__(self, spare_segments=SHARED_PAYLOAD_SPARE_SEGMENTS):
+        self.segments = {}  # 段名称 -> (SharedMemory, 各接收方的引用数, 创建时间)
+        self.spare = []
+        self.spare_segments = spare_segments
+        self.lock = threading.Lock()
+        self.created = 0
+        self.released = 0
+        self.expired = 0
+
+    def allocate(self, size):
+        """返回可写的共享内存段（优先复用大小合适的空闲段），写入完成后调用 share 交给接收方"""
+        with self.lock:
+            for index, segment in enumerate(self.spare):
+                if size <= segment.size <= size * 2:
+                    return self.spare.pop(index)
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    def put(self, data):
+        """复制数据到新的共享内存段并返回该段"""
+        segment = self.allocate(len(data))
+        segment.buf[:len(data)] = data
+        return segment
+
+    def share(self, segment, size, holders):
+        """登记接收方并返回发送给它们的句柄；holders 为接收方列表，同一接收方可出现多次"""
+        with self.lock:
+            self.segments[segment.name] = (segment, Counter(holders), time.monotonic())
+            self.created += 1
+        return {"name": segment.name, "size": size}
+
+    def release(self, name, holder, count=1):
+        """接收方读取完毕，引用全部释放后删除共享内存段"""
+        with self.lock:
+            entry = self.segments.get(name)
+            if entry is None:
+                return
+            holders = entry[1]
+            holders[holder] -= count
+            if holders[holder] <= 0:
+                del holders[holder]
+            if holders:
+                return
+            del self.segments[name]
+            self.released += 1
+            if len(self.spare) < self.spare_segments:
+                self.spare.append(entry[0])
+                return
+        self.discard(entry[0])
+
+    def release_holder(self, holder):
+        """接收方断开连接时释放它持有的全部引用"""
+        with self.lock:
+            held = [(name, holders[holder]) for name, (_, holders, _) in self.segments.items() if holder in holders]
+        for name, count in held:
+            self.release(name, holder, count)
+
+    def expire(self, max_age=SHARED_PAYLOAD_TTL):
+        """回收超过 max_age 秒仍未释放的共享内存段"""
+        deadline = time.monotonic() - max_age
+        with self.lock:
+            expired = [name for name, (_, _, created) in self.segments.items() if created < deadline]
+            segments = [self.segments.pop(name)[0] for name in expired]
+            self.expired += len(segments)
+        for segment in segments:
+            self.discard(segment)
+
+    def close(self):
+        with self.lock:
+            segments = [entry[0] for entry in self.segments.values()] + self.spare
+            self.segments.clear()
+            self.spare = []
+        for segment in segments:
+            self.discard(segment)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": len(self.segments),
+                "active_bytes": sum(entry[0].size for entry in self.segments.values()),
+                "spare": len(self.spare),
+                "spare_bytes": sum(segment.size for segment in self.spare),
+                "created": self.created,
+                "released": self.released,
+                "expired": self.expired
+            }
+
+    @staticmethod
+    def discard(segment):
+        """删除共享内存段（未交给接收方或已无引用时）"""
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def open_shared_payload(handle):
+    """以只读视图打开其他进程共享的负载，不复制数据；退出上下文后视图失效"""
+    segment = shared_memory.SharedMemory(name=handle["name"])
+    if os.name == "posix":
+        # 打开已有的段也会登记到本进程的资源跟踪器，进程退出时会误删创建方仍在使用的段
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+    view = segment.buf[:handle["size"]]
+    readonly = view.toreadonly()
+    try:
+        yield readonly
+    finally:
+        readonly.release()
+        view.release()
+        segment.close()
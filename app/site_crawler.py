@@ -0,0 +1,387 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+
+logger = logging.getLogger('api')
+
+# robots.txt 中匹配的爬虫名称
+CRAWLER_USER_AGENT = "MarkdownCrawler"
+
+DEFAULT_MAX_DEPTH = 2
+MAX_DEPTH_LIMIT = 10
+DEFAULT_MAX_PAGES = 100
+MAX_PAGES_LIMIT = 10000
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# 每个主机每秒最多请求数，robots.txt 的 Crawl-delay 更严格时以其为准
+DEFAULT_RATE_LIMIT = 2.0
+# 每完成多少个页面写一次断点
+CHECKPOINT_INTERVAL = 10
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+# 明显不是网页的链接，不加入待抓取队列
+SKIPPED_EXTENSIONS = (
+    '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.bmp',
+    '.css', '.js', '.json', '.xml', '.pdf', '.zip', '.gz', '.tar', '.rar', '.7z',
+    '.mp3', '.mp4', '.webm', '.avi', '.mov', '.woff', '.woff2', '.ttf', '.exe', '.dmg'
+)
+
+
+def normalize_url(url):
+    """规范化URL用于去重：去掉片段和用户信息，协议和主机转小写，省略默认端口；非HTTP(S)链接返回None"""
+    try:
+        url, _ = urldefrag(url.strip())
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+        host = parts.hostname.lower()
+        if ':' in host:
+            host = f"[{host}]"
+        port = parts.port
+    except ValueError:
+        return None
+    netloc = host if port is None or port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def url_origin(url):
+    """返回 协议://主机[:端口]"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class LinkParser(HTMLParser):
+    """提取页面中的链接、标题，以及 <meta name="robots"> 的 nofollow 指令"""
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = []
+        self.title_parts = []
+        self.in_title = False
+        self.nofollow = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag in ("a", "area") and attrs.get("href"):
+            if "nofollow" not in (attrs.get("rel") or "").lower().split():
+                self.links.append(urljoin(self.base_url, attrs["href"]))
+        elif tag == "title":
+            self.in_title = True
+        elif tag == "meta" and (attrs.get("name") or "").lower() == "robots":
+            directives = [d.strip() for d in (attrs.get("content") or "").lower().split(",")]
+            self.nofollow = "nofollow" in directives or "none" in directives
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+
+
+def parse_page(html, base_url):
+    """解析页面，返回去重后的绝对链接、标题和 nofollow 标记"""
+    parser = LinkParser(base_url)
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logger.warning(f"解析页面链接时出错: {str(e)}, URL: {base_url}")
+
+    links = []
+    for link in parser.links:
+        link = normalize_url(link)
+        if link and not urlsplit(link).path.lower().endswith(SKIPPED_EXTENSIONS):
+            links.append(link)
+    return {
+        "links": list(dict.fromkeys(links)),
+        "title": ' '.join(''.join(parser.title_parts).split()),
+        "nofollow": parser.nofollow
+    }
+
+
+def is_html(content_type):
+    content_type = (content_type or "").split(';')[0].strip().lower()
+    return content_type in ("", "text/html", "application/xhtml+xml")
+
+
+class CrawlJob:
+    """站点抓取任务：去重的广度优先URL队列，遵守 robots.txt 和按主机限速，可从断点恢复
+
+    网络请求和页面处理由调用方以异步函数传入：
+    fetch(url) -> {"status_code", "location", "content_type", "text"}（不跟随重定向）
+    process(html, url) -> {"markdown", "links", "title", "nofollow"}
+    """
+
+    def __init__(self, job_id, seed_url, max_depth=DEFAULT_MAX_DEPTH, max_pages=DEFAULT_MAX_PAGES,
+                 concurrency=DEFAULT_CONCURRENCY, same_origin=True, include_paths=None, exclude_paths=None,
+                 rate_limit=DEFAULT_RATE_LIMIT, respect_robots=True, checkpoint_path=None):
+        seed = normalize_url(seed_url or "")
+        if not seed:
+            raise ValueError("起始URL必须是 http 或 https 地址")
+        for name, paths in (("include_paths", include_paths), ("exclude_paths", exclude_paths)):
+            if paths is not None and not (isinstance(paths, list) and all(isinstance(p, str) for p in paths)):
+                raise ValueError(f"{name} 必须是路径前缀列表")
+
+        self.job_id = job_id
+        self.seed_url = seed
+        self.max_depth = max(0, min(int(max_depth), MAX_DEPTH_LIMIT))
+        self.max_pages = max(1, min(int(max_pages), MAX_PAGES_LIMIT))
+        self.concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+        self.same_origin = bool(same_origin)
+        self.include_paths = include_paths or []
+        self.exclude_paths = exclude_paths or []
+        self.rate_limit = float(rate_limit or 0)
+        self.respect_robots = bool(respect_robots)
+        self.checkpoint_path = checkpoint_path
+
+        self.seen = set()
+        self.frontier = deque()
+        self.in_flight = {}
+        self.pages_crawled = 0
+        self.counts = {}
+        self.finished = False
+        self.robots = {}
+        self.next_slot = {}
+        self.wake = None
+        # 起始URL不受路径过滤限制
+        self.seen.add(self.seed_url)
+        self.frontier.append((self.seed_url, 0))
+
+    def allowed(self, url):
+        """URL 是否满足同源和路径过滤条件"""
+        if self.same_origin and url_origin(url) != url_origin(self.seed_url):
+            return False
+        path = urlsplit(url).path
+        if self.include_paths and not any(path.startswith(prefix) for prefix in self.include_paths):
+            return False
+        return not any(path.startswith(prefix) for prefix in self.exclude_paths)
+
+    def enqueue(self, url, depth):
+        """加入待抓取队列，已见过或被过滤的URL返回 False"""
+        if url in self.seen or not self.allowed(url):
+            return False
+        self.seen.add(url)
+        self.frontier.append((url, depth))
+        return True
+
+    def limit_reached(self):
+        return self.pages_crawled + len(self.in_flight) >= self.max_pages
+
+    async def run(self, fetch, process):
+        """并发抓取，按完成顺序逐个产出页面结果；取消或结束时保存断点"""
+        results = asyncio.Queue()
+        self.wake = asyncio.Event()
+        workers = [asyncio.ensure_future(self._worker(fetch, process, results)) for _ in range(self.concurrency)]
+
+        async def supervise():
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                results.put_nowait(None)
+
+        supervisor = asyncio.ensure_future(supervise())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            await supervisor
+            self.finished = not self.frontier and not self.in_flight
+        finally:
+            # 客户端断开时取消抓取，进行中的URL写回断点，恢复时重新抓取
+            supervisor.cancel()
+            for worker in workers:
+                worker.cancel()
+            self.save_checkpoint()
+
+    async def _worker(self, fetch, process, results):
+        while True:
+            if self.limit_reached():
+                return
+            if not self.frontier:
+                if not self.in_flight:
+                    return
+                # 等待其他页面完成，可能产生新的链接
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+
+            url, depth = self.frontier.popleft()
+            self.in_flight[url] = depth
+            started = time.monotonic()
+            try:
+                result = await self._crawl(url, depth, fetch, process)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"抓取页面时出错: {str(e)}, URL: {url}")
+                result = {"type": "page", "url": url, "depth": depth, "status": "error", "message": str(e)}
+            result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+            del self.in_flight[url]
+            if result["status"] != "skipped":
+                self.pages_crawled += 1
+            self.counts[result["status"]] = self.counts.get(result["status"], 0) + 1
+            self.wake.set()
+            if self.pages_crawled and self.pages_crawled % CHECKPOINT_INTERVAL == 0 and result["status"] != "skipped":
+                self.save_checkpoint()
+            await results.put(result)
+
+    async def _crawl(self, url, depth, fetch, process):
+        result = {"type": "page", "url": url, "depth": depth}
+        if self.respect_robots and not (await self._robots(url, fetch)).can_fetch(CRAWLER_USER_AGENT, url):
+            result.update(status="skipped", reason="robots")
+            return result
+
+        await self._throttle(url)
+        response = await fetch(url)
+        # 不自动跟随重定向：目标地址和普通链接一样经过过滤、去重、robots.txt 和限速
+        if response["status_code"] in REDIRECT_STATUS_CODES and response.get("location"):
+            target = normalize_url(urljoin(url, response["location"]))
+            result.update(status="skipped", reason="redirect", redirect_to=target)
+            if target:
+                self.enqueue(target, depth)
+            return result
+        if response["status_code"] != 200:
+            result.update(status="error", message=f"获取网页失败，状态码: {response['status_code']}")
+            return result
+
+        if not is_html(response["content_type"]):
+            result.update(status="skipped", reason="not_html", content_type=response["content_type"])
+            return result
+
+        page = await process(response["text"], url)
+        queued = 0
+        if depth < self.max_depth and not page["nofollow"]:
+            for link in page["links"]:
+                if self.enqueue(link, depth + 1):
+                    queued += 1
+
+        result.update(
+            status="success",
+            title=page["title"],
+            links_found=len(page["links"]),
+            links_queued=queued,
+            markdown=page["markdown"]
+        )
+        return result
+
+    async def _robots(self, url, fetch):
+        """获取并缓存每个源站的 robots.txt，并发的请求共用同一次获取"""
+        origin = url_origin(url)
+        if origin not in self.robots:
+            self.robots[origin] = asyncio.ensure_future(self._load_robots(origin, fetch))
+        return await self.robots[origin]
+
+    async def _load_robots(self, origin, fetch):
+        # urllib.robotparser 会导入 urllib.request 和 ssl，只在爬取时导入
+        from urllib.robotparser import RobotFileParser
+
+        parser = RobotFileParser(origin + "/robots.txt")
+        try:
+            await self._throttle(origin + "/robots.txt")
+            response = await fetch(origin + "/robots.txt")
+            if response["status_code"] == 200:
+                parser.parse(response["text"].splitlines())
+            elif response["status_code"] in (401, 403):
+                parser.disallow_all = True
+            else:
+                parser.allow_all = True
+        except Exception as e:
+            logger.warning(f"获取 robots.txt 失败，按允许处理: {str(e)}, 源站: {origin}")
+            parser.allow_all = True
+        return parser
+
+    async def _throttle(self, url):
+        """按主机限速：为每个请求预约下一个可用时间片"""
+        host = urlsplit(url).netloc
+        interval = 1.0 / self.rate_limit if self.rate_limit > 0 else 0.0
+        robots = self.robots.get(url_origin(url))
+        if robots is not None and robots.done() and not robots.exception():
+            interval = max(interval, float(robots.result().crawl_delay(CRAWLER_USER_AGENT) or 0))
+        if interval <= 0:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, 0.0))
+        self.next_slot[host] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def summary(self):
+        return {
+            "type": "summary",
+            "job_id": self.job_id,
+            "pages_crawled": self.pages_crawled,
+            "counts": self.counts,
+            "remaining": len(self.frontier) + len(self.in_flight),
+            "finished": self.finished
+        }
+
+    def to_checkpoint(self):
+        # 进行中的URL放回队列头部，恢复时优先重新抓取
+        frontier = [[url, depth] for url, depth in self.in_flight.items()] + [[url, depth] for url, depth in self.frontier]
+        return {
+            "job_id": self.job_id,
+            "seed_url": self.seed_url,
+            "max_depth": self.max_depth,
+            "max_pages": self.max_pages,
+            "concurrency": self.concurrency,
+            "same_origin": self.same_origin,
+            "include_paths": self.include_paths,
+            "exclude_paths": self.exclude_paths,
+            "rate_limit": self.rate_limit,
+            "respect_robots": self.respect_robots,
+            "seen": sorted(self.seen),
+            "frontier": frontier,
+            "pages_crawled": self.pages_crawled,
+            "counts": self.counts,
+            "finished": self.finished,
+            "saved_time": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def save_checkpoint(self):
+        """原子地写入断点文件（先写临时文件再替换）"""
+        if not self.checkpoint_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+            temp_path = self.checkpoint_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_checkpoint(), f, ensure_ascii=False)
+            os.replace(temp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.error(f"保存抓取断点失败: {str(e)}, 任务: {self.job_id}")
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint_path, **overrides):
+        """从断点文件恢复任务，overrides 可调整页数上限、并发数等参数"""
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        options = {
+            key: state[key] for key in (
+                "max_depth", "max_pages", "concurrency", "same_origin",
+                "include_paths", "exclude_paths", "rate_limit", "respect_robots"
+            )
+        }
+        # max_pages 是整个任务的页数上限，达到上限后可用更大的值恢复继续抓取
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        job = cls(state["job_id"], state["seed_url"], checkpoint_path=checkpoint_path, **options)
+        job.seen = set(state["seen"])
+        job.frontier = deque((url, depth) for url, depth in state["frontier"])
+        job.pages_crawled = state["pages_crawled"]
+        job.counts = state["counts"]
+        job.finished = state["finished"]
+        return job
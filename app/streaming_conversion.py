@@ -0,0 +1,112 @@
+import html.entities
+import re
+
+NBSP = html.entities.html5["nbsp;"]
+
+# 流式获取时交给转换器的片段大小（字符），插件分片回传页面源码时也使用该大小
+STREAM_CHUNK_CHARS = 128 * 1024
+
+EXTRA_NEWLINES = re.compile(r'\n{3,}')
+TRAILING_NEWLINES = re.compile(r'\n+$')
+SVG_TAG = re.compile(r'<(/?)svg\b', re.IGNORECASE)
+
+
+def create_html2text():
+    """创建按本项目选项配置的 html2text 转换器（整页转换和流式转换共用）"""
+    import html2text
+
+    converter = html2text.HTML2Text()
+    converter.ignore_links = False
+    converter.ignore_images = False
+    converter.body_width = 0  # 不限制宽度
+    converter.protect_links = True  # 保护链接
+    converter.unicode_snob = True  # 正确处理Unicode字符
+    converter.single_line_break = True  # 使用单行换行
+    return converter
+
+
+def collapse_newlines(markdown):
+    """减少多余空行"""
+    return EXTRA_NEWLINES.sub('\n\n', markdown)
+
+
+class StreamingMarkdownConverter:
+    """增量转换：HTML片段到达后立即交给 html2text，返回这一片段新产生的Markdown
+
+    依次拼接 feed() 与 close() 的返回值，与整页转换的结果相同（body_width 为0时不需要整体重排）。
+    中途取出结果依赖 html2text 的内部状态（outtextlist、start 和不换行空格占位符），
+    因此 requirements.txt 固定了 html2text 的版本，升级时由 test_html2text_internals 检查。
+    transform 在转换前处理每一段HTML（如移出内嵌资源），每段都从标签开始，内联SVG不会被分开。
+    """
+
+    def __init__(self, transform=None):
+        self.converter = create_html2text()
+        self.transform = transform
+        self.converter.start = True
+        self.pending = ""
+        # 末尾的换行先不输出，与下一段合并后再去掉多余空行
+        self.newlines = ""
+        self.html_chars = 0
+        self.markdown_chars = 0
+
+    def feed(self, html):
+        self.html_chars += len(html)
+        # 只转换到最后一个 "<" 之前：同一文本节点分两次交给 html2text 时空格和自动链接的处理不同
+        self.pending += html
+        cut = self.pending.rfind("<")
+        if self.transform is not None:
+            cut = self._open_svg(cut)
+        if cut <= 0:
+            return ""
+        html, self.pending = self.pending[:cut], self.pending[cut:]
+        self._convert(html)
+        # 最后一段可能还会被 html2text 修改（如链接中的标题会去掉已输出的 "["），暂不取出
+        pieces = self.converter.outtextlist
+        if len(pieces) < 2:
+            return ""
+        text = "".join(pieces[:-1])
+        del pieces[:-1]
+        # 与 html2text 结束转换时相同，保留不换行空格
+        return self._emit(text.replace("&nbsp_place_holder;", NBSP))
+
+    def close(self):
+        """结束转换，返回剩余的Markdown"""
+        self._convert(self.pending)
+        self.pending = ""
+        self.converter.feed("")
+        text = self._emit(self.converter.finish()) + self.newlines
+        self.markdown_chars += len(self.newlines)
+        self.newlines = ""
+        return text
+
+    def _convert(self, html):
+        if self.transform is not None and html:
+            html = self.transform(html)
+        self.converter.feed(html)
+
+    def _open_svg(self, end):
+        """pending[:end] 中尚未结束的 <svg> 元素的起始位置，没有时返回 end"""
+        start = end
+        for match in SVG_TAG.finditer(self.pending, 0, end):
+            if match.group(1):
+                start = end
+            elif start == end:
+                start = match.start()
+        return start
+
+    def _emit(self, text):
+        text = collapse_newlines(self.newlines + text)
+        match = TRAILING_NEWLINES.search(text)
+        if match:
+            self.newlines = match.group(0)
+            text = text[:match.start()]
+        else:
+            self.newlines = ""
+        self.markdown_chars += len(text)
+        return text
+
+
+def iter_chunks(text, size=STREAM_CHUNK_CHARS):
+    """按固定大小切分字符串"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
@@ -0,0 +1,359 @@
+import base64
+import csv
+import io
+import re
+import sys
+from array import array
+from html.parser import HTMLParser
+
+# 直接从HTML中提取表格和代码块（一次解析），不经过Markdown：
+# 表格按列返回并推断类型，数值列可以打包为与 NumPy/Arrow 兼容的小端缓冲区。
+
+# 其中的文字不属于表格或代码
+IGNORED_TAGS = {"script", "style", "noscript", "template", "head", "title"}
+# 表格单元格的结束边界：新单元格、新行或行组开始时，未闭合的单元格和行随之结束
+ROW_GROUP_TAGS = {"thead", "tbody", "tfoot"}
+LANGUAGE_PATTERN = re.compile(r'(?:^|\s)(?:language|lang)-([\w+#.-]+)', re.IGNORECASE)
+# 以 0 开头的多位整数（编号、邮编等）保留为文本
+LEADING_ZERO_PATTERN = re.compile(r'^[+-]?0\d')
+INT_PATTERN = re.compile(r'^[+-]?(?:\d{1,3}(?:,\d{3})+|\d+)$')
+FLOAT_PATTERN = re.compile(r'^[+-]?(?:(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?$')
+BOOL_VALUES = {"true": True, "false": False}
+INT64_MAX = 2 ** 63 - 1
+# 单元格的 colspan/rowspan 上限，避免异常属性生成巨大的表格
+MAX_SPAN = 1000
+
+# 打包的数值列：类型 -> (array 类型码, NumPy dtype)
+ARRAY_TYPES = {"int": ("q", "<i8"), "float": ("d", "<f8")}
+
+
+class TableState:
+    """正在解析的表格：已完成的行、当前行和单元格，以及向下延续的 rowspan 单元格"""
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.caption = None
+        self.rows = []
+        self.row = None
+        self.cell = None
+        self.in_thead = False
+        # 列号 -> [剩余行数, 文本, 是否表头]
+        self.spans = {}
+
+    def start_row(self):
+        self.end_row()
+        self.row = {"cells": [], "header": self.in_thead}
+
+    def end_row(self):
+        self.end_cell()
+        if self.row is None:
+            return
+        # 上方的 rowspan 单元格延续到本行末尾之后的列
+        self.fill_spans(self.row["cells"], to_end=True)
+        self.rows.append(self.row)
+        self.row = None
+
+    def start_cell(self, tag, attrs):
+        if self.row is None:
+            self.start_row()
+        self.end_cell()
+        self.cell = {
+            "parts": [],
+            "header": tag == "th",
+            "colspan": span_attribute(attrs, "colspan"),
+            "rowspan": span_attribute(attrs, "rowspan")
+        }
+
+    def end_cell(self):
+        cell, self.cell = self.cell, None
+        if cell is None:
+            return
+        cells = self.row["cells"]
+        text = " ".join("".join(cell["parts"]).split())
+        for _ in range(cell["colspan"]):
+            self.fill_spans(cells)
+            if cell["rowspan"] > 1:
+                self.spans[len(cells)] = [cell["rowspan"] - 1, text, cell["header"]]
+            cells.append((text, cell["header"]))
+
+    def fill_spans(self, cells, to_end=False):
+        """补上上方延续到当前位置的单元格；to_end 为真时一直补到最后一个延续的列（中间的空位为空单元格）"""
+        while self.spans and (len(cells) in self.spans or (to_end and max(self.spans) > len(cells))):
+            span = self.spans.get(len(cells))
+            if span is None:
+                cells.append(("", False))
+                continue
+            cells.append((span[1], span[2]))
+            span[0] -= 1
+            if not span[0]:
+                del self.spans[len(cells) - 1]
+
+
+def span_attribute(attrs, name):
+    if name not in attrs:
+        return 1
+    try:
+        return min(max(int(attrs.get(name) or 1), 1), MAX_SPAN)
+    except ValueError:
+        return 1
+
+
+class StructureParser(HTMLParser):
+    """一次解析同时收集表格（嵌套表格各自独立）和 <pre> 代码块"""
+
+    def __init__(self, tables=True, code=True):
+        super().__init__(convert_charrefs=True)
+        self.collect_tables = tables
+        self.collect_code = code
+        self.tables = []
+        self.code_blocks = []
+        self.table_stack = []
+        self.code = None
+        self.pre_depth = 0
+        self.ignored_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in IGNORED_TAGS:
+            self.ignored_depth += 1
+            return
+        if tag == "br":
+            self.handle_data("\n")
+            return
+        attrs = dict(attrs) if attrs else {}
+        if self.collect_code:
+            self.start_code(tag, attrs)
+        if not self.collect_tables:
+            return
+        if tag == "table":
+            # 按开始标签的顺序编号，嵌套表格排在外层表格之后
+            self.table_stack.append(TableState(attrs))
+            self.tables.append(self.table_stack[-1])
+            return
+        if not self.table_stack:
+            return
+        table = self.table_stack[-1]
+        if tag in ROW_GROUP_TAGS:
+            table.end_row()
+            table.in_thead = tag == "thead"
+        elif tag == "tr":
+            table.start_row()
+        elif tag in ("td", "th"):
+            table.start_cell(tag, attrs)
+        elif tag == "caption":
+            table.caption = []
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "br":
+            self.handle_data("\n")
+        elif tag not in IGNORED_TAGS:
+            # 自闭合的 <table/> 等没有内容
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in IGNORED_TAGS:
+            self.ignored_depth = max(self.ignored_depth - 1, 0)
+            return
+        if self.collect_code and tag == "pre" and self.pre_depth:
+            self.pre_depth -= 1
+            if not self.pre_depth:
+                self.end_code()
+        if not self.table_stack:
+            return
+        table = self.table_stack[-1]
+        if tag == "table":
+            self.table_stack.pop()
+            table.end_row()
+            if isinstance(table.caption, list):
+                table.caption = " ".join("".join(table.caption).split())
+        elif tag in ("td", "th"):
+            table.end_cell()
+        elif tag == "tr":
+            table.end_row()
+        elif tag in ROW_GROUP_TAGS:
+            table.end_row()
+            table.in_thead = False
+        elif tag == "caption" and isinstance(table.caption, list):
+            table.caption = " ".join("".join(table.caption).split())
+
+    def handle_data(self, data):
+        if self.ignored_depth:
+            return
+        if self.code is not None:
+            self.code["parts"].append(data)
+        if not self.table_stack:
+            return
+        table = self.table_stack[-1]
+        if table.cell is not None:
+            table.cell["parts"].append(data)
+        elif isinstance(table.caption, list):
+            table.caption.append(data)
+
+    def start_code(self, tag, attrs):
+        if tag == "pre":
+            self.pre_depth += 1
+            if self.pre_depth == 1:
+                self.code = {"parts": [], "language": code_language(attrs)}
+        elif tag == "code" and self.code is not None and self.code["language"] is None:
+            self.code["language"] = code_language(attrs)
+
+    def end_code(self):
+        code, self.code = self.code, None
+        text = "".join(code["parts"])
+        # <pre> 开始标签后紧跟的换行不属于内容
+        if text.startswith("\n"):
+            text = text[1:]
+        if text.strip():
+            self.code_blocks.append({"language": code["language"], "code": text})
+
+    def close(self):
+        super().close()
+        if self.code is not None:
+            self.end_code()
+        while self.table_stack:
+            self.handle_endtag("table")
+
+
+def code_language(attrs):
+    """代码语言：data-lang 属性，或 class 中的 language-xxx / lang-xxx"""
+    if attrs.get("data-lang"):
+        return attrs["data-lang"].lower()
+    match = LANGUAGE_PATTERN.search(attrs.get("class") or "")
+    return match.group(1).lower() if match else None
+
+
+def parse_number(text):
+    """整数、小数（允许千位分隔符和 Unicode 负号），不是数字时返回 None"""
+    text = text.replace("−", "-")
+    if LEADING_ZERO_PATTERN.match(text):
+        return None
+    if INT_PATTERN.match(text):
+        value = int(text.replace(",", ""))
+        return value if abs(value) <= INT64_MAX else float(value)
+    if FLOAT_PATTERN.match(text):
+        return float(text.replace(",", ""))
+    return None
+
+
+def infer_column(texts):
+    """推断列类型（int、float、bool 或 string），返回 (类型, 值列表)；空单元格为 None"""
+    present = [text for text in texts if text]
+    if not present:
+        return "string", [None] * len(texts)
+    numbers = {text: parse_number(text) for text in present}
+    if all(value is not None for value in numbers.values()):
+        if all(isinstance(value, int) for value in numbers.values()):
+            return "int", [numbers[text] if text else None for text in texts]
+        return "float", [float(numbers[text]) if text else None for text in texts]
+    if all(text.lower() in BOOL_VALUES for text in present):
+        return "bool", [BOOL_VALUES[text.lower()] if text else None for text in texts]
+    return "string", [text or None for text in texts]
+
+
+def column_names(header_rows, width):
+    """多行表头逐列用 " / " 连接（跨列的上层表头不重复），没有表头时为 column_1、column_2……；重名时加序号"""
+    names = []
+    for index in range(width):
+        parts = []
+        for row in header_rows:
+            text = row[index][0] if index < len(row) else ""
+            if text and (not parts or parts[-1] != text):
+                parts.append(text)
+        names.append(" / ".join(parts) or f"column_{index + 1}")
+    seen = {}
+    for index, name in enumerate(names):
+        if name in seen:
+            seen[name] += 1
+            names[index] = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 1
+    return names
+
+
+def build_table(table, index):
+    """把解析出的行转换为按列的表格：开头的表头行（<thead> 或全部为 <th>）作为列名"""
+    rows = [row["cells"] for row in table.rows if row["cells"]]
+    header_count = 0
+    for row in table.rows:
+        if not row["cells"]:
+            continue
+        if row["header"] or all(is_header for _, is_header in row["cells"]):
+            header_count += 1
+        else:
+            break
+    # 全部由表头单元格组成的表格（用 <th> 排版）所有行都作为数据
+    if header_count and header_count == len(rows):
+        header_count = 0
+    header_rows, data_rows = rows[:header_count], rows[header_count:]
+    width = max(len(row) for row in rows)
+    names = column_names(header_rows, width)
+    columns = []
+    for column, name in enumerate(names):
+        kind, values = infer_column([row[column][0] if column < len(row) else "" for row in data_rows])
+        columns.append({"name": name, "type": kind, "values": values})
+    return {
+        "index": index,
+        "caption": table.caption or None,
+        "id": table.attrs.get("id"),
+        "row_count": len(data_rows),
+        "columns": columns
+    }
+
+
+def extract_structures(html, tables=True, code=True):
+    """一次解析提取表格和代码块，返回 (表格列表, 代码块列表)"""
+    parser = StructureParser(tables=tables, code=code)
+    parser.feed(html)
+    parser.close()
+    tables = [table for table in parser.tables if any(row["cells"] for row in table.rows)]
+    built = [build_table(table, index) for index, table in enumerate(tables)]
+    blocks = [{"index": index, **block, "line_count": block["code"].count("\n") + 1}
+              for index, block in enumerate(parser.code_blocks)]
+    return built, blocks
+
+
+def pack_column(column):
+    """数值列打包为小端缓冲区（base64），空值位置为 0，并附带 Arrow 格式的有效位图（LSB 在前，无空值时为 None）
+
+    NumPy: np.frombuffer(base64.b64decode(buffer), dtype)；Arrow: pa.Array.from_buffers 使用同样的数据和位图。
+    """
+    typecode, dtype = ARRAY_TYPES[column["type"]]
+    values = column["values"]
+    data = array(typecode, (0 if value is None else value for value in values))
+    if sys.byteorder == "big":
+        data.byteswap()
+    validity = None
+    if any(value is None for value in values):
+        bitmap = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value is not None:
+                bitmap[index >> 3] |= 1 << (index & 7)
+        validity = base64.b64encode(bytes(bitmap)).decode("ascii")
+    packed = {key: column[key] for key in ("name", "type")}
+    packed.update(dtype=dtype, length=len(values), buffer=base64.b64encode(data.tobytes()).decode("ascii"), validity=validity)
+    return packed
+
+
+def pack_numeric_columns(table):
+    """返回数值列替换为打包缓冲区的表格副本"""
+    columns = [pack_column(column) if column["type"] in ARRAY_TYPES else column for column in table["columns"]]
+    return dict(table, columns=columns)
+
+
+def csv_field(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def table_to_csv(table):
+    """带表头的CSV，空值为空字段"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    columns = table["columns"]
+    writer.writerow([column["name"] for column in columns])
+    for row in range(table["row_count"]):
+        writer.writerow([csv_field(column["values"][row]) for column in columns])
+    return output.getvalue()
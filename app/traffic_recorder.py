@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+logger = logging.getLogger('main')
+
+# 录制插件与本地程序之间的原生消息，供 benchmarks/replay_traffic.py 回放；设置录制文件路径即启用
+RECORD_PATH = os.environ.get("MARKDOWN_RECORD_PATH")
+# 是否脱敏：页面文本和属性值替换为等长的占位字符，URL替换为摘要
+RECORD_REDACT = os.environ.get("MARKDOWN_RECORD_REDACT", "0") == "1"
+# 单个字符串字段保留的最大字符数，超出部分截断
+RECORD_MAX_PAYLOAD_CHARS = int(os.environ.get("MARKDOWN_RECORD_MAX_PAYLOAD", str(1024 * 1024)))
+# 录制文件的大小上限，达到后停止录制
+RECORD_MAX_FILE_BYTES = int(os.environ.get("MARKDOWN_RECORD_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# 按HTML结构脱敏的字段，以及只替换文本的字段
+HTML_FIELDS = {"source_code", "html"}
+TEXT_FIELDS = {"markdown", "title", "content", "message", "error"}
+URL_FIELDS = {"url", "favIconUrl"}
+
+TAG_PATTERN = re.compile(r'<[^>]*>')
+ATTR_VALUE_PATTERN = re.compile(r'(=\s*)("[^"]*"|\'[^\']*\')')
+NON_SPACE_PATTERN = re.compile(r'\S')
+
+
+def mask_text(text):
+    """非空白字符替换为 x，保留长度和换行，转换时的工作量与原文接近"""
+    return NON_SPACE_PATTERN.sub("x", text)
+
+
+def redact_html(html):
+    """保留标签和属性名，替换文本内容和属性值"""
+    pieces = []
+    position = 0
+    for match in TAG_PATTERN.finditer(html):
+        pieces.append(mask_text(html[position:match.start()]))
+        pieces.append(ATTR_VALUE_PATTERN.sub(
+            lambda value: value.group(1) + value.group(2)[0] + mask_text(value.group(2)[1:-1]) + value.group(2)[-1],
+            match.group(0)
+        ))
+        position = match.end()
+    pieces.append(mask_text(html[position:]))
+    return "".join(pieces)
+
+
+def redact_url(url):
+    """同一URL得到相同的替换结果，回放时仍能区分不同页面"""
+    return f"https://redacted.invalid/{hashlib.sha256(url.encode('utf-8')).hexdigest()[:12]}"
+
+
+class TrafficRecorder:
+    """把原生消息按时间顺序写入JSONL录制文件；序列化和写入在后台线程中进行，不阻塞消息处理"""
+
+    def __init__(self, path, redact=False, max_payload_chars=RECORD_MAX_PAYLOAD_CHARS,
+                 max_file_bytes=RECORD_MAX_FILE_BYTES):
+        self.path = path
+        self.redact = redact
+        self.max_payload_chars = max_payload_chars
+        self.max_file_bytes = max_file_bytes
+        self.started = time.monotonic()
+        self.queue = queue.Queue()
+        self.written_bytes = 0
+        self.recorded = 0
+        self.stopped = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 行缓冲，进程异常退出时已录制的消息不会丢失
+        self.file = open(path, "a", encoding="utf-8", buffering=1)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def record(self, direction, message, size=None):
+        """记录一条消息；direction 为 "in"（插件发往本地程序）或 "out"，message 可以是已编码的消息帧"""
+        if not self.stopped:
+            self.queue.put((time.monotonic() - self.started, direction, message, size))
+
+    def flush(self, timeout=None):
+        """等待已提交的消息写入文件"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, threading.Event):
+                self.file.flush()
+                item.set()
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"录制消息时出错: {str(e)}")
+
+    def _write(self, offset, direction, message, size):
+        if self.stopped:
+            return
+        if isinstance(message, (bytes, bytearray)):
+            size = len(message)
+            message = json.loads(bytes(message[4:]).decode("utf-8"))
+        entry = {"t": round(offset, 6), "dir": direction, "bytes": size}
+        truncated = []
+        entry["message"] = self._prepare(message, None, truncated)
+        if truncated:
+            entry["truncated"] = sorted(set(truncated))
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self.written_bytes + len(line) > self.max_file_bytes:
+            self.stopped = True
+            logger.warning(f"录制文件已达到大小上限 {self.max_file_bytes} 字节，停止录制")
+            return
+        self.file.write(line)
+        self.written_bytes += len(line)
+        self.recorded += 1
+
+    def _prepare(self, value, key, truncated):
+        """按字段脱敏并截断过长的字符串"""
+        if isinstance(value, dict):
+            return {k: self._prepare(v, k, truncated) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._prepare(item, key, truncated) for item in value]
+        if not isinstance(value, str):
+            return value
+        if len(value) > self.max_payload_chars:
+            value = value[:self.max_payload_chars]
+            truncated.append(key or "message")
+        if self.redact:
+            if key in HTML_FIELDS:
+                value = redact_html(value)
+            elif key in URL_FIELDS:
+                value = redact_url(value)
+            elif key in TEXT_FIELDS:
+                value = mask_text(value)
+        return value
+
+
+def load_capture(path):
+    """读取录制文件，按时间排序返回记录列表"""
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry["t"])
+
+
+def create_recorder():
+    """按环境变量创建录制器，未启用时返回 None"""
+    if not RECORD_PATH:
+        return None
+    logger.info(f"原生消息录制已启用: {RECORD_PATH}, 脱敏: {RECORD_REDACT}")
+    return TrafficRecorder(RECORD_PATH, redact=RECORD_REDACT)
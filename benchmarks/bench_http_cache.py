@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""重复读取 /api/get-markdown 时的传输字节数与客户端耗时：不压缩、gzip 与 If-None-Match
+
+用法: python benchmarks/bench_http_cache.py [--markdown-kb 64 1024 4096] [--rounds 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+PARAGRAPH = "## 小节\n重复读取同一结果时，客户端带上 ETag 即可跳过传输和解析。[链接](https://example.com/a)\n\n"
+
+
+def measure(client, request_id, headers, rounds):
+    timings, wire_bytes = [], 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        response = client.post("/api/get-markdown", json={"request_id": request_id}, headers=headers)
+        if response.status_code == 200:
+            response.json()
+        timings.append((time.perf_counter() - started) * 1000)
+        wire_bytes = int(response.headers.get("content-length", len(response.content)))
+    return statistics.median(timings), wire_bytes
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Markdown响应缓存与压缩基准测试")
+    parser.add_argument("--markdown-kb", type=int, nargs="+", default=[64, 1024, 4096])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'Markdown':>10} {'方式':>14} {'传输字节':>12} {'耗时(ms)':>10}")
+    with TestClient(main.create_app()) as client:
+        for size_kb in args.markdown_kb:
+            request_id = f"bench_{size_kb}"
+            markdown = PARAGRAPH * (size_kb * 1024 // len(PARAGRAPH.encode("utf-8")) + 1)
+            main.store_markdown(request_id, markdown, url="https://bench.example/")
+            etag = client.post("/api/get-markdown", json={"request_id": request_id},
+                               headers={"Accept-Encoding": "identity"}).headers["etag"]
+            for label, headers in (
+                ("identity", {"Accept-Encoding": "identity"}),
+                ("gzip", {"Accept-Encoding": "gzip"}),
+                ("If-None-Match", {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+            ):
+                elapsed, wire_bytes = measure(client, request_id, headers, args.rounds)
+                print(f"{size_kb:>8}KB {label:>14} {wire_bytes:>12} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""正文提取：Markdown 输出体积的缩减比例与额外的CPU耗时
+
+生成带导航栏、侧栏、Cookie 提示、分享栏、评论和页脚的几类典型页面，
+分别以完整页面和 main_content 模式转换，比较输出大小与转换耗时。
+
+用法: python benchmarks/bench_main_content.py [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from content_extraction import extract_main_content  # noqa: E402
+from main import convert_html_to_markdown  # noqa: E402
+
+SENTENCE = ("服务端在转换前先选出正文所在的元素，导航、侧栏和页脚不会进入输出。"
+            "The extraction stage scores each block by how much non-link text it carries. ")
+
+
+def paragraphs(rng, count):
+    return "".join(
+        f"<p>{SENTENCE * rng.randint(1, 4)}<a href='/ref{n}'>参考{n}</a>，<code>value_{n}</code>。</p>"
+        for n in range(count)
+    )
+
+
+def link_list(prefix, count, css_class):
+    items = "".join(f"<li><a href='/{prefix}/{n}'>{prefix.title()} link number {n}</a></li>" for n in range(count))
+    return f"<ul class='{css_class}'>{items}</ul>"
+
+
+def chrome(rng, body):
+    """在正文外包一层典型的站点外壳"""
+    return (
+        "<html><head><title>Bench</title><style>body{margin:0}</style><script>var x = 1;</script></head><body>"
+        "<div class='cookie-consent'>We use cookies to personalise content and ads. <a href='/privacy'>Learn more</a>"
+        "<button>Accept all</button></div>"
+        f"<header class='site-header'><nav>{link_list('section', 40, 'menu')}</nav>"
+        "<form class='search'><input name='q'><button>Search</button></form></header>"
+        f"<div class='layout'><aside class='sidebar'>{link_list('related', 30, 'related-posts')}"
+        f"<div class='newsletter'><p>Subscribe to our newsletter for weekly updates and offers.</p></div></aside>"
+        f"{body}</div>"
+        f"<footer class='site-footer'>{link_list('about', 25, 'footer-links')}"
+        "<p>Copyright 2024 Example Media. All rights reserved.</p></footer></body></html>"
+    )
+
+
+def news_article(rng):
+    return chrome(rng,
+        "<main><article class='post'><h1>Article headline</h1>"
+        f"<div class='share-bar'>{link_list('share', 6, 'social')}</div>"
+        f"{paragraphs(rng, 12)}<figure><img src='/a.png'><figcaption>Figure caption</figcaption></figure>"
+        f"{paragraphs(rng, 8)}</article>"
+        f"<section class='comments'>{paragraphs(rng, 6)}</section></main>")
+
+
+def docs_page(rng):
+    return chrome(rng,
+        f"<div class='docs'><nav class='toc'>{link_list('docs', 120, 'toc')}</nav>"
+        f"<div class='content'><h1>API reference</h1>{paragraphs(rng, 6)}"
+        "<pre><code>def handler(request):\n    return response\n</code></pre>"
+        "<table><tr><th>参数</th><th>说明</th></tr>"
+        + "".join(f"<tr><td>param_{n}</td><td>{SENTENCE}</td></tr>" for n in range(10))
+        + f"</table>{paragraphs(rng, 6)}</div></div>")
+
+
+def short_post(rng):
+    return chrome(rng, f"<div id='main-content'><h2>Short note</h2>{paragraphs(rng, 3)}</div>")
+
+
+PAGES = {
+    "新闻文章": news_article,
+    "文档页面": docs_page,
+    "短文": short_post,
+}
+
+
+def cpu_time(fn, *args, runs):
+    """多次运行取中位数（进程CPU时间）"""
+    samples = []
+    for _ in range(runs):
+        started = time.process_time()
+        fn(*args)
+        samples.append(time.process_time() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正文提取基准测试")
+    parser.add_argument("--runs", type=int, default=20, help="每种页面的重复次数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'页面':<8}{'HTML':>10}{'完整MD':>10}{'正文MD':>10}{'缩减':>8}{'完整转换':>10}{'正文转换':>10}{'提取':>8}{'额外CPU':>9}")
+    for name, build in PAGES.items():
+        html = build(rng)
+        full = convert_html_to_markdown(html)
+        main_only = convert_html_to_markdown(html, main_content=True)
+        full_ms = cpu_time(convert_html_to_markdown, html, runs=args.runs)
+        main_ms = cpu_time(convert_html_to_markdown, html, True, runs=args.runs)
+        extract_ms = cpu_time(extract_main_content, html, runs=args.runs)
+        reduction = 1 - len(main_only.encode("utf-8")) / len(full.encode("utf-8"))
+        print(f"{name:<8}{len(html):>10}{len(full.encode('utf-8')):>10}{len(main_only.encode('utf-8')):>10}"
+              f"{reduction:>8.0%}{full_ms:>8.2f}ms{main_ms:>8.2f}ms{extract_ms:>6.2f}ms{(main_ms - full_ms) / full_ms:>+9.0%}")
+
+
+if __name__ == "__main__":
+    main()
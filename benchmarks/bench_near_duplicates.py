@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""重复获取同一页面：普通字典与去重存储（DedupPageStore）的内存占用和保存耗时
+
+模拟代理反复获取同一篇文章，每次只有时间戳、阅读数和广告不同，另有一部分获取的页面完全没有变化。
+去重存储中近似重复的页面只保存差异，源码完全相同时直接复用转换结果。
+
+用法: python benchmarks/bench_near_duplicates.py [--captures 50] [--paragraphs 200] [--unchanged 0.3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import main  # noqa: E402
+from memory_report import page_size_breakdown  # noqa: E402
+from near_duplicates import DedupPageStore  # noqa: E402
+
+WORDS = [f"词{n}" for n in range(800)] + [f"token{n}" for n in range(800)]
+
+
+def build_article(rng, paragraphs):
+    return "".join(
+        f"<div class='para'><p>{' '.join(rng.choice(WORDS) for _ in range(60))}</p>"
+        f"<a href='/ref/{n}'>参考 {n}</a></div>\n"
+        for n in range(paragraphs)
+    )
+
+
+def capture(n, article):
+    return (f"<html><body><div class='meta'>更新于 12:{n % 60:02d}:{n % 7:02d} 阅读 {n * 131}</div>"
+            f"{article}<aside class='ad'>广告 {n * 7919 % 1000}</aside></body></html>")
+
+
+def run(store, sources):
+    main.page_sources = store
+    convert = save = 0.0
+    for n, source in enumerate(sources):
+        started = time.perf_counter()
+        markdown = main.convert_html_to_markdown(source)
+        converted = time.perf_counter()
+        store[f"r{n}"] = {"url": "https://news.example/a", "source_code": source, "markdown": markdown}
+        convert += converted - started
+        save += time.perf_counter() - converted
+    pages = store.pages if isinstance(store, DedupPageStore) else store
+    size = sum(page_size_breakdown(page)[0] for page in pages.values())
+    return convert, save, size
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="近似重复去重基准测试")
+    parser.add_argument("--captures", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--unchanged", type=float, default=0.3, help="与上一次完全相同的获取所占比例")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    article = build_article(rng, args.paragraphs)
+    sources, n = [], 0
+    for _ in range(args.captures):
+        if not sources or rng.random() >= args.unchanged:
+            n += 1
+        sources.append(capture(n, article))
+    print(f"页面 {len(sources[0]) // 1024}KB × {args.captures} 次获取，其中 {args.captures - n} 次未变化")
+
+    results = {}
+    for name, store in (("dict", {}), ("dedup", DedupPageStore())):
+        convert, save, size = run(store, sources)
+        results[name] = size
+        print(f"{name:>6}: 转换 {convert * 1000:8.1f} ms, 保存 {save * 1000:8.1f} ms, 内存 {size / 1024 / 1024:8.2f} MB")
+        if isinstance(store, DedupPageStore):
+            print(f"        {store.stats()}")
+            assert all(store[f"r{i}"]["source_code"] == source for i, source in enumerate(sources))
+    print(f"内存缩减 {1 - results['dedup'] / results['dict']:.1%}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""全文索引的写入吞吐与查询延迟
+
+用法: python benchmarks/bench_search_index.py [--pages 30000] [--queries 500]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from search_index import SearchIndex  # noqa: E402
+
+WORDS = ("python rust server client cache index search proxy deploy config thread async "
+         "buffer socket stream parser token markdown browser extension capture request "
+         "response latency memory schedule queue worker network storage").split()
+
+
+def build_vocabulary(rng, size=20000):
+    """生成词表：英文词加数字后缀，中文词由常用汉字区间随机组合（2~4字）"""
+    vocabulary = []
+    for number in range(size):
+        if number % 3 == 0:
+            vocabulary.append("".join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(rng.randint(2, 4))))
+        else:
+            vocabulary.append(rng.choice(WORDS) + str(number))
+    return vocabulary
+
+
+def fake_page(rng, vocabulary, weights, words_per_page):
+    """按 Zipf 分布抽词生成页面，使高频词与长尾词的比例接近真实文本"""
+    parts = rng.choices(vocabulary, cum_weights=weights, k=words_per_page)
+    title = " ".join(parts[:4])
+    return title, f"# {title}\n\n" + " ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全文索引基准测试")
+    parser.add_argument("--pages", type=int, default=30000, help="索引的页面数")
+    parser.add_argument("--words", type=int, default=400, help="每个页面的词数")
+    parser.add_argument("--queries", type=int, default=500, help="查询次数")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = build_vocabulary(rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    pages = [fake_page(rng, vocabulary, weights, args.words) for _ in range(args.pages)]
+    index = SearchIndex()
+
+    started = time.perf_counter()
+    for number, (title, markdown) in enumerate(pages):
+        index.submit(f"req_{number}", f"https://example.com/{number}", title, markdown)
+    submit_seconds = time.perf_counter() - started
+    index.flush()
+    index_seconds = time.perf_counter() - started
+
+    print(f"页面数: {args.pages}, 提交耗时: {submit_seconds * 1000:.1f}ms（调用方阻塞时间）")
+    print(f"索引完成耗时: {index_seconds:.2f}s, 吞吐: {args.pages / index_seconds:.0f} 页/秒")
+
+    # 查询词同样按 Zipf 分布抽取，包含单词和双词查询，高频词会命中大部分页面
+    queries = [" ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 2))) for _ in range(args.queries)]
+
+    latencies = []
+    hits = 0
+    for query in queries:
+        started = time.perf_counter()
+        hits += len(index.search(query, limit=10))
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    print(f"查询次数: {len(queries)}, 平均命中: {hits / len(queries):.1f}")
+    print(f"查询延迟 p50: {statistics.median(latencies):.3f}ms, "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1]:.3f}ms, "
+          f"p99: {latencies[int(len(latencies) * 0.99) - 1]:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
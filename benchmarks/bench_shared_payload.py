@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""进程间传递大页面的开销：pickle、原始字节管道与共享内存交接的比较
+
+父进程扮演原生消息桥，子进程扮演API工作进程。每轮传递一个页面，子进程得到
+可用的 str 后回送确认（共享内存方式同时释放该段），统计每个页面的往返耗时。
+
+- pickle: Connection.send(str)，multiprocessing 默认的对象传递方式
+- bytes: Connection.send_bytes(UTF-8)，独立进程模式最初的转发方式
+- shm: 写入共享内存段，连接上只传递段名称，子进程从只读视图直接解码
+
+用法: python benchmarks/bench_shared_payload.py [--sizes-kb 100 1024 5120 20480] [--rounds 20]
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from shared_payload import SharedPayloadPool, open_shared_payload  # noqa: E402
+
+LINE = "<p>服务端在转换前先选出正文所在的元素，<a href='/ref'>参考链接</a>。The page body carries most of the text.</p>\n"
+
+
+def make_page(size):
+    return (LINE * (size // len(LINE.encode("utf-8")) + 1)).encode("utf-8")[:size].decode("utf-8", "ignore")
+
+
+def worker(connection):
+    while True:
+        mode, payload = connection.recv_bytes()[:1], None
+        if mode == b"q":
+            return
+        if mode == b"p":
+            payload = pickle.loads(connection.recv_bytes())
+        elif mode == b"b":
+            payload = connection.recv_bytes().decode("utf-8")
+        elif mode == b"s":
+            handle = pickle.loads(connection.recv_bytes())
+            with open_shared_payload(handle) as view:
+                payload = str(view, "utf-8")
+        connection.send_bytes(str(len(payload)).encode("ascii"))
+
+
+def run_mode(connection, pool, mode, page, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        connection.send_bytes(mode)
+        if mode == b"p":
+            connection.send_bytes(pickle.dumps(page, protocol=pickle.HIGHEST_PROTOCOL))
+        elif mode == b"b":
+            connection.send_bytes(page.encode("utf-8"))
+        else:
+            data = page.encode("utf-8")
+            handle = pool.share(pool.put(data), len(data), ["worker"])
+            connection.send_bytes(pickle.dumps(handle))
+        assert int(connection.recv_bytes()) == len(page)
+        if mode == b"s":
+            pool.release(handle["name"], "worker")
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程间大负载交接基准测试")
+    parser.add_argument("--sizes-kb", type=int, nargs="+", default=[100, 1024, 5120, 20480])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=worker, args=(child,), daemon=True)
+    process.start()
+    pool = SharedPayloadPool()
+
+    print(f"{'页面大小':>10} {'pickle(ms)':>12} {'bytes(ms)':>12} {'shm(ms)':>12} {'shm/pickle':>12}")
+    try:
+        for size_kb in args.sizes_kb:
+            page = make_page(size_kb * 1024)
+            # 较大的页面减少轮数，避免总耗时过长
+            rounds = max(3, args.rounds * 1024 // max(size_kb, 1024))
+            pickled = run_mode(parent, pool, b"p", page, rounds)
+            raw = run_mode(parent, pool, b"b", page, rounds)
+            shared = run_mode(parent, pool, b"s", page, rounds)
+            print(f"{size_kb:>8}KB {pickled:>12.2f} {raw:>12.2f} {shared:>12.2f} {shared / pickled:>11.2f}x")
+    finally:
+        parent.send_bytes(b"q")
+        process.join(5)
+        pool.close()
+    print(f"共享内存段: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
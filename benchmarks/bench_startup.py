@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""本地应用冷启动耗时：从启动进程到处理完第一条插件消息
+
+模拟浏览器的行为：启动 app/main.py，通过 stdin 发送 init 消息，
+测量收到 "初始化成功" 响应的时间。
+
+用法: python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "main.py")
+
+
+def encode(message):
+    content = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return struct.pack('=I', len(content)) + content
+
+
+def read_frame(stream):
+    raw_length = stream.read(4)
+    if len(raw_length) < 4:
+        return None
+    length = struct.unpack('=I', raw_length)[0]
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def measure_once(workdir):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MAIN_PY],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=workdir,
+    )
+    try:
+        process.stdin.write(encode({"action": "init", "message": "bench"}))
+        process.stdin.flush()
+        first_frame = None
+        while True:
+            message = read_frame(process.stdout)
+            if message is None:
+                raise RuntimeError("本地应用提前退出")
+            if first_frame is None:
+                first_frame = time.perf_counter() - started
+            if isinstance(message, dict) and message.get("content") == "初始化成功":
+                return first_frame, time.perf_counter() - started
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地应用冷启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    first_frames = []
+    handled = []
+    for _ in range(args.runs):
+        first_frame, handled_at = measure_once(workdir)
+        first_frames.append(first_frame * 1000)
+        handled.append(handled_at * 1000)
+        time.sleep(0.5)  # 等待上一个进程释放端口
+
+    print(f"运行次数: {args.runs}")
+    print(f"首条消息到达: 中位数 {statistics.median(first_frames):.1f}ms, 最小 {min(first_frames):.1f}ms")
+    print(f"首条插件消息处理完成: 中位数 {statistics.median(handled):.1f}ms, 最小 {min(handled):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
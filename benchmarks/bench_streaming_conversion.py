@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""大页面直接获取时的首字节时间与总耗时：先下载完再转换（轮询 get-markdown） vs stream 流式转换
+
+源站按 --mbps 限速分块发送页面，模拟较慢的网络；流式转换在下载的同时转换，首段Markdown在下载完成前即可返回。
+
+用法: python benchmarks/bench_streaming_conversion.py [--page-kb 512 2048] [--mbps 8] [--rounds 3] [--html page.html]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import main  # noqa: E402
+
+SECTION = ("<h2>第{n}节</h2><p>这是用于测试流式转换的正文 {n}，包含<a href='https://example.com/{n}'>链接</a>、"
+           "<b>粗体</b>和<code>代码</code>。</p><ul><li>项目一</li><li>项目二</li></ul><pre>fn main() {{ {n} }}</pre>")
+# 源站每次写出的字节数
+WRITE_BYTES = 16 * 1024
+
+
+def build_page(size):
+    parts, n = [], 0
+    while sum(map(len, parts)) < size:
+        parts.append(SECTION.format(n=n))
+        n += 1
+    return f"<html><head><title>流式转换</title></head><body>{''.join(parts)}</body></html>"
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """按限速分块发送 /page/{大小}"""
+
+    def do_GET(self):
+        data = self.server.pages[self.path].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        interval = WRITE_BYTES / (self.server.mbps * 1024 * 1024)
+        for start in range(0, len(data), WRITE_BYTES):
+            self.wfile.write(data[start:start + WRITE_BYTES])
+            time.sleep(interval)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_api():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(main.create_app(), log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def buffered(client, api, url):
+    """先下载完整页面再转换：提交请求后轮询结果"""
+    started = time.perf_counter()
+    request_id = client.post(f"{api}/api/get-webpage-markdown", json={"url": url}).json()["request_id"]
+    while True:
+        response = client.post(f"{api}/api/get-markdown", json={"request_id": request_id})
+        if response.status_code == 200:
+            elapsed = time.perf_counter() - started
+            return elapsed, elapsed, response.json()["markdown"]
+        time.sleep(0.005)
+
+
+def streaming(client, api, url):
+    started = time.perf_counter()
+    first_chunk, parts = None, []
+    with client.stream("POST", f"{api}/api/get-webpage-markdown", json={"url": url, "stream": True}) as response:
+        for line in response.iter_lines():
+            message = json.loads(line)
+            if message["type"] == "chunk":
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                parts.append(message["markdown"])
+            elif message["type"] == "error":
+                raise RuntimeError(message["message"])
+    return first_chunk, time.perf_counter() - started, "".join(parts)
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="流式转换基准测试")
+    parser.add_argument("--page-kb", type=int, nargs="+", default=[512, 2048])
+    parser.add_argument("--mbps", type=float, default=8.0, help="源站发送速率（MB/s）")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--html", help="使用指定的HTML文件代替生成的页面")
+    args = parser.parse_args()
+
+    origin = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    origin.mbps = args.mbps
+    origin.pages = {}
+    if args.html:
+        with open(args.html, encoding="utf-8", errors="replace") as f:
+            origin.pages["/page/file"] = f.read()
+    else:
+        for size_kb in args.page_kb:
+            origin.pages[f"/page/{size_kb}"] = build_page(size_kb * 1024)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{origin.server_address[1]}"
+    api = start_api()
+
+    print(f"源站速率 {args.mbps} MB/s")
+    print(f"{'页面':>10} {'方式':>8} {'首段(ms)':>10} {'总耗时(ms)':>12}")
+    with httpx.Client(timeout=120) as client:
+        for path, page in origin.pages.items():
+            label = f"{len(page.encode('utf-8')) // 1024}KB"
+            results = {}
+            for name, run in (("buffered", buffered), ("stream", streaming)):
+                timings = [run(client, api, base + path) for _ in range(args.rounds)]
+                results[name] = timings[-1][2]
+                first = statistics.median(t[0] for t in timings) * 1000
+                total = statistics.median(t[1] for t in timings) * 1000
+                print(f"{label:>10} {name:>8} {first:>10.1f} {total:>12.1f}")
+            assert results["buffered"] == results["stream"], "流式转换结果与整页转换不一致"
+
+
+if __name__ == "__main__":
+    main_bench()
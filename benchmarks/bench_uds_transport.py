@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""比较 TCP 与 Unix 域套接字在本地 HTTP 往返上的延迟
+
+用法: python benchmarks/bench_uds_transport.py [--rounds 200] [--payload-mb 1 4 8]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# 预先生成的 Markdown 负载，按大小缓存
+_payloads = {}
+
+
+def markdown_payload(size):
+    if size not in _payloads:
+        line = "## 标题\n这是一段用于测试传输延迟的 Markdown 文本，包含 [链接](https://example.com)。\n"
+        repeated = line * (size // len(line.encode("utf-8")) + 1)
+        _payloads[size] = repeated.encode("utf-8")[:size]
+    return _payloads[size]
+
+
+async def handle_control(request):
+    body = await request.json()
+    return JSONResponse({"status": "success", "request_id": body.get("request_id")})
+
+
+async def handle_markdown(request):
+    size = int(request.query_params["size"])
+    return Response(markdown_payload(size), media_type="text/markdown")
+
+
+app = Starlette(routes=[
+    Route("/control", endpoint=handle_control, methods=["POST"]),
+    Route("/markdown", endpoint=handle_markdown),
+])
+
+
+def start_server(uds_path):
+    """在后台线程中同时监听 TCP（随机端口）与 Unix 域套接字"""
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_sock.bind(("127.0.0.1", 0))
+    uds_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds_sock.bind(uds_path)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [tcp_sock, uds_sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, tcp_sock.getsockname()[1]
+
+
+def measure(client, rounds, request):
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        response = request(client)
+        response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "mean": statistics.mean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP 与 Unix 域套接字往返延迟对比")
+    parser.add_argument("--rounds", type=int, default=200, help="控制消息的往返次数")
+    parser.add_argument("--payload-mb", type=float, nargs="+", default=[1, 4, 8], help="Markdown 负载大小（MB）")
+    args = parser.parse_args()
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("当前平台不支持 Unix 域套接字")
+        return
+
+    uds_path = os.path.join(tempfile.mkdtemp(), "bench_api.sock")
+    server, thread, port = start_server(uds_path)
+
+    transports = {
+        "TCP": httpx.Client(base_url=f"http://127.0.0.1:{port}"),
+        "UDS": httpx.Client(base_url="http://localhost", transport=httpx.HTTPTransport(uds=uds_path)),
+    }
+
+    cases = [("控制消息", args.rounds, lambda c: c.post("/control", json={"request_id": "req_bench"}))]
+    for size_mb in args.payload_mb:
+        size = int(size_mb * 1024 * 1024)
+        markdown_payload(size)
+        cases.append((f"Markdown {size_mb:g}MB", max(10, args.rounds // 20),
+                      lambda c, size=size: c.get("/markdown", params={"size": size})))
+
+    try:
+        print(f"{'场景':<16}{'传输':<6}{'p50(ms)':>10}{'p95(ms)':>10}{'均值(ms)':>10}")
+        for name, rounds, request in cases:
+            for transport_name, client in transports.items():
+                measure(client, min(rounds, 5), request)  # 预热连接
+                result = measure(client, rounds, request)
+                print(f"{name:<16}{transport_name:<6}{result['p50']:>10.3f}{result['p95']:>10.3f}{result['mean']:>10.3f}")
+    finally:
+        for client in transports.values():
+            client.close()
+        server.should_exit = True
+        thread.join(timeout=5)
+        if os.path.exists(uds_path):
+            os.unlink(uds_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""回放录制的原生消息，对本地程序做可重复的性能回归测试
+
+录制文件由 MARKDOWN_RECORD_PATH 开启的录制器生成（每行一条消息）。回放时启动一个新的
+本地程序进程，本脚本扮演插件：
+
+- 插件主动发送的消息（初始化、心跳、标签页上报、按钮点击等）按录制时的时间点写入 stdin
+- 录制中本地程序发出的 get_page_source / list_tabs 请求，在对应时间点调用触发该请求的HTTP接口；
+  本地程序发出请求后，按录制时的响应延迟回送录制的响应（替换为新的请求ID）
+- 结束后比较HTTP接口的状态与延迟，以及本地程序输出的消息类型数量
+
+--speed 大于1时按比例加速（时间点和响应延迟同时缩短）。存在失败的请求、未被触发的录制响应，
+或延迟超过 --max-p95-ms 时退出码为1。
+
+用法: python benchmarks/replay_traffic.py capture.jsonl [--speed 1] [--host app/native_bridge.py] [--json]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "app"))
+
+from traffic_recorder import load_capture  # noqa: E402
+
+# 本地程序主动发出、需要通过HTTP接口触发的请求类型
+TRIGGERED_TYPES = {"get_page_source", "list_tabs"}
+# 由定时器产生、数量与回放时长有关的消息，不参与比较
+TIMER_TYPES = {"heartbeat"}
+
+
+def encode_frame(message):
+    content = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return struct.pack('=I', len(content)) + content
+
+
+def message_type(message):
+    return message.get("type", message.get("action")) if isinstance(message, dict) else "text"
+
+
+def request_key(message):
+    """匹配录制请求与回放请求：同类型、同标签页的请求按先后顺序对应"""
+    return message.get("type"), message.get("tab_id")
+
+
+def trigger_call(message):
+    """返回触发该请求的HTTP接口和请求体"""
+    if message["type"] == "list_tabs":
+        return "/api/list-tabs", {"refresh": True}
+    if message.get("tab_id") is not None:
+        return "/api/capture-tabs", {"tab_ids": [message["tab_id"]]}
+    return "/api/get-current-tab-markdown", {}
+
+
+def build_plan(entries):
+    """拆分为按时间发送的插件消息、HTTP触发点，以及各请求对应的录制响应"""
+    requests = {}
+    for entry in entries:
+        message = entry["message"]
+        if entry["dir"] == "out" and isinstance(message, dict) and message.get("type") in TRIGGERED_TYPES \
+                and message.get("request_id"):
+            requests[message["request_id"]] = {"entry": entry, "reply": None}
+
+    sends, triggers = [], []
+    expected = Counter()
+    for entry in entries:
+        message = entry["message"]
+        request_id = message.get("request_id") if isinstance(message, dict) else None
+        if entry["dir"] == "in":
+            if request_id in requests and requests[request_id]["reply"] is None:
+                requests[request_id]["reply"] = entry
+            else:
+                sends.append(entry)
+        elif request_id in requests:
+            triggers.append(requests[request_id])
+        elif message_type(message) not in TIMER_TYPES:
+            expected[message_type(message)] += 1
+    return sends, triggers, expected
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Replayer:
+    def __init__(self, entries, host, speed, timeout):
+        self.sends, self.triggers, self.expected = build_plan(entries)
+        self.host = host
+        self.speed = speed
+        self.timeout = timeout
+        self.port = free_port()
+        # 等待本地程序发出的请求：请求键 -> 录制的 (请求, 响应)
+        self.pending = defaultdict(deque)
+        self.pending_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.received = Counter()
+        self.unmatched_requests = 0
+        self.results = []
+        self.process = None
+
+    def write(self, message):
+        with self.write_lock:
+            self.process.stdin.write(encode_frame(message))
+            self.process.stdin.flush()
+
+    def read_host(self):
+        while True:
+            header = self.process.stdout.read(4)
+            if len(header) < 4:
+                return
+            message = json.loads(self.process.stdout.read(struct.unpack('=I', header)[0]).decode("utf-8"))
+            if isinstance(message, dict) and message.get("type") in TRIGGERED_TYPES:
+                with self.pending_lock:
+                    queued = self.pending[request_key(message)]
+                    recorded = queued.popleft() if queued else None
+                if recorded is None:
+                    self.unmatched_requests += 1
+                    continue
+                if recorded["reply"] is not None:
+                    threading.Thread(target=self.reply, args=(message["request_id"], recorded), daemon=True).start()
+            elif message_type(message) == "heartbeat":
+                # 与插件一样应答心跳，否则本地程序会判定插件无响应
+                self.write({"action": "heartbeat"})
+            elif message_type(message) not in TIMER_TYPES:
+                self.received[message_type(message)] += 1
+
+    def reply(self, request_id, recorded):
+        """按录制时的响应延迟回送录制的响应"""
+        time.sleep(max(recorded["reply"]["t"] - recorded["entry"]["t"], 0) / self.speed)
+        self.write(dict(recorded["reply"]["message"], request_id=request_id))
+
+    def call(self, recorded):
+        path, body = trigger_call(recorded["entry"]["message"])
+        started = time.perf_counter()
+        try:
+            response = httpx.post(f"http://127.0.0.1:{self.port}{path}", json=body, timeout=self.timeout)
+            if path == "/api/capture-tabs":
+                # 逐行输出的结果，最后一行为汇总
+                summary = json.loads(response.text.strip().splitlines()[-1])
+                ok = summary["counts"].get("success", 0) == summary["total"]
+            else:
+                ok = response.status_code == 200 and response.json().get("status") == "success"
+        except (httpx.HTTPError, ValueError, KeyError, IndexError):
+            ok = False
+        self.results.append({"path": path, "ok": ok, "latency_ms": (time.perf_counter() - started) * 1000})
+
+    def wait_ready(self):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"http://127.0.0.1:{self.port}/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        raise TimeoutError("本地程序的API服务未就绪")
+
+    def run(self):
+        env = dict(os.environ, MARKDOWN_API_PORT=str(self.port))
+        env.pop("MARKDOWN_RECORD_PATH", None)
+        with tempfile.TemporaryDirectory() as cwd:
+            self.process = subprocess.Popen(
+                [sys.executable, self.host], cwd=cwd, env=env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            try:
+                threading.Thread(target=self.read_host, daemon=True).start()
+                self.wait_ready()
+                return self.replay()
+            finally:
+                self.process.stdin.close()
+                try:
+                    self.process.wait(5)
+                except subprocess.TimeoutExpired:
+                    self.process.terminate()
+                    self.process.wait()
+
+    def replay(self):
+        events = [(entry["t"], 0, entry) for entry in self.sends] + [(r["entry"]["t"], 1, r) for r in self.triggers]
+        events.sort(key=lambda event: (event[0], event[1]))
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            for offset, kind, item in events:
+                delay = started + offset / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if kind == 0:
+                    self.write(item["message"])
+                else:
+                    with self.pending_lock:
+                        self.pending[request_key(item["entry"]["message"])].append(item)
+                    executor.submit(self.call, item)
+        # 等待最后几条异步消息
+        time.sleep(0.5)
+        elapsed = time.monotonic() - started
+        return self.summary(elapsed, events[-1][0] if events else 0)
+
+    def summary(self, elapsed, recorded_duration):
+        latencies = sorted(result["latency_ms"] for result in self.results)
+        by_path = defaultdict(list)
+        for result in self.results:
+            by_path[result["path"]].append(result["latency_ms"])
+        missing_replies = sum(len(queued) for queued in self.pending.values())
+        return {
+            "recorded_seconds": round(recorded_duration, 3),
+            "replay_seconds": round(elapsed, 3),
+            "speed": self.speed,
+            "messages_sent": len(self.sends),
+            "requests": len(self.results),
+            "failed": sum(1 for result in self.results if not result["ok"]),
+            "missing_replies": missing_replies,
+            "unmatched_requests": self.unmatched_requests,
+            "latency_ms": percentiles(latencies),
+            "latency_by_path": {path: percentiles(sorted(values)) for path, values in by_path.items()},
+            "output_types": {
+                kind: {"recorded": self.expected[kind], "replayed": self.received[kind]}
+                for kind in sorted(set(self.expected) | set(self.received))
+            }
+        }
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    return {
+        "p50": round(statistics.median(values), 2),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        "max": round(values[-1], 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的原生消息")
+    parser.add_argument("capture", help="录制文件（JSONL）")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，默认按原速")
+    parser.add_argument("--host", default=os.path.join(ROOT_DIR, "app", "main.py"), help="本地程序入口")
+    parser.add_argument("--timeout", type=float, default=60, help="单个HTTP请求的超时时间（秒）")
+    parser.add_argument("--max-p95-ms", type=float, help="HTTP请求p95延迟上限，超出时退出码为1")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    summary = Replayer(load_capture(args.capture), args.host, args.speed, args.timeout).run()
+    passed = summary["failed"] == 0 and summary["missing_replies"] == 0
+    if args.max_p95_ms is not None and summary["latency_ms"]:
+        passed = passed and summary["latency_ms"]["p95"] <= args.max_p95_ms
+    summary["passed"] = passed
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"录制时长: {summary['recorded_seconds']}s, 回放耗时: {summary['replay_seconds']}s（{args.speed}x）")
+        print(f"发送消息: {summary['messages_sent']}, HTTP请求: {summary['requests']}, 失败: {summary['failed']}, "
+              f"未触发的录制响应: {summary['missing_replies']}")
+        for path, values in summary["latency_by_path"].items():
+            print(f"  {path}: p50 {values['p50']}ms, p95 {values['p95']}ms, max {values['max']}ms")
+        for kind, counts in summary["output_types"].items():
+            print(f"  输出 {kind}: 录制 {counts['recorded']}, 回放 {counts['replayed']}")
+        print("通过" if passed else "未通过")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
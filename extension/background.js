@@ -1,5 +1,15 @@
 var port = null;
 
+// 本浏览器（配置文件）的ID：多个浏览器共用一个本地API时，按该ID把请求交给对应的浏览器
+function getProfileId() {
+    let profileId = localStorage.getItem('profileId');
+    if (!profileId) {
+        profileId = 'profile-' + Math.random().toString(36).slice(2, 10);
+        localStorage.setItem('profileId', profileId);
+    }
+    return profileId;
+}
+
 // 浏览器启动或插件加载时自动连接本地应用
 console.log('插件已加载，正在自动连接本地应用...');
 connectToNativeHost({ 
@@ -119,8 +129,30 @@ async function onNativeMessage(message) {
         
         // 处理获取页面源码请求
         if (message.type === 'get_page_source') {
-            console.log('收到获取页面源码请求，ID:', message.request_id);
-            handleGetPageSource(message.request_id);
+            console.log('收到获取页面源码请求，ID:', message.request_id, '标签页:', message.tab_id);
+            // stream 为真时按 chunk_size 分片回传，本地程序收到第一片即可开始转换
+            // window_id 指定窗口时读取该窗口的活动标签页
+            handleGetPageSource(message.request_id, message.tab_id, message.timeout, message.stream ? message.chunk_size : 0, message.window_id);
+            return;
+        }
+        
+        // 处理取消请求（调用方已断开或超过截止时间）
+        if (message.type === 'cancel_request') {
+            console.log('本地应用取消请求，ID:', message.request_id, '原因:', message.reason);
+            cancelPageSource(message.request_id);
+            return;
+        }
+        
+        // 处理预取配置（初始化成功后由本地程序发送）
+        if (message.type === 'prefetch_config') {
+            configurePrefetch(message);
+            return;
+        }
+        
+        // 处理获取标签页列表请求
+        if (message.type === 'list_tabs') {
+            console.log('收到获取标签页列表请求，ID:', message.request_id);
+            sendTabsUpdate(message.request_id);
             return;
         }
         
@@ -258,6 +290,9 @@ port.onMessage.addListener(async function(message) {
 
 // 修改连接到本地应用后的初始化流程，自动设置当前页面为活跃页面
 function connectToNativeHost(msg) {
+    if (msg.action === "init") {
+        msg.profile = getProfileId();
+    }
     if (port !== null) {
         try {
             port.postMessage(msg);
@@ -303,6 +338,9 @@ function connectToNativeHost(msg) {
         console.log('正在发送消息到本地应用:', msg);
         port.postMessage(msg);
         
+        // 连接建立后上报一次标签页列表
+        sendTabsUpdate(null);
+        
         // 如果是初始化消息，尝试设置当前页面为活跃页面
         if (msg.action === "init") {
             setTimeout(() => {
@@ -331,10 +369,195 @@ function connectToNativeHost(msg) {
     }
 }
 
-// 处理获取页面源码请求
-async function handleGetPageSource(requestId) {
+// 向本地应用上报所有打开的标签页
+function sendTabsUpdate(requestId) {
+    if (port === null) {
+        return;
+    }
+    
+    chrome.tabs.query({}, function(tabs) {
+        const tabList = tabs.map(tab => ({
+            id: tab.id,
+            window_id: tab.windowId,
+            url: tab.url,
+            title: tab.title,
+            active: tab.active,
+            status: tab.status
+        }));
+        
+        const message = {
+            type: "tabs_update",
+            tabs: tabList
+        };
+        if (requestId) {
+            message.request_id = requestId;
+        }
+        
+        if (port !== null) {
+            port.postMessage(message);
+        }
+    });
+}
+
+// 标签页变化时合并上报，避免频繁发送
+var tabsUpdateTimer = null;
+function scheduleTabsUpdate() {
+    if (tabsUpdateTimer !== null) {
+        clearTimeout(tabsUpdateTimer);
+    }
+    tabsUpdateTimer = setTimeout(() => {
+        tabsUpdateTimer = null;
+        sendTabsUpdate(null);
+    }, 500);
+}
+
+chrome.tabs.onCreated.addListener(scheduleTabsUpdate);
+chrome.tabs.onRemoved.addListener(scheduleTabsUpdate);
+chrome.tabs.onActivated.addListener(scheduleTabsUpdate);
+chrome.tabs.onUpdated.addListener(function(tabId, changeInfo) {
+    if (changeInfo.status === 'complete' || changeInfo.title || changeInfo.url) {
+        scheduleTabsUpdate();
+    }
+});
+
+// 预取：本地程序开启后，在标签页激活、加载完成或空闲时主动上报当前标签页的快照，
+// 本地程序提前转换，获取当前标签页时不必再等待页面抓取和转换
+var prefetchConfig = null;
+var prefetchTimer = null;
+var prefetchIdleTimer = null;
+
+function configurePrefetch(config) {
+    prefetchConfig = config.enabled ? config : null;
+    console.log('预取配置:', prefetchConfig);
+    if (prefetchConfig !== null) {
+        schedulePageSnapshot('activated');
+    }
+}
+
+// 快速切换标签页时只上报最后停留的页面
+function schedulePageSnapshot(reason) {
+    if (prefetchConfig === null) {
+        return;
+    }
+    if (prefetchTimer !== null) {
+        clearTimeout(prefetchTimer);
+    }
+    prefetchTimer = setTimeout(() => {
+        prefetchTimer = null;
+        sendPageSnapshot(reason);
+    }, 1000);
+    
+    // 有操作时重新计时，空闲后再上报一次（页面内容可能已被脚本更新）
+    if (prefetchIdleTimer !== null) {
+        clearTimeout(prefetchIdleTimer);
+        prefetchIdleTimer = null;
+    }
+    if (prefetchConfig.idle_seconds > 0) {
+        prefetchIdleTimer = setTimeout(() => {
+            prefetchIdleTimer = null;
+            sendPageSnapshot('idle');
+        }, prefetchConfig.idle_seconds * 1000);
+    }
+}
+
+async function sendPageSnapshot(reason) {
+    if (port === null || prefetchConfig === null) {
+        return;
+    }
+    const tabId = await getCurrentTabId();
+    if (!tabId) {
+        return;
+    }
+    chrome.tabs.get(tabId, function(tab) {
+        if (chrome.runtime.lastError || !tab) {
+            return;
+        }
+        const snapshot = {
+            type: "page_snapshot",
+            reason: reason,
+            tab_id: tab.id,
+            window_id: tab.windowId,
+            url: tab.url,
+            title: tab.title,
+            source_code: null
+        };
+        const post = () => {
+            if (port !== null) {
+                port.postMessage(snapshot);
+            }
+        };
+        
+        // 加载中或浏览器内部页面无法抓取，只上报标签页信息，本地程序作废之前的快照
+        if (tab.status !== 'complete' || isBrowserInternalPage(tab.url)) {
+            post();
+            return;
+        }
+        chrome.tabs.sendMessage(tab.id, {
+            type: 'get_page_source',
+            request_id: 'page_snapshot'
+        }, function(response) {
+            if (chrome.runtime.lastError) {
+                console.log('获取快照源码失败:', chrome.runtime.lastError.message);
+            } else if (response && response.source_code && response.source_code.length <= prefetchConfig.max_bytes) {
+                snapshot.source_code = response.source_code;
+            }
+            post();
+        });
+    });
+}
+
+chrome.tabs.onActivated.addListener(function() {
+    schedulePageSnapshot('activated');
+});
+chrome.tabs.onUpdated.addListener(function(tabId, changeInfo, tab) {
+    if (tab.active && (changeInfo.status === 'loading' || changeInfo.status === 'complete')) {
+        schedulePageSnapshot(changeInfo.status);
+    }
+});
+chrome.windows.onFocusChanged.addListener(function(windowId) {
+    if (windowId !== chrome.windows.WINDOW_ID_NONE) {
+        schedulePageSnapshot('activated');
+    }
+});
+
+// 正在获取源码的请求ID -> 标签页ID；已取消的请求不再回传源码
+var pendingPageSources = new Map();
+var cancelledRequests = new Set();
+
+function cancelPageSource(requestId) {
+    const tabId = pendingPageSources.get(requestId);
+    if (tabId === undefined) {
+        return;
+    }
+    pendingPageSources.delete(requestId);
+    cancelledRequests.add(requestId);
+    chrome.tabs.sendMessage(tabId, {
+        type: "cancel_request",
+        request_id: requestId
+    }, function() {
+        if (chrome.runtime.lastError) {
+            console.log('通知内容脚本取消请求失败:', chrome.runtime.lastError.message);
+        }
+    });
+}
+
+// 处理获取页面源码请求（未指定标签页时使用当前标签页）；timeout 为本地程序给出的截止时间（秒）
+// chunkSize 大于0时分片回传源码
+// 指定窗口的活动标签页ID
+function getActiveTabId(windowId) {
+    return new Promise(resolve => {
+        chrome.tabs.query({active: true, windowId: windowId}, function(tabs) {
+            resolve(tabs && tabs.length > 0 ? tabs[0].id : null);
+        });
+    });
+}
+
+async function handleGetPageSource(requestId, targetTabId, timeout, chunkSize, windowId) {
     try {
-        const tabId = await getCurrentTabId();
+        let tabId = targetTabId;
+        if (tabId === undefined || tabId === null) {
+            tabId = (windowId !== undefined && windowId !== null) ? await getActiveTabId(windowId) : await getCurrentTabId();
+        }
         if (!tabId) {
             console.error('无法获取当前标签页ID');
             sendPageSourceError(requestId, '无法获取当前标签页');
@@ -352,11 +575,23 @@ async function handleGetPageSource(requestId) {
             const url = tab.url;
             console.log('正在获取页面源码，URL:', url);
             
+            // 超过截止时间后本地程序已不再等待，自行放弃
+            pendingPageSources.set(requestId, tabId);
+            if (timeout) {
+                setTimeout(() => cancelPageSource(requestId), timeout * 1000);
+            }
+            
             // 向内容脚本发送获取源码请求
             chrome.tabs.sendMessage(tabId, {
                 type: "get_page_source",
-                request_id: requestId
+                request_id: requestId,
+                timeout: timeout
             }, function(response) {
+                pendingPageSources.delete(requestId);
+                if (cancelledRequests.delete(requestId)) {
+                    console.log('请求已取消，不再回传源码，ID:', requestId);
+                    return;
+                }
                 if (chrome.runtime.lastError) {
                     console.error('向内容脚本发送请求失败:', chrome.runtime.lastError);
                     sendPageSourceError(requestId, '向内容脚本发送请求失败');
@@ -367,7 +602,11 @@ async function handleGetPageSource(requestId) {
                 
                 if (response && response.source_code) {
                     // 发送源码回本地应用
-                    sendPageSourceResponse(requestId, url, response.source_code);
+                    if (chunkSize) {
+                        sendPageSourceChunks(requestId, url, response.source_code, tabId, chunkSize);
+                    } else {
+                        sendPageSourceResponse(requestId, url, response.source_code, tabId);
+                    }
                 } else {
                     sendPageSourceError(requestId, '内容脚本未返回源码');
                 }
@@ -380,7 +619,7 @@ async function handleGetPageSource(requestId) {
 }
 
 // 发送页面源码响应到本地应用
-function sendPageSourceResponse(requestId, url, sourceCode) {
+function sendPageSourceResponse(requestId, url, sourceCode, tabId) {
     if (port === null) {
         console.error('无法发送页面源码响应：未连接到本地应用');
         return;
@@ -391,11 +630,35 @@ function sendPageSourceResponse(requestId, url, sourceCode) {
     port.postMessage({
         type: "page_source_response",
         request_id: requestId,
+        tab_id: tabId,
         url: url,
         source_code: sourceCode
     });
 }
 
+// 分片发送页面源码，done 放在 data 之前，原生消息桥只读消息开头即可判断是否为最后一片
+function sendPageSourceChunks(requestId, url, sourceCode, tabId, chunkSize) {
+    if (port === null) {
+        console.error('无法发送页面源码分片：未连接到本地应用');
+        return;
+    }
+    
+    const total = Math.max(Math.ceil(sourceCode.length / chunkSize), 1);
+    console.log(`分片发送页面源码，ID: ${requestId}, URL: ${url}, 源码长度: ${sourceCode.length}, 分片数: ${total}`);
+    
+    for (let seq = 0; seq < total; seq++) {
+        port.postMessage({
+            type: "page_source_chunk",
+            request_id: requestId,
+            seq: seq,
+            done: seq === total - 1,
+            tab_id: tabId,
+            url: url,
+            data: sourceCode.slice(seq * chunkSize, (seq + 1) * chunkSize)
+        });
+    }
+}
+
 // 发送页面源码错误响应
 function sendPageSourceError(requestId, errorMessage) {
     if (port === null) {
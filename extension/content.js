@@ -228,17 +228,29 @@ function processBase64Content(html) {
     return tempDiv.innerHTML;
 }
 
+// 正在获取源码的请求，本地程序取消请求或超过截止时间时中止下载
+const pageSourceControllers = new Map();
+
 // 修改获取页面源码的函数
-async function getPageSource() {
+async function getPageSource(requestId, timeout) {
     try {
         let html;
         // 尝试获取原始HTML
+        const controller = new AbortController();
+        pageSourceControllers.set(requestId, controller);
+        const timer = timeout ? setTimeout(() => controller.abort(), timeout * 1000) : null;
         try {
-            const response = await fetch(window.location.href);
+            const response = await fetch(window.location.href, { signal: controller.signal });
             html = await response.text();
         } catch (error) {
+            if (controller.signal.aborted) {
+                throw new Error('请求已取消');
+            }
             console.log('获取原始HTML失败，使用DOM方式:', error);
             html = document.documentElement.outerHTML;
+        } finally {
+            clearTimeout(timer);
+            pageSourceControllers.delete(requestId);
         }
         
         // 处理HTML中的base64内容
@@ -264,6 +276,9 @@ async function getPageSource() {
         return finalHtml;
         
     } catch (error) {
+        if (error.message === '请求已取消') {
+            throw error;
+        }
         console.error('处理页面源码时出错:', error);
         return document.documentElement.outerHTML;
     }
@@ -281,12 +296,23 @@ chrome.runtime.onMessage.addListener(function(request, sender, sendResponse) {
         return false;
     }
     
+    // 处理取消请求
+    if (typeof request === 'object' && request.type === 'cancel_request') {
+        const controller = pageSourceControllers.get(request.request_id);
+        if (controller) {
+            console.log('取消获取页面源码，ID:', request.request_id);
+            controller.abort();
+        }
+        sendResponse({ status: "success" });
+        return false;
+    }
+    
     // 处理获取页面源码请求
     if (typeof request === 'object' && request.type === 'get_page_source') {
         console.log('收到获取页面源码请求，ID:', request.request_id);
         
         // 使用异步方式获取页面源码
-        getPageSource().then(html => {
+        getPageSource(request.request_id, request.timeout).then(html => {
             const stats = {
                 originalLength: html.length,
                 base64Count: (html.match(/\[base64_image:/g) || []).length
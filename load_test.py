@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""本地服务压测工具（替代原来只发送一次请求的 test_api.py）
+
+场景:
+  current-tab  获取当前标签页Markdown（API，或MCP工具 get_current_tab_markdown）
+  url          提交网页URL转换并轮询到结果可用，统计端到端耗时（仅API）
+  poll         反复读取已有结果（API: get-markdown，MCP: get_markdown_page）
+  notify       发送通知，--burst 指定每次同时发送的条数（仅API）
+
+模式:
+  默认为闭环：--concurrency 个客户端各自在上一个请求完成后立即发送下一个，可用 --rate 限制总速率
+  --open-loop：按 --rate 的固定到达率发送，不等待之前的请求完成，延迟从计划发送时间算起
+
+用法:
+  python load_test.py current-tab --requests 1 --save
+  python load_test.py poll --concurrency 16 --duration 30
+  python load_test.py url --url https://example.com/ --concurrency 4 --requests 20
+  python load_test.py notify --open-loop --rate 200 --burst 10 --duration 10
+  python load_test.py current-tab --target mcp --concurrency 4 --duration 20
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+
+import httpx
+
+API_URL = "http://localhost:8888"
+MCP_URL = "http://localhost:8014/sse"
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LoadError(Exception):
+    """请求失败，kind 为统计用的错误类别"""
+
+    def __init__(self, kind, message=""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+def percentile(sorted_values, q):
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[min(int(rank), len(sorted_values)) - 1]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.dropped = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, latency, error=None):
+        if error is None:
+            self.latencies.append(latency)
+        else:
+            self.errors[error] += 1
+
+    def report(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        latencies = sorted(latency * 1000 for latency in self.latencies)
+        failed = sum(self.errors.values())
+        total = len(latencies) + failed
+        latency_ms = {f"p{q}": round(percentile(latencies, q), 2) for q in PERCENTILES} if latencies else {}
+        if latencies:
+            latency_ms["mean"] = round(statistics.fmean(latencies), 2)
+            latency_ms["max"] = round(latencies[-1], 2)
+        return {
+            "requests": total,
+            "succeeded": len(latencies),
+            "failed": failed,
+            "dropped": self.dropped,
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            "errors": dict(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": latency_ms
+        }
+
+
+def check_response(response):
+    """HTTP状态码和响应中的 status 均表示成功时返回响应数据"""
+    if response.status_code != 200:
+        raise LoadError(f"http_{response.status_code}")
+    data = response.json()
+    if data.get("status") not in ("success", "pending"):
+        raise LoadError(f"status_{data.get('status')}", data.get("message", ""))
+    return data
+
+
+class ApiTarget:
+    """直接访问本地API（默认 :8888）"""
+
+    name = "api"
+
+    def __init__(self, client, urls=(), request_ids=(), burst=1, poll_interval=0.2, poll_timeout=60):
+        self.client = client
+        self.urls = itertools.cycle(urls or ["https://example.com/"])
+        self.request_ids = list(request_ids)
+        self.burst = burst
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.counter = itertools.count(1)
+        self.last_markdown = None
+
+    async def setup(self, scenario):
+        if scenario == "poll" and not self.request_ids:
+            # 没有指定请求ID时先获取一次当前标签页，之后反复读取该结果
+            data = check_response(await self.client.post("/api/get-current-tab-markdown", json={}))
+            self.request_ids.append(data["request_id"])
+        self.poll_ids = itertools.cycle(self.request_ids)
+
+    async def current_tab(self):
+        data = check_response(await self.client.post("/api/get-current-tab-markdown", json={}))
+        self.last_markdown = data.get("markdown")
+
+    async def url(self):
+        data = check_response(await self.client.post("/api/get-webpage-markdown", json={"url": next(self.urls)}))
+        deadline = time.monotonic() + self.poll_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            response = await self.client.post("/api/get-markdown", json={"request_id": data["request_id"]})
+            if response.status_code == 404:
+                # 网页尚未获取完成
+                continue
+            check_response(response)
+            return
+        raise LoadError("poll_timeout")
+
+    async def poll(self):
+        check_response(await self.client.post("/api/get-markdown", json={"request_id": next(self.poll_ids)}))
+
+    async def notify(self):
+        responses = await asyncio.gather(*[
+            self.client.post("/api/send-notification", json={"message": f"压测通知 {next(self.counter)}"})
+            for _ in range(self.burst)
+        ])
+        for response in responses:
+            check_response(response)
+
+
+class McpTarget:
+    """通过MCP SSE服务（默认 :8014）调用工具，每个并发客户端使用一个MCP会话"""
+
+    name = "mcp"
+
+    def __init__(self, url, sessions, request_ids=()):
+        self.url = url
+        self.session_count = sessions
+        self.request_ids = list(request_ids)
+        self.stack = AsyncExitStack()
+        self.sessions = None
+        self.last_markdown = None
+
+    async def __aenter__(self):
+        from mcp import ClientSession
+        from mcp.client.sse import sse_client
+
+        sessions = []
+        for _ in range(self.session_count):
+            read_stream, write_stream = await self.stack.enter_async_context(sse_client(self.url))
+            session = await self.stack.enter_async_context(ClientSession(read_stream, write_stream))
+            await session.initialize()
+            sessions.append(session)
+        self.sessions = itertools.cycle(sessions)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stack.aclose()
+
+    async def call(self, tool, arguments):
+        result = await next(self.sessions).call_tool(tool, arguments)
+        if result.isError:
+            raise LoadError("tool_error", result.content[0].text if result.content else "")
+        data = json.loads(result.content[0].text)
+        if data.get("status") not in ("success", None):
+            raise LoadError(f"status_{data.get('status')}", data.get("message", ""))
+        return data
+
+    async def setup(self, scenario):
+        if scenario == "poll" and not self.request_ids:
+            self.request_ids.append((await self.call("get_current_tab_markdown", {}))["request_id"])
+        self.poll_ids = itertools.cycle(self.request_ids)
+
+    async def current_tab(self):
+        self.last_markdown = (await self.call("get_current_tab_markdown", {})).get("markdown")
+
+    async def poll(self):
+        await self.call("get_markdown_page", {"request_id": next(self.poll_ids)})
+
+
+SCENARIOS = {
+    "current-tab": "current_tab",
+    "url": "url",
+    "poll": "poll",
+    "notify": "notify"
+}
+
+
+async def timed(operation, stats, started):
+    try:
+        await operation()
+        stats.record(time.monotonic() - started)
+    except LoadError as e:
+        stats.record(None, e.kind)
+    except (httpx.HTTPError, ValueError) as e:
+        stats.record(None, type(e).__name__)
+
+
+async def run_load(target, scenario, concurrency=1, duration=None, requests=None, rate=None, open_loop=False,
+                   max_inflight=1000):
+    """按闭环或开环方式施加负载，返回统计结果；duration 和 requests 至少指定一个"""
+    operation = getattr(target, SCENARIOS[scenario], None)
+    if operation is None:
+        raise ValueError(f"目标 {target.name} 不支持场景 {scenario}")
+    if duration is None and requests is None:
+        raise ValueError("需要指定 duration 或 requests")
+    await target.setup(scenario)
+
+    stats = LoadStats()
+    deadline = time.monotonic() + duration if duration else None
+
+    if open_loop:
+        if not rate:
+            raise ValueError("开环模式需要指定 rate")
+        inflight = set()
+        for sent in itertools.count():
+            scheduled = stats.started + sent / rate
+            if (requests is not None and sent >= requests) or (deadline is not None and scheduled >= deadline):
+                break
+            await asyncio.sleep(max(0.0, scheduled - time.monotonic()))
+            if len(inflight) >= max_inflight:
+                # 服务跟不上到达率，超出上限的请求不再发送
+                stats.dropped += 1
+                continue
+            # 延迟从计划发送时间算起，避免服务变慢时少算排队时间
+            task = asyncio.ensure_future(timed(operation, stats, scheduled))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        if inflight:
+            await asyncio.gather(*inflight)
+    else:
+        issued = itertools.count()
+        next_slot = [stats.started]
+
+        async def worker():
+            while True:
+                if (requests is not None and next(issued) >= requests) or \
+                        (deadline is not None and time.monotonic() >= deadline):
+                    return
+                if rate:
+                    # 所有客户端共用发送时间槽，总速率不超过 rate
+                    slot = max(next_slot[0], time.monotonic())
+                    next_slot[0] = slot + 1 / rate
+                    await asyncio.sleep(max(0.0, slot - time.monotonic()))
+                await timed(operation, stats, time.monotonic())
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    stats.finished = time.monotonic()
+    return stats.report()
+
+
+def print_report(args, report):
+    mode = f"开环 {args.rate}/秒" if args.open_loop else f"闭环 并发 {args.concurrency}"
+    print(f"场景: {args.scenario}  目标: {args.target}  模式: {mode}")
+    print(f"请求: {report['requests']}  成功: {report['succeeded']}  失败: {report['failed']} "
+          f"({report['error_rate'] * 100:.1f}%)  丢弃: {report['dropped']}")
+    print(f"吞吐: {report['throughput']} 请求/秒  耗时: {report['elapsed_seconds']}s")
+    if report["latency_ms"]:
+        print("延迟(ms): " + "  ".join(f"{key} {value}" for key, value in report["latency_ms"].items()))
+    for kind, count in sorted(report["errors"].items()):
+        print(f"错误: {kind} x{count}")
+
+
+async def main_async(args):
+    if args.target == "mcp":
+        async with McpTarget(args.mcp_url, args.concurrency, args.request_id) as target:
+            report = await run_load(target, args.scenario, args.concurrency, args.duration, args.requests,
+                                    args.rate, args.open_loop, args.max_inflight)
+    else:
+        limits = httpx.Limits(max_connections=max(args.concurrency * args.burst, 1))
+        async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout, limits=limits) as client:
+            target = ApiTarget(client, args.url, args.request_id, args.burst)
+            report = await run_load(target, args.scenario, args.concurrency, args.duration, args.requests,
+                                    args.rate, args.open_loop, args.max_inflight)
+    return target, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地服务压测工具")
+    parser.add_argument("scenario", nargs="?", default="current-tab", choices=sorted(SCENARIOS))
+    parser.add_argument("--target", choices=["api", "mcp"], default="api", help="压测本地API或MCP SSE服务")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--mcp-url", default=MCP_URL)
+    parser.add_argument("--concurrency", type=int, default=1, help="闭环模式的并发客户端数（MCP为会话数）")
+    parser.add_argument("--duration", type=float, help="持续时间（秒）")
+    parser.add_argument("--requests", type=int, help="请求总数")
+    parser.add_argument("--rate", type=float, help="每秒请求数：闭环模式为上限，开环模式为固定到达率")
+    parser.add_argument("--open-loop", action="store_true", help="按固定到达率发送，不等待请求完成")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="开环模式下同时进行的请求上限")
+    parser.add_argument("--burst", type=int, default=1, help="notify 场景每次同时发送的通知数")
+    parser.add_argument("--url", action="append", default=[], help="url 场景使用的网页地址，可重复指定")
+    parser.add_argument("--request-id", action="append", default=[], help="poll 场景读取的请求ID，可重复指定")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求的超时时间（秒）")
+    parser.add_argument("--save", action="store_true", help="current-tab 场景结束后保存最后一次获取的Markdown")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+    if args.duration is None and args.requests is None:
+        args.duration = 10
+
+    try:
+        target, report = asyncio.run(main_async(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(args, report)
+
+    if args.save and target.last_markdown:
+        filename = f"current_tab_markdown_{int(time.time())}.md"
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(target.last_markdown)
+        print(f"Markdown已保存到文件: {filename}")
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
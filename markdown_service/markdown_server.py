@@ -3,31 +3,200 @@ import uvicorn
 from starlette.applications import Starlette
 from starlette.routing import Route, Mount
 from mcp.server.sse import SseServerTransport
-from typing import Dict
-import requests
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import socket
+import time
+import httpx
+
+# 本地API服务地址及客户端配置（可通过环境变量覆盖）
+API_URL = os.environ.get("MARKDOWN_API_URL", "http://localhost:8888")
+API_UDS_PATH = os.environ.get("MARKDOWN_API_UDS")  # 本地API的Unix域套接字路径，存在时优先使用
+MCP_UDS_PATH = os.environ.get("MARKDOWN_MCP_UDS")  # 本服务额外监听的Unix域套接字路径
+API_CONNECT_TIMEOUT = float(os.environ.get("MARKDOWN_API_CONNECT_TIMEOUT", "3"))
+API_READ_TIMEOUT = float(os.environ.get("MARKDOWN_API_READ_TIMEOUT", "75"))  # 需覆盖浏览器往返的60秒等待
+API_MAX_RETRIES = int(os.environ.get("MARKDOWN_API_MAX_RETRIES", "3"))
+API_RETRY_BACKOFF = float(os.environ.get("MARKDOWN_API_RETRY_BACKOFF", "0.5"))
+# 告知本地API的截止时间（秒），略短于读取超时，API在本客户端放弃之前停止等待浏览器并返回超时
+API_REQUEST_DEADLINE = max(min(API_READ_TIMEOUT - 5, 60), 1)
+
+# 可重试的状态码：API服务重启或暂时过载；请求已被API收到，只对幂等的调用（读取已保存的内容）重试
+RETRY_STATUS_CODES = {502, 503, 504}
+
+# 工具结果缓存的有效期（秒）：标签页未变化（ID、URL、标题、加载状态相同）时直接返回上次的结果，0 表示不缓存
+RESULT_CACHE_TTL = float(os.environ.get("MARKDOWN_MCP_CACHE_TTL", "10"))
+RESULT_CACHE_MAX_ENTRIES = 64
+# 批量工具一次最多获取的URL和标签页数
+BATCH_MAX_ITEMS = int(os.environ.get("MARKDOWN_MCP_BATCH_MAX", "20"))
+
+# 所有MCP会话共享的异步HTTP客户端（带连接池）
+_api_client = None
+
+def get_api_client() -> httpx.AsyncClient:
+    """获取共享的异步HTTP客户端，首次使用时创建"""
+    global _api_client
+    if _api_client is None or _api_client.is_closed:
+        limits = httpx.Limits(max_connections=32, max_keepalive_connections=8)
+        # Unix域套接字可用时走本地套接字，否则回退到TCP
+        if API_UDS_PATH and hasattr(socket, "AF_UNIX") and os.path.exists(API_UDS_PATH):
+            transport = httpx.AsyncHTTPTransport(uds=API_UDS_PATH, limits=limits)
+        else:
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+        _api_client = httpx.AsyncClient(
+            base_url=API_URL,
+            # 本机回环上压缩只增加两端的CPU开销，不需要API压缩响应
+            headers={"Accept-Encoding": "identity", "X-Request-Timeout": str(API_REQUEST_DEADLINE)},
+            timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            limits=limits,
+            transport=transport,
+        )
+    return _api_client
+
+async def close_api_client():
+    """关闭共享的HTTP客户端"""
+    global _api_client
+    if _api_client is not None:
+        await _api_client.aclose()
+        _api_client = None
+
+async def post_api(path: str, payload: Dict, idempotent: bool = False) -> Dict:
+    """向本地API发送POST请求，连接失败时按指数退避重试
+
+    只有连接阶段的错误（请求尚未发出）一定可以重试；获取页面、爬取等调用重复发送会产生重复的请求，
+    idempotent 为True的调用在服务暂不可用（502/503/504）时也重试
+    """
+    client = get_api_client()
+    for attempt in range(API_MAX_RETRIES + 1):
+        try:
+            response = await client.post(path, json=payload)
+            if not idempotent or response.status_code not in RETRY_STATUS_CODES or attempt == API_MAX_RETRIES:
+                return response.json()
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # 读取超时、连接中途断开时API可能已收到请求，不重复发送
+            if attempt == API_MAX_RETRIES:
+                raise
+            if API_UDS_PATH and not os.path.exists(API_UDS_PATH):
+                # 套接字文件已消失（API服务重启或未启用），重建客户端以回退到TCP
+                await close_api_client()
+                client = get_api_client()
+        await asyncio.sleep(API_RETRY_BACKOFF * (2 ** attempt))
+
+async def stream_api(path: str, payload: Dict) -> List[Dict]:
+    """向本地API发送POST请求并读取NDJSON响应的所有行；API直接返回JSON（如参数错误、过载）时返回该对象"""
+    client = get_api_client()
+    async with client.stream("POST", path, json=payload) as response:
+        if not response.headers.get("content-type", "").startswith("application/x-ndjson"):
+            await response.aread()
+            return [response.json()]
+        return [json.loads(line) async for line in response.aiter_lines() if line]
+
+def trim_result(response: Dict, *fields: str) -> Dict:
+    """精简API响应：成功时只保留状态、请求ID、URL和内容，失败时保留错误信息"""
+    if response.get("status") != "success":
+        return {key: response[key] for key in ("status", "message", "request_id", "url", "retry_after") if key in response}
+    return {key: response[key] for key in ("status", "request_id", "url") + fields if key in response}
+
+class ResultCache:
+    """工具结果的短时缓存：按键保存 (标签页指纹, 结果, 过期时间)，超过条目上限时淘汰最早的结果"""
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fingerprint):
+        """指纹相同且未过期时返回缓存的结果，否则返回 None"""
+        entry = self.entries.get(key)
+        if entry is None or entry[2] < time.monotonic() or fingerprint is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry[1], cached=True)
+
+    def peek(self, key):
+        """是否有未过期的缓存（决定是否需要先查询标签页指纹）"""
+        entry = self.entries.get(key)
+        return entry is not None and entry[2] >= time.monotonic()
+
+    def put(self, key, fingerprint, result):
+        if self.ttl <= 0 or fingerprint is None:
+            return
+        self.entries[key] = (fingerprint, result, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+result_cache = ResultCache()
+
+def tab_fingerprint(tab: Dict):
+    """标签页指纹：ID、所属浏览器、URL、标题相同且已加载完成时视为内容未变化；加载中的标签页没有指纹"""
+    if tab.get("status") != "complete":
+        return None
+    return (tab.get("profile"), tab.get("id"), tab.get("url"), tab.get("title"))
+
+async def list_tabs() -> Dict:
+    """读取API缓存的标签页列表（插件在标签页变化时主动上报）；无法获取时返回空字典"""
+    try:
+        response = await post_api("/api/list-tabs", {"timeout": 2}, idempotent=True)
+    except Exception:
+        return {}
+    if response.get("status") != "success":
+        return {}
+    return {(tab.get("profile"), tab.get("id")): tab for tab in response.get("tabs", [])}
+
+async def list_tab_ids() -> Dict:
+    """标签页ID -> 标签页（批量获取的标签页ID按单个浏览器处理）"""
+    return {tab_id: tab for (_, tab_id), tab in (await list_tabs()).items()}
+
+async def current_tab_fingerprint(tabs: Optional[Dict] = None):
+    """当前标签页的指纹；多个窗口（或浏览器）各有活动标签页时无法确定当前标签页，返回 None"""
+    tabs = await list_tabs() if tabs is None else tabs
+    active = [tab for tab in tabs.values() if tab.get("active")]
+    return tab_fingerprint(active[0]) if len(active) == 1 else None
 
 # 创建一个MCP服务器实例
 mcp = FastMCP("网页Markdown转换服务")
 
 @mcp.tool()
-async def get_current_tab_markdown() -> Dict:
+async def get_current_tab_markdown(main_content: bool = False, refresh: bool = False) -> Dict:
     """
     获取当前标签页的Markdown内容
     
+    Args:
+        main_content: 为True时只保留正文，去掉导航、侧栏、页脚等，输出通常小很多
+        refresh: 为True时忽略缓存重新获取（标签页未变化时，短时间内的重复调用返回缓存的结果）
+    
     Returns:
-        包含当前标签页Markdown内容的字典
+        status、request_id、url 和 markdown；结果来自缓存时带有 cached
     """
     try:
-        # 检查是否有当前活跃页面
-        url = "http://localhost:8888/api/get-current-tab-markdown"
-        response = requests.post(url, json={}).json()
-        print(response)
+        key = ("current_tab", main_content)
+        # 只有缓存未过期时才需要在获取前查询标签页指纹；每次调用最多读取一次标签页列表
+        fingerprint, looked_up = None, False
+        if not refresh and result_cache.peek(key):
+            fingerprint, looked_up = await current_tab_fingerprint(), True
+            cached = result_cache.get(key, fingerprint)
+            if cached is not None:
+                return cached
         
-        # 返回Markdown内容
-        return {
-            "status": "success",
-            "message": response
-        }
+        response = await post_api("/api/get-current-tab-markdown", {"main_content": main_content})
+        result = trim_result(response, "markdown")
+        if result["status"] == "success" and result_cache.ttl > 0:
+            # 获取前没有读取时在获取后读取指纹，URL不一致说明期间已切换页面，不缓存
+            if not looked_up:
+                fingerprint = await current_tab_fingerprint()
+            if fingerprint is not None and fingerprint[2] == result.get("url"):
+                result_cache.put(key, fingerprint, result)
+        return result
         
     except Exception as e:
         error_msg = f"获取当前标签页Markdown时出错: {str(e)}"
@@ -37,6 +206,195 @@ async def get_current_tab_markdown() -> Dict:
         }
 
 
+async def fetch_url_markdown(url: str, main_content: bool) -> Dict:
+    """以流式转换获取单个URL，拼接所有 chunk 返回精简的结果"""
+    try:
+        lines = await stream_api("/api/get-webpage-markdown", {"url": url, "stream": True, "main_content": main_content})
+    except Exception as e:
+        return {"status": "error", "url": url, "message": str(e)}
+    last = lines[-1] if lines else {"status": "error", "message": "API没有返回结果"}
+    if last.get("type") != "summary":
+        # 转换中途出错（error 行）或请求被拒绝（普通JSON响应）
+        return dict(trim_result(last), url=url)
+    markdown = "".join(line["markdown"] for line in lines if line.get("type") == "chunk")
+    return {"status": "success", "request_id": last.get("request_id"), "url": url, "markdown": markdown}
+
+async def fetch_url_markdown_cached(url: str, main_content: bool) -> Dict:
+    """URL没有标签页指纹，有效期内按URL复用结果"""
+    key = ("url", url, main_content)
+    cached = result_cache.get(key, url)
+    if cached is not None:
+        return cached
+    result = await fetch_url_markdown(url, main_content)
+    if result["status"] == "success":
+        result_cache.put(key, url, result)
+    return result
+
+async def capture_tabs_markdown(tab_ids: List[int], main_content: bool) -> Dict:
+    """一次请求并发获取多个标签页，标签页未变化时使用缓存；返回 标签页ID -> 精简的结果
+
+    整批只读取一次标签页列表：有未过期的缓存时在获取前读取，否则在获取后读取，用于缓存新的结果。
+    """
+    tabs = None
+    if any(result_cache.peek(("tab", tab_id, main_content)) for tab_id in tab_ids):
+        tabs = await list_tab_ids()
+    results, missing = {}, []
+    for tab_id in tab_ids:
+        fingerprint = tab_fingerprint(tabs[tab_id]) if tabs and tab_id in tabs else None
+        cached = result_cache.get(("tab", tab_id, main_content), fingerprint)
+        if cached is not None:
+            results[tab_id] = cached
+        else:
+            missing.append(tab_id)
+    if missing:
+        try:
+            lines = await stream_api("/api/capture-tabs", {"tab_ids": missing, "main_content": main_content})
+        except Exception as e:
+            lines = [{"status": "error", "message": str(e)}]
+        if tabs is None and result_cache.ttl > 0 and any(line.get("status") == "success" for line in lines):
+            tabs = await list_tab_ids()
+        tabs = tabs or {}
+        for line in lines:
+            if line.get("type") == "tab_result":
+                result = dict(trim_result(line, "markdown"), tab_id=line["tab_id"])
+                results[line["tab_id"]] = result
+                tab = tabs.get(line["tab_id"])
+                if result["status"] == "success" and tab is not None and tab.get("url") == result.get("url"):
+                    result_cache.put(("tab", line["tab_id"], main_content), tab_fingerprint(tab), result)
+        # 整个请求失败（如参数错误、过载）时每个标签页都返回该错误
+        failure = trim_result(lines[-1]) if lines and lines[-1].get("type") is None else {"status": "error", "message": "标签页没有返回结果"}
+        for tab_id in missing:
+            results.setdefault(tab_id, dict(failure, tab_id=tab_id))
+    return results
+
+
+@mcp.tool()
+async def get_markdown_batch(urls: Optional[List[str]] = None, tab_ids: Optional[List[int]] = None, main_content: bool = False) -> Dict:
+    """
+    一次获取多个URL或标签页的Markdown内容（并发获取，结果按参数顺序返回）
+    
+    Args:
+        urls: 要直接获取的网页URL列表
+        tab_ids: 要获取的标签页ID列表（可先通过 list_tabs 等方式得到）
+        main_content: 为True时只保留正文
+    
+    Returns:
+        results 列表，每项包含 status、url（标签页还有 tab_id）、request_id 和 markdown，失败时为 message
+    """
+    urls = list(dict.fromkeys(urls or []))
+    tab_ids = list(dict.fromkeys(tab_ids or []))
+    if not urls and not tab_ids:
+        return {"status": "error", "message": "请提供 urls 或 tab_ids"}
+    if len(urls) + len(tab_ids) > BATCH_MAX_ITEMS:
+        return {"status": "error", "message": f"一次最多获取 {BATCH_MAX_ITEMS} 个URL或标签页"}
+    try:
+        # URL 与标签页同时获取；没有标签页时 capture_tabs_markdown 直接返回空字典，不发出请求
+        url_results = asyncio.gather(*[fetch_url_markdown_cached(url, main_content) for url in urls])
+        try:
+            tab_results = await capture_tabs_markdown(tab_ids, main_content)
+            results = list(await url_results) + [tab_results[tab_id] for tab_id in tab_ids]
+        finally:
+            # 获取标签页出错时不再继续获取URL
+            url_results.cancel()
+        failed = sum(1 for result in results if result["status"] != "success")
+        return {"status": "success" if failed == 0 else "partial" if failed < len(results) else "error",
+                "results": results}
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"批量获取Markdown时出错: {str(e)}"
+        }
+
+
+@mcp.tool()
+async def get_current_tab_outline(main_content: bool = False) -> Dict:
+    """
+    获取当前标签页的标题目录（不含正文），适合先浏览大页面的结构
+    
+    Args:
+        main_content: 为True时只保留正文，去掉导航、侧栏、页脚等
+    
+    Returns:
+        包含request_id和章节目录（编号、级别、标题、字节偏移和长度）的字典
+    """
+    try:
+        return await post_api("/api/get-current-tab-markdown", {"outline_only": True, "main_content": main_content})
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取当前标签页目录时出错: {str(e)}"
+        }
+
+
+@mcp.tool()
+async def get_markdown_section(request_id: str, section: int, include_subsections: bool = False, max_bytes: int = 32768) -> Dict:
+    """
+    按章节编号读取已获取页面的Markdown内容
+    
+    Args:
+        request_id: get_current_tab_outline 或 get_current_tab_markdown 返回的请求ID
+        section: 目录中的章节编号
+        include_subsections: 是否包含该章节下的子章节
+        max_bytes: 返回内容的最大字节数
+    """
+    try:
+        return await post_api("/api/markdown-section", {
+            "request_id": request_id,
+            "section": section,
+            "include_subsections": include_subsections,
+            "max_bytes": max_bytes
+        }, idempotent=True)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取章节内容时出错: {str(e)}"
+        }
+
+
+@mcp.tool()
+async def get_markdown_page(request_id: str, offset: int = 0, limit: int = 16384) -> Dict:
+    """
+    按字节偏移分页读取已获取页面的Markdown内容
+    
+    Args:
+        request_id: 页面的请求ID
+        offset: 起始字节偏移，首次读取为0，之后使用上次返回的next_offset
+        limit: 本次读取的最大字节数
+    """
+    try:
+        return await post_api("/api/markdown-page", {
+            "request_id": request_id,
+            "offset": offset,
+            "limit": limit
+        }, idempotent=True)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取分页内容时出错: {str(e)}"
+        }
+
+
+@mcp.tool()
+async def search_captured_pages(query: str, limit: int = 10) -> Dict:
+    """
+    在已获取过的页面中全文搜索
+    
+    Args:
+        query: 搜索关键词，多个词之间用空格分隔，全部命中才返回
+        limit: 最多返回的结果数
+    
+    Returns:
+        按相关度排序的结果，包含request_id、URL、标题和摘要；可用request_id继续读取章节或分页
+    """
+    try:
+        return await post_api("/api/search", {"query": query, "limit": limit}, idempotent=True)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"搜索页面时出错: {str(e)}"
+        }
+
+
 @mcp.resource("markdown://help")
 def get_help() -> str:
     """提供服务的帮助信息"""
@@ -47,7 +405,12 @@ def get_help() -> str:
 
 ## 可用功能
 
-- **get_current_tab_markdown**: 获取当前标签页的Markdown内容
+- **get_current_tab_markdown**: 获取当前标签页的Markdown内容（`main_content=True` 时只保留正文）；标签页未变化时短时间内的重复调用返回缓存
+- **get_markdown_batch**: 一次获取多个URL或标签页的Markdown内容
+- **get_current_tab_outline**: 获取当前标签页的标题目录，适合大页面
+- **get_markdown_section**: 按章节编号读取内容
+- **get_markdown_page**: 按字节偏移分页读取内容
+- **search_captured_pages**: 在已获取过的页面中全文搜索
 
 ## 如何使用
 
@@ -64,6 +427,9 @@ def markdown_prompt() -> str:
 你现在正在使用查看当前浏览器活动标签页服务，可以获取当前标签页相关内容。
 可以尝试以下操作：
 1. 使用get_current_tab_markdown()获取当前标签页的Markdown内容
+2. 只需要文章正文时使用get_current_tab_markdown(main_content=True)，去掉导航、侧栏和页脚
+3. 页面较大时，先用get_current_tab_outline()获取目录，再用get_markdown_section()读取需要的章节
+4. 需要多个网页或标签页时，使用get_markdown_batch(urls=[...], tab_ids=[...])一次获取
 """
 
 # 创建SSE传输层
@@ -80,11 +446,37 @@ routes = [
     Mount("/messages/", app=sse.handle_post_message),
 ]
 
+@asynccontextmanager
+async def lifespan(app):
+    """服务关闭时释放共享的HTTP连接池"""
+    yield
+    await close_api_client()
+
 # 创建Starlette应用
-app = Starlette(routes=routes)
+app = Starlette(routes=routes, lifespan=lifespan)
+
+def create_listen_sockets(host: str, port: int):
+    """创建监听套接字：TCP始终监听，配置了MARKDOWN_MCP_UDS时同时监听Unix域套接字"""
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp_sock.bind((host, port))
+    sockets = [tcp_sock]
+    
+    if MCP_UDS_PATH and hasattr(socket, "AF_UNIX"):
+        if os.path.exists(MCP_UDS_PATH):
+            os.unlink(MCP_UDS_PATH)
+        uds_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        uds_sock.bind(MCP_UDS_PATH)
+        os.chmod(MCP_UDS_PATH, 0o600)
+        sockets.append(uds_sock)
+    return sockets
 
 # 启动服务器
 if __name__ == "__main__":
-    API_URL = "http://localhost:8888"
     # 启动服务
-    uvicorn.run(app, host="0.0.0.0", port=8014) 
\ No newline at end of file
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8014))
+    try:
+        server.run(sockets=create_listen_sockets("0.0.0.0", 8014))
+    finally:
+        if MCP_UDS_PATH and os.path.exists(MCP_UDS_PATH):
+            os.unlink(MCP_UDS_PATH) 
\ No newline at end of file
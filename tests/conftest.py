@@ -0,0 +1,169 @@
+import json
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "app"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "markdown_service"))
+sys.path.insert(0, ROOT_DIR)
+
+import main  # noqa: E402
+
+
+def decode_frame(encoded_message):
+    """按原生消息协议解码一帧（4字节长度 + UTF-8 JSON）"""
+    length = struct.unpack('=I', encoded_message[:4])[0]
+    return json.loads(encoded_message[4:4 + length].decode("utf-8"))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def encode_frame(message):
+    content = json.dumps(message).encode("utf-8")
+    return struct.pack('=I', len(content)) + content
+
+
+class HostProcess:
+    """以子进程启动本地程序（main.py 或原生消息桥），测试代码扮演插件读写其 stdin/stdout"""
+
+    def __init__(self, script, cwd, port=None, **env):
+        # 指定 port 时与已启动的本地程序共用API端口（多浏览器）
+        self.port = port or free_port()
+        env = dict(os.environ, MARKDOWN_API_PORT=str(self.port), **env)
+        self.process = subprocess.Popen(
+            [sys.executable, script], cwd=cwd, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.messages = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        while True:
+            header = self.process.stdout.read(4)
+            if len(header) < 4:
+                return
+            body = self.process.stdout.read(struct.unpack('=I', header)[0])
+            self.messages.put(decode_frame(header + body))
+
+    def send(self, message):
+        self.process.stdin.write(encode_frame(message))
+        self.process.stdin.flush()
+
+    def receive(self, predicate, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self.messages.get(timeout=max(deadline - time.monotonic(), 0.01))
+            if predicate(message):
+                return message
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(self.url("/"), timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise TimeoutError("API服务未就绪")
+
+
+class SimulatedExtension:
+    """模拟浏览器插件：接收宿主发往 stdout 的消息，并按插件的行为回送响应"""
+
+    def __init__(self):
+        # tab_id -> {"url", "title", "html", "delay"}；delay 为 None 表示该标签页永不响应
+        self.tabs = {}
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def add_tab(self, tab_id, url, html, delay=0.0, title=""):
+        self.tabs[tab_id] = {"url": url, "title": title, "html": html, "delay": delay}
+
+    def send_message(self, encoded_message):
+        message = decode_frame(encoded_message)
+        with self.lock:
+            self.sent.append(message)
+        if isinstance(message, dict):
+            threading.Thread(target=self._respond, args=(message,), daemon=True).start()
+        return True
+
+    def _respond(self, message):
+        if message.get("type") == "list_tabs":
+            main.handle_tabs_update({
+                "type": "tabs_update",
+                "request_id": message["request_id"],
+                "tabs": [
+                    {"id": tab_id, "url": tab["url"], "title": tab["title"], "active": False, "status": "complete"}
+                    for tab_id, tab in self.tabs.items()
+                ]
+            })
+        elif message.get("type") == "get_page_source":
+            tab = self.tabs.get(message.get("tab_id"))
+            if tab is None:
+                main.handle_page_source_response({
+                    "type": "page_source_response",
+                    "request_id": message["request_id"],
+                    "url": "unknown",
+                    "error": "无法获取当前标签页",
+                    "source_code": "<html><body><h1>Error</h1></body></html>"
+                })
+                return
+            if tab["delay"] is None:
+                return
+            time.sleep(tab["delay"])
+            if message.get("stream"):
+                # 与插件相同，按 chunk_size 分片回传
+                html, size = tab["html"], message["chunk_size"]
+                total = max(-(-len(html) // size), 1)
+                for seq in range(total):
+                    main.dispatch_message({
+                        "type": "page_source_chunk",
+                        "request_id": message["request_id"],
+                        "seq": seq,
+                        "done": seq == total - 1,
+                        "tab_id": message.get("tab_id"),
+                        "url": tab["url"],
+                        "data": html[seq * size:(seq + 1) * size]
+                    })
+                return
+            main.handle_page_source_response({
+                "type": "page_source_response",
+                "request_id": message["request_id"],
+                "tab_id": message.get("tab_id"),
+                "url": tab["url"],
+                "source_code": tab["html"]
+            })
+
+    def sent_of_type(self, message_type):
+        with self.lock:
+            return [m for m in self.sent if isinstance(m, dict) and m.get("type") == message_type]
+
+
+@pytest.fixture
+def extension(monkeypatch):
+    simulated = SimulatedExtension()
+    monkeypatch.setattr(main, "send_message", simulated.send_message)
+    main.callbacks.clear()
+    main.page_sources.clear()
+    main.tab_registry["tabs"] = {}
+    main.tab_registry["updated_time"] = None
+    yield simulated
+    main.callbacks.clear()
+    main.page_sources.clear()
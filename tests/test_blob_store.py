@@ -0,0 +1,75 @@
+import base64
+
+from starlette.testclient import TestClient
+
+import main
+from blob_store import BlobStore, offload_blobs
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+PNG_URI = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode("ascii")
+SVG = '<svg viewBox="0 0 10 10"><title>Logo</title>' + '<path d="M0 0L10 10"/>' * 120 + '</svg>'
+
+
+def test_offloads_data_uris_and_inline_svg_with_deduplication():
+    store = BlobStore()
+    html = (
+        f'<p><img src="{PNG_URI}"><img src=\'{PNG_URI}\'></p>'
+        f'<div style="background:url({PNG_URI})"></div>'
+        '<img src="data:image/gif;base64,R0lGODlhAQABAAAAACw=">'
+        f'{SVG}<svg><circle r="1"/></svg>'
+    )
+    result, saved = offload_blobs(html, store, "/api/blob/")
+
+    assert "base64" not in result.replace("data:image/gif;base64,R0lGODlhAQABAAAAACw=", "")
+    assert result.count("/api/blob/") == 4
+    assert saved > len(PNG_URI) * 3
+    # 相同内容只保存一份，小于阈值的 data: URI 和小 SVG 保持原样
+    assert len(store) == 2
+    assert store.stats()["deduplicated"] == 2
+    assert '<svg><circle r="1"/></svg>' in result
+    assert 'alt="Logo"' in result
+
+    digests = {media_type: digest for digest, (media_type, _) in store.blobs.items()}
+    assert store.get(digests["image/png"])[1] == PNG_BYTES
+    assert store.get(digests["image/svg+xml"])[1].startswith(b'<svg xmlns="http://www.w3.org/2000/svg"')
+
+
+def test_store_evicts_least_recently_used():
+    store = BlobStore(max_bytes=10)
+    first = store.put("text/plain", b"123456")
+    second = store.put("text/plain", b"abcdef")
+    assert store.get(first) is None
+    assert store.get(second) == ("text/plain", b"abcdef")
+
+
+def test_page_sources_keep_references_and_blob_endpoint_serves_content(extension):
+    extension.add_tab(None, "https://img.example/", f'<h1>Gallery</h1><img alt="cat" src="{PNG_URI}">')
+
+    with TestClient(main.create_app()) as client:
+        data = client.post("/api/get-current-tab-markdown", json={}).json()
+        assert data["status"] == "success"
+        assert "base64" not in main.page_sources[data["request_id"]]["source_code"]
+        assert main.BLOB_URL_PREFIX in data["markdown"]
+
+        blob_url = data["markdown"].split("](")[1].split(")")[0]
+        response = client.get(blob_url.replace(f"http://{main.API_HOST}:{main.API_PORT}", ""))
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert response.headers["content-security-policy"] == "sandbox; default-src 'none'"
+        assert response.content == PNG_BYTES
+
+        cached = client.get(response.url.path, headers={"If-None-Match": response.headers["etag"]})
+        assert cached.status_code == 304
+        assert client.get("/api/blob/0000").status_code == 404
+
+
+def test_blob_endpoint_downloads_scriptable_types_as_attachments(extension):
+    with TestClient(main.create_app()) as client:
+        for media_type in ("image/svg+xml", "text/html"):
+            digest = main.blob_store.put(media_type, b"<svg onload='alert(1)'/>")
+            response = client.get(f"/api/blob/{digest}")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/octet-stream"
+            assert response.headers["content-disposition"] == f'attachment; filename="{digest}"'
+            assert response.headers["content-security-policy"] == "sandbox; default-src 'none'"
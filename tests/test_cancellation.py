@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from cancellation import CancelToken, RequestCancelled
+from conftest import ROOT_DIR, HostProcess
+
+MAIN_PY = os.path.join(ROOT_DIR, "app", "main.py")
+
+
+def test_cancel_token_deadline_and_callbacks():
+    token = CancelToken(0.05)
+    reasons = []
+    token.on_cancel(reasons.append)
+    token.check()
+    time.sleep(0.06)
+    with pytest.raises(RequestCancelled):
+        token.check()
+    token.cancel("disconnected")
+    token.on_cancel(reasons.append)
+    assert reasons == ["deadline", "deadline"] and token.remaining() == 0
+
+
+def test_deadline_stops_waiting_and_cancels_extension_request(extension):
+    extension.add_tab(None, "https://hung.example/", "<p>never</p>", delay=None)
+
+    started = time.monotonic()
+    with TestClient(main.create_app()) as client:
+        response = client.post("/api/get-current-tab-markdown", json={}, headers={"X-Request-Timeout": "0.3"})
+        assert client.post("/api/get-current-tab-markdown", json={"timeout": -1}).status_code == 400
+        assert client.post("/api/get-current-tab-markdown", json={"timeout": [1]}).status_code == 400
+    assert time.monotonic() - started < 5
+    assert response.status_code == 504 and response.json()["status"] == "timeout"
+
+    request = extension.sent_of_type("get_page_source")[0]
+    assert request["timeout"] <= 0.3
+    deadline = time.monotonic() + 5
+    while not extension.sent_of_type("cancel_request"):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    cancel = extension.sent_of_type("cancel_request")[0]
+    assert cancel["request_id"] == request["request_id"] and cancel["reason"] == "deadline"
+
+
+def test_client_disconnect_cancels_extension_round_trip(tmp_path):
+    host = HostProcess(MAIN_PY, tmp_path)
+    try:
+        host.send({"action": "init"})
+        host.wait_ready()
+        thread = threading.Thread(target=lambda: pytest.raises(httpx.ReadTimeout, httpx.post, host.url("/api/get-current-tab-markdown"),
+                                                               json={}, timeout=0.5))
+        thread.start()
+        request = host.receive(lambda m: m.get("type") == "get_page_source")
+        assert request["timeout"] == 60
+
+        # 插件没有响应，客户端放弃后本地程序立即通知插件，不再等满60秒
+        cancel = host.receive(lambda m: m.get("type") == "cancel_request", timeout=5)
+        thread.join(5)
+        assert cancel["request_id"] == request["request_id"] and cancel["reason"] == "disconnected"
+        stats = httpx.get(host.url("/api/scheduler-stats")).json()["scheduler"]
+        assert stats["extension"]["running"] == 0
+    finally:
+        host.process.kill()
+        host.process.wait()
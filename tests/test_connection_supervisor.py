@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import httpx
+
+from conftest import ROOT_DIR, HostProcess
+from connection_supervisor import ConnectionSupervisor
+
+MAIN_PY = os.path.join(ROOT_DIR, "app", "main.py")
+
+
+def post_in_background(host, path, body):
+    """在后台线程发出请求，返回 (线程, 结果)；结果中 elapsed 为耗时"""
+    result = {}
+
+    def run():
+        started = time.monotonic()
+        response = httpx.post(host.url(path), json=body, timeout=30)
+        result.update(response.json(), http_status=response.status_code, elapsed=time.monotonic() - started)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def test_heartbeat_interval_adapts_and_timeouts_mark_channel_unresponsive():
+    sent, states = [], []
+    supervisor = ConnectionSupervisor(lambda: sent.append(1) or True, lambda *state: states.append(state),
+                                      min_interval=1, max_interval=4, timeout=2)
+    start = supervisor.last_received
+
+    # 有消息往来时不发送心跳
+    supervisor.received(start + 0.9)
+    supervisor.check(start + 1.5)
+    assert not sent
+
+    # 空闲时发送心跳，得到响应后间隔加倍，直到上限
+    now = start + 1.9
+    for expected in (2, 4, 4):
+        supervisor.check(now)
+        supervisor.received(now + 0.1)
+        assert supervisor.interval == expected
+        now += expected + 0.1
+    assert len(sent) == 3 and not states
+
+    # 心跳超时：标记为无响应，收到任何消息后恢复
+    supervisor.check(now)
+    supervisor.check(now + 2)
+    assert states == [("unresponsive", "heartbeat_timeout")] and supervisor.interval == 1
+    supervisor.received(now + 3)
+    supervisor.closed()
+    assert states[1:] == [("connected", None), ("closed", "eof")]
+    assert supervisor.stats()["outages"] == 2 and supervisor.stats()["missed_heartbeats"] == 1
+
+
+def test_unanswered_heartbeat_fails_requests_fast_until_extension_responds(tmp_path):
+    host = HostProcess(MAIN_PY, tmp_path, MARKDOWN_PROFILE="alpha", MARKDOWN_HEARTBEAT_MIN="0.2",
+                       MARKDOWN_HEARTBEAT_TIMEOUT="1")
+    try:
+        host.send({"action": "init"})
+        host.wait_ready()
+        host.send({"action": "heartbeat"})
+
+        # 插件收到页面源码请求后不再响应任何消息
+        thread, result = post_in_background(host, "/api/get-current-tab-markdown", {"timeout": 20})
+        host.receive(lambda m: m.get("type") == "get_page_source")
+        thread.join(10)
+        assert result["status"] == "disconnected" and result["http_status"] == 503
+        assert result["elapsed"] < 5
+
+        response = httpx.post(host.url("/api/get-current-tab-markdown"), json={"timeout": 20}, timeout=5)
+        assert response.status_code == 503 and response.json()["status"] == "disconnected"
+        assert httpx.get(host.url("/api/browsers")).json()["channel"]["state"] == "unresponsive"
+
+        # 插件恢复响应后重新分配请求
+        host.send({"action": "heartbeat"})
+        deadline = time.monotonic() + 5
+        while httpx.get(host.url("/api/browsers")).json()["channel"]["state"] != "connected":
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        thread, result = post_in_background(host, "/api/get-current-tab-markdown", {})
+        request = host.receive(lambda m: m.get("type") == "get_page_source")
+        host.send({"type": "page_source_response", "request_id": request["request_id"],
+                   "url": "https://a.example/", "source_code": "<p>back</p>"})
+        thread.join(10)
+        assert result["status"] == "success" and "back" in result["markdown"]
+    finally:
+        host.process.kill()
+        host.process.wait()
+
+
+def test_extension_disconnect_keeps_api_server_for_reconnecting_host(tmp_path):
+    first = HostProcess(MAIN_PY, tmp_path, MARKDOWN_PROFILE="alpha")
+    second = None
+    try:
+        first.send({"action": "init"})
+        first.wait_ready()
+
+        # stdin 关闭（EOF）时进行中的请求立即结束，不等到超时
+        thread, result = post_in_background(first, "/api/get-current-tab-markdown", {"timeout": 20})
+        first.receive(lambda m: m.get("type") == "get_page_source")
+        first.process.stdin.close()
+        thread.join(10)
+        assert result["status"] == "disconnected" and result["elapsed"] < 5
+        assert first.process.poll() is None
+
+        # 插件重新连接时启动的新进程注册到仍在运行的API服务器
+        second = HostProcess(MAIN_PY, tmp_path, port=first.port)
+        second.send({"action": "init", "profile": "alpha"})
+        second.receive(lambda m: m.get("content") == "初始化成功")
+        deadline = time.monotonic() + 10
+        while not httpx.get(first.url("/api/browsers")).json()["browsers"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        thread, result = post_in_background(first, "/api/get-current-tab-markdown", {})
+        request = second.receive(lambda m: m.get("type") == "get_page_source")
+        second.send({"type": "page_source_response", "request_id": request["request_id"],
+                     "url": "https://a.example/", "source_code": "<p>reconnected</p>"})
+        thread.join(10)
+        assert result["status"] == "success" and "reconnected" in result["markdown"]
+        browsers = httpx.get(first.url("/api/browsers")).json()
+        assert browsers["role"] == "broker" and [b["local"] for b in browsers["browsers"]] == [False]
+    finally:
+        for host in (first, second):
+            if host is not None:
+                host.process.kill()
+                host.process.wait()
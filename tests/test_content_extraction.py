@@ -0,0 +1,53 @@
+from starlette.testclient import TestClient
+
+import main
+from content_extraction import extract_main_content
+
+PARAGRAPH = ("<p>正文段落包含足够多的文字，用来说明文章的主要内容，并带有<a href='/x'>一个链接</a>。"
+             "The article body carries most of the non-link text on the page.</p>")
+NAV_LINKS = "".join(f"<li><a href='/s{n}'>Section {n}</a></li>" for n in range(30))
+PAGE = (
+    "<html><head><title>T</title></head><body>"
+    "<div class='cookie-banner'>We use cookies. <a href='/privacy'>Privacy</a><button>OK</button></div>"
+    f"<header><nav><ul>{NAV_LINKS}</ul></nav><h1>Article Title</h1></header>"
+    f"<div class='layout'><aside class='sidebar'><ul>{NAV_LINKS}</ul></aside>"
+    f"<div class='post-body'>{PARAGRAPH * 6}<figure><img src='a.png'></figure>"
+    "<div class='share-links'><a href='/tw'>Twitter</a><a href='/fb'>Facebook</a></div>"
+    f"{PARAGRAPH * 2}</div></div>"
+    "<footer><p>Copyright 2024 Example. <a href='/terms'>Terms</a></p></footer></body></html>"
+)
+
+
+def test_extracts_article_and_drops_boilerplate():
+    content = extract_main_content(PAGE)
+    assert content.startswith("<h1>Article Title</h1>")
+    assert content.count("正文段落") == 8
+    assert "a.png" in content
+    for boilerplate in ("Section 1", "cookies", "Twitter", "Copyright"):
+        assert boilerplate not in content
+
+    markdown = main.convert_html_to_markdown(PAGE, main_content=True)
+    assert markdown.startswith("# Article Title")
+    assert len(markdown) < len(main.convert_html_to_markdown(PAGE)) / 2
+
+
+def test_returns_full_page_when_no_main_content_found():
+    html = "<html><body><ul><li><a href='/a'>Home</a></li></ul><p>Short.</p></body></html>"
+    assert extract_main_content(html) == html
+    assert extract_main_content("") == ""
+
+
+def test_main_content_is_selectable_per_request(extension):
+    extension.add_tab(None, "https://news.example/", PAGE)
+
+    with TestClient(main.create_app()) as client:
+        data = client.post("/api/get-current-tab-markdown", json={"main_content": True}).json()
+        assert data["status"] == "success"
+        assert "Section 1" not in data["markdown"]
+        request_id = data["request_id"]
+
+        # 已保存的结果按请求的提取方式重新转换
+        full = client.post("/api/get-markdown", json={"request_id": request_id, "main_content": False}).json()
+        assert full["main_content"] is False and "Section 1" in full["markdown"]
+        outline = client.post("/api/markdown-outline", json={"request_id": request_id, "main_content": True}).json()
+        assert [section["title"] for section in outline["outline"] if section["level"] > 0] == ["Article Title"]
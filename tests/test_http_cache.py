@@ -0,0 +1,44 @@
+from starlette.testclient import TestClient
+
+import main
+from http_cache import etag_matches, negotiate_encoding
+
+PAGE = "<h1>Cache</h1>" + "<p>重复读取的结果使用ETag校验，较大的响应体压缩后传输。</p>" * 400
+
+
+def test_markdown_responses_carry_etag_and_compress(extension):
+    extension.add_tab(None, "https://cache.example/", PAGE)
+
+    with TestClient(main.create_app()) as client:
+        request_id = client.post("/api/get-current-tab-markdown", json={}).json()["request_id"]
+
+        first = client.post("/api/get-markdown", json={"request_id": request_id}, headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+        assert first.headers["etag"].endswith('-gzip"') and first.headers["vary"] == "Accept-Encoding"
+        assert int(first.headers["content-length"]) < len(first.content) / 5
+        assert first.json()["markdown"].startswith("# Cache")
+
+        # 任一编码的ETag都可用于确认内容未变化
+        for etag in (first.headers["etag"], first.headers["etag"].replace("-gzip", "")):
+            cached = client.post("/api/get-markdown", json={"request_id": request_id}, headers={"If-None-Match": etag})
+            assert cached.status_code == 304 and cached.content == b""
+
+        plain = client.post("/api/get-markdown", json={"request_id": request_id}, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.headers["etag"] == first.headers["etag"].replace("-gzip", "")
+        assert main.compressed_bodies.stats()["misses"] >= 1
+
+        # 小响应不压缩
+        outline = client.post("/api/markdown-outline", json={"request_id": request_id},
+                              headers={"Accept-Encoding": "gzip"})
+        assert outline.status_code == 200 and "content-encoding" not in outline.headers
+
+
+def test_encoding_negotiation_and_etag_matching():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") in ("br", "gzip")
+    assert negotiate_encoding(None) is None
+    assert etag_matches('W/"abc", "def-gzip"', '"def"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+
+import main
+from load_test import ApiTarget, percentile, run_load
+
+
+def run_against_app(scenario, **options):
+    async def run():
+        transport = httpx.ASGITransport(app=main.create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            target = ApiTarget(client, burst=options.pop("burst", 1))
+            return target, await run_load(target, scenario, **options)
+    return asyncio.run(run())
+
+
+def test_closed_loop_current_tab_reports_percentiles(extension):
+    extension.add_tab(None, "https://load.example/", "<h1>Load</h1><p>text</p>", delay=0.01)
+
+    target, report = run_against_app("current-tab", concurrency=4, requests=20)
+    assert report["requests"] == report["succeeded"] == 20
+    assert report["failed"] == 0 and report["error_rate"] == 0.0
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"] <= report["latency_ms"]["max"]
+    assert target.last_markdown.startswith("# Load")
+
+
+def test_open_loop_notification_bursts_and_poll(extension):
+    _, report = run_against_app("notify", open_loop=True, rate=50, duration=0.3, burst=3)
+    # 固定到达率：0.3秒内约15次到达，每次3条通知
+    assert 13 <= report["requests"] <= 16 and report["failed"] == 0
+    assert len(extension.sent_of_type("notification")) == report["requests"] * 3
+
+    extension.add_tab(None, "https://load.example/", "<h1>Poll</h1>")
+    _, report = run_against_app("poll", concurrency=2, requests=10)
+    assert report["succeeded"] == 10
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, q) for q in (50, 90, 99)] == [50, 90, 99]
+    assert percentile([7], 95) == 7 and percentile([], 50) is None
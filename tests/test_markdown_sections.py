@@ -0,0 +1,117 @@
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from markdown_sections import build_section_index, read_page, read_section
+
+DOCUMENT = """前言段落
+
+# 第一章
+第一章内容
+
+## 1.1 小节
+小节内容
+
+```
+# 这不是标题
+```
+
+# 第二章
+最后一章，包含中文字符
+"""
+
+
+def test_section_index_offsets_and_levels():
+    sections = build_section_index(DOCUMENT)
+    encoded = DOCUMENT.encode("utf-8")
+
+    assert [(s["level"], s["title"]) for s in sections] == [
+        (0, ""), (1, "第一章"), (2, "1.1 小节"), (1, "第二章")
+    ]
+    for section in sections:
+        chunk = encoded[section["byte_offset"]:section["byte_offset"] + section["byte_length"]]
+        assert chunk.decode("utf-8") == DOCUMENT[section["char_offset"]:section["char_offset"] + section["char_length"]]
+    assert sum(s["byte_length"] for s in sections) == len(encoded)
+
+
+def test_read_section_with_subsections():
+    sections = build_section_index(DOCUMENT)
+    only_heading = read_section(DOCUMENT, sections, 1)
+    assert only_heading["content"] == "# 第一章\n第一章内容\n\n"
+
+    with_children = read_section(DOCUMENT, sections, 1, include_subsections=True)
+    assert with_children["subsection_count"] == 1
+    assert "# 这不是标题" in with_children["content"]
+    assert "第二章" not in with_children["content"]
+
+    truncated = read_section(DOCUMENT, sections, 1, max_bytes=5)
+    assert truncated["truncated"] and truncated["content"] == "# 第"
+    assert read_section(DOCUMENT, sections, 99) is None
+    with pytest.raises(ValueError):
+        read_section(DOCUMENT, sections, 1, max_bytes=-2)
+
+
+def test_read_page_walks_whole_document_on_char_boundaries():
+    sections = build_section_index(DOCUMENT)
+    pieces = []
+    offset = 0
+    while offset is not None:
+        page = read_page(DOCUMENT, sections, offset=offset, limit=7)
+        assert len(page["content"].encode("utf-8")) <= 7
+        pieces.append(page["content"])
+        offset = page["next_offset"]
+    assert "".join(pieces) == DOCUMENT
+
+
+def test_outline_section_and_page_endpoints():
+    main.page_sources.clear()
+    main.page_sources["req_sections"] = {"url": "https://example.com", "source_code": "<h1>标题</h1><p>正文</p><h2>子标题</h2><p>更多</p>"}
+
+    with TestClient(main.create_app()) as client:
+        outline = client.post("/api/markdown-outline", json={"request_id": "req_sections"}).json()
+        assert [entry["title"] for entry in outline["outline"]] == ["标题", "子标题"]
+
+        section = client.post("/api/markdown-section", json={"request_id": "req_sections", "section": 1}).json()
+        assert section["section"]["content"].startswith("## 子标题")
+
+        page = client.post("/api/markdown-page", json={"request_id": "req_sections", "offset": 0, "limit": 6}).json()
+        assert page["content"] == "# 标"
+        assert page["next_offset"] == 5
+
+        # max_bytes 必须是非负整数，否则返回400而不是截断出错
+        for max_bytes in (-2, "10", 1.5, True):
+            response = client.post("/api/markdown-section",
+                                   json={"request_id": "req_sections", "section": 0, "max_bytes": max_bytes})
+            assert response.status_code == 400 and "max_bytes" in response.json()["message"]
+        empty = client.post("/api/markdown-section", json={"request_id": "req_sections", "section": 0, "max_bytes": 0}).json()
+        assert empty["section"]["truncated"] and empty["section"]["content"] == ""
+
+        missing = client.post("/api/markdown-outline", json={"request_id": "nope"})
+        assert missing.status_code == 404
+
+        # 没有章节索引的已转换页面：建立的索引写回存储，之后的读取不再重建
+        main.page_sources["req_legacy"] = {"url": "https://example.com", "markdown": DOCUMENT}
+        legacy = client.post("/api/markdown-outline", json={"request_id": "req_legacy"}).json()
+        assert [entry["title"] for entry in legacy["outline"]] == ["", "第一章", "1.1 小节", "第二章"]
+        assert main.page_sources["req_legacy"]["sections"] == build_section_index(DOCUMENT)
+    main.page_sources.clear()
+
+
+def test_in_flight_capture_is_not_found(extension, monkeypatch):
+    extension.add_tab(None, "https://hung.example/", "<p>never</p>", delay=None)
+
+    with TestClient(main.create_app()) as client:
+        request_id = client.post("/api/get-page-source", json={}).json()["request_id"]
+        # 单进程时不写入处理中标记，读取结果时与不存在的ID相同
+        assert request_id not in main.page_sources
+        assert client.post("/api/get-markdown", json={"request_id": request_id}).status_code == 404
+        assert client.post("/api/page-source-result", json={"request_id": request_id}).json()["status"] == "pending"
+
+        # 多个工作进程共用存储时的处理中标记
+        main.page_sources["req_pending"] = {"status": "pending"}
+        for path in ("/api/get-markdown", "/api/markdown-outline", "/api/markdown-page"):
+            assert client.post(path, json={"request_id": "req_pending"}).status_code == 404
+        assert client.post("/api/markdown-section", json={"request_id": "req_pending", "section": 0}).status_code == 404
+
+        # 结束等待插件响应的工作线程
+        main.callbacks[request_id]({"type": "channel_lost", "request_id": request_id, "error": "测试结束"})
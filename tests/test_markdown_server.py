@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+pytest.importorskip("mcp")
+
+import markdown_server  # noqa: E402
+
+
+def install_transport(monkeypatch, handler):
+    """用 MockTransport 替换共享客户端，避免访问真实的本地API"""
+    client = httpx.AsyncClient(base_url="http://api.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(markdown_server, "_api_client", client)
+    monkeypatch.setattr(markdown_server, "API_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(markdown_server, "result_cache", markdown_server.ResultCache(ttl=10))
+    return client
+
+
+def test_concurrent_tool_calls_run_in_parallel(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"status": "success", "markdown": "# hi"})
+
+    install_transport(monkeypatch, handler)
+
+    async def run():
+        started = time.monotonic()
+        results = await asyncio.gather(*[markdown_server.get_current_tab_markdown() for _ in range(5)])
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+    assert all(result["status"] == "success" for result in results)
+    assert elapsed < 1.0
+
+
+def test_post_api_retries_connect_errors_with_backoff(monkeypatch):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"status": "success"})
+
+    install_transport(monkeypatch, handler)
+    assert asyncio.run(markdown_server.post_api("/api/get-current-tab-markdown", {})) == {"status": "success"}
+    assert len(attempts) == 3
+
+
+def test_post_api_does_not_retry_read_timeouts(monkeypatch):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        raise httpx.ReadTimeout("slow tab", request=request)
+
+    install_transport(monkeypatch, handler)
+    result = asyncio.run(markdown_server.get_current_tab_markdown())
+    assert result["status"] == "error"
+    assert len(attempts) == 1
+
+
+def test_post_api_retries_unavailable_status_only_for_idempotent_calls(monkeypatch):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url.path)
+        if request.url.path == "/api/crawl-site":
+            # 连接中途断开时API可能已收到请求
+            raise httpx.RemoteProtocolError("server disconnected", request=request)
+        return httpx.Response(503, json={"status": "error"})
+
+    install_transport(monkeypatch, handler)
+    with pytest.raises(httpx.RemoteProtocolError):
+        asyncio.run(markdown_server.post_api("/api/crawl-site", {}))
+    assert asyncio.run(markdown_server.post_api("/api/get-current-tab-markdown", {}))["status"] == "error"
+    assert attempts == ["/api/crawl-site", "/api/get-current-tab-markdown"]
+
+    asyncio.run(markdown_server.post_api("/api/search", {"query": "x"}, idempotent=True))
+    assert attempts.count("/api/search") == markdown_server.API_MAX_RETRIES + 1
+
+
+def test_current_tab_result_is_cached_until_the_tab_changes(monkeypatch):
+    tab = {"id": 1, "window_id": 1, "url": "https://a.example/", "title": "A", "active": True, "status": "complete"}
+    fetches = []
+    listings = []
+
+    def handler(request):
+        if request.url.path == "/api/list-tabs":
+            listings.append(request)
+            return httpx.Response(200, json={"status": "success", "tabs": [tab]})
+        fetches.append(request)
+        return httpx.Response(200, json={"status": "success", "request_id": f"r{len(fetches)}", "url": tab["url"],
+                                         "markdown": "# A", "source_code_length": 100, "message": "ok"})
+
+    install_transport(monkeypatch, handler)
+
+    async def run():
+        first = await markdown_server.get_current_tab_markdown()
+        second = await markdown_server.get_current_tab_markdown()
+        tab["title"] = "A2"
+        third = await markdown_server.get_current_tab_markdown()
+        refreshed = await markdown_server.get_current_tab_markdown(refresh=True)
+        return first, second, third, refreshed
+
+    first, second, third, refreshed = asyncio.run(run())
+    # 成功时只返回精简的字段
+    assert first == {"status": "success", "request_id": "r1", "url": "https://a.example/", "markdown": "# A"}
+    assert second == dict(first, cached=True)
+    assert third["request_id"] == "r2" and refreshed["request_id"] == "r3"
+    assert len(fetches) == 3
+    # 每次调用最多读取一次标签页列表
+    assert len(listings) == 4
+
+
+def test_batch_tool_fetches_urls_and_tabs_together(monkeypatch):
+    tabs = [{"id": 5, "url": "https://tab.example/", "title": "T", "active": True, "status": "complete"},
+            {"id": 6, "url": "https://other.example/", "title": "O", "active": False, "status": "complete"}]
+    captures = []
+    listings = []
+
+    def ndjson(lines):
+        return httpx.Response(200, content="".join(json.dumps(line) + "\n" for line in lines),
+                              headers={"content-type": "application/x-ndjson"})
+
+    def handler(request):
+        body = json.loads(request.content)
+        if request.url.path == "/api/list-tabs":
+            listings.append(request)
+            return httpx.Response(200, json={"status": "success", "tabs": tabs})
+        if request.url.path == "/api/capture-tabs":
+            captures.append(body["tab_ids"])
+            return ndjson([{"type": "tab_result", "tab_id": tab_id, "request_id": f"tab_{tab_id}", "status": "success",
+                            "url": next(tab["url"] for tab in tabs if tab["id"] == tab_id), "markdown": f"# {tab_id}"}
+                           for tab_id in body["tab_ids"]] + [{"type": "summary", "total": len(body["tab_ids"])}])
+        if body["url"].endswith("/bad"):
+            return ndjson([{"type": "start", "request_id": "u2", "url": body["url"]},
+                           {"type": "error", "status": "timeout", "message": "获取超时", "request_id": "u2"}])
+        return ndjson([{"type": "start", "request_id": "u1", "url": body["url"]},
+                       {"type": "chunk", "markdown": "# Page\n"}, {"type": "chunk", "markdown": "text\n"},
+                       {"type": "summary", "status": "success", "request_id": "u1", "url": body["url"]}])
+
+    install_transport(monkeypatch, handler)
+
+    async def run():
+        first = await markdown_server.get_markdown_batch(urls=["https://u.example/", "https://u.example/bad"],
+                                                         tab_ids=[5, 6])
+        second = await markdown_server.get_markdown_batch(tab_ids=[5, 6])
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["status"] == "partial"
+    page, bad, tab5, tab6 = first["results"]
+    assert page == {"status": "success", "request_id": "u1", "url": "https://u.example/", "markdown": "# Page\ntext\n"}
+    assert bad["status"] == "timeout" and bad["url"] == "https://u.example/bad"
+    assert tab5["tab_id"] == 5 and tab5["markdown"] == "# 5" and tab6["markdown"] == "# 6"
+    # 标签页未变化，第二次全部来自缓存
+    assert second["status"] == "success" and all(result["cached"] for result in second["results"])
+    assert captures == [[5, 6]]
+    # 每批只读取一次标签页列表
+    assert len(listings) == 2
+    assert asyncio.run(markdown_server.get_markdown_batch())["status"] == "error"
+
+
+def test_batch_cancels_url_fetches_when_tab_capture_fails(monkeypatch):
+    fetching = []
+
+    async def slow_fetch(url, main_content):
+        fetching.append(url)
+        await asyncio.sleep(10)
+
+    async def failing_capture(tab_ids, main_content):
+        await asyncio.sleep(0)
+        raise RuntimeError("标签页获取失败")
+
+    monkeypatch.setattr(markdown_server, "fetch_url_markdown_cached", slow_fetch)
+    monkeypatch.setattr(markdown_server, "capture_tabs_markdown", failing_capture)
+
+    async def run():
+        result = await markdown_server.get_markdown_batch(urls=["https://u.example/"], tab_ids=[5])
+        await asyncio.sleep(0)
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return result, pending
+
+    started = time.monotonic()
+    result, pending = asyncio.run(run())
+    assert result["status"] == "error" and "标签页获取失败" in result["message"]
+    assert fetching == ["https://u.example/"] and pending == []
+    assert time.monotonic() - started < 5
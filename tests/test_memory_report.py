@@ -0,0 +1,39 @@
+from starlette.testclient import TestClient
+
+import main
+
+
+def allocate_pages():
+    return ["记录" * 2000 + str(n) for n in range(200)]
+
+
+def test_memory_report_ranks_pages_by_size(extension):
+    main.page_sources["small"] = {"url": "https://small.example/", "source_code": "<p>x</p>"}
+    main.store_markdown("large", "# 大页面\n" + "段落内容\n" * 20000, url="https://large.example/", source_code="<p>y</p>" * 5000)
+
+    with TestClient(main.create_app()) as client:
+        report = client.get("/api/admin/memory", params={"limit": 1}).json()
+
+    pages = report["page_sources"]
+    assert pages["backend"] == "memory" and pages["count"] == 2
+    assert [entry["request_id"] for entry in pages["largest"]] == ["large"]
+    assert pages["largest"][0]["field_bytes"]["markdown"] > 200000
+    assert pages["total_bytes"] >= sum(pages["field_bytes"].values())
+    assert report["requests"]["callbacks"] == 0
+    assert report["caches"]["search_index"]["available"] in (True, False)
+
+
+def test_tracemalloc_diff_points_at_allocation_site():
+    with TestClient(main.create_app()) as client:
+        assert client.post("/api/admin/tracemalloc", json={"action": "diff"}).status_code == 400
+        assert client.post("/api/admin/tracemalloc", json={"action": "start", "frames": 5}).json()["tracing"]
+        try:
+            baseline = client.post("/api/admin/tracemalloc", json={"action": "snapshot", "limit": 5}).json()
+            pages = allocate_pages()
+            diff = client.post("/api/admin/tracemalloc", json={"action": "diff", "limit": 5}).json()
+            assert diff["baseline"] == baseline["snapshot_id"] and diff["size_diff_bytes"] > 0
+            top = diff["top"][0]
+            assert top["site"].startswith(__file__) and top["size_diff_bytes"] >= len(pages) * 4000
+        finally:
+            status = client.post("/api/admin/tracemalloc", json={"action": "stop"}).json()
+    assert not status["tracing"] and status["snapshots"] == []
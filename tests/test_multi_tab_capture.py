@@ -0,0 +1,76 @@
+import json
+import time
+
+from starlette.testclient import TestClient
+
+import main
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_list_tabs_refreshes_and_caches(extension):
+    extension.add_tab(1, "https://a.example/", "<h1>A</h1>", title="A")
+    extension.add_tab(2, "https://b.example/", "<h1>B</h1>", title="B")
+
+    with TestClient(main.create_app()) as client:
+        data = client.post("/api/list-tabs", json={}).json()
+        assert data["status"] == "success"
+        assert sorted(tab["id"] for tab in data["tabs"]) == [1, 2]
+
+        # 第二次请求直接使用缓存，不再向插件发送 list_tabs
+        client.post("/api/list-tabs", json={})
+        assert len(extension.sent_of_type("list_tabs")) == 1
+
+        client.post("/api/list-tabs", json={"refresh": True})
+        assert len(extension.sent_of_type("list_tabs")) == 2
+
+
+def test_capture_tabs_streams_results_as_they_arrive(extension):
+    extension.add_tab(1, "https://slow.example/", "<h1>Slow</h1>", delay=0.4)
+    extension.add_tab(2, "https://fast.example/", "<h1>Fast</h1><p>body</p>", delay=0.0)
+
+    with TestClient(main.create_app()) as client:
+        with client.stream("POST", "/api/capture-tabs", json={"tab_ids": [1, 2], "timeout": 5}) as response:
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            lines = read_ndjson(response)
+
+    results = [line for line in lines if line["type"] == "tab_result"]
+    assert [result["tab_id"] for result in results] == [2, 1]
+    assert all(result["status"] == "success" for result in results)
+    assert "# Fast" in results[0]["markdown"]
+    assert lines[-1]["type"] == "summary"
+    assert lines[-1]["counts"] == {"success": 2}
+
+    # 每个标签页使用独立的请求ID，并带上目标标签页
+    requests = extension.sent_of_type("get_page_source")
+    assert sorted(message["tab_id"] for message in requests) == [1, 2]
+    assert len({message["request_id"] for message in requests}) == 2
+    assert all(result["request_id"] in main.page_sources for result in results)
+
+
+def test_hung_tab_times_out_without_blocking_others(extension):
+    extension.add_tab(1, "https://hung.example/", "<p>never</p>", delay=None)
+    extension.add_tab(2, "https://ok.example/", "<p>ok</p>")
+
+    started = time.monotonic()
+    with TestClient(main.create_app()) as client:
+        with client.stream("POST", "/api/capture-tabs", json={"tab_ids": [1, 2, 3], "timeout": 0.5}) as response:
+            lines = read_ndjson(response)
+    elapsed = time.monotonic() - started
+
+    by_tab = {line["tab_id"]: line for line in lines if line["type"] == "tab_result"}
+    assert by_tab[2]["status"] == "success"
+    assert by_tab[1]["status"] == "timeout"
+    assert by_tab[3]["status"] == "error"
+    assert lines[0]["tab_id"] != 1
+    assert elapsed < 3
+    # 超时后回调已被清理
+    assert not main.callbacks
+
+
+def test_capture_tabs_rejects_empty_request(extension):
+    with TestClient(main.create_app()) as client:
+        response = client.post("/api/capture-tabs", json={"tab_ids": []})
+    assert response.status_code == 400
@@ -0,0 +1,104 @@
+import os
+import threading
+
+import httpx
+import pytest
+
+from conftest import ROOT_DIR, HostProcess
+from page_store import SQLitePageStore
+from shared_payload import SharedPayloadPool, open_shared_payload, SHARED_PAYLOAD_MIN_BYTES
+
+BRIDGE_PY = os.path.join(ROOT_DIR, "app", "native_bridge.py")
+
+
+@pytest.fixture
+def bridge(tmp_path):
+    process = HostProcess(BRIDGE_PY, tmp_path, MARKDOWN_API_WORKERS="2")
+    yield process
+    if process.process.poll() is None:
+        process.process.kill()
+        process.process.wait()
+
+
+def test_page_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "pages.db")
+    first, second = SQLitePageStore(path), SQLitePageStore(path)
+    first["req_1"] = {"url": "https://a.example/", "source_code": "<p>页面</p>"}
+    assert second["req_1"]["source_code"] == "<p>页面</p>"
+    assert "req_1" in second and len(second) == 1 and list(second) == ["req_1"]
+    assert second.get("missing") is None
+    del second["req_1"]
+    assert "req_1" not in first
+
+
+def test_shared_payload_is_released_after_all_holders():
+    pool = SharedPayloadPool(spare_segments=0)
+    data = "页面源码".encode("utf-8") * 1000
+    handle = pool.share(pool.put(data), len(data), ["worker_1", "worker_2", "worker_2"])
+    with open_shared_payload(handle) as view:
+        assert view.readonly and str(view, "utf-8") == data.decode("utf-8")
+
+    pool.release(handle["name"], "worker_1")
+    pool.release(handle["name"], "worker_2")
+    assert pool.stats()["active"] == 1
+    pool.release_holder("worker_2")
+    assert pool.stats() == {"active": 0, "active_bytes": 0, "spare": 0, "spare_bytes": 0, "created": 1, "released": 1, "expired": 0}
+    with pytest.raises(FileNotFoundError):
+        open_shared_payload(handle).__enter__()
+
+
+def test_released_segments_are_reused():
+    pool = SharedPayloadPool(spare_segments=1)
+    segment = pool.put(b"a" * 4096)
+    pool.release(pool.share(segment, 4096, ["worker"])["name"], "worker")
+    assert pool.allocate(3000) is segment
+    other = pool.allocate(3000)
+    assert other is not segment
+    pool.discard(segment)
+    pool.discard(other)
+
+
+def test_bridge_answers_extension_and_workers_share_state(bridge):
+    # 初始化消息由桥直接应答，不等待API服务启动
+    bridge.send({"action": "init"})
+    assert bridge.receive(lambda m: m.get("content") == "初始化成功", timeout=5)
+    bridge.wait_ready()
+
+    # 最后一个页面超过阈值，经由共享内存交给工作进程
+    sizes = [2000, 2000, 2000, SHARED_PAYLOAD_MIN_BYTES]
+    results = []
+    for n in range(4):
+        thread = threading.Thread(target=lambda: results.append(httpx.post(
+            bridge.url("/api/get-current-tab-markdown"), json={}, timeout=30
+        ).json()))
+        thread.start()
+        request = bridge.receive(lambda m: m.get("type") == "get_page_source")
+        bridge.send({
+            "type": "page_source_response",
+            "request_id": request["request_id"],
+            "url": f"https://site.example/{n}",
+            "source_code": f"<h1>Page {n}</h1><p>{'内容' * sizes[n]}</p>"
+        })
+        thread.join(30)
+
+    assert sorted(result["markdown"].split("\n")[0] for result in results) == [f"# Page {n}" for n in range(4)]
+    assert max(result["markdown_length"] for result in results) > SHARED_PAYLOAD_MIN_BYTES
+
+    # 请求分散到两个工作进程，任一进程都能读取其他进程保存的结果
+    pids = {httpx.get(bridge.url("/api/scheduler-stats")).json()["pid"] for _ in range(50)}
+    assert len(pids) == 2
+    for result in results:
+        for _ in range(3):
+            data = httpx.post(bridge.url("/api/get-markdown"), json={"request_id": result["request_id"]}).json()
+            assert data["status"] == "success" and data["url"] == result["url"]
+
+    # 内存统计包含共享存储中的页面和桥持有的共享内存段
+    memory = httpx.get(bridge.url("/api/admin/memory")).json()
+    assert memory["page_sources"]["backend"] == "sqlite" and memory["page_sources"]["count"] >= 4
+    assert memory["bridge"]["connections"] == 2 and memory["bridge"]["shared_payloads"]["active"] == 0
+
+    # 插件断开连接后桥关闭API服务并退出
+    bridge.process.stdin.close()
+    assert bridge.process.wait(15) == 0
+    with pytest.raises(httpx.HTTPError):
+        httpx.get(bridge.url("/"), timeout=1)
@@ -0,0 +1,126 @@
+import random
+import threading
+
+from starlette.testclient import TestClient
+
+import main
+import near_duplicates
+from near_duplicates import DedupPageStore, apply_delta, hamming_distance, make_delta, simhash
+
+WORDS = [f"词{n}" for n in range(500)] + [f"word{n}" for n in range(500)]
+
+
+def build_article(paragraphs=30, seed=7):
+    rng = random.Random(seed)
+    return "".join(f"<p>{' '.join(rng.choice(WORDS) for _ in range(40))}</p>\n" for _ in range(paragraphs))
+
+
+def capture(n, article):
+    """同一篇文章的不同时刻：时间戳、阅读数和广告不同"""
+    return (f"<html><body><div class='meta'>更新于 2026-10-{n:02d} 12:{n:02d} 阅读 {n * 131}</div>"
+            f"{article}<aside>广告 {n}</aside></body></html>")
+
+
+def test_simhash_separates_near_duplicates_from_other_pages():
+    article = main.convert_html_to_markdown(build_article())
+    variants = [simhash(main.convert_html_to_markdown(capture(n, build_article()))) for n in range(1, 6)]
+    other = simhash(main.convert_html_to_markdown(build_article(seed=8)))
+
+    assert all(hamming_distance(variants[0], fingerprint) <= 6 for fingerprint in variants)
+    assert hamming_distance(variants[0], other) > 16
+    assert simhash(article[:50]) is None
+
+    for base, text in ((capture(1, article), capture(2, article)), ("", "a\n"), ("a\nb\n", ""), ("a\na\n", "b\na\na\n")):
+        assert apply_delta(base, make_delta(base, text)) == text
+
+
+def test_store_keeps_deltas_and_restores_after_canonical_is_removed():
+    store = DedupPageStore()
+    pages = {}
+    for n in range(1, 5):
+        source = capture(n, build_article())
+        pages[f"r{n}"] = {"url": "https://news.example/a", "source_code": source,
+                          "markdown": main.convert_html_to_markdown(source)}
+        store[f"r{n}"] = pages[f"r{n}"]
+    store["other"] = {"markdown": main.convert_html_to_markdown(build_article(seed=8))}
+
+    assert store.canonical("r3")[0] == "r1" and store.canonical("other") == ("other", 0)
+    assert store.duplicates_of("r1") == ["r2", "r3", "r4"]
+    assert "markdown" not in store.pages["r3"] and "source_delta" in store.pages["r3"]
+    assert store.stats()["saved_bytes"] > sum(len(pages[f"r{n}"]["source_code"]) for n in (2, 3, 4)) * 0.9
+
+    # 更新其他字段时沿用差异；删除规范版本后副本仍能还原
+    page = store["r2"]
+    page["served"] = True
+    store["r2"] = page
+    assert "markdown_delta" in store.pages["r2"] and store["r2"]["served"]
+    del store["r1"]
+    for request_id in ("r2", "r3", "r4"):
+        assert store[request_id]["markdown"] == pages[request_id]["markdown"]
+        assert store[request_id]["source_code"] == pages[request_id]["source_code"]
+    assert store.canonical("r4")[0] == "r2"
+
+
+def test_source_digest_index_follows_replacements_and_deletes():
+    store = DedupPageStore()
+    source = capture(1, build_article())
+    markdown = main.convert_html_to_markdown(source)
+    store["a"] = {"source_code": source, "markdown": markdown}
+    store["b"] = {"source_code": source, "markdown": markdown}
+
+    # 摘要指向最近保存的页面，删除较早的页面时不影响它
+    del store["a"]
+    assert store.converted_markdown(source, False) == markdown
+    store["b"] = {"status": "pending"}
+    assert store.converted_markdown(source, False) is None
+    assert store.source_digests == {} and store.request_digests == {}
+
+
+def test_deltas_are_computed_without_holding_the_store_lock(monkeypatch):
+    store = DedupPageStore()
+    for n in range(1, 4):
+        store[f"r{n}"] = {"markdown": main.convert_html_to_markdown(capture(n, build_article()))}
+    assert store.duplicates_of("r1") == ["r2", "r3"]
+
+    locked = []
+
+    def checked_make_delta(base, text):
+        # 其他线程（如读取页面的请求）在计算差异期间可以访问存储
+        def try_lock():
+            acquired = store.lock.acquire(timeout=1)
+            if acquired:
+                store.lock.release()
+            locked.append(not acquired)
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return make_delta(base, text)
+
+    monkeypatch.setattr(near_duplicates, "make_delta", checked_make_delta)
+    # 删除规范版本：副本在锁外重新计算差异
+    del store["r1"]
+    assert locked == [False] and store.canonical("r3")[0] == "r2"
+    assert store["r3"]["markdown"] == main.convert_html_to_markdown(capture(3, build_article()))
+
+
+def test_repeated_captures_share_storage_and_conversion(extension):
+    article = build_article()
+    extension.add_tab(None, "https://news.example/a", capture(1, article))
+
+    with TestClient(main.create_app()) as client:
+        first = client.post("/api/get-current-tab-markdown", json={}).json()
+        extension.add_tab(None, "https://news.example/a", capture(2, article))
+        second = client.post("/api/get-current-tab-markdown", json={}).json()
+        # 页面没有变化时直接复用转换结果
+        reused = main.page_sources.reused_conversions
+        third = client.post("/api/get-current-tab-markdown", json={}).json()
+        assert main.page_sources.reused_conversions == reused + 1
+        assert third["markdown"] == second["markdown"] != first["markdown"]
+
+        response = client.post("/api/canonical-capture", json={"request_id": second["request_id"]}).json()
+        assert response["canonical_id"] == first["request_id"] and response["duplicate"]
+        assert response["duplicates"] == sorted([second["request_id"], third["request_id"]])
+        stored = client.post("/api/get-markdown", json={"request_id": second["request_id"]}).json()
+        assert stored["markdown"] == second["markdown"]
+        assert client.post("/api/canonical-capture", json={"request_id": "missing"}).status_code == 404
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def prefetch(extension, monkeypatch):
+    monkeypatch.setattr(main, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(main, "prefetch_budget", main.PrefetchBudget())
+    main.prefetch_index.clear()
+    yield extension
+    main.prefetch_index.clear()
+
+
+def snapshot(tab_id, url, html, reason="complete"):
+    main.dispatch_message({
+        "type": "page_snapshot",
+        "reason": reason,
+        "tab_id": tab_id,
+        "window_id": 1,
+        "url": url,
+        "title": "",
+        "source_code": html
+    })
+    # 快照在转换工作队列中保存，完成后才成为可用的当前快照
+    deadline = time.monotonic() + 5
+    while html and main.prefetch_index["current"]["request_id"] is None:
+        assert time.monotonic() < deadline, "保存快照超时"
+        time.sleep(0.01)
+
+
+def wait_converted(request_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while "markdown" not in main.page_sources.get(request_id, {}):
+        assert time.monotonic() < deadline, "预转换超时"
+        time.sleep(0.02)
+
+
+def test_current_tab_served_from_fresh_snapshot(prefetch):
+    prefetch.add_tab(None, "https://live.example/", "<h1>Live</h1>")
+    snapshot(7, "https://snap.example/", "<h1>Snapshot</h1><p>预取内容</p>")
+    request_id = main.prefetch_index["current"]["request_id"]
+    wait_converted(request_id)
+
+    with TestClient(main.create_app()) as client:
+        response = client.post("/api/get-current-tab-markdown", json={})
+        data = response.json()
+        assert data["prefetched"] is True and data["request_id"] == request_id
+        assert "# Snapshot" in data["markdown"] and "age" in response.headers
+        assert prefetch.sent_of_type("get_page_source") == []
+
+        # 同一内容重复上报时沿用已转换的结果
+        snapshot(7, "https://snap.example/", "<h1>Snapshot</h1><p>预取内容</p>", reason="idle")
+        assert main.prefetch_index["current"]["request_id"] == request_id
+        assert client.post("/api/get-current-tab-markdown", json={"outline_only": True}).json()["prefetched"]
+
+        # prefetch 为假时重新向插件获取
+        data = client.post("/api/get-current-tab-markdown", json={"prefetch": False}).json()
+        assert "prefetched" not in data and "# Live" in data["markdown"]
+        assert len(prefetch.sent_of_type("get_page_source")) == 1
+
+
+def test_stale_or_invalidated_snapshot_falls_back_to_capture(prefetch):
+    prefetch.add_tab(None, "https://live.example/", "<h1>Live</h1>")
+    snapshot(7, "https://snap.example/", "<h1>Snapshot</h1>")
+    wait_converted(main.prefetch_index["current"]["request_id"])
+
+    with TestClient(main.create_app()) as client:
+        assert "prefetched" not in client.post("/api/get-current-tab-markdown", json={"max_age": 0}).json()
+        for max_age in ("soon", [], -1):
+            assert client.post("/api/get-current-tab-markdown", json={"max_age": max_age}).status_code == 400
+
+        # 标签页缓存显示该标签页已导航到其他地址
+        main.tab_registry["tabs"] = {7: {"id": 7, "url": "https://other.example/", "active": True, "status": "complete"}}
+        assert "prefetched" not in client.post("/api/get-current-tab-markdown", json={}).json()
+
+        # 加载中或无法抓取的标签页作废之前的快照
+        main.tab_registry["tabs"] = {}
+        snapshot(8, "chrome://settings/", None, reason="activated")
+        data = client.post("/api/get-current-tab-markdown", json={}).json()
+        assert "prefetched" not in data and "# Live" in data["markdown"]
+    assert len(prefetch.sent_of_type("get_page_source")) == 3
+
+
+def test_prefetched_pages_are_capped(prefetch, monkeypatch):
+    monkeypatch.setattr(main, "PREFETCH_MAX_PAGES", 2)
+    request_ids = []
+    for n in range(3):
+        snapshot(n, f"https://site.example/{n}", f"<h1>Page {n}</h1>")
+        request_ids.append(main.prefetch_index["current"]["request_id"])
+        if n == 0:
+            # 已返回给客户端的页面不删除
+            wait_converted(request_ids[0])
+            with TestClient(main.create_app()) as client:
+                assert client.post("/api/get-current-tab-markdown", json={}).json()["prefetched"]
+
+    assert main.prefetch_index["pages"] == request_ids[1:]
+    assert all(request_id in main.page_sources for request_id in request_ids)
+
+    snapshot(3, "https://site.example/3", "<h1>Page 3</h1>")
+    assert request_ids[1] not in main.page_sources
+    assert len(main.prefetch_index["pages"]) == 2
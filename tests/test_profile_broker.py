@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from cancellation import CancelToken
+from conftest import ROOT_DIR, HostProcess
+from profile_broker import ProfileBroker, broker_dir, read_broker_key
+from scheduler import PRIORITY_INTERACTIVE, Scheduler
+
+MAIN_PY = os.path.join(ROOT_DIR, "app", "main.py")
+
+
+def answer_page_source(host, html):
+    """扮演插件：回复下一条页面源码请求"""
+    request = host.receive(lambda m: m.get("type") == "get_page_source")
+    host.send({"type": "page_source_response", "request_id": request["request_id"],
+               "url": f"https://{html}.example/", "source_code": f"<p>{html}</p>"})
+    return request
+
+
+def test_select_prefers_profile_window_and_least_loaded():
+    broker = ProfileBroker(0, dispatch=lambda message: None)
+    broker.register({"profile": "work", "pid": 2}, connection=object())
+    broker.links["work"].windows = {7}
+
+    assert broker.assign("a", "get_page_source") == broker.local.profile
+    # 本地浏览器已有进行中的请求，未指定时交给空闲的浏览器
+    assert broker.assign("b", "get_page_source") == "work"
+    assert broker.assign("c", "get_page_source", window_id=7) == "work"
+    assert broker.assign("d", "get_page_source", profile=broker.local.profile) == broker.local.profile
+    with pytest.raises(LookupError):
+        broker.assign("e", "get_page_source", profile="missing")
+    with pytest.raises(LookupError):
+        broker.assign("e", "get_page_source", window_id=8)
+
+    broker.observe({"type": "page_source_response", "request_id": "b"})
+    broker.observe({"type": "page_source_response", "request_id": "c"})
+    assert broker.links["work"].inflight == 0 and broker.local.inflight == 2
+
+
+def test_second_host_joins_broker_and_takes_over_port(tmp_path):
+    first = HostProcess(MAIN_PY, tmp_path, MARKDOWN_PROFILE="alpha")
+    second = None
+    try:
+        first.send({"action": "init"})
+        first.wait_ready()
+        second = HostProcess(MAIN_PY, tmp_path, port=first.port)
+        # 插件上报的配置文件ID作为成员的名称
+        second.send({"action": "init", "profile": "beta"})
+        second.receive(lambda m: m.get("content") == "初始化成功")
+
+        deadline = time.monotonic() + 10
+        while True:
+            profiles = {b["profile"] for b in httpx.get(first.url("/api/browsers")).json()["browsers"]}
+            if profiles == {"alpha", "beta"} or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        assert profiles == {"alpha", "beta"}
+
+        for host, profile in ((second, "beta"), (first, "alpha")):
+            result = {}
+            thread = threading.Thread(target=lambda: result.update(httpx.post(
+                first.url("/api/get-current-tab-markdown"), json={"profile": profile}, timeout=10).json()))
+            thread.start()
+            answer_page_source(host, profile)
+            thread.join(10)
+            assert result["profile"] == profile and profile in result["markdown"]
+
+        assert httpx.post(first.url("/api/get-current-tab-markdown"), json={"profile": "gamma"}).status_code == 404
+
+        # 代理所在的浏览器退出后，成员接管API端口
+        first.process.kill()
+        first.process.wait()
+        second.wait_ready()
+        browsers = httpx.get(second.url("/api/browsers")).json()
+        assert browsers["role"] == "broker" and [b["profile"] for b in browsers["browsers"]] == ["beta"]
+    finally:
+        for host in (first, second):
+            if host is not None:
+                host.process.kill()
+                host.process.wait()
+
+
+def test_broker_files_live_in_private_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    broker = ProfileBroker(0, dispatch=lambda message: None).start()
+    try:
+        directory = os.path.dirname(broker.key_path)
+        assert directory == os.path.dirname(broker.address) and directory.startswith(str(tmp_path))
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+        assert os.stat(broker.key_path).st_mode & 0o777 == 0o600
+        assert len(read_broker_key(broker.key_path)) == 32
+
+        # 其他用户可读的密钥文件不被信任
+        os.chmod(broker.key_path, 0o644)
+        with pytest.raises(PermissionError):
+            read_broker_key(broker.key_path)
+        # 放宽权限的目录不被使用
+        os.chmod(directory, 0o755)
+        with pytest.raises(PermissionError):
+            broker_dir()
+        os.chmod(directory, 0o700)
+    finally:
+        broker.stop()
+
+
+def test_tabs_are_kept_per_browser():
+    broker = ProfileBroker(0, dispatch=lambda message: None)
+    member = broker.register({"profile": "work", "pid": 2}, connection=object())
+    broker.update_tabs({1: {"id": 1, "url": "https://local.example/"}}, "t1")
+    broker.context.link = member
+    broker.update_tabs({1: {"id": 1, "url": "https://work.example/"}}, "t2")
+    broker.context.link = None
+
+    assert broker.tab(broker.local.profile, 1)["url"] == "https://local.example/"
+    assert broker.tab("work", 1)["url"] == "https://work.example/"
+    assert broker.tab("missing", 1) is None
+
+
+def test_routes_are_released_when_requests_are_not_sent(monkeypatch):
+    broker = ProfileBroker(0, dispatch=lambda message: None)
+    monkeypatch.setattr(main, "broker", broker)
+    monkeypatch.setattr(main, "send_message", lambda frame: False)
+    scheduler = Scheduler({"extension": (1, 4), "fetch": (1, 4), "convert": (1, 4)})
+    monkeypatch.setattr(main, "scheduler", scheduler)
+    release = threading.Event()
+    scheduler.submit("extension", release.wait, 5, priority=PRIORITY_INTERACTIVE)
+
+    try:
+        with TestClient(main.create_app()) as client:
+            # 在队列中等待时超过截止时间，请求不会再发出
+            response = client.post("/api/get-current-tab-markdown", json={}, headers={"X-Request-Timeout": "0.2"})
+            assert response.status_code == 504
+            assert broker.routes == {} and broker.local.inflight == 0
+            release.set()
+
+            # 发送失败
+            response = client.post("/api/get-current-tab-markdown", json={})
+            assert response.status_code == 500
+            assert broker.routes == {} and broker.local.inflight == 0
+    finally:
+        release.set()
+
+    # 已取消的请求在发送前返回
+    token = CancelToken(1)
+    token.cancel("disconnected")
+    main.assign_browser("req_cancelled", "get_page_source", {})
+    assert main.get_page_source("req_cancelled", token=token)["status"] == "cancelled"
+    assert broker.routes == {} and broker.local.inflight == 0
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from scheduler import (PRIORITY_BULK, PRIORITY_INTERACTIVE, Scheduler,
+                       SchedulerOverloaded)
+
+
+def test_concurrency_is_bounded_per_work_class():
+    scheduler = Scheduler({"convert": (2, 10)})
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+
+    futures = [scheduler.submit("convert", work) for _ in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert max(peak) == 2
+    assert scheduler.stats()["convert"]["completed"] == 6
+
+
+def test_interactive_work_runs_before_queued_bulk_work():
+    scheduler = Scheduler({"fetch": (1, 10)})
+    release = threading.Event()
+    order = []
+
+    scheduler.submit("fetch", release.wait, 5)
+    bulk = [scheduler.submit("fetch", order.append, f"bulk{i}", priority=PRIORITY_BULK) for i in range(3)]
+    interactive = scheduler.submit("fetch", order.append, "interactive", priority=PRIORITY_INTERACTIVE)
+    release.set()
+    for future in bulk + [interactive]:
+        future.result(timeout=5)
+    assert order[0] == "interactive"
+
+
+def test_overload_rejects_bulk_first_and_reports_retry_after():
+    scheduler = Scheduler({"fetch": (1, 4)})
+    release = threading.Event()
+    scheduler.submit("fetch", release.wait, 5)
+
+    # 非交互请求最多占用一半队列
+    scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_BULK)
+    scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_BULK)
+    with pytest.raises(SchedulerOverloaded) as excinfo:
+        scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_BULK)
+    assert excinfo.value.retry_after >= 1
+
+    # 交互请求仍可进入预留的队列容量
+    scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_INTERACTIVE)
+    scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_INTERACTIVE)
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.submit("fetch", time.sleep, 0, priority=PRIORITY_INTERACTIVE)
+    release.set()
+    assert scheduler.stats()["fetch"]["rejected"] == 2
+
+
+def test_api_returns_429_with_retry_after_when_overloaded(monkeypatch):
+    scheduler = Scheduler({"extension": (1, 2), "fetch": (1, 2), "convert": (1, 2)})
+    monkeypatch.setattr(main, "scheduler", scheduler)
+    release = threading.Event()
+    scheduler.submit("fetch", release.wait, 5)
+    scheduler.submit("fetch", release.wait, 5, priority=PRIORITY_BULK)
+
+    try:
+        with TestClient(main.create_app()) as client:
+            response = client.post("/api/get-webpage-markdown", json={"url": "http://example.invalid/"})
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+            assert response.json()["work_class"] == "fetch"
+
+            stats = client.get("/api/scheduler-stats").json()["scheduler"]
+            assert stats["fetch"]["rejected"] == 1
+    finally:
+        release.set()
+
+
+def test_cancelled_queued_work_frees_capacity_and_is_skipped():
+    scheduler = Scheduler({"extension": (1, 2)})
+    release = threading.Event()
+    ran = []
+    scheduler.submit("extension", release.wait, 5)
+    while scheduler.stats()["extension"]["running"] == 0:
+        time.sleep(0.01)
+    queued = [scheduler.submit("extension", ran.append, n, priority=PRIORITY_INTERACTIVE) for n in range(2)]
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.submit("extension", ran.append, 2, priority=PRIORITY_INTERACTIVE)
+
+    # 调用方放弃后立即让出队列容量，被取消的任务不再执行
+    assert all(future.cancel() for future in queued)
+    replacement = scheduler.submit("extension", ran.append, 3, priority=PRIORITY_INTERACTIVE)
+    release.set()
+    replacement.result(timeout=5)
+    stats = scheduler.stats()["extension"]
+    assert ran == [3]
+    assert stats["cancelled"] == 2 and stats["queued"] == 0
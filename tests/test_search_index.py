@@ -0,0 +1,44 @@
+from starlette.testclient import TestClient
+
+import main
+from search_index import SearchIndex
+
+
+def test_search_ranks_title_matches_and_segments_cjk():
+    index = SearchIndex()
+    index.submit("req_a", "https://a.example", "异步编程指南", "# 异步编程指南\n介绍 asyncio 事件循环。")
+    index.submit("req_b", "https://b.example", "Rust", "# Rust\n所有权与借用，也提到了异步编程。")
+    assert index.flush(timeout=5)
+
+    results = index.search("异步编程")
+    assert [result["request_id"] for result in results] == ["req_a", "req_b"]
+    assert "[异步编程]" in results[1]["snippet"]
+    assert index.search("asyncio 事件")[0]["request_id"] == "req_a"
+    assert index.search("不存在的词") == []
+
+
+def test_reindexing_replaces_previous_version():
+    index = SearchIndex()
+    index.submit("req_a", "https://a.example", "", "旧内容 alpha")
+    index.submit("req_a", "https://a.example", "", "新内容 beta")
+    index.remove("req_missing")
+    assert index.flush(timeout=5)
+
+    assert index.search("alpha") == []
+    assert [result["request_id"] for result in index.search("beta")] == ["req_a"]
+    assert len(index) == 1
+
+
+def test_search_endpoint_finds_converted_pages():
+    main.page_sources.clear()
+    main.page_sources["req_doc"] = {"url": "https://docs.example", "source_code": "<h1>Deployment guide</h1><p>Configure the reverse proxy.</p>"}
+
+    with TestClient(main.create_app()) as client:
+        client.post("/api/get-markdown", json={"request_id": "req_doc"})
+        main.get_search_index().flush(timeout=5)
+        data = client.post("/api/search", json={"query": "reverse proxy"}).json()
+        assert data["results"][0]["request_id"] == "req_doc"
+        assert data["results"][0]["title"] == "Deployment guide"
+
+        assert client.post("/api/search", json={"query": " "}).status_code == 400
+    main.page_sources.clear()
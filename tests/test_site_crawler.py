@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from site_crawler import normalize_url, parse_page
+
+PAGE_COUNT = 15
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """生成的测试站点：/docs/page{i}.html 组成二叉树，另有 robots.txt 禁止的目录、重定向和外站链接"""
+
+    def do_GET(self):
+        site = self.server.site
+        with site["lock"]:
+            site["requests"].append(self.path)
+            site["active"] += 1
+            site["peak"] = max(site["peak"], site["active"])
+        try:
+            time.sleep(site["delay"])
+            self.respond()
+        finally:
+            with site["lock"]:
+                site["active"] -= 1
+
+    def respond(self):
+        if self.path == "/robots.txt":
+            return self.send_body("text/plain", "User-agent: *\nDisallow: /private/\n")
+        if self.path == "/old":
+            self.send_response(301)
+            self.send_header("Location", "/docs/page1.html")
+            self.end_headers()
+            return
+        if self.path.startswith("/docs/page"):
+            number = int(self.path[len("/docs/page"):-len(".html")])
+            children = [n for n in (2 * number, 2 * number + 1) if n <= PAGE_COUNT]
+            links = ''.join(f'<a href="page{n}.html">Page {n}</a>' for n in children)
+            links += ('<a href="/docs/page1.html#top">home</a><a href="/private/secret.html">secret</a>'
+                      '<a href="http://other.invalid/x">external</a><a href="/docs/logo.png">logo</a>'
+                      '<a href="/old">old</a>')
+            return self.send_body("text/html; charset=utf-8",
+                                  f"<html><head><title>Page {number}</title></head>"
+                                  f"<body><h1>Page {number}</h1><p>文档内容 {number}</p>{links}</body></html>")
+        self.send_body("text/html", "<p>missing</p>", status=404)
+
+    def send_body(self, content_type, text, status=200):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    server.site = {"requests": [], "active": 0, "peak": 0, "delay": 0.0, "lock": threading.Lock()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(main, "CRAWL_CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "page_sources", {})
+    server.site["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server.site
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(client, payload):
+    with client.stream("POST", "/api/crawl-site", json=payload) as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_normalize_and_extract_links():
+    assert normalize_url("HTTP://Example.COM:80/a#frag") == "http://example.com/a"
+    assert normalize_url("https://example.com") == "https://example.com/"
+    assert normalize_url("mailto:someone@example.com") is None
+
+    page = parse_page(
+        '<title> Docs </title><base href="/guide/"><a href="intro.html">x</a><a href="intro.html#s">y</a>'
+        '<a href="/x.pdf">pdf</a><a rel="nofollow" href="/ads">ad</a>',
+        "http://example.com/index.html"
+    )
+    assert page["links"] == ["http://example.com/guide/intro.html"]
+    assert page["title"] == "Docs"
+    assert not page["nofollow"]
+
+
+def test_crawl_streams_pages_within_depth_and_respects_robots(site):
+    with TestClient(main.create_app()) as client:
+        lines = crawl(client, {"url": site["url"] + "/docs/page1.html", "max_depth": 2, "rate_limit": 0})
+
+        assert lines[0]["type"] == "job"
+        pages = [line for line in lines if line["type"] == "page"]
+        success = sorted(line["title"] for line in pages if line["status"] == "success")
+        assert success == sorted(f"Page {n}" for n in range(1, 8))
+        reasons = {line["reason"] for line in pages if line["status"] == "skipped"}
+        assert reasons == {"robots", "redirect"}
+        assert all("# Page" in line["markdown"] for line in pages if line["status"] == "success")
+
+        summary = lines[-1]
+        assert summary["type"] == "summary" and summary["finished"]
+        assert summary["pages_crawled"] == 7
+
+        # 每个页面只请求一次，robots.txt 禁止的目录、超出深度的页面和外站链接都不请求
+        requested = [path for path in site["requests"] if path.startswith("/docs/")]
+        assert len(requested) == len(set(requested)) == 7
+        assert "/private/secret.html" not in site["requests"]
+        assert site["requests"].count("/robots.txt") == 1
+
+        # 抓取的页面可以全文搜索
+        main.get_search_index().flush(timeout=5)
+        results = client.post("/api/search", json={"query": "文档内容"}).json()["results"]
+        assert any(result["request_id"].startswith(summary["job_id"]) for result in results)
+
+
+def test_crawl_limits_concurrency_and_per_host_rate(site):
+    site["delay"] = 0.05
+    with TestClient(main.create_app()) as client:
+        crawl(client, {"url": site["url"] + "/docs/page1.html", "max_depth": 3, "concurrency": 3, "rate_limit": 0})
+        assert 1 < site["peak"] <= 3
+
+        site["requests"].clear()
+        site["delay"] = 0.0
+        started = time.monotonic()
+        crawl(client, {"url": site["url"] + "/docs/page1.html", "max_depth": 1, "concurrency": 4, "rate_limit": 10})
+        # robots.txt + 3 个页面 + 重定向，按每秒10次限速至少需要 0.4 秒
+        assert len(site["requests"]) == 5
+        assert time.monotonic() - started >= 0.38
+
+
+def test_crawl_resumes_from_checkpoint(site):
+    with TestClient(main.create_app()) as client:
+        first = crawl(client, {"url": site["url"] + "/docs/page1.html", "max_depth": 3, "max_pages": 5,
+                               "concurrency": 2, "rate_limit": 0})
+        summary = first[-1]
+        assert summary["pages_crawled"] == 5 and not summary["finished"]
+        assert summary["remaining"] > 0
+
+        second = crawl(client, {"resume": summary["job_id"], "max_pages": 100})
+        assert second[0]["resumed"]
+        assert second[-1]["finished"] and second[-1]["pages_crawled"] == PAGE_COUNT
+
+        titles = [line["title"] for line in first + second if line.get("status") == "success"]
+        assert sorted(titles) == sorted(f"Page {n}" for n in range(1, PAGE_COUNT + 1))
+        requested = [path for path in site["requests"] if path.startswith("/docs/")]
+        assert len(requested) == len(set(requested))
+
+        assert client.post("/api/crawl-site", json={"resume": "crawl_00000000"}).status_code == 404
+        assert client.post("/api/crawl-site", json={"url": "ftp://example.com/"}).status_code == 400
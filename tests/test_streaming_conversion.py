@@ -0,0 +1,150 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from scheduler import PRIORITY_INTERACTIVE, Scheduler
+from streaming_conversion import StreamingMarkdownConverter, create_html2text, iter_chunks
+
+LOGO = '<svg viewBox="0 0 10 10"><title>Logo</title>' + '<path d="M0 0L10 10"/>' * 200 + '</svg>'
+PIXEL = "data:image/png;base64," + base64.b64encode(b"\x89PNG" + b"x" * 3000).decode()
+
+
+def build_page(sections=30):
+    body = "".join(
+        f"<h2>第{n}节</h2><p>正文 {n}&nbsp;内容，<a href='https://example.com/{n}'>链接</a> "
+        f"<a href='https://example.com/{n}'>https://example.com/{n}</a> <img alt='图{n}' src='{PIXEL}'></p>"
+        f"{LOGO}<pre>code &lt; {n}</pre><ul><li>项目 <b>{n}</b></li></ul>"
+        for n in range(sections)
+    )
+    return f"<html><head><title>流式</title></head><body>{body}</body></html>"
+
+
+def read_stream(client, path, payload):
+    with client.stream("POST", path, json=payload) as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+@pytest.mark.parametrize("size", [7, 100, 4096, 1 << 20])
+def test_streaming_converter_matches_whole_page(size):
+    html = build_page()
+    expected = main.convert_html_to_markdown(main.offload_page_blobs(html))
+
+    converter = StreamingMarkdownConverter(transform=main.offload_page_blobs)
+    parts = [converter.feed(chunk) for chunk in iter_chunks(html, size)]
+    parts.append(converter.close())
+
+    assert "".join(parts) == expected
+    assert "data:image" not in expected and "![Logo]" in expected
+    if size < len(html) // 2:
+        # 源码未收齐时已经输出了部分结果
+        assert any(parts[:len(parts) // 2])
+
+
+def test_html2text_internals():
+    # 流式转换中途读取 html2text 的内部状态，升级 html2text 后这些行为变化时需要同步修改转换器
+    converter = create_html2text()
+    assert converter.start is True
+    converter.feed("<p>a&nbsp;b</p><p>c</p>")
+    assert converter.outtextlist == ["a", "&nbsp_place_holder;", "b", "\n", "c"]
+
+
+def test_current_tab_streams_chunks_from_extension(extension):
+    html = build_page()
+    extension.add_tab(None, "https://stream.example/", html)
+
+    with TestClient(main.create_app()) as client:
+        lines = read_stream(client, "/api/get-current-tab-markdown", {"stream": True})
+
+        assert lines[0]["type"] == "start"
+        request = extension.sent_of_type("get_page_source")[0]
+        assert request["stream"] is True and request["chunk_size"] == main.STREAM_CHUNK_CHARS
+        chunks = [line["markdown"] for line in lines if line["type"] == "chunk"]
+        summary = lines[-1]
+        assert summary["type"] == "summary" and summary["status"] == "success"
+        assert summary["url"] == "https://stream.example/" and summary["source_length"] == len(html)
+
+        markdown = "".join(chunks)
+        assert markdown == main.convert_html_to_markdown(main.offload_page_blobs(html))
+        stored = client.post("/api/get-markdown", json={"request_id": summary["request_id"]}).json()
+        assert stored["markdown"] == markdown
+        assert summary["request_id"] not in main.callbacks
+
+        # 需要提取正文时收齐后一次转换
+        lines = read_stream(client, "/api/get-current-tab-markdown", {"stream": True, "main_content": True})
+        assert lines[-1]["status"] == "success" and len([line for line in lines if line["type"] == "chunk"]) == 1
+
+        # 插件报错时以 error 行结束
+        extension.tabs.clear()
+        lines = read_stream(client, "/api/get-current-tab-markdown", {"stream": True})
+        assert lines[-1]["type"] == "error" and "无法获取" in lines[-1]["message"]
+
+
+def test_current_tab_stream_returns_429_when_extension_queue_is_full(extension, monkeypatch):
+    scheduler = Scheduler({"extension": (1, 2), "fetch": (1, 2), "convert": (1, 2)})
+    monkeypatch.setattr(main, "scheduler", scheduler)
+    release = threading.Event()
+    for _ in range(3):
+        scheduler.submit("extension", release.wait, 5, priority=PRIORITY_INTERACTIVE)
+    extension.add_tab(None, "https://stream.example/", build_page(1))
+
+    try:
+        with TestClient(main.create_app()) as client:
+            response = client.post("/api/get-current-tab-markdown", json={"stream": True})
+            assert response.status_code == 429
+            assert response.json()["work_class"] == "extension"
+            assert not extension.sent_of_type("get_page_source")
+    finally:
+        release.set()
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """分多次写出页面的源站，多字节字符被拆在两次写入之间"""
+
+    def do_GET(self):
+        if self.path != "/page":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = self.server.page.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        for start in range(0, len(data), 1001):
+            self.wfile.write(data[start:start + 1001])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    server.page = build_page(60)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(main, "page_sources", {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_webpage_streams_while_downloading(origin):
+    base = f"http://127.0.0.1:{origin.server_address[1]}"
+    with TestClient(main.create_app()) as client:
+        lines = read_stream(client, "/api/get-webpage-markdown", {"url": base + "/page", "stream": True})
+
+        summary = lines[-1]
+        assert summary["type"] == "summary" and summary["chunks"] > 1
+        markdown = "".join(line["markdown"] for line in lines if line["type"] == "chunk")
+        assert markdown == main.convert_html_to_markdown(main.offload_page_blobs(origin.page))
+        assert main.page_sources[summary["request_id"]]["status"] == "success"
+
+        lines = read_stream(client, "/api/get-webpage-markdown", {"url": base + "/missing", "stream": True})
+        assert [line["type"] for line in lines] == ["start", "error"]
+        assert "404" in lines[-1]["message"]
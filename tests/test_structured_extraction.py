@@ -0,0 +1,107 @@
+import base64
+import struct
+
+import httpx
+from starlette.testclient import TestClient
+
+import main
+from structured_extraction import extract_structures, pack_numeric_columns, table_to_csv
+
+PAGE = """<html><head><script>var t = "<table><tr><td>x</td></tr></table>";</script></head><body>
+<table id="prices"><caption>Prices &amp; stock</caption>
+<thead><tr><th rowspan=2>Item</th><th colspan=2>Price</th><th rowspan="2">In stock</th><th rowspan=2>Code</th></tr>
+<tr><th>USD</th><th>EUR</th></tr></thead>
+<tbody><tr><td>Apple</td><td>1,200</td><td>1.5</td><td>true</td><td>007</td></tr>
+<tr><td rowspan=2>Pear</td><td>3</td><td></td><td>false<td>12
+<tr><td>−4</td><td>2e3</td><td>TRUE</td><td>0</td></tr>
+</tbody></table>
+<table><tr><td>Notes<table><tr><th>inner</th></tr><tr><td>9</td></tr></table></td></tr></table>
+<pre class="language-Python">
+def f():
+    return 1 &lt; 2</pre>
+<pre><code class="lang-js">a<br>b</code></pre>
+</body></html>"""
+
+
+def test_tables_and_code_blocks_are_parsed_in_one_pass():
+    tables, code_blocks = extract_structures(PAGE)
+
+    prices, outer, inner = tables
+    assert (prices["caption"], prices["id"], prices["row_count"]) == ("Prices & stock", "prices", 3)
+    assert {column["name"]: (column["type"], column["values"]) for column in prices["columns"]} == {
+        # 跨行的单元格向下延续，跨列的表头逐级连接
+        "Item": ("string", ["Apple", "Pear", "Pear"]),
+        "Price / USD": ("int", [1200, 3, -4]),
+        "Price / EUR": ("float", [1.5, None, 2000.0]),
+        "In stock": ("bool", [True, False, True]),
+        # 以 0 开头的编号保留为文本
+        "Code": ("string", ["007", "12", "0"])
+    }
+    assert outer["columns"][0] == {"name": "column_1", "type": "string", "values": ["Notes"]}
+    assert inner["columns"] == [{"name": "inner", "type": "int", "values": [9]}]
+    assert [(block["language"], block["code"]) for block in code_blocks] == [
+        ("python", "def f():\n    return 1 < 2"), ("js", "a\nb")]
+
+    assert table_to_csv(prices).splitlines() == [
+        "Item,Price / USD,Price / EUR,In stock,Code",
+        "Apple,1200,1.5,true,007", "Pear,3,,false,12", "Pear,-4,2000.0,true,0"]
+
+    # 数值列打包为小端缓冲区和 Arrow 有效位图
+    packed = {column["name"]: column for column in pack_numeric_columns(prices)["columns"]}
+    usd, eur = packed["Price / USD"], packed["Price / EUR"]
+    assert usd["dtype"] == "<i8" and struct.unpack("<3q", base64.b64decode(usd["buffer"])) == (1200, 3, -4)
+    assert usd["validity"] is None and "values" not in usd
+    assert struct.unpack("<3d", base64.b64decode(eur["buffer"])) == (1.5, 0.0, 2000.0)
+    assert base64.b64decode(eur["validity"]) == bytes([0b101])
+    assert packed["Item"]["values"] == ["Apple", "Pear", "Pear"]
+
+
+def test_extract_endpoint_reads_captured_source(extension):
+    extension.add_tab(None, "https://data.example/prices", PAGE)
+
+    with TestClient(main.create_app()) as client:
+        captured = client.post("/api/get-current-tab-markdown", json={}).json()
+        request_id = captured["request_id"]
+
+        result = client.post("/api/extract-structured", json={"request_id": request_id, "include": ["tables"]}).json()
+        assert result["status"] == "success" and result["url"] == "https://data.example/prices"
+        assert len(result["tables"]) == 3 and "code_blocks" not in result
+
+        response = client.post("/api/extract-structured", json={"request_id": request_id, "format": "csv", "table": 2})
+        assert response.headers["content-type"].startswith("text/csv") and response.text.splitlines() == ["inner", "9"]
+
+        code = client.post("/api/extract-structured", json={"request_id": request_id, "include": ["code"]}).json()
+        assert [block["language"] for block in code["code_blocks"]] == ["python", "js"]
+
+        assert client.post("/api/extract-structured", json={"request_id": request_id, "format": "csv",
+                                                            "table": 5}).status_code == 404
+        assert client.post("/api/extract-structured", json={"request_id": "missing"}).status_code == 404
+        assert client.post("/api/extract-structured", json={"request_id": request_id,
+                                                            "format": "xml"}).status_code == 400
+
+
+def test_extract_endpoint_fetches_url(monkeypatch):
+    pages = {"/prices": PAGE}
+
+    def handler(request):
+        page = pages.get(request.url.path)
+        if page is None:
+            return httpx.Response(404, text="missing")
+        return httpx.Response(200, text=page, headers={"Content-Type": "text/html; charset=utf-8"})
+
+    real_client = httpx.Client
+    monkeypatch.setattr(httpx, "Client", lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+    monkeypatch.setattr(main, "page_sources", {})
+
+    with TestClient(main.create_app()) as client:
+        result = client.post("/api/extract-structured", json={"url": "https://data.example/prices"}).json()
+        assert result["status"] == "success" and len(result["tables"]) == 3
+        # 获取的源码在获取工作线程中保存，可按新的请求ID重复提取
+        request_id = result["request_id"]
+        assert request_id.startswith("st_") and main.page_sources[request_id]["url"] == "https://data.example/prices"
+        again = client.post("/api/extract-structured", json={"request_id": request_id, "include": ["code"]}).json()
+        assert len(again["code_blocks"]) == 2
+
+        response = client.post("/api/extract-structured", json={"url": "https://data.example/missing"})
+        assert response.status_code == 502 and "404" in response.json()["message"]
+        assert list(main.page_sources) == [request_id]
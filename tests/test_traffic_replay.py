@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import httpx
+
+from conftest import ROOT_DIR, HostProcess
+from main import encode_message
+from traffic_recorder import TrafficRecorder, load_capture
+
+MAIN_PY = os.path.join(ROOT_DIR, "app", "main.py")
+REPLAY_PY = os.path.join(ROOT_DIR, "benchmarks", "replay_traffic.py")
+
+
+def test_recorder_redacts_and_caps_payloads(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    recorder = TrafficRecorder(path, redact=True, max_payload_chars=50)
+    recorder.record("in", {
+        "type": "page_source_response",
+        "request_id": "req_1",
+        "url": "https://private.example/account?id=42",
+        "source_code": '<p class="name">张三 Alice</p><a href="/me">Profile page for the user</a>'
+    })
+    recorder.record("out", encode_message({"type": "get_page_source", "request_id": "req_1"}))
+    assert recorder.flush(5)
+
+    first, second = load_capture(path)
+    message = first["message"]
+    assert first["dir"] == "in" and first["truncated"] == ["source_code"]
+    assert message["source_code"] == '<p class="xxxx">xx xxxxx</p><a href="xxx">xxxxxxx '
+    assert message["url"].startswith("https://redacted.invalid/") and "42" not in message["url"]
+    assert message["request_id"] == "req_1"
+    assert second["message"]["type"] == "get_page_source" and second["bytes"] > 4
+
+
+def test_recorded_traffic_replays_against_a_new_host(tmp_path):
+    capture = str(tmp_path / "capture.jsonl")
+    host = HostProcess(MAIN_PY, tmp_path, MARKDOWN_RECORD_PATH=capture)
+    try:
+        host.send({"action": "init"})
+        host.wait_ready()
+        for n in range(2):
+            thread = threading.Thread(target=httpx.post, args=(host.url("/api/get-current-tab-markdown"),),
+                                      kwargs={"json": {}, "timeout": 30})
+            thread.start()
+            request = host.receive(lambda m: m.get("type") == "get_page_source")
+            host.send({
+                "type": "page_source_response",
+                "request_id": request["request_id"],
+                "url": f"https://site.example/{n}",
+                "source_code": f"<h1>Page {n}</h1>" + "<p>段落内容</p>" * 200
+            })
+            thread.join(30)
+    finally:
+        host.process.kill()
+        host.process.wait()
+
+    replay = subprocess.run(
+        [sys.executable, REPLAY_PY, capture, "--speed", "4", "--json"],
+        capture_output=True, text=True, timeout=120
+    )
+    summary = json.loads(replay.stdout)
+    assert replay.returncode == 0 and summary["passed"]
+    assert summary["requests"] == 2 and summary["failed"] == 0 and summary["missing_replies"] == 0
+    assert summary["latency_by_path"]["/api/get-current-tab-markdown"]["p50"] > 0
+    assert summary["output_types"]["system"]["recorded"] == summary["output_types"]["system"]["replayed"] == 2